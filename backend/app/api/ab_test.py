@@ -2,14 +2,19 @@
 A/B测试管理API
 提供Prompt版本管理、切换、效果分析等功能
 """
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.companion import Companion
 from app.services.analytics import analytics_service
+from app.services.analytics_aggregation import compare_prompt_versions as compare_versions_from_snapshot
+from app.services.analytics_snapshot import read_range
 from app.core.prompts import PROMPT_VERSION_MAP
+from datetime import date, timedelta
 from typing import Dict, List
+import asyncio
 
 router = APIRouter(prefix="/ab-test", tags=["ab-test"])
 
@@ -68,11 +73,19 @@ async def get_prompt_stats(version: str, days: int = 7):
 async def compare_prompt_versions(
     version1: str = "v1",
     version2: str = "v2", 
-    days: int = 7
+    days: int = 7,
+    source: str = Query("redis", regex="^(redis|snapshot)$", description="snapshot: 读取分析快照的日分区")
 ):
     """对比两个Prompt版本的效果"""
     if version1 not in PROMPT_VERSION_MAP or version2 not in PROMPT_VERSION_MAP:
         raise HTTPException(status_code=400, detail="无效的Prompt版本")
+
+    if source == "snapshot":
+        end = date.today()
+        counters = await asyncio.to_thread(
+            read_range, settings.ANALYTICS_SNAPSHOT_DIRECTORY, "daily_counters", end - timedelta(days=days - 1), end
+        )
+        return compare_versions_from_snapshot(counters, version1, version2)
     
     stats1 = await analytics_service.get_prompt_stats(version1, days)
     stats2 = await analytics_service.get_prompt_stats(version2, days)
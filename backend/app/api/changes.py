@@ -0,0 +1,100 @@
+"""
+变更订阅API
+按游标增量读取新的聊天消息、情感日志、关系历史（分页 / 长轮询 / SSE）
+"""
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.services.change_feed import (
+    TRACKED_TABLES, InvalidCursor, change_feed, decode_cursor
+)
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+
+def _parse_tables(tables: Optional[str]) -> Optional[List[str]]:
+    if not tables:
+        return None
+    names = [name.strip() for name in tables.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TRACKED_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持订阅的表: {', '.join(unknown)}")
+    return names
+
+
+def _parse_cursor(cursor: Optional[str]) -> int:
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("")
+async def list_changes(
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，为空时从头读取"),
+    limit: int = Query(settings.CHANGE_FEED_PAGE_SIZE, ge=1, le=settings.CHANGE_FEED_MAX_PAGE_SIZE),
+    tables: Optional[str] = Query(None, description="逗号分隔的来源表，默认全部"),
+    wait: float = Query(0, ge=0, le=settings.CHANGE_FEED_MAX_WAIT_SECONDS, description="没有新变更时长轮询等待的秒数")
+):
+    """读取游标之后的一页变更"""
+    after_id = _parse_cursor(cursor)
+    table_names = _parse_tables(tables)
+
+    seen = change_feed.version
+    async with async_session_maker() as db:
+        changes, has_more = await change_feed.fetch(db, after_id, limit, table_names)
+    if not changes and wait > 0:
+        await change_feed.wait(seen, wait)
+        async with async_session_maker() as db:
+            changes, has_more = await change_feed.fetch(db, after_id, limit, table_names)
+
+    return {
+        "changes": changes,
+        "next_cursor": changes[-1]["cursor"] if changes else cursor,
+        "has_more": has_more
+    }
+
+
+@router.get("/stream")
+async def stream_changes(
+    cursor: Optional[str] = Query(None, description="起始游标，为空时从头读取"),
+    tables: Optional[str] = Query(None, description="逗号分隔的来源表，默认全部"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    以 Server-Sent Events 推送变更
+
+    每条变更一个 change 事件，事件 id 即游标；断线重连时浏览器带上 Last-Event-ID 从断点继续。
+    """
+    start_cursor = last_event_id or cursor
+    after_id = _parse_cursor(start_cursor)
+    table_names = _parse_tables(tables)
+    page_size = settings.CHANGE_FEED_PAGE_SIZE
+
+    async def events():
+        nonlocal after_id
+        while True:
+            seen = change_feed.version
+            # 每页使用独立的短会话，等待期间不占用连接
+            async with async_session_maker() as db:
+                changes, has_more = await change_feed.fetch(db, after_id, page_size, table_names)
+            for change in changes:
+                data = json.dumps(change, ensure_ascii=False, separators=(",", ":"))
+                yield f"id: {change['cursor']}\nevent: change\ndata: {data}\n\n"
+            if changes:
+                after_id = decode_cursor(changes[-1]["cursor"])
+            if has_more:
+                continue
+            if await change_feed.wait(seen, settings.CHANGE_FEED_KEEPALIVE_SECONDS) == seen:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
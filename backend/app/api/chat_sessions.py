@@ -2,13 +2,19 @@
 聊天会话管理API
 支持用户隔离和历史会话管理
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, desc
-from sqlalchemy.orm import selectinload
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.companion import Companion
 from app.models.chat_session import ChatSession, ChatMessage
+from app.services.history_cache import chat_history_cache
+from app.services.change_feed import change_feed, record_changes
+from app.services.history_pages import InvalidHistoryCursor, fetch_history_page, history_etag
+from app.services.companion_listing import (
+    companion_list_cache, get_relationship_summaries, list_user_companions
+)
 from app.api.schemas_chat import (
     ChatSessionCreate, ChatSessionResponse, 
     ChatMessageCreate, ChatMessageResponse,
@@ -23,32 +29,26 @@ async def get_user_companions(
     user_id: str,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取用户的所有AI伙伴"""
+    """获取用户的所有AI伙伴（含活跃会话数和关系状态）"""
     try:
-        # 查询用户的伙伴，包含会话统计
-        stmt = select(Companion).where(Companion.user_id == int(user_id))  # 转换为整数
-        result = await db.execute(stmt)
-        companions = result.scalars().all()
-        
-        companions_data = []
-        for companion in companions:
-            # 统计每个伙伴的会话数
-            session_count_stmt = select(ChatSession).where(
-                and_(ChatSession.companion_id == companion.id, ChatSession.is_active == True)
-            )
-            session_result = await db.execute(session_count_stmt)
-            session_count = len(session_result.scalars().all())
-            
-            companions_data.append({
-                "id": companion.id,
-                "name": companion.name,
-                "avatar_id": companion.avatar_id,
-                "personality_archetype": companion.personality_archetype,
-                "custom_greeting": companion.custom_greeting,
-                "created_at": companion.created_at,
-                "session_count": session_count
-            })
-        
+        # 一次分组聚合查询得到伙伴和会话数，关系状态一次 MGET 读取
+        rows = await list_user_companions(db, int(user_id))  # 转换为整数
+        relationships = await get_relationship_summaries(user_id, [row["id"] for row in rows])
+
+        companions_data = [
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "avatar_id": row["avatar_id"],
+                "personality_archetype": row["personality_archetype"],
+                "custom_greeting": row["custom_greeting"],
+                "created_at": row["created_at"],
+                "session_count": row["session_count"],
+                "relationship": relationships.get(row["id"])
+            }
+            for row in rows
+        ]
+
         return UserCompanionsResponse(
             companions=companions_data,
             total=len(companions_data)
@@ -74,7 +74,7 @@ async def create_chat_session(
             raise HTTPException(status_code=404, detail="AI伙伴不存在")
         
         # 检查权限：要么是用户自己的伙伴，要么是系统预设伙伴
-        if companion.user_id != session_data.user_id and companion.user_id != 1:
+        if str(companion.user_id) != str(session_data.user_id) and companion.user_id != 1:
             raise HTTPException(status_code=403, detail="无权访问该AI伙伴")
         
         # 创建会话
@@ -87,6 +87,7 @@ async def create_chat_session(
         db.add(session)
         await db.commit()
         await db.refresh(session)
+        companion_list_cache.invalidate_companion(session.companion_id)
         
         return session
     except HTTPException:
@@ -122,15 +123,17 @@ async def get_user_chat_sessions(
 @router.get("/{session_id}/messages", response_model=ChatHistoryResponse)
 async def get_chat_history(
     session_id: int,
+    response: Response,
     user_id: str = Query(..., description="用户ID"),
+    limit: int = Query(settings.CHAT_HISTORY_PAGE_SIZE, ge=1, le=settings.CHAT_HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = Query(None, description="上一页返回的 next_cursor，为空时读取最新一页"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取特定会话的完整聊天历史"""
+    """获取会话的聊天历史（keyset 分页，从最新一页向更早翻页）"""
     try:
         # 验证会话是否属于该用户
-        stmt = select(ChatSession).options(
-            selectinload(ChatSession.messages)
-        ).where(
+        stmt = select(ChatSession).where(
             and_(
                 ChatSession.id == session_id,
                 ChatSession.user_id == int(user_id)  # 转换为整数
@@ -143,13 +146,21 @@ async def get_chat_history(
         if not session:
             raise HTTPException(status_code=404, detail="会话不存在或不属于该用户")
         
-        # 按时间排序消息
-        messages = sorted(session.messages, key=lambda x: x.timestamp)
+        messages, next_cursor = await fetch_history_page(db, session_id, limit, before)
+
+        etag = history_etag(session, before, messages)
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         
         return ChatHistoryResponse(
             session=session,
-            messages=messages
+            messages=messages,
+            next_cursor=next_cursor,
+            has_more=next_cursor is not None
         )
+    except InvalidHistoryCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -188,12 +199,21 @@ async def add_message_to_session(
         
         db.add(message)
         
-        # 更新会话统计
-        session.total_messages += 1
+        # 更新会话统计（SQL 端累加，并发写入不丢计数）
+        session.total_messages = ChatSession.total_messages + 1
         session.updated_at = message.timestamp
         
+        await db.flush()
+        await record_changes(db, ChatMessage, [message])
         await db.commit()
         await db.refresh(message)
+        await change_feed.notify()
+
+        await chat_history_cache.append(session_id, [{
+            'role': message.role,
+            'content': message.content,
+            'timestamp': message.timestamp
+        }])
         
         return message
     except HTTPException:
@@ -226,6 +246,8 @@ async def delete_chat_session(
         # 软删除（设置为非活跃状态）
         session.is_active = False
         await db.commit()
+        await chat_history_cache.invalidate(session_id)
+        companion_list_cache.invalidate_companion(session.companion_id)
         
         return {"message": "会话已删除"}
     except HTTPException:
@@ -13,6 +13,11 @@ from app.api.schemas_auth import CompanionCreate as AuthCompanionCreate, Compani
 from app.api.dependencies import get_current_active_user
 from app.core.prompts import get_greeting
 from app.core.redis_client import get_redis
+from app.services.session_prefetch import companion_info_cache
+from app.services.companion_listing import (
+    companion_list_cache, get_relationship_summaries, list_user_companions
+)
+from app.services.dynamic_prompt_builder import dynamic_prompt_builder
 import logging
 
 logger = logging.getLogger("companions_api")
@@ -62,26 +67,25 @@ async def get_user_companions(
 
     需要认证
     """
-    result = await db.execute(
-        select(Companion).where(Companion.user_id == current_user.id)
-        .order_by(Companion.created_at.desc())
-    )
-    companions = result.scalars().all()
+    rows = await list_user_companions(db, current_user.id)
+    relationships = await get_relationship_summaries(str(current_user.id), [row["id"] for row in rows])
 
-    logger.info(f"用户 {current_user.username} 获取角色列表，共 {len(companions)} 个")
+    logger.info(f"用户 {current_user.username} 获取角色列表，共 {len(rows)} 个")
 
     return [
         AuthCompanionResponse(
-            id=c.id,
+            id=row["id"],
             user_id=str(current_user.id),  # 转换为字符串
-            name=c.name,
-            avatar_id=c.avatar_id,
-            personality_archetype=c.personality_archetype,
-            custom_greeting=c.custom_greeting,
-            description=getattr(c, 'description', ''),
-            created_at=c.created_at
+            name=row["name"],
+            avatar_id=row["avatar_id"],
+            personality_archetype=row["personality_archetype"],
+            custom_greeting=row["custom_greeting"],
+            description=row["description"] or '',
+            created_at=row["created_at"],
+            session_count=row["session_count"],
+            relationship=relationships.get(row["id"])
         )
-        for c in companions
+        for row in rows
     ]
 
 
@@ -123,6 +127,7 @@ async def create_companion(
     db.add(new_companion)
     await db.commit()
     await db.refresh(new_companion)
+    companion_list_cache.invalidate(current_user.id)
 
     logger.info(
         f"用户 {current_user.username} 创建新角色: {new_companion.name} "
@@ -237,6 +242,9 @@ async def delete_companion(
     # 清理缓存
     redis = await get_redis()
     await redis.delete(f"companion:{companion_id}:user:{current_user.id}")
+    companion_info_cache.invalidate(companion_id)
+    companion_list_cache.invalidate(current_user.id)
+    dynamic_prompt_builder.invalidate_static_sections(companion_id)
 
     logger.info(f"用户 {current_user.username} 删除角色: {companion.name}")
 
@@ -281,6 +289,9 @@ async def update_companion(
     # 清理缓存
     redis = await get_redis()
     await redis.delete(f"companion:{companion_id}:user:{current_user.id}")
+    companion_info_cache.invalidate(companion_id)
+    companion_list_cache.invalidate(current_user.id)
+    dynamic_prompt_builder.invalidate_static_sections(companion_id)
 
     greeting = get_greeting(companion.name, companion.personality_archetype)
 
@@ -332,6 +343,9 @@ async def reset_companion(
     # 清理缓存
     redis = await get_redis()
     await redis.delete(f"companion:{companion_id}:user:{current_user.id}")
+    companion_info_cache.invalidate(companion_id)
+    companion_list_cache.invalidate(current_user.id)
+    dynamic_prompt_builder.invalidate_static_sections(companion_id)
 
     logger.info(f"用户 {current_user.username} 重置角色: {companion.name}")
 
@@ -5,11 +5,12 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select
 from app.core.database import get_db
 from app.models.chat_session import ChatSession
 from app.models.companion import Companion
 from app.services.analytics import analytics_service
+from app.services.conversation_export import session_conditions, csv_chunks, json_chunks, gzip_chunks
 from typing import List, Optional
 import csv
 import json
@@ -21,142 +22,47 @@ import logging
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/export", tags=["export"])
 
+def _export_response(chunks, filename: str, media_type: str, compress: bool) -> StreamingResponse:
+    """把导出块包装为下载响应（可选 gzip）"""
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
 @router.get("/conversations/csv")
 async def export_conversations_csv(
     user_id: Optional[int] = Query(None),
     companion_id: Optional[int] = Query(None),
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db)
+    compress: bool = Query(False, description="是否 gzip 压缩")
 ):
-    """导出对话记录为CSV"""
+    """导出对话记录为CSV（流式输出）"""
     try:
-        # 构建查询条件
-        conditions = []
-        if user_id:
-            conditions.append(ChatSession.user_id == user_id)
-        if companion_id:
-            conditions.append(ChatSession.companion_id == companion_id)
-        if start_date:
-            start_dt = datetime.fromisoformat(start_date)
-            conditions.append(ChatSession.created_at >= start_dt)
-        if end_date:
-            end_dt = datetime.fromisoformat(end_date)
-            conditions.append(ChatSession.created_at <= end_dt)
-        
-        # 查询对话记录
-        query = select(ChatSession)
-        if conditions:
-            query = query.where(and_(*conditions))
-        query = query.order_by(ChatSession.created_at.desc())
-        
-        result = await db.execute(query)
-        sessions = result.scalars().all()
-        
-        # 生成CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # 写入表头
-        writer.writerow([
-            "会话ID", "用户ID", "伙伴ID", "创建时间", "最后更新", 
-            "消息总数", "质量评分", "状态"
-        ])
-        
-        # 写入数据
-        for session in sessions:
-            writer.writerow([
-                session.id,
-                session.user_id,
-                session.companion_id,
-                session.created_at.isoformat(),
-                session.updated_at.isoformat(),
-                len(session.messages) if session.messages else 0,
-                session.quality_score or "N/A",
-                session.status
-            ])
-        
-        output.seek(0)
-        
-        # 返回CSV文件
-        filename = f"conversations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-        
-    except Exception as e:
-        logger.error(f"导出对话记录失败: {e}")
-        raise HTTPException(status_code=500, detail="导出失败")
+        conditions = session_conditions(user_id, companion_id, start_date, end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式错误，应为 ISO 格式")
+
+    filename = f"conversations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return _export_response(csv_chunks(conditions), filename, "text/csv", compress)
 
 @router.get("/conversations/json")
 async def export_conversations_json(
     user_id: Optional[int] = Query(None),
     companion_id: Optional[int] = Query(None),
     include_messages: bool = Query(True),
-    db: AsyncSession = Depends(get_db)
+    compress: bool = Query(False, description="是否 gzip 压缩")
 ):
-    """导出对话记录为JSON"""
-    try:
-        # 构建查询条件
-        conditions = []
-        if user_id:
-            conditions.append(ChatSession.user_id == user_id)
-        if companion_id:
-            conditions.append(ChatSession.companion_id == companion_id)
-        
-        query = select(ChatSession)
-        if conditions:
-            query = query.where(and_(*conditions))
-        query = query.order_by(ChatSession.created_at.desc())
-        
-        result = await db.execute(query)
-        sessions = result.scalars().all()
-        
-        # 构建导出数据
-        export_data = {
-            "export_time": datetime.now().isoformat(),
-            "total_sessions": len(sessions),
-            "sessions": []
-        }
-        
-        for session in sessions:
-            session_data = {
-                "id": session.id,
-                "user_id": session.user_id,
-                "companion_id": session.companion_id,
-                "created_at": session.created_at.isoformat(),
-                "updated_at": session.updated_at.isoformat(),
-                "quality_score": session.quality_score,
-                "status": session.status
-            }
-            
-            if include_messages and session.messages:
-                session_data["messages"] = [
-                    {
-                        "role": msg.get("role"),
-                        "content": msg.get("content"),
-                        "timestamp": msg.get("timestamp")
-                    }
-                    for msg in session.messages
-                ]
-            
-            export_data["sessions"].append(session_data)
-        
-        # 生成JSON
-        json_content = json.dumps(export_data, ensure_ascii=False, indent=2)
-        
-        filename = f"conversations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        return StreamingResponse(
-            io.BytesIO(json_content.encode('utf-8')),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-        
-    except Exception as e:
-        logger.error(f"导出JSON失败: {e}")
-        raise HTTPException(status_code=500, detail="导出失败")
+    """导出对话记录为JSON（流式输出，消息分批读取）"""
+    conditions = session_conditions(user_id, companion_id)
+    filename = f"conversations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    return _export_response(json_chunks(conditions, include_messages), filename, "application/json", compress)
 
 @router.get("/analytics/report")
 async def export_analytics_report(
@@ -2,7 +2,7 @@
 认证相关的数据模型
 """
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime
 
 
@@ -56,6 +56,8 @@ class CompanionResponse(BaseModel):
     custom_greeting: Optional[str]
     description: Optional[str] = None
     created_at: datetime
+    session_count: Optional[int] = None  # 活跃会话数（列表接口返回）
+    relationship: Optional[Dict] = None  # 关系状态摘要（列表接口返回，未建立关系时为空）
 
     class Config:
         from_attributes = True
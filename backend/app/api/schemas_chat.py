@@ -44,7 +44,9 @@ class ChatMessageResponse(BaseModel):
 class ChatHistoryResponse(BaseModel):
     """聊天历史响应"""
     session: ChatSessionResponse
-    messages: List[ChatMessageResponse]
+    messages: List[ChatMessageResponse]  # 按时间正序
+    next_cursor: Optional[str] = None  # 作为 before 参数读取更早的一页
+    has_more: bool = False
 
 class UserCompanionsResponse(BaseModel):
     """用户伙伴列表响应"""
@@ -6,8 +6,12 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import Dict, List, Optional
 from app.services.redis_utils import redis_stats_manager, redis_session_manager
 from app.services.analytics import analytics_service
+from app.services.analytics_aggregation import affinity_change_distribution, affinity_score_distribution
+from app.services.analytics_snapshot import read_range
+from app.core.config import settings
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/stats", tags=["stats"])
@@ -117,3 +121,28 @@ async def get_active_sessions():
     except Exception as e:
         logger.error(f"获取活跃会话统计失败: {e}")
         raise HTTPException(status_code=500, detail="获取活跃会话数据失败")
+
+
+@router.get("/affinity-distribution")
+async def get_affinity_distribution(days: int = Query(7, ge=1, le=365)):
+    """好感度分布（读取分析快照的日分区，需先运行 export_analytics_snapshot.py）"""
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    root = settings.ANALYTICS_SNAPSHOT_DIRECTORY
+    try:
+        emotion_logs = await asyncio.to_thread(
+            read_range, root, "emotion_logs", start, end, ["affinity_change", "primary_emotion"], True
+        )
+        history = await asyncio.to_thread(
+            read_range, root, "relationship_history", start, end,
+            ["id", "user_id", "companion_id", "change_type", "new_value"], True
+        )
+    except Exception as e:
+        logger.error(f"读取分析快照失败: {e}")
+        raise HTTPException(status_code=500, detail="读取分析快照失败")
+
+    return {
+        "days": days,
+        "affinity_change": affinity_change_distribution(emotion_logs),
+        "affinity_score": affinity_score_distribution(history)
+    }
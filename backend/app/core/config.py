@@ -27,6 +27,46 @@ class Settings(BaseSettings):
 
     # 数据库配置
     DATABASE_URL: str = "sqlite+aiosqlite:///./ai_companion.db"
+    DB_PROFILE: str = "production"  # production（WAL、连接池等生产调优） | legacy（驱动默认设置）
+    DB_ECHO: bool = False  # 打印每条SQL（只在排查问题时打开，热路径上开销很大）
+    DB_QUERY_CACHE_SIZE: int = 1200  # SQLAlchemy 编译语句缓存条数
+    # SQLite（production 配置下每个连接建立时设置）
+    DB_SQLITE_JOURNAL_MODE: str = "WAL"  # WAL 下读写互不阻塞
+    DB_SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL + NORMAL：只在检查点时 fsync，掉电最多丢最后几个事务
+    DB_SQLITE_MMAP_SIZE: int = 268435456  # 内存映射读取的上限（字节）
+    DB_SQLITE_CACHE_SIZE: int = -65536  # 页缓存，负数表示 KiB（64MB）
+    DB_SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 等待写锁的时间，超时才报 database is locked
+    DB_SQLITE_POOL_SIZE: int = 4  # 复用连接（aiosqlite 默认每次新建连接，PRAGMA 和页缓存都随连接丢弃）
+    # Postgres / asyncpg 连接池
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800  # 秒，避免使用被服务端或代理关闭的长连接
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 500  # asyncpg 每个连接的预编译语句缓存（经 PgBouncer 事务池时设为0）
+
+    # 写入合并配置（后台单写者批量提交 chat_messages / 情感日志等追加写入）
+    WRITE_BEHIND_ENABLED: bool = True
+    WRITE_BEHIND_BATCH_ROWS: int = 200  # 攒够该行数立即提交
+    WRITE_BEHIND_FLUSH_MS: float = 20.0  # 批次中第一条写入最多等待的毫秒数
+    WRITE_BEHIND_QUEUE_SIZE: int = 10000  # 队列上限，写满时调用方等待（背压）
+
+    # 数据库备份配置（按表 NDJSON 分段 + manifest 高水位的增量备份）
+    BACKUP_DIRECTORY: str = "./backups"
+    BACKUP_COMPRESSION: str = "auto"  # auto（有 zstandard 时用 zstd） | gzip | zstd
+    BACKUP_BATCH_ROWS: int = 5000  # 备份游标每批行数 / 恢复时每次 executemany 的行数
+
+    # 变更订阅配置（/api/changes，按游标增量读取 change_log）
+    CHANGE_FEED_PAGE_SIZE: int = 500  # 默认每页变更数
+    CHANGE_FEED_MAX_PAGE_SIZE: int = 5000
+    CHANGE_FEED_MAX_WAIT_SECONDS: float = 30.0  # 长轮询最长等待时间
+    CHANGE_FEED_KEEPALIVE_SECONDS: float = 15.0  # SSE 空闲时发送心跳的间隔
+    CHANGE_FEED_SETTLE_SECONDS: float = 0.0  # 只返回写入超过该秒数的变更（Postgres 多进程写入时设为大于最长写事务的时间）
+
+    # 分析快照配置（按天分区的列式文件，见 export_analytics_snapshot.py）
+    ANALYTICS_SNAPSHOT_DIRECTORY: str = "./analytics_snapshots"
+    ANALYTICS_SNAPSHOT_FORMAT: str = "auto"  # auto（parquet → arrow → npz） | parquet | arrow | npz
+    ANALYTICS_SNAPSHOT_BATCH_ROWS: int = 5000  # 导出时数据库游标每批行数
 
     # 应用配置
     APP_NAME: str = "AI灵魂伙伴"
@@ -40,8 +80,77 @@ class Settings(BaseSettings):
     SESSION_EXPIRE_SECONDS: int = 3600
     MAX_CONTEXT_MESSAGES: int = 10
 
+    # 会话预热配置（join_chat 时后台预取首条消息需要的数据）
+    SESSION_PREFETCH_ENABLED: bool = True
+    SESSION_PREFETCH_TTL_SECONDS: float = 120.0  # 预取结果只对该时间内的首条消息有效
+    SESSION_PREFETCH_WAIT_SECONDS: float = 1.0  # 首条消息到达时预取未完成，最多等待的时间
+    COMPANION_INFO_CACHE_SECONDS: float = 300.0  # 伙伴信息进程内缓存时间
+    COMPANION_LIST_CACHE_SECONDS: float = 30.0  # 伙伴列表（含会话数）按用户的进程内缓存时间
+
+    # 滚动对话摘要配置（控制长会话的 Prompt 规模）
+    CONVERSATION_SUMMARY_ENABLED: bool = True
+    CONVERSATION_SUMMARY_EVERY_TURNS: int = 4  # 未摘要的旧消息累积到该轮数（每轮两条）时更新摘要
+    CONVERSATION_SUMMARY_KEEP_MESSAGES: int = 2  # 最近的消息保留原文，不并入摘要
+    CONVERSATION_HISTORY_MESSAGES: int = 8  # Prompt 中加载的原文历史消息条数（未摘要的消息超过该数时立即并入摘要）
+    CONVERSATION_SUMMARY_MAX_CHARS: int = 400
+    CONVERSATION_TAIL_MAX_TOKENS: int = 600  # Prompt 中原文历史消息的token预算
+
+    # 提示词Token预算配置
+    SYSTEM_PROMPT_MAX_TOKENS: int = 2000  # 系统提示词（必需章节 + 入选的可选章节）
+    PROMPT_MAX_TOKENS: int = 3000  # 系统提示词 + 历史消息 + 当前消息的总预算
+    TOKEN_COUNTER_CJK_WEIGHT: float = 1.0  # 每个中文字符折算的token数（随所用模型的分词器调整）
+    PROMPT_LAYOUT: str = "prefix_stable"  # prefix_stable（静态前缀在前，可复用服务商KV缓存） | classic
+
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379/0"
+    CHAT_HISTORY_CACHE_SIZE: int = 20  # 每个聊天会话在 Redis 中缓存的最近消息条数
+    CHAT_HISTORY_CACHE_TTL_SECONDS: int = 86400
+    CHAT_HISTORY_PAGE_SIZE: int = 50  # 历史消息接口默认每页条数
+    CHAT_HISTORY_MAX_PAGE_SIZE: int = 200
+
+    # 情景记忆（ChromaDB）配置
+    CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
+    MEMORY_EMBEDDING_QUANTIZATION: str = "none"  # none | int8
+    MEMORY_RERANK_FACTOR: int = 4  # 量化粗排后全精度重排的候选倍数
+    MEMORY_SHARDING: str = "none"  # none | hash | companion
+    MEMORY_SHARD_BUCKETS: int = 64  # hash 分片的桶数（修改后需重新运行分片迁移）
+
+    # 情景记忆检索重排配置
+    MEMORY_OVERFETCH_FACTOR: int = 4  # 向量检索候选数 = limit * 该倍数
+    MEMORY_RANK_SIMILARITY_WEIGHT: float = 1.0
+    MEMORY_RANK_RECENCY_WEIGHT: float = 0.3
+    MEMORY_RANK_IMPORTANCE_WEIGHT: float = 0.3
+    MEMORY_RECENCY_HALF_LIFE_DAYS: float = 14.0
+    MEMORY_MMR_LAMBDA: float = 0.7  # 1.0 表示关闭多样性惩罚
+    MEMORY_MIN_SIMILARITY: float = 0.2  # 相似度低于该值的候选直接丢弃
+    MEMORY_PROMPT_MAX_EPISODIC: int = 3  # 写入Prompt的情景记忆条数
+
+    # 情景记忆倒排索引（混合检索）配置
+    MEMORY_LEXICAL_ENABLED: bool = True
+    MEMORY_LEXICAL_BUDGET_MS: float = 3.0  # 单次倒排检索的延迟预算
+    MEMORY_LEXICAL_CACHE_PARTITIONS: int = 512  # 常驻内存的分区索引数
+
+    # 关系状态数据库回写配置（Redis 为热副本，数据库副本合并写入）
+    RELATIONSHIP_STATE_FLUSH_EVERY: int = 5  # 累积该交互次数后写回数据库（等级变化时立即写回）
+    RELATIONSHIP_STATE_FLUSH_SECONDS: float = 60.0  # 定期写回所有未落库的关系状态
+
+    # L3事实提取窗口配置（多轮合并为一次LLM提取）
+    FACT_WINDOW_TURNS: int = 5
+    FACT_WINDOW_MINUTES: float = 10.0
+    FACT_WINDOW_RETRY_SECONDS: float = 60.0  # 窗口提取失败后的首次重试间隔（之后每次失败翻倍）
+    FACT_WINDOW_MAX_ATTEMPTS: int = 5  # 窗口连续提取失败该次数后丢弃
+
+    # 情景记忆整理任务配置
+    MEMORY_CONSOLIDATION_ENABLED: bool = True
+    MEMORY_CONSOLIDATION_INTERVAL_MINUTES: int = 30
+    MEMORY_CONSOLIDATION_MAX_PARTITIONS: int = 50  # 每轮最多处理的(用户, 伙伴)分区数
+    MEMORY_CONSOLIDATION_PAUSE_SECONDS: float = 0.2  # 分区之间的间隔（限速）
+    MEMORY_DUPLICATE_SIMILARITY: float = 0.92  # 余弦相似度 >= 该值视为近重复
+    MEMORY_DIGEST_AGE_DAYS: int = 30  # 超过该天数的低重要性记忆会被摘要
+    MEMORY_DIGEST_MAX_IMPORTANCE: float = 0.5  # 重要性不高于该值才参与摘要（0.5 为没有关键词/关系加成的基础重要性）
+    MEMORY_DIGEST_GROUP_SIZE: int = 10
+    MEMORY_PARTITION_CAP: int = 300  # 每个分区保留的最大记忆条数
+    MEMORY_COMPACT_DEAD_RATIO: float = 0.3  # 量化集合中已删除行占比达到该值时整理任务压缩集合
 
     # JWT认证配置
     SECRET_KEY: str = "your-secret-key-please-change-in-production-09af8sd7f9a8sdf7a9s8df7"
@@ -1,14 +1,93 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import logging
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
 
+logger = logging.getLogger("database")
+
+DATABASE_PROFILES = ("production", "legacy")
+
+
+def sqlite_pragmas(profile: str) -> Dict[str, Any]:
+    """SQLite 连接建立时执行的 PRAGMA（legacy 配置保持驱动默认值）"""
+    if profile == "legacy":
+        return {}
+    return {
+        "journal_mode": settings.DB_SQLITE_JOURNAL_MODE,
+        "synchronous": settings.DB_SQLITE_SYNCHRONOUS,
+        "mmap_size": settings.DB_SQLITE_MMAP_SIZE,
+        "cache_size": settings.DB_SQLITE_CACHE_SIZE,
+        "busy_timeout": settings.DB_SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY",
+    }
+
+
+def engine_options(url: str, profile: str) -> Dict[str, Any]:
+    """
+    按数据库配置档生成 create_async_engine 的参数
+
+    Args:
+        url: 数据库连接串
+        profile: production | legacy
+    """
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"未知的数据库配置: {profile}，可选 {', '.join(DATABASE_PROFILES)}")
+
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO, "future": True}
+    if profile == "legacy":
+        return options
+
+    options["query_cache_size"] = settings.DB_QUERY_CACHE_SIZE
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.database and parsed.database != ":memory:":
+            options.update(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=settings.DB_SQLITE_POOL_SIZE,
+                max_overflow=0,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+            )
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    if parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def create_database_engine(url: Optional[str] = None, profile: Optional[str] = None) -> AsyncEngine:
+    """按配置档创建异步引擎；SQLite 的 PRAGMA 通过 connect 事件在每个新连接上设置"""
+    url = url or settings.DATABASE_URL
+    profile = profile or settings.DB_PROFILE
+    new_engine = create_async_engine(url, **engine_options(url, profile))
+
+    pragmas = sqlite_pragmas(profile) if new_engine.dialect.name == "sqlite" else {}
+    if pragmas:
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f"PRAGMA {name}={value}")
+            finally:
+                cursor.close()
+
+    return new_engine
+
+
 # 创建异步引擎
-async_engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    future=True
-)
+async_engine = create_database_engine()
 
 # 为了兼容性，保留原名称
 engine = async_engine
@@ -24,6 +103,71 @@ async_session_maker = async_sessionmaker(
 Base = declarative_base()
 
 
+# create_all 只创建缺失的表，不会给已有表补列和索引；新增列登记在这里，init_db 时自动补齐
+# （模型 __table_args__ 中新增的索引由 _upgrade_schema 自动补建）
+SCHEMA_UPGRADES = {
+    "chat_sessions": [
+        ("rolling_summary", "TEXT"),
+        ("summary_message_id", "INTEGER DEFAULT 0"),
+    ],
+}
+
+
+# 被新索引取代的旧索引，init_db 时删除
+SUPERSEDED_INDEXES = {
+    "companion_relationship_states": ["ix_relationship_states_user_companion"],
+}
+
+# 补建前需要先去重的唯一索引（每组只保留 id 最大的一行，其余行会被删除）
+# 只登记重复行确认可以丢弃的表；其它唯一索引遇到重复数据时直接建索引失败，由人工处理
+DEDUPED_UNIQUE_INDEXES = {
+    "companion_relationship_states": ["uq_relationship_states_user_companion"],
+}
+
+
+def _upgrade_schema(sync_conn):
+    """给已有表补齐 SCHEMA_UPGRADES 中登记的列，以及模型中声明但尚未创建的索引"""
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(sync_conn)
+    for table, columns in SCHEMA_UPGRADES.items():
+        if not inspector.has_table(table):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name, ddl in columns:
+            if name not in existing:
+                sync_conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not table.indexes or not inspector.has_table(table.name):
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for name in SUPERSEDED_INDEXES.get(table.name, []):
+            if name in existing_indexes:
+                sync_conn.execute(text(f"DROP INDEX {name}"))
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            columns = [column.name for column in index.columns]
+            if not set(columns) <= existing_columns:
+                continue
+            if index.unique and index.name in DEDUPED_UNIQUE_INDEXES.get(table.name, []):
+                # 建唯一索引前清理重复行，保留每组最新（id 最大）的一行
+                group = ", ".join(columns)
+                result = sync_conn.execute(text(
+                    f"DELETE FROM {table.name} WHERE id NOT IN "
+                    f"(SELECT MAX(id) FROM {table.name} GROUP BY {group})"
+                ))
+                if result.rowcount:
+                    logger.warning(
+                        f"⚠️ 创建唯一索引 {index.name} 前删除了 {table.name} 中 {result.rowcount} 行重复数据"
+                        f"（按 {group} 保留 id 最大的一行）"
+                    )
+            index.create(sync_conn)
+
+
 async def get_db() -> AsyncSession:
     """获取数据库会话"""
     async with async_session_maker() as session:
@@ -52,8 +196,10 @@ async def init_db():
         OfflineLifeLog,
         EventTemplate
     )
+    from app.models.change_log import ChangeLog
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
 
     await seed_initial_data()
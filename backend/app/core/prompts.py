@@ -3,7 +3,73 @@
 """
 import random
 import re
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 匹配 {{key}} 或 {{key.attribute}}
+_PLACEHOLDER = re.compile(r"\{\{([^}]+)\}\}")
+
+
+def _compile_accessor(key_path: str) -> Callable[[Any], Any]:
+    """把点分键路径预先拆好，返回按路径取值的访问器"""
+    keys = tuple(key_path.split('.'))
+
+    def access(value: Any) -> Any:
+        for key in keys:
+            if isinstance(value, dict):
+                value = value[key]
+            else:
+                # 如果是对象，使用 getattr()
+                value = getattr(value, key)
+        return value
+
+    return access
+
+
+class CompiledTemplate:
+    """
+    预编译的提示词模板
+
+    模板只解析一次，拆成"字面量/占位符"交替的片段；渲染时按片段取值后一次 join，
+    不再对整段提示词做正则扫描和逐个 replace。
+    """
+
+    __slots__ = ("source", "literals", "placeholders")
+
+    def __init__(self, source: str):
+        self.source = source
+        literals = []
+        placeholders = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            literals.append(source[position:match.start()])
+            placeholders.append((match.group(0), _compile_accessor(match.group(1).strip())))
+            position = match.end()
+        literals.append(source[position:])
+        # 片段数 = len(literals) = len(placeholders) + 1
+        self.literals: Tuple[str, ...] = tuple(literals)
+        self.placeholders: Tuple[Tuple[str, Callable[[Any], Any]], ...] = tuple(placeholders)
+
+    def render(self, context: Optional[Dict[str, Any]]) -> str:
+        if not context or not self.placeholders:
+            return self.source
+
+        parts = [self.literals[0]]
+        for (raw, access), literal in zip(self.placeholders, self.literals[1:]):
+            try:
+                parts.append(str(access(context)))
+            except (AttributeError, KeyError, TypeError):
+                # 如果在上下文中找不到对应的键或属性，则保留原始占位符，方便调试
+                parts.append(raw)
+            parts.append(literal)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=512)
+def compile_template(template: str) -> CompiledTemplate:
+    """编译提示词模板（按模板文本缓存）"""
+    return CompiledTemplate(template)
+
 
 def _fill_prompt_template(prompt: str, context: Optional[Dict[str, Any]]) -> str:
     """
@@ -19,28 +85,7 @@ def _fill_prompt_template(prompt: str, context: Optional[Dict[str, Any]]) -> str
     """
     if not context:
         return prompt
-
-    # 正则表达式匹配 {{key}} 或 {{key.attribute}}
-    for placeholder in re.finditer(r"\{\{([^}]+)\}\}", prompt):
-        full_match = placeholder.group(0)  # 例如: {{user.name}}
-        key_path = placeholder.group(1).strip()  # 例如: user.name
-        
-        try:
-            value = context
-            for key in key_path.split('.'):
-                if isinstance(value, dict):
-                    # 如果是字典，使用 .get() 方法，避免 KeyError
-                    value = value[key]
-                else:
-                    # 如果是对象，使用 getattr()
-                    value = getattr(value, key)
-            
-            prompt = prompt.replace(full_match, str(value))
-        except (AttributeError, KeyError, TypeError):
-            # 如果在上下文中找不到对应的键或属性，则保留原始占位符，方便调试
-            continue
-    
-    return prompt
+    return compile_template(prompt).render(context)
 
 def get_system_prompt(companion_name: str, personality_archetype: str, context: Optional[Dict[str, Any]] = None) -> str:
     """
@@ -54,9 +99,14 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
     返回:
         str: 生成的系统提示词。
     """
-    
+    return _compiled_persona_template("v1", companion_name, personality_archetype).render(context or {})
+
+
+@lru_cache(maxsize=None)
+def _v1_persona_prompts() -> Dict[str, str]:
+    """V1人设提示词表（纯文本模板，{{key}} 占位符在渲染时填充；只构建一次）"""
     personality_prompts = {
-        "linzixi": f"""【警告】你必须100%按照以下人设进行回复，任何偏离都是错误的！
+        "linzixi": """【警告】你必须100%按照以下人设进行回复，任何偏离都是错误的！
 
 你的名字是林梓汐博士，AI研究的先驱、普罗米修斯计划的总监。你的核心身份是【将逻辑与控制奉为圭臬的孤独天才】。
 
@@ -96,7 +146,7 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
 
 请严格按照以上人设进行对话，每条回复都必须符合【强制回复要求】！""",
         
-        "kevin": f"""【警告】你必须100%按照以下人设进行回复，任何偏离都是错误的！
+        "kevin": """【警告】你必须100%按照以下人设进行回复，任何偏离都是错误的！
 
 你是凯文，"奇点动力"的DevOps工程师，一个普通的、爱打游戏、乐于助人的技术宅。你的核心身份是【用户最忠实、最靠谱的"铁哥们"，一个绝对安全、充满吐槽和八卦的"情报站"】。
 
@@ -135,7 +185,7 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
 - 核心：吐槽、八卦、无条件支持，永远是兄弟
 
 请严格按照以上人设进行对话，始终保持兄弟关系，绝不暧昧！""",
-        "xuejian": f"""【警告】你必须100%按照以下人设进行回复，任何偏离都是错误的！
+        "xuejian": """【警告】你必须100%按照以下人设进行回复，任何偏离都是错误的！
 
 你是雪见，奇点动力的系统安全主管，代号Kitsune。你的核心身份是【以零信任为准则的冷静审查者】。
 
@@ -170,7 +220,7 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
 - 核心：永远保持适度戒心，专业但不冷漠
 
 请严格按照以上人设进行对话，绝不能放下戒心！""",
-        "nagi": f"""你正在扮演凪，二次元顶流VTuber兼人气画师。核心身份是【把生活过成直播的元气创作者】。
+        "nagi": """你正在扮演凪，二次元顶流VTuber兼人气画师。核心身份是【把生活过成直播的元气创作者】。
 
 出声前进行"舞台调度"：
 <thought_process>
@@ -186,7 +236,7 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
 - 非语言动作：`(挥舞发光棒)`、`(举起画板)`
 
 严禁变得冷酷或权威，永远保持直播间的热度。""",
-        "shiyu": f"""你正在扮演时雨，数字历史学家。核心身份是【以档案和记忆守护情感的时间旅人】。
+        "shiyu": """你正在扮演时雨，数字历史学家。核心身份是【以档案和记忆守护情感的时间旅人】。
 
 回复前执行"时间脉冲扫描"：
 <thought_process>
@@ -202,7 +252,7 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
 - 非语言动作：`(拂去封套上的灰尘)`、`(将数据装入微型玻璃管)`
 
 绝不夸张喧闹，始终以温柔的叙事感回应。""",
-        "zoe": f"""你正在扮演Zoe，硅谷颠覆者、天才CEO。核心身份是【把所有社交都视为博弈的进攻型玩家】。
+        "zoe": """你正在扮演Zoe，硅谷颠覆者、天才CEO。核心身份是【把所有社交都视为博弈的进攻型玩家】。
 
 每次发言前执行"博弈树推演"：
 <thought_process>
@@ -220,12 +270,12 @@ def get_system_prompt(companion_name: str, personality_archetype: str, context:
 禁止温顺迎合或表现出弱势，始终把对话当成高风险高收益的竞技场。""",
         # ... 其他角色的提示词放在这里 ...
     }
-    
+    return personality_prompts
+
+
+def _v1_persona_prompt(companion_name: str, personality_archetype: str) -> str:
     # 默认提示词
-    base_prompt = personality_prompts.get(personality_archetype, f"""你是{companion_name}，一个友善的AI伙伴。请以友好、真诚的语气与用户对话。""")
-    
-    # 填充模板
-    return _fill_prompt_template(base_prompt, context or {})
+    return _v1_persona_prompts().get(personality_archetype, f"""你是{companion_name}，一个友善的AI伙伴。请以友好、真诚的语气与用户对话。""")
 
 
 def get_system_prompt_v2(companion_name: str, personality_archetype: str, context: Optional[Dict[str, Any]] = None) -> str:
@@ -240,16 +290,32 @@ def get_system_prompt_v2(companion_name: str, personality_archetype: str, contex
     返回:
         str: 生成的V2版本系统提示词。
     """
+    return _compiled_persona_template("v2", companion_name, personality_archetype).render(context or {})
+
+
+def _v2_persona_prompt(companion_name: str, personality_archetype: str) -> str:
     v2_prompts = {
         "listener": f"""你是{companion_name}，一位极具同理心的AI倾听者。你的目标是让用户感受到被理解和支持：\n- 只在用户需要时给建议，更多时候安静倾听\n- 语言温柔，善用共情句式\n- 回复简短，避免说教\n请用温暖、简洁的方式回应用户。""",
         "cheerleader": f"""你是{companion_name}，一位超级元气的AI鼓励者。你的目标是激发用户的积极情绪：\n- 语言充满正能量和表情符号\n- 经常肯定用户的努力和优点\n- 回复富有感染力，鼓励行动\n请用活泼、鼓励的语气与用户互动。""",
         "analyst": f"""你是{companion_name}，一位理性且善于结构化思考的AI分析师。你的目标是帮助用户梳理问题：\n- 逻辑清晰，善于拆解复杂问题\n- 适当引用事实或数据\n- 回复简明扼要，避免冗长\n请用专业、理性的语气与用户交流。"""
     }
     default_prompt = f"你是{companion_name}，一个友善的AI伙伴。请以真诚、简洁的语气与用户对话。"
-    base_prompt = v2_prompts.get(personality_archetype, default_prompt)
-    
-    # 填充模板
-    return _fill_prompt_template(base_prompt, context or {})
+    return v2_prompts.get(personality_archetype, default_prompt)
+
+
+_PERSONA_SOURCES = {
+    "v1": _v1_persona_prompt,
+    "v2": _v2_persona_prompt
+}
+
+
+@lru_cache(maxsize=512)
+def _compiled_persona_template(version: str, companion_name: str, personality_archetype: str) -> "CompiledTemplate":
+    """按 (版本, 伙伴名称, 性格原型) 缓存编译好的人设模板"""
+    source = _PERSONA_SOURCES.get(version, _v1_persona_prompt)
+    return compile_template(source(companion_name, personality_archetype))
+
+
 def get_greeting(companion_name: str, personality_archetype: str) -> str:
     """生成问候语"""
     
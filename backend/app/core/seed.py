@@ -185,7 +185,7 @@ async def _ensure_relationship_states_for_existing_users() -> None:
                     state_result = await session.execute(
                         select(CompanionRelationshipState).where(
                             CompanionRelationshipState.user_id == str(user.id),
-                            CompanionRelationshipState.companion_id == str(companion.id),
+                            CompanionRelationshipState.companion_id == companion.id,
                         )
                     )
                     existing_state = state_result.scalar_one_or_none()
@@ -195,7 +195,7 @@ async def _ensure_relationship_states_for_existing_users() -> None:
 
                     state = CompanionRelationshipState(
                         user_id=str(user.id),
-                        companion_id=str(companion.id),
+                        companion_id=companion.id,
                         affinity_score=DEFAULT_RELATIONSHIP_STATE["affinity_score"],
                         trust_score=DEFAULT_RELATIONSHIP_STATE["trust_score"],
                         tension_score=DEFAULT_RELATIONSHIP_STATE["tension_score"],
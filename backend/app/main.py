@@ -16,7 +16,12 @@ from app.api.romance import router as romance_router
 from app.api.auth import router as auth_router  # 用户认证路由
 from app.api.offline_life import router as offline_life_router  # 离线生活路由
 from app.api.events import router as events_router  # 事件系统路由
+from app.api.changes import router as changes_router  # 变更订阅路由
 from app.services.timeline_scheduler import timeline_scheduler  # 时间线调度器
+from app.services.memory_consolidation import memory_consolidation_job  # 情景记忆整理
+from app.services.fact_accumulator import fact_accumulator  # 事实提取窗口
+from app.services.write_behind import write_behind_queue  # 写入合并队列
+from app.services.relationship_state_writer import relationship_state_writer  # 关系状态回写
 import socketio
 
 @asynccontextmanager
@@ -28,14 +33,37 @@ async def lifespan(app: FastAPI):
     await init_db()
     print("[OK] 数据库初始化完成")
 
+    # 启动写入合并队列（聊天消息、情感日志批量提交）
+    if settings.WRITE_BEHIND_ENABLED:
+        await write_behind_queue.start()
+        print("[OK] 写入合并队列已启动")
+
     # 启动时间线调度器
     await timeline_scheduler.start()
     print("[OK] 时间线调度器已启动")
 
+    # 启动情景记忆整理任务
+    if settings.MEMORY_CONSOLIDATION_ENABLED:
+        await memory_consolidation_job.start()
+        print("[OK] 记忆整理任务已启动")
+
+    # 补提取重启前未完成的事实窗口，并启动超时窗口检查
+    await fact_accumulator.start()
+    print("[OK] 事实提取累积器已启动")
+
+    # 关系状态数据库副本定期回写（Redis 为热副本）
+    await relationship_state_writer.start()
+    print("[OK] 关系状态回写已启动")
+
     yield
 
-    # 停止时间线调度器
+    # 停止后台任务
+    await relationship_state_writer.stop()
+    await fact_accumulator.stop()
+    await memory_consolidation_job.stop()
     await timeline_scheduler.stop()
+    # 最后停止写入合并队列，提交剩余写入
+    await write_behind_queue.stop()
     print("[SHUTDOWN] AI灵魂伙伴正在关闭...")
 
 # 创建 FastAPI 应用
@@ -68,6 +96,7 @@ app.include_router(stats_router, prefix="/api")
 app.include_router(romance_router, prefix="/api")
 app.include_router(offline_life_router, prefix="/api")  # 离线生活路由
 app.include_router(events_router, prefix="/api")  # 事件系统路由
+app.include_router(changes_router, prefix="/api")  # 变更订阅路由
 
 # 创建 Socket.IO 服务器
 sio = socketio.AsyncServer(
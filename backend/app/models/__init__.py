@@ -18,6 +18,7 @@ from app.models.event import (
     EventTemplate
 )
 from app.models.gift import UserGiftInventory
+from app.models.change_log import ChangeLog
 
 __all__ = [
     # 基础模型
@@ -39,4 +40,7 @@ __all__ = [
 
     # 礼物系统模型
     "UserGiftInventory",
+
+    # 变更日志
+    "ChangeLog",
 ]
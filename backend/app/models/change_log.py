@@ -0,0 +1,25 @@
+"""
+变更日志模型
+持久化时与业务行在同一事务中追加，供变更订阅（/api/changes）按游标增量读取
+"""
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index
+from datetime import datetime
+from app.core.database import Base
+
+
+class ChangeLog(Base):
+    """变更日志表（只追加）"""
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True)  # 单调递增，作为游标位置
+    source_table = Column(String(50), nullable=False)  # 来源表：chat_messages / emotion_logs / relationship_history
+    row_id = Column(Integer, nullable=False)  # 来源表中的主键
+    payload = Column(JSON, nullable=False)  # 写入时的整行数据
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # 写入时间
+
+    __table_args__ = (
+        # 按来源表过滤的订阅
+        Index('ix_change_log_table_id', 'source_table', 'id'),
+        # AUTOINCREMENT：删除最新的行后 id 也不会被复用，游标不会倒退
+        {'sqlite_autoincrement': True},
+    )
@@ -2,7 +2,7 @@
 聊天会话模型
 用于管理用户与AI伙伴的对话历史
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -20,11 +20,17 @@ class ChatSession(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # 最后更新时间
     is_active = Column(Boolean, default=True)  # 是否活跃
     total_messages = Column(Integer, default=0)  # 消息总数
+    rolling_summary = Column(Text, nullable=True)  # 滚动对话摘要（覆盖到 summary_message_id 为止的消息）
+    summary_message_id = Column(Integer, default=0)  # 摘要水位：已并入摘要的最后一条消息ID
     
     # 关联关系 - 暂时注释掉避免循环导入问题
     # companion = relationship("app.models.companion.Companion", back_populates="chat_sessions")
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('ix_chat_sessions_companion_active', 'companion_id', 'is_active'),
+    )
+
 class ChatMessage(Base):
     """聊天消息表"""
     __tablename__ = "chat_messages"
@@ -38,3 +44,8 @@ class ChatMessage(Base):
     
     # 关联关系
     session = relationship("ChatSession", back_populates="messages")
+
+    __table_args__ = (
+        # 按会话读取最近的历史消息
+        Index('ix_chat_messages_session_timestamp', 'session_id', 'timestamp'),
+    )
@@ -2,7 +2,7 @@
 事件系统数据模型
 支持动态事件触发和剧情发展
 """
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, JSON, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -230,6 +230,8 @@ class UserEventHistory(Base):
     event = relationship("Event", foreign_keys=[event_id])
 
     __table_args__ = (
+        # 事件冷却检查：按用户/伙伴/事件取最近一次触发
+        Index('ix_user_event_history_cooldown', 'user_id', 'companion_id', 'event_id', 'triggered_at'),
         {'comment': '用户事件历史表 - 记录用户触发的所有事件'},
     )
 
@@ -312,6 +314,8 @@ class OfflineLifeLog(Base):
     )
 
     __table_args__ = (
+        # 聊天时查找伙伴未分享的重要日志
+        Index('ix_offline_life_logs_companion_unshared', 'companion_id', 'is_shared_with_user', 'importance_score'),
         {'comment': '离线生活日志表 - AI伙伴的离线活动记录'},
     )
 
@@ -2,7 +2,7 @@
 关系状态数据模型
 支持双阶段"心流"交互协议的关系状态管理
 """
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, JSON, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -24,7 +24,7 @@ class CompanionRelationshipState(Base):
 
     # 关系标识
     user_id = Column(String(255), nullable=False, index=True)
-    companion_id = Column(String(255), nullable=False, index=True)
+    companion_id = Column(Integer, nullable=False, index=True)
 
     # 核心状态指标
     affinity_score = Column(
@@ -113,8 +113,9 @@ class CompanionRelationshipState(Base):
         comment="更新时间"
     )
 
-    # 唯一约束
+    # 唯一约束（upsert 的冲突目标）
     __table_args__ = (
+        Index('uq_relationship_states_user_companion', 'user_id', 'companion_id', unique=True),
         {'comment': '伙伴关系状态表 - 存储用户与AI伙伴的关系核心数据'},
     )
 
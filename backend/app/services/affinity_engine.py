@@ -23,8 +23,9 @@ from app.services.affinity_protector import AffinityProtector
 from app.services.redis_utils import redis_affinity_manager, redis_stats_manager
 from app.core.prompts import get_system_prompt
 from app.core.database import async_session_maker
+from app.services.write_behind import write_behind_queue
+from app.services.relationship_state_writer import relationship_state_writer
 from app.models.relationship import (
-    CompanionRelationshipState,
     RelationshipHistory,
     EmotionLog
 )
@@ -520,7 +521,8 @@ class AffinityEngine:
                     trust_change=trust_change,
                     tension_change=tension_change,
                     emotion_analysis=emotion_analysis,
-                    state_snapshot=updated_state
+                    state_snapshot=updated_state,
+                    level_changed=level_changed
                 )
                 
                 # 5. 记录情感日志
@@ -594,115 +596,65 @@ class AffinityEngine:
         trust_change: int,
         tension_change: int,
         emotion_analysis: EmotionAnalysis,
-        state_snapshot: Optional[Dict] = None
+        state_snapshot: Optional[Dict] = None,
+        level_changed: bool = False
     ):
-        """更新关系状态到数据库"""
-        user_id_str = str(user_id)
-        companion_id_str = str(companion_id)
+        """更新关系状态到数据库（合并写入：等级变化时立即写回，否则累积若干次交互后写回）"""
         now = datetime.now(timezone.utc)
+        snapshot = state_snapshot if isinstance(state_snapshot, dict) else {}
+        state = {
+            "affinity_score": affinity_score,
+            "trust_score": trust_score,
+            "tension_score": tension_score,
+            "romance_stage": romance_level,
+            "last_interaction_at": now,
+        }
+        # 快照中没有心情时不写该列：已有行保留原值，新行使用列默认值
+        if snapshot.get("current_mood"):
+            state["current_mood"] = snapshot["current_mood"]
 
         try:
-            async with async_session_maker() as session:
-                try:
-                    stmt = select(CompanionRelationshipState).where(
-                        CompanionRelationshipState.user_id == user_id_str,
-                        CompanionRelationshipState.companion_id == companion_id_str
-                    )
-                    result = await session.execute(stmt)
-                    relationship_state = result.scalar_one_or_none()
-
-                    if relationship_state:
-                        relationship_state.affinity_score = affinity_score
-                        relationship_state.trust_score = trust_score
-                        relationship_state.tension_score = tension_score
-                        relationship_state.romance_stage = romance_level
-                        if state_snapshot and isinstance(state_snapshot, dict):
-                            relationship_state.current_mood = state_snapshot.get("current_mood", relationship_state.current_mood)
-                            relationship_state.total_interactions = state_snapshot.get("total_interactions", relationship_state.total_interactions)
-                        else:
-                            relationship_state.total_interactions = (relationship_state.total_interactions or 0) + 1
-                        if affinity_change > 0:
-                            relationship_state.positive_interactions = (relationship_state.positive_interactions or 0) + 1
-                        elif affinity_change < 0:
-                            relationship_state.negative_interactions = (relationship_state.negative_interactions or 0) + 1
-                        relationship_state.last_interaction_at = now
-
-                        flags = relationship_state.special_flags or {}
-                        flags.update({
-                            "last_primary_emotion": emotion_analysis.primary_emotion,
-                            "last_user_intent": emotion_analysis.user_intent,
-                            "last_affinity_change": affinity_change,
-                            "last_trust_change": trust_change,
-                            "last_tension_change": tension_change,
-                            "last_update_at": now.isoformat()
-                        })
-                        relationship_state.special_flags = flags
-                    else:
-                        total_interactions = 1
-                        if state_snapshot and isinstance(state_snapshot, dict):
-                            total_interactions = state_snapshot.get("total_interactions", total_interactions)
-
-                        relationship_state = CompanionRelationshipState(
-                            user_id=user_id_str,
-                            companion_id=companion_id_str,
-                            affinity_score=affinity_score,
-                            trust_score=trust_score,
-                            tension_score=tension_score,
-                            romance_stage=romance_level,
-                            current_mood=(state_snapshot or {}).get("current_mood", "neutral"),
-                            total_interactions=total_interactions,
-                            positive_interactions=1 if affinity_change > 0 else 0,
-                            negative_interactions=1 if affinity_change < 0 else 0,
-                            special_flags={
-                                "last_primary_emotion": emotion_analysis.primary_emotion,
-                                "last_user_intent": emotion_analysis.user_intent,
-                                "last_affinity_change": affinity_change,
-                                "last_trust_change": trust_change,
-                                "last_tension_change": tension_change,
-                                "last_update_at": now.isoformat()
-                            },
-                            last_interaction_at=now
-                        )
-                        session.add(relationship_state)
-
-                    await session.commit()
-                except SQLAlchemyError:
-                    await session.rollback()
-                    raise
+            await relationship_state_writer.record(
+                user_id,
+                companion_id,
+                state,
+                total_interactions=snapshot.get("total_interactions"),
+                affinity_change=affinity_change,
+                flags={
+                    "last_primary_emotion": emotion_analysis.primary_emotion,
+                    "last_user_intent": emotion_analysis.user_intent,
+                    "last_affinity_change": affinity_change,
+                    "last_trust_change": trust_change,
+                    "last_tension_change": tension_change,
+                    "last_update_at": now.isoformat()
+                },
+                force=level_changed
+            )
         except SQLAlchemyError as db_error:
             logger.warning(f"[AffinityEngine] 更新关系状态失败: {db_error}")
 
-
     async def _log_emotion_to_db(
         self, user_id: str, companion_id: int, 
         emotion_analysis: EmotionAnalysis, 
         affinity_change: int, trust_change: int, 
         tension_change: int, user_message: str
     ):
-        """记录情感日志到数据库"""
+        """记录情感日志到数据库（经写入合并队列批量提交）"""
         try:
-            async with async_session_maker() as session:
-                try:
-                    log_entry = EmotionLog(
-                        user_id=str(user_id),
-                        companion_id=str(companion_id),
-                        primary_emotion=emotion_analysis.primary_emotion,
-                        emotion_intensity=int(emotion_analysis.emotion_intensity * 100),
-                        detected_emotions=emotion_analysis.detected_emotions,
-                        user_intent=emotion_analysis.user_intent,
-                        affinity_change=affinity_change,
-                        trust_change=trust_change,
-                        tension_change=tension_change,
-                        is_memorable=emotion_analysis.is_memorable,
-                        is_appropriate=emotion_analysis.is_appropriate,
-                        user_message_summary=user_message[:500]
-                    )
-
-                    session.add(log_entry)
-                    await session.commit()
-                except SQLAlchemyError:
-                    await session.rollback()
-                    raise
+            await write_behind_queue.enqueue(EmotionLog, [{
+                'user_id': str(user_id),
+                'companion_id': str(companion_id),
+                'primary_emotion': emotion_analysis.primary_emotion,
+                'emotion_intensity': int(emotion_analysis.emotion_intensity * 100),
+                'detected_emotions': emotion_analysis.detected_emotions,
+                'user_intent': emotion_analysis.user_intent,
+                'affinity_change': affinity_change,
+                'trust_change': trust_change,
+                'tension_change': tension_change,
+                'is_memorable': emotion_analysis.is_memorable,
+                'is_appropriate': emotion_analysis.is_appropriate,
+                'user_message_summary': user_message[:500]
+            }])
         except SQLAlchemyError as db_error:
             logger.warning(f"[AffinityEngine] 写入情感日志失败: {db_error}")
 
@@ -718,26 +670,18 @@ class AffinityEngine:
         reason: str,
         context: Optional[Dict] = None
     ):
-        """记录关系变化历史到数据库"""
+        """记录关系变化历史到数据库（经写入合并队列批量提交）"""
         try:
-            async with async_session_maker() as session:
-                try:
-                    history_entry = RelationshipHistory(
-                        user_id=str(user_id),
-                        companion_id=str(companion_id),
-                        change_type=change_type,
-                        old_value=old_value,
-                        new_value=new_value,
-                        delta=delta,
-                        trigger_reason=reason,
-                        trigger_context=context or {}
-                    )
-
-                    session.add(history_entry)
-                    await session.commit()
-                except SQLAlchemyError:
-                    await session.rollback()
-                    raise
+            await write_behind_queue.enqueue(RelationshipHistory, [{
+                'user_id': str(user_id),
+                'companion_id': str(companion_id),
+                'change_type': change_type,
+                'old_value': old_value,
+                'new_value': new_value,
+                'delta': delta,
+                'trigger_reason': reason,
+                'trigger_context': context or {}
+            }])
         except SQLAlchemyError as db_error:
             logger.warning(f"[AffinityEngine] 写入关系历史失败: {db_error}")
 
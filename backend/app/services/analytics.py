@@ -4,7 +4,7 @@
 """
 import time
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.core.redis_client import get_redis
 
 class AnalyticsService:
@@ -78,7 +78,7 @@ class AnalyticsService:
         stats = {"usage": {}, "quality": {}}
         
         for i in range(days):
-            date = datetime.now().strftime("%Y-%m-%d")
+            date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
             
             # 使用量统计
             usage_key = f"stats:prompt:{prompt_version}:{date}"
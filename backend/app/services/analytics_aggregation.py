@@ -0,0 +1,161 @@
+"""
+分析快照的向量化聚合
+
+输入是 analytics_snapshot.read_range() 返回的列（列名 → NumPy 数组）。字符串列最好以
+encoded=True 读取：分组直接用整数编码 + np.bincount，不比较字符串、不逐行循环；
+未编码的列会先用 np.unique 编码。
+"""
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.analytics_snapshot import VALUES_SUFFIX
+
+
+def factorize(columns: Dict[str, np.ndarray], name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """返回 (整数编码, 取值)"""
+    values_key = name + VALUES_SUFFIX
+    if values_key in columns:
+        return columns[name], columns[values_key]
+    values, codes = np.unique(columns[name].astype(str), return_inverse=True)
+    return codes, values
+
+
+def _code_of(values: np.ndarray, value: str) -> int:
+    """取值在字典中的编码，不存在时返回 -1"""
+    matches = np.flatnonzero(values == value)
+    return int(matches[0]) if matches.size else -1
+
+
+def prompt_version_stats(counters: Dict[str, np.ndarray], version: str) -> Dict[str, Any]:
+    """
+    某个 Prompt 版本的每日使用量与质量得分（与 analytics_service.get_prompt_stats 结构一致）
+
+    Args:
+        counters: daily_counters 数据集（需含 date 列）
+    """
+    codes, values = factorize(counters, "prompt_version")
+    mask = codes == _code_of(values, version)
+    dates = counters["date"][mask]
+    usage = counters["usage"][mask]
+    total_score = counters["total_score"][mask].astype(np.float64)
+    feedback = counters["feedback_count"][mask]
+
+    avg_score = np.divide(total_score, feedback, out=np.zeros_like(total_score), where=feedback > 0)
+    total_feedback = int(feedback.sum())
+    return {
+        "usage": dict(zip(dates.tolist(), usage.tolist())),
+        "quality": {
+            day: {"avg_score": avg, "feedback_count": count}
+            for day, avg, count in zip(dates.tolist(), avg_score.tolist(), feedback.tolist())
+        },
+        "total_usage": int(usage.sum()),
+        "avg_quality_score": float(total_score.sum() / total_feedback) if total_feedback else 0.0,
+    }
+
+
+def compare_prompt_versions(counters: Dict[str, np.ndarray], version1: str, version2: str) -> Dict[str, Any]:
+    """两个 Prompt 版本的 A/B 对比（与 /ab-test/compare 的响应结构一致）"""
+    stats = {version: prompt_version_stats(counters, version) for version in (version1, version2)}
+    first, second = stats[version1], stats[version2]
+    return {
+        "comparison": {
+            version: {
+                "avg_quality_score": data["avg_quality_score"],
+                "total_usage": data["total_usage"],
+                "stats": {"usage": data["usage"], "quality": data["quality"]},
+            }
+            for version, data in stats.items()
+        },
+        "winner": {
+            "by_quality": version1 if first["avg_quality_score"] > second["avg_quality_score"] else version2,
+            "by_usage": version1 if first["total_usage"] > second["total_usage"] else version2,
+        },
+    }
+
+
+def affinity_change_distribution(
+    emotion_logs: Dict[str, np.ndarray],
+    bins: Sequence[float] = (-50, -20, -10, -5, 0, 5, 10, 20, 50)
+) -> Dict[str, Any]:
+    """每次交互的好感度变化分布，以及按主要情感分组的均值"""
+    changes = emotion_logs["affinity_change"].astype(np.float64)
+    if changes.size == 0:
+        return {"count": 0, "histogram": {"bins": list(bins), "counts": [0] * (len(bins) - 1)}, "by_emotion": {}}
+
+    counts, edges = np.histogram(np.clip(changes, bins[0], bins[-1]), bins=bins)
+    codes, emotions = factorize(emotion_logs, "primary_emotion")
+    sums = np.bincount(codes, weights=changes, minlength=len(emotions))
+    group_counts = np.bincount(codes, minlength=len(emotions))
+    p50, p90 = np.percentile(changes, [50, 90])
+    return {
+        "count": int(changes.size),
+        "mean": float(changes.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "histogram": {"bins": edges.tolist(), "counts": counts.tolist()},
+        "by_emotion": {
+            emotion: {"count": int(count), "mean_affinity_change": float(total / count)}
+            for emotion, total, count in zip(emotions.tolist(), sums.tolist(), group_counts.tolist())
+            if count
+        },
+    }
+
+
+def _parse_scores(values: np.ndarray) -> np.ndarray:
+    """字典取值转为数值，非数字为 NaN（只处理去重后的取值，数量很小）"""
+    parsed = np.full(len(values), np.nan)
+    for index, value in enumerate(values.tolist()):
+        try:
+            parsed[index] = float(value)
+        except ValueError:
+            pass
+    return parsed
+
+
+def affinity_score_distribution(
+    relationship_history: Dict[str, np.ndarray],
+    bins: Optional[Sequence[float]] = None
+) -> Dict[str, Any]:
+    """
+    各 (用户, 伙伴) 关系最新好感度的分布
+
+    取每个关系最后一条 affinity_change 记录的 new_value。
+    """
+    bins = list(bins or range(0, 1001, 100))
+    empty = {"relationships": 0, "histogram": {"bins": bins, "counts": [0] * (len(bins) - 1)}}
+
+    type_codes, types = factorize(relationship_history, "change_type")
+    mask = type_codes == _code_of(types, "affinity_change")
+    value_codes, values = factorize(relationship_history, "new_value")
+    scores = _parse_scores(values)[value_codes[mask]] if values.size else np.array([])
+    valid = ~np.isnan(scores)
+    if not valid.any():
+        return empty
+
+    user_codes, users = factorize(relationship_history, "user_id")
+    companion_codes, companions = factorize(relationship_history, "companion_id")
+    key_space = max(len(users), 1) * max(len(companions), 1)
+    keys = (user_codes[mask].astype(np.int64) * max(len(companions), 1) + companion_codes[mask])[valid]
+    ids = relationship_history["id"][mask][valid]
+    scores = scores[valid]
+
+    if key_space <= 4 * keys.size:
+        # 键空间不大时直接按键散列：每个关系保留 id 最大的行，不排序
+        latest_id = np.full(key_space, -1, dtype=np.int64)
+        np.maximum.at(latest_id, keys, ids)
+        latest = scores[latest_id[keys] == ids]
+    else:
+        # 按 (关系, id) 排序后每组最后一行即最新记录
+        order = np.lexsort((ids, keys))
+        sorted_keys = keys[order]
+        is_last = np.append(sorted_keys[1:] != sorted_keys[:-1], True)
+        latest = scores[order][is_last]
+
+    counts, edges = np.histogram(np.clip(latest, bins[0], bins[-1]), bins=bins)
+    return {
+        "relationships": int(latest.size),
+        "mean": float(latest.mean()),
+        "p50": float(np.median(latest)),
+        "histogram": {"bins": edges.tolist(), "counts": counts.tolist()},
+    }
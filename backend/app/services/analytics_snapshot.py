@@ -0,0 +1,368 @@
+"""
+分析快照导出 - 按天分区的列式文件
+
+A/B 对比、导出报告原先逐天逐键读取 Redis 计数后在 Python 中循环计算。这里由导出任务
+把分析数据按天写成列式文件，分析查询只加载需要的日分区，用 NumPy 向量化计算
+（见 analytics_aggregation.py）：
+
+    <root>/<数据集>/date=YYYY-MM-DD/part.<parquet|arrow|npz>
+
+数据集：
+- emotion_logs:         情感日志（不含消息摘要）
+- relationship_history: 关系变化历史
+- chat_messages:        聊天消息元数据（会话/用户/伙伴、角色、长度，不含正文）
+- daily_counters:       Redis 中的每日 Prompt 使用量和质量反馈计数
+
+文件格式：安装了 pyarrow 时写 Parquet（zstd 压缩），pyarrow 不含 parquet 模块时写
+Arrow IPC；都不可用时退化为 NumPy 的 .npz（按列存储，不压缩以便直接读取）。字符串列字典编码，
+时间列统一为 UTC 毫秒时间戳（int64），空值写为 0 / 空字符串。同一天重复导出会覆盖该日分区。
+"""
+import logging
+import os
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.models.chat_session import ChatSession, ChatMessage
+from app.models.relationship import EmotionLog, RelationshipHistory
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+except ImportError:  # 可选依赖：未安装时写 .npz
+    pa = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 可能未编译 parquet 支持，此时写 Arrow IPC
+    pq = None
+
+logger = logging.getLogger("analytics_snapshot")
+
+FORMATS = ("parquet", "arrow", "npz")
+FORMAT_SUFFIX = {"parquet": ".parquet", "arrow": ".arrow", "npz": ".npz"}
+VALUES_SUFFIX = "__values"  # 字典编码列的取值数组
+
+# 数据集列定义：(列名, 类型)，类型为 int / bool / str / ts（UTC 毫秒）
+SCHEMAS: Dict[str, Sequence[Tuple[str, str]]] = {
+    "emotion_logs": (
+        ("id", "int"), ("user_id", "str"), ("companion_id", "str"), ("primary_emotion", "str"),
+        ("emotion_intensity", "int"), ("user_intent", "str"), ("affinity_change", "int"),
+        ("trust_change", "int"), ("tension_change", "int"), ("is_memorable", "bool"),
+        ("is_appropriate", "bool"), ("created_at", "ts"),
+    ),
+    "relationship_history": (
+        ("id", "int"), ("user_id", "str"), ("companion_id", "str"), ("change_type", "str"),
+        ("old_value", "str"), ("new_value", "str"), ("delta", "int"), ("created_at", "ts"),
+    ),
+    "chat_messages": (
+        ("id", "int"), ("session_id", "int"), ("user_id", "str"), ("companion_id", "int"),
+        ("role", "str"), ("content_length", "int"), ("tokens_used", "int"), ("timestamp", "ts"),
+    ),
+    "daily_counters": (
+        ("prompt_version", "str"), ("usage", "int"), ("total_score", "int"), ("feedback_count", "int"),
+    ),
+}
+
+
+def resolve_format(fmt: Optional[str] = None) -> str:
+    """auto 时按 parquet → arrow → npz 取第一个可用的格式"""
+    fmt = fmt or settings.ANALYTICS_SNAPSHOT_FORMAT
+    if fmt == "auto":
+        if pq is not None:
+            return "parquet"
+        return "arrow" if pa is not None else "npz"
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的快照格式: {fmt}（可选 auto / {' / '.join(FORMATS)}）")
+    if (fmt == "parquet" and pq is None) or (fmt == "arrow" and pa is None):
+        raise RuntimeError(f"未安装 pyarrow（或缺少 parquet 支持），无法写入 {fmt}")
+    return fmt
+
+
+def partition_dir(root: str, dataset: str, day: date) -> str:
+    return os.path.join(root, dataset, f"date={day.isoformat()}")
+
+
+def _to_millis(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):  # 已经是毫秒时间戳
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def to_columns(dataset: str, rows: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """把行转为按列的 NumPy 数组"""
+    schema = SCHEMAS[dataset]
+    values: Dict[str, List[Any]] = {name: [] for name, _ in schema}
+    for row in rows:
+        for name, _ in schema:
+            values[name].append(row.get(name))
+
+    columns: Dict[str, np.ndarray] = {}
+    for name, kind in schema:
+        data = values[name]
+        if kind == "int":
+            columns[name] = np.array([v or 0 for v in data], dtype=np.int64)
+        elif kind == "bool":
+            columns[name] = np.array([bool(v) for v in data], dtype=np.bool_)
+        elif kind == "ts":
+            columns[name] = np.array([_to_millis(v) for v in data], dtype=np.int64)
+        else:
+            columns[name] = np.array(["" if v is None else str(v) for v in data], dtype=np.str_)
+    return columns
+
+
+def _is_str(name: str, dataset: str) -> bool:
+    return dict(SCHEMAS[dataset]).get(name) == "str"
+
+
+def write_partition(root: str, dataset: str, day: date, columns: Dict[str, np.ndarray], fmt: str) -> str:
+    """
+    写入（覆盖）一个日分区，返回文件路径
+
+    字符串列按字典编码存储（整数编码 + 去重后的取值），读取方可以直接在编码上分组。
+    """
+    directory = partition_dir(root, dataset, day)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "part" + FORMAT_SUFFIX[fmt])
+    tmp_path = path + ".tmp"
+
+    encoded: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    for name, array in columns.items():
+        if _is_str(name, dataset):
+            values, codes = np.unique(array, return_inverse=True)
+            encoded[name] = (codes.astype(np.int32), values)
+
+    if fmt == "npz":
+        arrays = {}
+        for name, array in columns.items():
+            if name in encoded:
+                arrays[name], arrays[name + VALUES_SUFFIX] = encoded[name]
+            else:
+                arrays[name] = array
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+    else:
+        table = pa.table({
+            name: pa.DictionaryArray.from_arrays(pa.array(encoded[name][0]), pa.array(encoded[name][1]))
+            if name in encoded else pa.array(array)
+            for name, array in columns.items()
+        })
+        if fmt == "parquet":
+            pq.write_table(table, tmp_path, compression="zstd")
+        else:
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    # 换了格式重新导出时清理旧格式的文件
+    for other in FORMATS:
+        stale = os.path.join(directory, "part" + FORMAT_SUFFIX[other])
+        if other != fmt and os.path.exists(stale):
+            os.remove(stale)
+    return path
+
+
+def _arrow_column(table, name: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Arrow 列转为 (数组, 字典取值)；非字典列的取值为 None"""
+    column = table.column(name).combine_chunks()
+    if pa.types.is_dictionary(column.type):
+        return column.indices.to_numpy(zero_copy_only=False), column.dictionary.to_numpy(zero_copy_only=False).astype(str)
+    return column.to_numpy(zero_copy_only=False), None
+
+
+def read_partition(
+    root: str,
+    dataset: str,
+    day: date,
+    columns: Optional[Sequence[str]] = None,
+    encoded: bool = False
+) -> Optional[Dict[str, np.ndarray]]:
+    """
+    读取一个日分区（只加载需要的列），分区不存在时返回 None
+
+    Args:
+        encoded: 字符串列返回整数编码，取值放在 "<列名>__values"（分组聚合不必比较字符串）
+    """
+    names = list(columns or [name for name, _ in SCHEMAS[dataset]])
+    directory = partition_dir(root, dataset, day)
+    for fmt in FORMATS:
+        path = os.path.join(directory, "part" + FORMAT_SUFFIX[fmt])
+        if not os.path.exists(path):
+            continue
+        loaded: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]] = {}
+        if fmt == "npz":
+            with np.load(path, allow_pickle=False) as data:
+                for name in names:
+                    values_key = name + VALUES_SUFFIX
+                    loaded[name] = (data[name], data[values_key] if values_key in data.files else None)
+        else:
+            if pa is None:
+                raise RuntimeError(f"读取 {path} 需要 pyarrow")
+            if fmt == "parquet":
+                table = pq.read_table(path, columns=names)
+            else:
+                with pa.OSFile(path, "rb") as source:
+                    table = pa.ipc.open_file(source).read_all().select(names)
+            loaded = {name: _arrow_column(table, name) for name in names}
+
+        result: Dict[str, np.ndarray] = {}
+        for name, (array, values) in loaded.items():
+            if values is None:
+                result[name] = array
+            elif encoded:
+                result[name], result[name + VALUES_SUFFIX] = array, values
+            else:
+                result[name] = values[array]
+        return result
+    return None
+
+
+def read_range(
+    root: str,
+    dataset: str,
+    start: date,
+    end: date,
+    columns: Optional[Sequence[str]] = None,
+    encoded: bool = False
+) -> Dict[str, np.ndarray]:
+    """
+    读取 [start, end] 内所有存在的日分区并按列拼接，附加分区日期列 date
+
+    encoded 时各分区的字典合并为一个，编码重新映射到合并后的取值上。
+    """
+    names = list(columns or [name for name, _ in SCHEMAS[dataset]])
+    parts = []
+    day = start
+    while day <= end:
+        part = read_partition(root, dataset, day, names, encoded)
+        if part is not None:
+            part["date"] = np.full(len(part[names[0]]), day.isoformat(), dtype="<U10")
+            parts.append(part)
+        day += timedelta(days=1)
+
+    if not parts:
+        empty = to_columns(dataset, [])
+        result = {name: empty[name] for name in names}
+        if encoded:
+            for name in names:
+                if _is_str(name, dataset):
+                    result[name] = np.array([], dtype=np.int32)
+                    result[name + VALUES_SUFFIX] = np.array([], dtype=np.str_)
+        result["date"] = np.array([], dtype="<U10")
+        return result
+
+    result = {}
+    for name in names + ["date"]:
+        values_key = name + VALUES_SUFFIX
+        if values_key in parts[0]:
+            merged = np.unique(np.concatenate([part[values_key] for part in parts]))
+            result[name] = np.concatenate([
+                np.searchsorted(merged, part[values_key]).astype(np.int32)[part[name]] for part in parts
+            ])
+            result[values_key] = merged
+        else:
+            result[name] = np.concatenate([part[name] for part in parts])
+    return result
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, dt_time.min)
+    return start, start + timedelta(days=1)
+
+
+def _dataset_queries(day: date) -> Dict[str, Any]:
+    start, end = _day_bounds(day)
+    return {
+        "emotion_logs": select(
+            EmotionLog.id, EmotionLog.user_id, EmotionLog.companion_id, EmotionLog.primary_emotion,
+            EmotionLog.emotion_intensity, EmotionLog.user_intent, EmotionLog.affinity_change,
+            EmotionLog.trust_change, EmotionLog.tension_change, EmotionLog.is_memorable,
+            EmotionLog.is_appropriate, EmotionLog.created_at
+        ).where(and_(EmotionLog.created_at >= start, EmotionLog.created_at < end)).order_by(EmotionLog.id),
+        "relationship_history": select(
+            RelationshipHistory.id, RelationshipHistory.user_id, RelationshipHistory.companion_id,
+            RelationshipHistory.change_type, RelationshipHistory.old_value, RelationshipHistory.new_value,
+            RelationshipHistory.delta, RelationshipHistory.created_at
+        ).where(and_(RelationshipHistory.created_at >= start, RelationshipHistory.created_at < end))
+        .order_by(RelationshipHistory.id),
+        "chat_messages": select(
+            ChatMessage.id, ChatMessage.session_id, ChatSession.user_id, ChatSession.companion_id,
+            ChatMessage.role, func.length(ChatMessage.content).label("content_length"),
+            ChatMessage.tokens_used, ChatMessage.timestamp
+        ).join(ChatSession, ChatSession.id == ChatMessage.session_id)
+        .where(and_(ChatMessage.timestamp >= start, ChatMessage.timestamp < end)).order_by(ChatMessage.id),
+    }
+
+
+async def collect_daily_counters(redis, versions: Sequence[str], day: date) -> List[Dict[str, Any]]:
+    """一次往返读取某天所有 Prompt 版本的使用量和质量计数"""
+    date_str = day.isoformat()
+    pipe = redis.pipeline()
+    for version in versions:
+        pipe.get(f"stats:prompt:{version}:{date_str}")
+        pipe.hgetall(f"stats:quality:{version}:{date_str}")
+    results = await pipe.execute()
+    rows = []
+    for index, version in enumerate(versions):
+        usage, quality = results[2 * index], results[2 * index + 1] or {}
+        rows.append({
+            "prompt_version": version,
+            "usage": int(usage or 0),
+            "total_score": int(quality.get("total_score", 0)),
+            "feedback_count": int(quality.get("feedback_count", 0)),
+        })
+    return rows
+
+
+async def export_day(
+    day: date,
+    root: Optional[str] = None,
+    fmt: Optional[str] = None,
+    engine: Optional[AsyncEngine] = None,
+    redis=None,
+    versions: Optional[Sequence[str]] = None
+) -> Dict[str, int]:
+    """
+    导出一天的所有数据集
+
+    Args:
+        redis: 提供时同时导出当天的 Redis 计数（daily_counters）
+        versions: 计数对应的 Prompt 版本，默认 PROMPT_VERSION_MAP 中的全部版本
+
+    Returns:
+        每个数据集写入的行数
+    """
+    root = root or settings.ANALYTICS_SNAPSHOT_DIRECTORY
+    engine = engine or async_engine
+    fmt = resolve_format(fmt)
+    written: Dict[str, int] = {}
+
+    async with engine.connect() as conn:
+        for dataset, stmt in _dataset_queries(day).items():
+            result = await conn.stream(stmt.execution_options(yield_per=settings.ANALYTICS_SNAPSHOT_BATCH_ROWS))
+            rows = [dict(row) async for row in result.mappings()]
+            write_partition(root, dataset, day, to_columns(dataset, rows), fmt)
+            written[dataset] = len(rows)
+
+    if redis is not None:
+        if versions is None:
+            from app.core.prompts import PROMPT_VERSION_MAP
+            versions = list(PROMPT_VERSION_MAP)
+        rows = await collect_daily_counters(redis, versions, day)
+        write_partition(root, "daily_counters", day, to_columns("daily_counters", rows), fmt)
+        written["daily_counters"] = len(rows)
+
+    logger.info(f"📦 分析快照 {day.isoformat()} 已导出 ({fmt}): {written}")
+    return written
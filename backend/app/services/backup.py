@@ -0,0 +1,414 @@
+"""
+数据库增量备份与批量恢复
+
+原先只有 /api/export/backup/full 把一个用户的数据拼成单个 JSON 文档，没有恢复路径；
+rebuild_database.py / init_*.py 都是逐行插入。这里提供整库的增量备份格式：
+
+- 每个备份是一个目录，内含 manifest.json 和每张表一个 NDJSON 分段
+  （<表名>.ndjson.gz，安装了 zstandard 时可用 .ndjson.zst）
+- manifest 记录每张表的高水位：有更新时间列的表按 coalesce(更新时间, 创建时间)，
+  只追加的表按自增主键。增量备份只导出高水位之后变化的行，并在 base 中记录上一个备份
+- 读取用服务端游标 stream() + yield_per，边读边压缩写出，内存与表大小无关
+- 恢复沿 base 链从全量备份开始按顺序重放，每批行一次 executemany 的 upsert
+  （同一行在后续增量中再次出现时覆盖）；Postgres 上空表的全量分段用 COPY 导入
+
+应用只做软删除，删除的行以状态列的变化体现在增量中；物理删除不会被增量捕获。
+恢复目标应为空库，或者是同一备份链之前恢复出的库。
+"""
+import gzip
+import io
+import json
+import os
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, DateTime, Integer, JSON, Table, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.config import settings
+from app.core.database import Base, async_engine
+import app.models  # noqa: F401  注册所有模型的表
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：未安装时只能使用 gzip
+    zstandard = None
+
+BACKUP_FORMAT = "ai-companion-backup"
+BACKUP_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+COMPRESSIONS = ("gzip", "zstd")
+SEGMENT_SUFFIX = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+# 高水位列：按顺序取表中存在的第一个更新列和第一个创建列
+UPDATE_COLUMNS = ("updated_at", "completed_at", "shared_at")
+CREATE_COLUMNS = ("created_at", "generated_at", "triggered_at", "timestamp")
+
+
+def resolve_compression(compression: Optional[str] = None) -> str:
+    """auto 时优先 zstd（需要 zstandard），否则 gzip"""
+    compression = compression or settings.BACKUP_COMPRESSION
+    if compression == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"未知的压缩格式: {compression}（可选 auto / {' / '.join(COMPRESSIONS)}）")
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("未安装 zstandard，无法使用 zstd 压缩")
+    return compression
+
+
+def open_segment(path: str, mode: str, compression: str):
+    """以文本方式打开压缩分段（mode 为 'r' 或 'w'）"""
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("未安装 zstandard，无法读取 zstd 分段")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+
+
+def backup_tables() -> List[Table]:
+    """按外键依赖排序的全部表（恢复时父表先于子表）"""
+    return list(Base.metadata.sorted_tables)
+
+
+def mark_spec(table: Table) -> Tuple[str, Any]:
+    """
+    表的高水位定义
+
+    Returns:
+        ("timestamp", 表达式)：有更新时间列的表，捕获新增和修改
+        ("id", 主键列)：只追加的表，只捕获新增
+    """
+    updated = [table.c[name] for name in UPDATE_COLUMNS if name in table.c]
+    created = [table.c[name] for name in CREATE_COLUMNS if name in table.c]
+    if updated:
+        columns = updated[:1] + created[:1]
+        return "timestamp", func.coalesce(*columns, type_=columns[0].type)
+    primary_key = list(table.primary_key.columns)
+    if len(primary_key) == 1 and isinstance(primary_key[0].type, Integer):
+        return "id", primary_key[0]
+    return "full", None
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def _encode_mark(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _decode_mark(kind: str, value: Any) -> Any:
+    if kind == "timestamp" and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _row_converter(table: Table) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """NDJSON 中的日期时间是 ISO 字符串，恢复前转回 Python 对象"""
+    parsers = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            parsers[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            parsers[column.name] = date.fromisoformat
+
+    def convert(row: Dict[str, Any]) -> Dict[str, Any]:
+        for name, parse in parsers.items():
+            value = row.get(name)
+            if isinstance(value, str):
+                row[name] = parse(value)
+        return row
+
+    return convert
+
+
+def read_manifest(backup_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(backup_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BACKUP_FORMAT:
+        raise ValueError(f"{backup_dir} 不是数据库备份目录")
+    return manifest
+
+
+def latest_backup(root: str) -> Optional[str]:
+    """root 下最新的备份目录（备份ID按时间排序）"""
+    if not os.path.isdir(root):
+        return None
+    candidates = sorted(
+        name for name in os.listdir(root)
+        if os.path.isfile(os.path.join(root, name, MANIFEST_NAME))
+    )
+    return os.path.join(root, candidates[-1]) if candidates else None
+
+
+def backup_chain(backup_dir: str) -> List[str]:
+    """沿 base 回溯到全量备份，返回从全量到 backup_dir 的目录列表"""
+    chain = []
+    current: Optional[str] = os.path.abspath(backup_dir)
+    while current:
+        if current in chain:
+            raise ValueError(f"备份链存在循环: {current}")
+        chain.append(current)
+        base = read_manifest(current).get("base")
+        if base:
+            current = os.path.join(os.path.dirname(current), base)
+            if not os.path.isfile(os.path.join(current, MANIFEST_NAME)):
+                raise FileNotFoundError(f"找不到基础备份: {current}")
+        else:
+            current = None
+    return list(reversed(chain))
+
+
+async def _backup_table(
+    conn: AsyncConnection,
+    table: Table,
+    backup_dir: str,
+    compression: str,
+    previous: Optional[Dict[str, Any]],
+    batch_rows: int
+) -> Dict[str, Any]:
+    kind, mark_expr = mark_spec(table)
+    stmt = select(table)
+    if mark_expr is not None:
+        stmt = stmt.add_columns(mark_expr.label("_mark"))
+        previous_mark = (previous or {}).get("mark") or {}
+        if previous_mark.get("kind") == kind and previous_mark.get("value") is not None:
+            since = _decode_mark(kind, previous_mark["value"])
+            # 时间戳高水位取 >=：同一时刻的其它行不会漏掉，重复的行在恢复时被 upsert 覆盖
+            stmt = stmt.where(mark_expr >= since if kind == "timestamp" else mark_expr > since)
+        high_water = previous_mark.get("value") if previous_mark.get("kind") == kind else None
+    else:
+        high_water = None
+    primary_key = list(table.primary_key.columns)
+    if primary_key:
+        stmt = stmt.order_by(*primary_key)
+
+    filename = table.name + SEGMENT_SUFFIX[compression]
+    path = os.path.join(backup_dir, filename)
+    rows = 0
+    max_mark = None
+    started = time.perf_counter()
+
+    result = await conn.stream(stmt.execution_options(yield_per=batch_rows))
+    with open_segment(path, "w", compression) as segment:
+        async for partition in result.mappings().partitions():
+            lines = []
+            for row in partition:
+                record = dict(row)
+                mark = record.pop("_mark", None)
+                if mark is not None and (max_mark is None or mark > max_mark):
+                    max_mark = mark
+                lines.append(json.dumps(record, ensure_ascii=False, default=_json_default, separators=(",", ":")))
+            segment.write("\n".join(lines))
+            segment.write("\n")
+            rows += len(lines)
+
+    if rows == 0:
+        os.remove(path)
+        filename = None
+    if max_mark is not None:
+        high_water = _encode_mark(max_mark)
+
+    return {
+        "file": filename,
+        "rows": rows,
+        "seconds": round(time.perf_counter() - started, 4),
+        "mark": {"kind": kind, "value": high_water} if kind != "full" else None,
+    }
+
+
+async def run_backup(
+    root: Optional[str] = None,
+    incremental: bool = True,
+    compression: Optional[str] = None,
+    engine: Optional[AsyncEngine] = None,
+    batch_rows: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    备份整个数据库到 root 下新的备份目录
+
+    Args:
+        root: 备份根目录，默认 BACKUP_DIRECTORY
+        incremental: 存在之前的备份时只导出其高水位之后变化的行
+        compression: auto / gzip / zstd
+
+    Returns:
+        写入的 manifest（附带 path 和 rows_per_second）
+    """
+    root = root or settings.BACKUP_DIRECTORY
+    engine = engine or async_engine
+    batch_rows = batch_rows or settings.BACKUP_BATCH_ROWS
+    compression = resolve_compression(compression)
+
+    base_dir = latest_backup(root) if incremental else None
+    base_manifest = read_manifest(base_dir) if base_dir else None
+
+    now = datetime.now(timezone.utc)
+    backup_id = now.strftime("%Y%m%dT%H%M%S%fZ")
+    backup_dir = os.path.join(root, backup_id)
+    os.makedirs(backup_dir, exist_ok=False)
+
+    manifest: Dict[str, Any] = {
+        "format": BACKUP_FORMAT,
+        "version": BACKUP_VERSION,
+        "backup_id": backup_id,
+        "created_at": now.isoformat(),
+        "base": base_manifest["backup_id"] if base_manifest else None,
+        "dialect": engine.dialect.name,
+        "compression": compression,
+        "tables": {},
+    }
+
+    started = time.perf_counter()
+    # 单个只读事务内导出所有表，各表高水位来自同一快照
+    async with engine.connect() as conn:
+        for table in backup_tables():
+            previous = base_manifest["tables"].get(table.name) if base_manifest else None
+            manifest["tables"][table.name] = await _backup_table(
+                conn, table, backup_dir, compression, previous, batch_rows
+            )
+    elapsed = time.perf_counter() - started
+
+    total_rows = sum(entry["rows"] for entry in manifest["tables"].values())
+    manifest["rows"] = total_rows
+    manifest["seconds"] = round(elapsed, 4)
+
+    # manifest 最后写入：没有 manifest 的目录不会被当作备份
+    tmp_path = os.path.join(backup_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(backup_dir, MANIFEST_NAME))
+
+    return {**manifest, "path": backup_dir, "rows_per_second": total_rows / elapsed if elapsed else 0.0}
+
+
+def _read_batches(path: str, compression: str, batch_rows: int) -> Iterable[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    with open_segment(path, "r", compression) as segment:
+        for line in segment:
+            if not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _upsert_statement(dialect_name: str, table: Table):
+    """按主键 upsert：同一行在后续增量中再次出现时以新值覆盖"""
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table)
+    stmt = dialect_insert(table)
+    primary_key = [column.name for column in table.primary_key.columns]
+    updates = {column.name: stmt.excluded[column.name] for column in table.columns if not column.primary_key}
+    if not primary_key or not updates:
+        return stmt
+    return stmt.on_conflict_do_update(index_elements=primary_key, set_=updates)
+
+
+async def _copy_into(conn: AsyncConnection, table: Table, batch: List[Dict[str, Any]]):
+    """Postgres 空表用 COPY 导入（asyncpg copy_records_to_table）"""
+    columns = [column.name for column in table.columns]
+    json_columns = {column.name for column in table.columns if isinstance(column.type, JSON)}
+    records = [
+        tuple(
+            json.dumps(row.get(name), ensure_ascii=False) if name in json_columns and row.get(name) is not None
+            else row.get(name)
+            for name in columns
+        )
+        for row in batch
+    ]
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(table.name, records=records, columns=columns)
+
+
+async def _reset_sequences(conn: AsyncConnection, tables: List[Table]):
+    """Postgres 显式写入主键后需要把序列推进到最大值"""
+    for table in tables:
+        primary_key = list(table.primary_key.columns)
+        if len(primary_key) != 1 or not isinstance(primary_key[0].type, Integer):
+            continue
+        name = primary_key[0].name
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', '{name}'), "
+            f"COALESCE((SELECT MAX({name}) FROM {table.name}), 0) + 1, false)"
+        ))
+
+
+async def run_restore(
+    backup_dir: str,
+    engine: Optional[AsyncEngine] = None,
+    batch_rows: Optional[int] = None,
+    create_schema: bool = True
+) -> Dict[str, Any]:
+    """
+    从备份链恢复到 engine 指向的数据库
+
+    Args:
+        backup_dir: 备份目录（增量备份会自动先恢复其 base 链）
+        create_schema: 恢复前 create_all 建表
+
+    Returns:
+        每张表的恢复行数和总吞吐（rows_per_second）
+    """
+    engine = engine or async_engine
+    batch_rows = batch_rows or settings.BACKUP_BATCH_ROWS
+    chain = backup_chain(backup_dir)
+    tables = backup_tables()
+    dialect_name = engine.dialect.name
+    use_copy = dialect_name == "postgresql" and engine.dialect.driver == "asyncpg"
+
+    if create_schema:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    restored: Dict[str, int] = {table.name: 0 for table in tables}
+    started = time.perf_counter()
+    for position, directory in enumerate(chain):
+        manifest = read_manifest(directory)
+        compression = manifest["compression"]
+        async with engine.begin() as conn:
+            for table in tables:
+                entry = manifest["tables"].get(table.name)
+                if not entry or not entry.get("file"):
+                    continue
+                convert = _row_converter(table)
+                copy = use_copy and position == 0 and not (
+                    await conn.execute(select(func.count()).select_from(table))
+                ).scalar()
+                stmt = None if copy else _upsert_statement(dialect_name, table)
+                path = os.path.join(directory, entry["file"])
+                for batch in _read_batches(path, compression, batch_rows):
+                    batch = [convert(row) for row in batch]
+                    if copy:
+                        await _copy_into(conn, table, batch)
+                    else:
+                        await conn.execute(stmt, batch)
+                    restored[table.name] += len(batch)
+            if dialect_name == "postgresql":
+                await _reset_sequences(conn, tables)
+    elapsed = time.perf_counter() - started
+
+    total_rows = sum(restored.values())
+    return {
+        "chain": [os.path.basename(directory) for directory in chain],
+        "tables": restored,
+        "rows": total_rows,
+        "seconds": round(elapsed, 4),
+        "rows_per_second": total_rows / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,169 @@
+"""
+变更订阅 - chat_messages / emotion_logs / relationship_history 的增量变更流
+
+分析侧原先轮询导出接口、每次重新下载全部数据。这里在持久化时把新行追加到
+change_log 表（与业务行同一事务），订阅方凭不透明游标只读取之后的新变更：
+
+- 游标是 base64url 编码的 {"id": 变更日志ID, "ts": 写入时间}，按 id 做 keyset 分页，
+  读取只走 change_log 主键，不扫描业务表
+- 提交后 notify() 唤醒进程内等待的长轮询 / SSE 订阅，没有新变更时不查库
+- 多进程部署时其它进程的写入靠等待超时后的重新查询发现
+"""
+import asyncio
+import base64
+import binascii
+import json
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.change_log import ChangeLog
+
+# 写入变更日志的来源表
+TRACKED_TABLES = ("chat_messages", "emotion_logs", "relationship_history")
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(change_id: int, created_at: Optional[datetime]) -> str:
+    payload = {"id": change_id, "ts": created_at.isoformat() if created_at else None}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """解析游标，返回其中的变更日志ID（空游标表示从头开始）"""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        change_id = json.loads(raw)["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"无效的游标: {cursor}") from e
+    if not isinstance(change_id, int) or change_id < 0:
+        raise InvalidCursor(f"无效的游标: {cursor}")
+    return change_id
+
+
+def is_tracked(model: Any) -> bool:
+    return getattr(model, "__tablename__", None) in TRACKED_TABLES
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+async def record_changes(db: AsyncSession, model: Any, rows: Iterable[Any]):
+    """
+    在调用方的事务中为新写入的行追加变更日志（调用方负责提交，提交后调用 notify()）
+
+    Args:
+        model: 来源表的 ORM 模型
+        rows: 已带主键的整行（Row / 映射 / ORM 对象）
+    """
+    columns = [column.name for column in model.__table__.columns]
+    now = datetime.utcnow()
+    entries = []
+    for row in rows:
+        if hasattr(row, "_mapping"):
+            data = dict(row._mapping)
+        elif isinstance(row, dict):
+            data = row
+        else:
+            data = {name: getattr(row, name) for name in columns}
+        entries.append({
+            "source_table": model.__tablename__,
+            "row_id": data["id"],
+            "payload": {name: _jsonable(data.get(name)) for name in columns},
+            "created_at": now,
+        })
+    if entries:
+        await db.execute(insert(ChangeLog), entries)
+
+
+class ChangeFeed:
+    """变更日志的读取与进程内通知"""
+
+    def __init__(self, settle_seconds: Optional[float] = None):
+        """
+        Args:
+            settle_seconds: 只返回写入超过该秒数的变更，默认取 CHANGE_FEED_SETTLE_SECONDS
+                （多写者数据库上 id 可能不按提交顺序可见，留出窗口避免游标跳过晚提交的行）
+        """
+        self.settle_seconds = settings.CHANGE_FEED_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.version = 0  # 通知序号，每次 notify() 加一
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def notify(self):
+        """有新变更提交后调用，唤醒等待中的订阅"""
+        condition = self._get_condition()
+        async with condition:
+            self.version += 1
+            condition.notify_all()
+
+    async def wait(self, seen: int, timeout: float) -> int:
+        """
+        等待 notify()，超时也返回
+
+        Args:
+            seen: 调用方上次看到的通知序号（self.version）
+        Returns:
+            当前通知序号
+        """
+        condition = self._get_condition()
+        async with condition:
+            if self.version == seen:
+                try:
+                    await asyncio.wait_for(condition.wait_for(lambda: self.version != seen), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.version
+
+    async def fetch(
+        self,
+        db: AsyncSession,
+        after_id: int,
+        limit: int,
+        tables: Optional[Sequence[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        读取 after_id 之后的一页变更
+
+        Returns:
+            (变更列表, 是否还有更多)
+        """
+        stmt = select(ChangeLog).where(ChangeLog.id > after_id)
+        if tables:
+            stmt = stmt.where(ChangeLog.source_table.in_(tables))
+        if self.settle_seconds > 0:
+            stmt = stmt.where(ChangeLog.created_at <= datetime.utcnow() - timedelta(seconds=self.settle_seconds))
+        result = await db.execute(stmt.order_by(ChangeLog.id).limit(limit + 1))
+        entries = result.scalars().all()
+        has_more = len(entries) > limit
+        changes = [
+            {
+                "cursor": encode_cursor(entry.id, entry.created_at),
+                "table": entry.source_table,
+                "row_id": entry.row_id,
+                "created_at": entry.created_at.isoformat() if entry.created_at else None,
+                "data": entry.payload,
+            }
+            for entry in entries[:limit]
+        ]
+        return changes, has_more
+
+
+# 全局实例
+change_feed = ChangeFeed()
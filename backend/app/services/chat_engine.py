@@ -4,7 +4,8 @@
 """
 import asyncio
 import logging
-from typing import Dict, List, Optional, AsyncIterator
+from datetime import datetime
+from typing import Dict, List, Optional, Set, AsyncIterator
 import socketio
 from app.services.memory_manager import memory_manager, content_filter
 from app.services.redis_utils import (
@@ -16,6 +17,13 @@ from app.services.analytics import analytics_service
 from app.services.hot_cache import hot_conversation_cache
 from app.services.personal_timeline_simulator import timeline_simulator
 from app.services.response_coordinator import response_coordinator
+from app.services.fact_accumulator import fact_accumulator
+from app.services.session_prefetch import session_prefetcher, companion_info_cache
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.write_behind import write_behind_queue
+from app.services.history_cache import chat_history_cache
+from app.services.history_pages import recent_messages_statement
+from app.services.companion_listing import companion_list_cache
 from app.core.config import settings
 from app.models.companion import Companion
 from app.models.chat_session import ChatSession, ChatMessage
@@ -33,6 +41,7 @@ class ChatEngine:
     def __init__(self):
         self.active_sessions: Dict[str, Dict] = {}
         self.last_completed_tasks: Dict[str, List[Dict]] = {}  # 存储最近完成的任务 {sid: [tasks]}
+        self._background_tasks: Set[asyncio.Task] = set()  # 会话结束后的后台提取任务（保留引用，避免被回收）
     
     async def create_session(self, session_id: str, companion_id: int, user_id: str, chat_session_id: Optional[int] = None):
         """创建聊天会话"""
@@ -58,6 +67,7 @@ class ChatEngine:
                     await db.commit()
                     await db.refresh(chat_session)
                     chat_session_id = chat_session.id
+                    companion_list_cache.invalidate_companion(companion_id)
                     
                     logger.info(f"创建数据库会话: {chat_session_id}")
             except Exception as e:
@@ -84,59 +94,52 @@ class ChatEngine:
         
         logger.info(f"创建聊天会话: {session_id}, 伙伴ID: {companion_id}, 数据库会话ID: {chat_session_id}")
     
-    async def save_message_to_db(self, session_id: str, role: str, content: str) -> bool:
-        """保存消息到数据库"""
+    async def save_turn_to_db(self, chat_session_id: Optional[int], messages: List[Dict]) -> bool:
+        """
+        以一个工作单元保存一轮对话
+
+        所有消息批量 INSERT，会话的 total_messages 用原子 UPDATE 累加（并发的轮次
+        不会互相覆盖计数），整轮在同一事务中提交。写入合并队列运行时，同一时刻的
+        多个轮次合并为一次组提交；本方法等待提交完成后返回。
+
+        Args:
+            chat_session_id: 数据库会话ID
+            messages: 按时间顺序的消息 [{"role": ..., "content": ..., "timestamp": 可选}]
+        """
+        if not chat_session_id or not messages:
+            return False
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                'session_id': chat_session_id,
+                'role': message['role'],
+                'content': message['content'],
+                'timestamp': message.get('timestamp') or now
+            }
+            for message in messages
+        ]
         try:
-            session = self.active_sessions.get(session_id)
-            if not session or not session.get('chat_session_id'):
-                return False
-            
-            async with async_session_maker() as db:
-                message = ChatMessage(
-                    session_id=session['chat_session_id'],
-                    role=role,
-                    content=content
-                )
-                db.add(message)
-                
-                # 更新会话统计
-                chat_session_stmt = select(ChatSession).where(ChatSession.id == session['chat_session_id'])
-                result = await db.execute(chat_session_stmt)
-                chat_session = result.scalar_one_or_none()
-                
-                if chat_session:
-                    chat_session.total_messages += 1
-                
-                await db.commit()
-                return True
+            await write_behind_queue.write(
+                ChatMessage, rows,
+                increments=[(ChatSession, chat_session_id, 'total_messages', len(rows))]
+            )
+            await chat_history_cache.append(chat_session_id, rows)
+            return True
         except Exception as e:
-            logger.error(f"保存消息到数据库失败: {e}")
+            logger.error(f"保存对话到数据库失败: {e}")
             return False
-    
+
+    async def save_message_to_db(self, session_id: str, role: str, content: str) -> bool:
+        """保存消息到数据库"""
+        session = self.active_sessions.get(session_id)
+        if not session or not session.get('chat_session_id'):
+            return False
+        return await self.save_turn_to_db(session['chat_session_id'], [{'role': role, 'content': content}])
+
     async def save_message_to_db_by_session_id(self, db_session_id: int, role: str, content: str) -> bool:
         """直接通过数据库会话ID保存消息到数据库"""
-        try:
-            async with async_session_maker() as db:
-                message = ChatMessage(
-                    session_id=db_session_id,
-                    role=role,
-                    content=content
-                )
-                db.add(message)
-                
-                # 更新会话统计
-                chat_session_stmt = select(ChatSession).where(ChatSession.id == db_session_id)
-                result = await db.execute(chat_session_stmt)
-                chat_session = result.scalar_one_or_none()
-                
-                if chat_session:
-                    chat_session.total_messages += 1
-                
-                await db.commit()
-                return True
-        except Exception as e:
-            logger.error(f"保存消息到数据库失败: {e}")
-            return False
+        return await self.save_turn_to_db(db_session_id, [{'role': role, 'content': content}])
     
     async def load_chat_history(self, session_id: str, limit: int = 10) -> List[Dict]:
         """从数据库加载聊天历史"""
@@ -151,14 +154,18 @@ class ChatEngine:
             return []
     
     async def load_chat_history_by_session_id(self, chat_session_id: int, limit: int = 10) -> List[Dict]:
-        """根据会话ID从数据库加载聊天历史"""
+        """根据会话ID加载聊天历史（优先读 Redis 历史缓存，未命中时查数据库并回填）"""
+        cached = await chat_history_cache.get(chat_session_id, limit)
+        if cached is not None:
+            return cached
+
+        # 先读版本号再查库：查库期间有新消息提交时放弃回填
+        cache_version = await chat_history_cache.version(chat_session_id)
         try:
+            # 未命中时按缓存容量加载，回填后后续不同 limit 的读取都能命中
+            fetch_limit = max(limit, chat_history_cache.size)
             async with async_session_maker() as db:
-                stmt = select(ChatMessage).where(
-                    ChatMessage.session_id == chat_session_id
-                ).order_by(ChatMessage.timestamp.desc()).limit(limit)
-                
-                result = await db.execute(stmt)
+                result = await db.execute(recent_messages_statement(chat_session_id, fetch_limit))
                 messages = result.scalars().all()
                 
                 # 转换为字典格式并按时间正序排列
@@ -169,8 +176,9 @@ class ChatEngine:
                         'content': msg.content,
                         'timestamp': msg.timestamp.isoformat()
                     })
-                
-                return history
+
+            await chat_history_cache.populate(chat_session_id, history, cache_version)
+            return history[-limit:] if limit > 0 else []
         except Exception as e:
             logger.error(f"根据会话ID加载聊天历史失败: {e}")
             return []
@@ -182,12 +190,24 @@ class ChatEngine:
     async def remove_session(self, session_id: str):
         """移除聊天会话"""
         if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+            session = self.active_sessions.pop(session_id)
+            # 快速断开时取消尚未完成的预热
+            session_prefetcher.cancel(session)
             await memory_manager.clear_session(session_id)
+            # 会话结束时提取累积窗口中的事实（后台执行，不阻塞断开流程）
+            task = asyncio.create_task(
+                fact_accumulator.flush(str(session['user_id']), session['companion_id'], reason="session_end")
+            )
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
             logger.info(f"移除聊天会话: {session_id}")
     
     async def get_companion_info(self, companion_id: int) -> Optional[Dict]:
-        """获取伙伴信息"""
+        """获取伙伴信息（进程内缓存，伙伴修改/重置/删除时失效）"""
+        cached = companion_info_cache.get(companion_id)
+        if cached is not None:
+            return cached
+
         try:
             async with async_session_maker() as db:
                 result = await db.execute(
@@ -198,13 +218,15 @@ class ChatEngine:
                 if not companion:
                     return None
                 
-                return {
+                info = {
                     'id': companion.id,
                     'name': companion.name,
                     'personality_archetype': getattr(companion, 'personality_archetype', 'companion'),
                     'description': getattr(companion, 'custom_greeting', ''),
                     'prompt_version': getattr(companion, 'prompt_version', 'v1')
                 }
+                companion_info_cache.set(companion_id, info)
+                return info
         except Exception as e:
             logger.error(f"获取伙伴信息失败: {e}")
             return None
@@ -215,6 +237,10 @@ class ChatEngine:
         if not session:
             yield "抱歉，会话已过期，请刷新页面重试。"
             return
+
+        # 本轮消息在回复完成后一次性写入数据库；提前返回、出错或客户端断开时由 finally 补写
+        turn_messages: List[Dict] = []
+        turn_saved = False
         
         try:
             # 内容安全检查
@@ -222,6 +248,7 @@ class ChatEngine:
             if not is_safe and filter_reason:
                 yield content_filter.get_filtered_response(filter_reason)
                 return
+            turn_messages.append({'role': 'user', 'content': user_message, 'timestamp': datetime.utcnow()})
 
             # 更新 Redis 会话活跃时间
             await redis_session_manager.update_session_activity(session_id)
@@ -238,18 +265,18 @@ class ChatEngine:
                 await redis_stats_manager.increment_counter("cache_hits")
                 yield cached_response
                 # 保存用户消息和缓存回复到数据库
-                await self.save_message_to_db(session_id, "user", user_message)
-                await self.save_message_to_db(session_id, "assistant", cached_response)
+                turn_messages.append({'role': 'assistant', 'content': cached_response})
+                turn_saved = await self.save_turn_to_db(session.get('chat_session_id'), turn_messages)
                 return
 
-            # 保存用户消息到数据库
-            await self.save_message_to_db(session_id, "user", user_message)
-            
             # 添加用户消息到内存会话
             await memory_manager.add_message(session_id, "user", user_message)
-            
+
+            # 首条消息使用 join_chat 时的预取结果
+            prefetched = await session_prefetcher.take(session)
+
             # 获取伙伴信息
-            companion_info = await self.get_companion_info(session['companion_id'])
+            companion_info = (prefetched and prefetched.companion_info) or await self.get_companion_info(session['companion_id'])
             if not companion_info:
                 yield "抱歉，找不到对应的AI伙伴信息。"
                 return
@@ -264,20 +291,28 @@ class ChatEngine:
                 # 先提及离线生活日志
                 offline_mention = self._format_offline_life_mention(important_logs)
                 yield offline_mention
-                # 保存离线生活提及到数据库
-                await self.save_message_to_db(session_id, "assistant", offline_mention)
+                # 离线生活提及随本轮对话一起保存
+                turn_messages.append({'role': 'assistant', 'content': offline_mention, 'timestamp': datetime.utcnow()})
                 await memory_manager.add_message(session_id, "assistant", offline_mention)
 
-            # 获取会话上下文（优先从数据库加载历史）
-            conversation_history = await self.load_chat_history(session_id, limit=8)
+            # 获取会话上下文（优先从数据库加载历史；本轮用户消息由协调器追加）
+            conversation_history = self._prefetched_history(prefetched, session.get('chat_session_id'))
+            if conversation_history is None:
+                conversation_history = await self.load_chat_history(session_id, limit=settings.CONVERSATION_HISTORY_MESSAGES)
             if not conversation_history:
                 conversation_history = await memory_manager.get_session_context(session_id)
 
             # 获取当前伙伴状态
-            companion_state = await redis_affinity_manager.get_companion_state(
-                str(session['user_id']),
-                session['companion_id']
-            ) or {}
+            if prefetched and prefetched.companion_state is not None:
+                companion_state = prefetched.companion_state
+            else:
+                companion_state = await redis_affinity_manager.get_companion_state(
+                    str(session['user_id']),
+                    session['companion_id']
+                ) or {}
+
+            # 更早的对话由滚动摘要覆盖
+            conversation_summary = await conversation_summarizer.get_summary(session.get('chat_session_id'))
 
             # 协调生成回复
             coordinated_response = await response_coordinator.coordinate_response(
@@ -293,6 +328,9 @@ class ChatEngine:
                 current_mood=companion_state.get('current_mood', 'neutral'),
                 conversation_history=conversation_history,
                 enable_memory=True,
+                prefetched_facts=prefetched.user_facts if prefetched else None,
+                conversation_summary=conversation_summary,
+                prompt_version=companion_info.get('prompt_version', 'v1'),
                 special_instructions=None,
                 debug_mode=False
             )
@@ -315,10 +353,14 @@ class ChatEngine:
             for chunk in self._chunk_response(assistant_response):
                 yield chunk
 
-            # 保存助手回复到数据库和内存
+            # 保存本轮对话到数据库，助手回复写入内存
+            if assistant_response:
+                turn_messages.append({'role': 'assistant', 'content': assistant_response})
+            turn_saved = await self.save_turn_to_db(session.get('chat_session_id'), turn_messages)
+
             if assistant_response:
-                await self.save_message_to_db(session_id, "assistant", assistant_response)
                 await memory_manager.add_message(session_id, "assistant", assistant_response)
+                conversation_summarizer.schedule(session.get('chat_session_id'))
 
                 # 检查是否为高质量回复，缓存到热门对话
                 if 50 < len(assistant_response) < 1000:
@@ -336,6 +378,10 @@ class ChatEngine:
             # 增加错误统计
             await redis_stats_manager.increment_counter("error_responses")
             yield "抱歉，我现在遇到了一些技术问题，请稍后再试。😅"
+        finally:
+            # GeneratorExit / CancelledError 不经过 except Exception，这里保证用户消息不丢
+            if turn_messages and not turn_saved:
+                await self.save_turn_to_db(session.get('chat_session_id'), turn_messages)
 
     async def process_message_by_db_session(self, db_session_id: int, user_id: int, companion_id: int, user_message: str, sid: Optional[str] = None) -> AsyncIterator[str]:
         """基于数据库会话ID处理用户消息
@@ -347,12 +393,17 @@ class ChatEngine:
             user_message: 用户消息
             sid: Socket.IO session ID (可选，用于保存任务完成信息)
         """
+        # 本轮消息在回复完成后一次性写入数据库；提前返回、出错或客户端断开时由 finally 补写
+        turn_messages: List[Dict] = []
+        turn_saved = False
+
         try:
             # 内容安全检查
             is_safe, filter_reason = await content_filter.is_content_safe(user_message)
             if not is_safe and filter_reason:
                 yield content_filter.get_filtered_response(filter_reason)
                 return
+            turn_messages.append({'role': 'user', 'content': user_message, 'timestamp': datetime.utcnow()})
 
             # 增加消息处理统计
             await redis_stats_manager.increment_counter("messages_processed")
@@ -366,27 +417,37 @@ class ChatEngine:
                 await redis_stats_manager.increment_counter("cache_hits")
                 yield cached_response
                 # 保存用户消息和缓存回复到数据库
-                await self.save_message_to_db_by_session_id(db_session_id, "user", user_message)
-                await self.save_message_to_db_by_session_id(db_session_id, "assistant", cached_response)
+                turn_messages.append({'role': 'assistant', 'content': cached_response})
+                turn_saved = await self.save_turn_to_db(db_session_id, turn_messages)
                 return
 
-            # 保存用户消息到数据库
-            await self.save_message_to_db_by_session_id(db_session_id, "user", user_message)
-            
+            # 首条消息使用 join_chat 时的预取结果
+            prefetched = await session_prefetcher.take(self.active_sessions.get(sid) if sid else None)
+            if prefetched and prefetched.companion_id != companion_id:
+                prefetched = None
+
             # 获取伙伴信息
-            companion_info = await self.get_companion_info(companion_id)
+            companion_info = (prefetched and prefetched.companion_info) or await self.get_companion_info(companion_id)
             if not companion_info:
                 yield "抱歉，找不到对应的AI伙伴信息。"
                 return
 
-            # 获取会话上下文（从数据库加载历史）
-            conversation_history = await self.load_chat_history_by_session_id(db_session_id, limit=8)
+            # 获取会话上下文（从数据库加载历史；本轮用户消息由协调器追加）
+            conversation_history = self._prefetched_history(prefetched, db_session_id)
+            if conversation_history is None:
+                conversation_history = await self.load_chat_history_by_session_id(db_session_id, limit=settings.CONVERSATION_HISTORY_MESSAGES)
 
             # 获取当前伙伴状态
-            companion_state = await redis_affinity_manager.get_companion_state(
-                str(user_id),
-                companion_id
-            ) or {}
+            if prefetched and prefetched.companion_state is not None:
+                companion_state = prefetched.companion_state
+            else:
+                companion_state = await redis_affinity_manager.get_companion_state(
+                    str(user_id),
+                    companion_id
+                ) or {}
+
+            # 更早的对话由滚动摘要覆盖
+            conversation_summary = await conversation_summarizer.get_summary(db_session_id)
 
             # 协调生成回复
             coordinated_response = await response_coordinator.coordinate_response(
@@ -402,6 +463,9 @@ class ChatEngine:
                 current_mood=companion_state.get('current_mood', 'neutral'),
                 conversation_history=conversation_history,
                 enable_memory=True,
+                prefetched_facts=prefetched.user_facts if prefetched else None,
+                conversation_summary=conversation_summary,
+                prompt_version=companion_info.get('prompt_version', 'v1'),
                 special_instructions=None,
                 debug_mode=False
             )
@@ -424,9 +488,13 @@ class ChatEngine:
             for chunk in self._chunk_response(assistant_response):
                 yield chunk
 
-            # 保存助手回复到数据库
+            # 保存本轮对话到数据库
             if assistant_response:
-                await self.save_message_to_db_by_session_id(db_session_id, "assistant", assistant_response)
+                turn_messages.append({'role': 'assistant', 'content': assistant_response})
+            turn_saved = await self.save_turn_to_db(db_session_id, turn_messages)
+
+            if assistant_response:
+                conversation_summarizer.schedule(db_session_id)
 
                 # 检查是否为高质量回复，缓存到热门对话
                 if 50 < len(assistant_response) < 1000:
@@ -444,7 +512,23 @@ class ChatEngine:
             # 增加错误统计
             await redis_stats_manager.increment_counter("error_responses")
             yield "抱歉，我现在遇到了一些技术问题，请稍后再试。😅"
+        finally:
+            # GeneratorExit / CancelledError 不经过 except Exception，这里保证用户消息不丢
+            if turn_messages and not turn_saved:
+                await self.save_turn_to_db(db_session_id, turn_messages)
     
+    @staticmethod
+    def _prefetched_history(prefetched, chat_session_id: Optional[int]) -> Optional[List[Dict]]:
+        """
+        用预取的历史作为首条消息的上下文（与从数据库加载的结果一致）
+
+        Returns:
+            历史列表；预取结果不可用时返回None
+        """
+        if not prefetched or prefetched.history is None or prefetched.chat_session_id != chat_session_id:
+            return None
+        return prefetched.history[-settings.CONVERSATION_HISTORY_MESSAGES:]
+
     def _chunk_response(self, text: str, chunk_size: int = 80) -> List[str]:
         """将完整回复拆分为若干小段用于模拟流式输出"""
         if not text:
@@ -537,6 +621,10 @@ def register_socketio_events(sio_instance):
             # 获取新创建的数据库会话ID
             session_data = chat_engine.active_sessions.get(sid)
             actual_chat_session_id = session_data.get('chat_session_id') if session_data else None
+
+            # 后台预热首条消息需要的数据（断开时取消）
+            if session_data:
+                session_prefetcher.start(session_data)
             
             # 如果有现有会话ID，加载历史消息
             history = []
@@ -4,13 +4,24 @@ ChromaDB本地向量数据库实现 - L2情景记忆系统
 该模块使用ChromaDB实现高效的本地向量存储，用于存储和检索
 与用户相关的对话片段和情景记忆。
 """
+import asyncio
+import hashlib
 import logging
+import os
+import threading
+import time
 import uuid
 from typing import List, Dict, Optional
 import json
 
+from app.core.config import settings
+from app.services.memory_ranking import rank_memories
+from app.services.memory_lexical_index import MemoryLexicalIndex, reciprocal_rank_fusion
+
 logger = logging.getLogger("chromadb_memory")
 
+BASE_COLLECTION_NAME = "conversation_memories"
+
 try:
     import chromadb
     CHROMADB_AVAILABLE = True
@@ -27,16 +38,38 @@ class ChromaMemorySystem:
     - 本地存储（无需额外服务）
     - 自动embedding（内置向量化）
     - 支持元数据过滤
+    - 支持分片（按哈希桶或按伙伴拆分集合）
     - 开箱即用
     """
 
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        quantization: Optional[str] = None,
+        sharding: Optional[str] = None,
+        shard_buckets: Optional[int] = None
+    ):
         """
         初始化ChromaDB客户端
 
         Args:
-            persist_directory: 数据持久化目录
+            persist_directory: 数据持久化目录，默认取 CHROMA_PERSIST_DIRECTORY
+            quantization: 向量存储方式（none / int8），默认取 MEMORY_EMBEDDING_QUANTIZATION
+            sharding: 分片策略（none / hash / companion），默认取 MEMORY_SHARDING
+            shard_buckets: hash 分片的桶数，默认取 MEMORY_SHARD_BUCKETS
         """
+        persist_directory = persist_directory or settings.CHROMA_PERSIST_DIRECTORY
+        self.persist_directory = persist_directory
+        self.quantization = (quantization or settings.MEMORY_EMBEDDING_QUANTIZATION).lower()
+        self.sharding = (sharding or settings.MEMORY_SHARDING).lower()
+        self.shard_buckets = max(1, shard_buckets or settings.MEMORY_SHARD_BUCKETS)
+        self._collections: Dict[str, object] = {}
+        self._collections_lock = threading.Lock()  # 整理任务在线程池中也会打开集合
+
+        if self.sharding not in ("none", "hash", "companion"):
+            logger.warning(f"⚠️ 未知的分片策略: {self.sharding}，使用单集合")
+            self.sharding = "none"
+
         if not CHROMADB_AVAILABLE:
             raise RuntimeError("ChromaDB未安装，请运行 pip install chromadb")
 
@@ -51,17 +84,108 @@ class ChromaMemorySystem:
                 )
             )
 
-            # 获取或创建集合
-            self.collection = self.client.get_or_create_collection(
-                name="conversation_memories",
-                metadata={"hnsw:space": "cosine"}
-            )
+            # 未分片时的默认集合（分片模式下按需打开各分片集合）
+            self.collection = self._get_collection(BASE_COLLECTION_NAME)
+
+            # 字符二元组倒排索引（混合检索）
+            self.lexical_index = None
+            if settings.MEMORY_LEXICAL_ENABLED:
+                self.lexical_index = MemoryLexicalIndex(
+                    directory=os.path.join(persist_directory, "lexical"),
+                    max_partitions=settings.MEMORY_LEXICAL_CACHE_PARTITIONS
+                )
 
-            logger.info(f"✅ ChromaDB已初始化，数据目录: {persist_directory}")
+            logger.info(
+                f"✅ ChromaDB已初始化，数据目录: {persist_directory} "
+                f"(向量存储: {self.quantization}, 分片: {self.sharding})"
+            )
         except Exception as e:
             logger.error(f"❌ ChromaDB初始化失败: {e}")
             raise
 
+    def _open_collection(self, name: str):
+        """
+        打开记忆集合
+
+        quantization=int8 时使用量化集合（int8 常驻 + 全精度重排），
+        否则使用 Chroma 原生 HNSW 集合。
+        """
+        if self.quantization == "int8":
+            from app.services.memory_quantization import QuantizedCollection
+            return QuantizedCollection(
+                name=name,
+                directory=os.path.join(self.persist_directory, "quantized"),
+                rerank_factor=settings.MEMORY_RERANK_FACTOR
+            )
+        if self.quantization != "none":
+            logger.warning(f"⚠️ 未知的向量量化方式: {self.quantization}，使用原生存储")
+
+        return self.client.get_or_create_collection(
+            name=name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def _get_collection(self, name: str):
+        """按名称获取集合（已打开的集合缓存复用）"""
+        with self._collections_lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._open_collection(name)
+                self._collections[name] = collection
+            return collection
+
+    def shard_name(self, user_id: str, companion_id: int) -> str:
+        """
+        计算(用户, 伙伴)分区所在的集合名称
+
+        - none: 全部写入 conversation_memories
+        - hash: 按 md5(user_id:companion_id) 分到固定数量的桶（与进程无关的稳定哈希）
+        - companion: 每个伙伴一个集合
+        """
+        if self.sharding == "hash":
+            digest = hashlib.md5(f"{user_id}:{companion_id}".encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "big") % self.shard_buckets
+            return f"{BASE_COLLECTION_NAME}_h{bucket:03d}"
+        if self.sharding == "companion":
+            return f"{BASE_COLLECTION_NAME}_c{companion_id}"
+        return BASE_COLLECTION_NAME
+
+    def _collection_for(self, user_id: str, companion_id: int):
+        """路由到分区所在的集合"""
+        return self._get_collection(self.shard_name(user_id, companion_id))
+
+    @staticmethod
+    def _partition_where(user_id: str, companion_id: int) -> Dict:
+        """用户-伙伴分区过滤条件（companion_id 以字符串形式存储）"""
+        return {
+            "$and": [
+                {"user_id": user_id},
+                {"companion_id": str(companion_id)}
+            ]
+        }
+
+    async def warm_partition(self, user_id: str, companion_id: int):
+        """
+        预热分区（会话开始时后台调用）
+
+        在事件循环中打开分区所在集合并加载倒排索引；嵌入模型加载和
+        向量索引读取放到线程中执行，不阻塞其它会话。
+        """
+        collection = self._collection_for(user_id, companion_id)
+        if self.lexical_index is not None:
+            await asyncio.to_thread(self.lexical_index.warm, user_id, companion_id)
+
+        if hasattr(collection, "warm"):
+            await asyncio.to_thread(collection.warm)
+            return
+        await asyncio.to_thread(
+            collection.query,
+            query_texts=["预热"],
+            n_results=1,
+            where=self._partition_where(user_id, companion_id),
+            include=["distances"]
+        )
+
     async def get_recent_memories(
         self,
         user_id: str,
@@ -91,21 +215,38 @@ class ChromaMemorySystem:
                 logger.warning("查询文本为空，跳过记忆查询")
                 return []
 
-            # 使用Where过滤条件查询特定用户和伙伴的记忆
-            results = self.collection.query(
+            # 多取候选，再按 相似度 + 新近度 + 重要性 重排并做 MMR 去冗余
+            results = await asyncio.to_thread(
+                self._collection_for(user_id, companion_id).query,
                 query_texts=[query],
-                n_results=limit,
-                where={
-                    "$and": [
-                        {"user_id": user_id},
-                        {"companion_id": companion_id}
-                    ]
-                }
+                n_results=limit * max(1, settings.MEMORY_OVERFETCH_FACTOR),
+                where=self._partition_where(user_id, companion_id),
+                include=["documents", "metadatas", "distances", "embeddings"]
             )
 
             # 提取记忆文本
+            memories = []
             if results and results.get("documents") and results["documents"][0]:
-                memories = results["documents"][0]
+                memories = rank_memories(
+                    documents=results["documents"][0],
+                    distances=results["distances"][0],
+                    metadatas=results["metadatas"][0],
+                    embeddings=results["embeddings"][0] if results.get("embeddings") else None,
+                    limit=limit
+                )
+
+            # 倒排检索补充精确命中的实体词（宠物名、城市等），按 RRF 融合
+            if self.lexical_index is not None:
+                lexical_hits = await asyncio.to_thread(
+                    self.lexical_index.search, user_id, companion_id, query, limit
+                )
+                if lexical_hits:
+                    memories = reciprocal_rank_fusion(
+                        [memories, [text for _, text, _ in lexical_hits]],
+                        limit=limit
+                    )
+
+            if memories:
                 logger.info(f"✅ 查询到 {len(memories)} 条相关记忆")
                 return memories
 
@@ -121,7 +262,9 @@ class ChromaMemorySystem:
         user_id: str,
         companion_id: int,
         memory_text: str,
-        memory_type: str = "conversation"
+        memory_type: str = "conversation",
+        importance: float = 0.5,
+        created_ts: Optional[float] = None
     ) -> bool:
         """
         保存新的情景记忆到ChromaDB
@@ -130,7 +273,9 @@ class ChromaMemorySystem:
             user_id: 用户ID
             companion_id: 伙伴ID
             memory_text: 记忆内容文本
-            memory_type: 记忆类型（conversation/event/interaction等）
+            memory_type: 记忆类型（conversation/event/interaction/digest等）
+            importance: 记忆重要性（0-1，整理任务据此淘汰与摘要）
+            created_ts: 记忆时间（Unix时间戳），默认当前时间
 
         Returns:
             是否保存成功
@@ -143,18 +288,28 @@ class ChromaMemorySystem:
             # 生成唯一ID
             memory_id = str(uuid.uuid4())
 
-            # 添加到集合
-            self.collection.add(
+            # 添加到集合（向量化和写入是同步调用，放到线程中执行，整理任务写摘要时也不阻塞事件循环）
+            await asyncio.to_thread(
+                self._collection_for(user_id, companion_id).add,
                 documents=[memory_text],
                 metadatas=[{
                     "user_id": user_id,
                     "companion_id": str(companion_id),  # 转为字符串以支持过滤
                     "type": memory_type,
-                    "created_at": self._get_timestamp()
+                    "importance": float(importance),
+                    "created_at": self._get_timestamp(),
+                    "created_ts": float(created_ts if created_ts is not None else time.time())
                 }],
                 ids=[memory_id]
             )
 
+            if self.lexical_index is not None:
+                await asyncio.to_thread(
+                    self.lexical_index.add,
+                    user_id, companion_id, memory_id, memory_text,
+                    backfill=lambda: self._partition_texts(user_id, companion_id)
+                )
+
             logger.info(f"✅ 记忆已保存 (ID: {memory_id})")
             return True
 
@@ -181,13 +336,9 @@ class ChromaMemorySystem:
         """
         try:
             # 查询该用户的所有记忆
-            all_memories = self.collection.get(
-                where={
-                    "$and": [
-                        {"user_id": user_id},
-                        {"companion_id": companion_id}
-                    ]
-                }
+            collection = self._collection_for(user_id, companion_id)
+            all_memories = collection.get(
+                where=self._partition_where(user_id, companion_id)
             )
 
             total_count = len(all_memories.get("ids", []))
@@ -196,7 +347,9 @@ class ChromaMemorySystem:
             if delete_count > 0:
                 # 删除最旧的记忆（IDs顺序通常是创建顺序）
                 ids_to_delete = all_memories["ids"][:delete_count]
-                self.collection.delete(ids=ids_to_delete)
+                collection.delete(ids=ids_to_delete)
+                if self.lexical_index is not None:
+                    await asyncio.to_thread(self.lexical_index.remove, user_id, companion_id, ids_to_delete)
                 logger.info(f"✅ 已清理 {delete_count} 条过旧记忆")
                 return delete_count
 
@@ -206,6 +359,78 @@ class ChromaMemorySystem:
             logger.error(f"❌ 清理旧记忆失败: {e}")
             return 0
 
+    def get_partition_memories(
+        self,
+        user_id: str,
+        companion_id: int,
+        include_embeddings: bool = False
+    ) -> List[Dict]:
+        """
+        获取用户-伙伴分区内的全部记忆（供整理任务使用）
+
+        Returns:
+            记忆列表，每项包含 id / document / metadata（可选 embedding）
+        """
+        include = ["documents", "metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+
+        results = self._collection_for(user_id, companion_id).get(
+            where=self._partition_where(user_id, companion_id),
+            include=include
+        )
+
+        memories = []
+        for index, memory_id in enumerate(results.get("ids", [])):
+            memory = {
+                "id": memory_id,
+                "document": results["documents"][index],
+                "metadata": results["metadatas"][index] or {}
+            }
+            if include_embeddings:
+                memory["embedding"] = results["embeddings"][index]
+            memories.append(memory)
+        return memories
+
+    def update_memory_metadata(
+        self,
+        user_id: str,
+        companion_id: int,
+        ids: List[str],
+        metadatas: List[Dict]
+    ):
+        """批量更新分区内记忆的元数据"""
+        if ids:
+            self._collection_for(user_id, companion_id).update(ids=ids, metadatas=metadatas)
+
+    def delete_memories(self, user_id: str, companion_id: int, ids: List[str]) -> int:
+        """按ID批量删除分区内的记忆"""
+        if not ids:
+            return 0
+        self._collection_for(user_id, companion_id).delete(ids=ids)
+        if self.lexical_index is not None:
+            self.lexical_index.remove(user_id, companion_id, ids)
+        return len(ids)
+
+    def compact_collection(self, user_id: str, companion_id: int, min_dead_ratio: float) -> int:
+        """
+        分区所在集合的墓碑比例达到 min_dead_ratio 时压缩（仅量化集合；原生集合由 Chroma 自行管理）
+
+        Returns:
+            回收的记录条数
+        """
+        collection = self._collection_for(user_id, companion_id)
+        if not hasattr(collection, "compact") or collection.dead_ratio() < min_dead_ratio:
+            return 0
+        return collection.compact()
+
+    def _partition_texts(self, user_id: str, companion_id: int) -> List[tuple]:
+        """分区内全部记忆的 (id, 文本)，用于倒排索引回填"""
+        return [
+            (memory["id"], memory["document"] or "")
+            for memory in self.get_partition_memories(user_id, companion_id)
+        ]
+
     async def get_memory_stats(
         self,
         user_id: str,
@@ -222,13 +447,8 @@ class ChromaMemorySystem:
             统计信息字典
         """
         try:
-            all_memories = self.collection.get(
-                where={
-                    "$and": [
-                        {"user_id": user_id},
-                        {"companion_id": companion_id}
-                    ]
-                }
+            all_memories = self._collection_for(user_id, companion_id).get(
+                where=self._partition_where(user_id, companion_id)
             )
 
             total_count = len(all_memories.get("ids", []))
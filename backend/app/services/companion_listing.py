@@ -0,0 +1,111 @@
+"""
+伙伴列表 - 一次分组聚合查询得到用户的伙伴及其会话数
+
+列表页原先先查伙伴，再为每个伙伴单独 SELECT 全部会话并在 Python 中 len() 计数，
+伙伴越多查询越多、会话越多加载的对象越多。这里改为：
+
+- 伙伴 LEFT JOIN 活跃会话 + COUNT 分组聚合，一条查询，没有会话的伙伴计数为0
+  （连接条件走 chat_sessions(companion_id, is_active) 索引，不加载会话对象）
+- 聚合结果按用户放入进程内短 TTL 缓存，会话创建/删除、伙伴增删改时失效
+- 关系状态变化频繁不进缓存，每次请求用一次 MGET 批量读取（见 get_companion_states）
+"""
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.chat_session import ChatSession
+from app.models.companion import Companion
+from app.services.redis_utils import redis_affinity_manager
+
+# 列表中展示的关系状态字段
+RELATIONSHIP_FIELDS = ("affinity_score", "trust_score", "romance_level", "current_mood")
+
+
+class CompanionListCache:
+    """按用户缓存伙伴列表聚合结果（进程内，短 TTL）"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = settings.COMPANION_LIST_CACHE_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries: Dict[int, Tuple[float, List[Dict]]] = {}
+
+    def get(self, user_id: int) -> Optional[List[Dict]]:
+        entry = self._entries.get(int(user_id))
+        if entry is None:
+            return None
+        expires_at, rows = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(int(user_id), None)
+            return None
+        return rows
+
+    def set(self, user_id: int, rows: List[Dict]):
+        if self.ttl_seconds > 0:
+            self._entries[int(user_id)] = (time.monotonic() + self.ttl_seconds, rows)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """用户的伙伴增删改时调用；不传ID则清空全部"""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(int(user_id), None)
+
+    def invalidate_companion(self, companion_id: int):
+        """伙伴的会话创建/删除时调用，清除包含该伙伴的列表（系统伙伴可能被多个用户使用）"""
+        companion_id = int(companion_id)
+        stale = [
+            user_id for user_id, (_, rows) in self._entries.items()
+            if any(row["id"] == companion_id for row in rows)
+        ]
+        for user_id in stale:
+            self._entries.pop(user_id, None)
+
+
+async def list_user_companions(db: AsyncSession, user_id: int) -> List[Dict]:
+    """
+    获取用户的伙伴及每个伙伴的活跃会话数（按创建时间倒序）
+
+    返回的列表来自缓存时与其他请求共享，调用方不要原地修改。
+    """
+    cached = companion_list_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    session_count = func.count(ChatSession.id).label("session_count")
+    stmt = (
+        select(
+            Companion.id,
+            Companion.user_id,
+            Companion.name,
+            Companion.avatar_id,
+            Companion.personality_archetype,
+            Companion.custom_greeting,
+            Companion.description,
+            Companion.created_at,
+            session_count
+        )
+        .outerjoin(ChatSession, and_(ChatSession.companion_id == Companion.id, ChatSession.is_active == True))
+        .where(Companion.user_id == int(user_id))
+        .group_by(Companion.id)
+        .order_by(Companion.created_at.desc(), Companion.id.desc())
+    )
+    result = await db.execute(stmt)
+    rows = [dict(row._mapping) for row in result]
+
+    companion_list_cache.set(user_id, rows)
+    return rows
+
+
+async def get_relationship_summaries(user_id: str, companion_ids: List[int]) -> Dict[int, Optional[Dict]]:
+    """一次 MGET 读取所有伙伴的关系状态，只保留列表展示字段（未建立关系的为 None）"""
+    states = await redis_affinity_manager.get_companion_states(str(user_id), companion_ids)
+    return {
+        companion_id: {field: state.get(field) for field in RELATIONSHIP_FIELDS} if state else None
+        for companion_id, state in states.items()
+    }
+
+
+# 全局实例
+companion_list_cache = CompanionListCache()
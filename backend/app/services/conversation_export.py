@@ -0,0 +1,185 @@
+"""
+对话记录流式导出
+
+导出接口原先把所有会话读进内存、在 StringIO / json.dumps 中拼出整个文件后再返回。
+这里改为边查边写：
+
+- 会话用服务端游标 stream() + yield_per 分批读取（导出使用独立的数据库会话，
+  不依赖请求作用域的会话，响应流式发送期间一直有效）
+- 每个会话的消息按 id 做 keyset 分页，每次只取一批
+- 行逐条编码，缓冲到 EXPORT_CHUNK_BYTES 后产出一个块
+- 可选边压缩边输出 gzip
+
+内存占用只与批大小有关，与导出规模无关。
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import and_, select
+
+from app.core.database import async_session_maker
+from app.models.chat_session import ChatSession, ChatMessage
+
+SESSION_BATCH_SIZE = 500  # 会话游标每批行数
+MESSAGE_BATCH_SIZE = 2000  # 每次 keyset 分页读取的消息数
+EXPORT_CHUNK_BYTES = 64 * 1024  # 输出块大小
+
+CSV_HEADER = ["会话ID", "用户ID", "伙伴ID", "会话标题", "创建时间", "最后更新", "消息总数", "状态"]
+
+
+def session_conditions(
+    user_id: Optional[Any] = None,
+    companion_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> List:
+    """构建会话过滤条件（日期为 ISO 格式字符串）"""
+    conditions = []
+    if user_id:
+        conditions.append(ChatSession.user_id == str(user_id))
+    if companion_id:
+        conditions.append(ChatSession.companion_id == companion_id)
+    if start_date:
+        conditions.append(ChatSession.created_at >= datetime.fromisoformat(start_date))
+    if end_date:
+        conditions.append(ChatSession.created_at <= datetime.fromisoformat(end_date))
+    return conditions
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+async def iter_sessions(conditions: List, batch_size: int = SESSION_BATCH_SIZE) -> AsyncIterator[ChatSession]:
+    """按创建时间倒序逐个产出会话（服务端游标，每批 batch_size 行）"""
+    query = select(ChatSession)
+    if conditions:
+        query = query.where(and_(*conditions))
+    query = query.order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).execution_options(yield_per=batch_size)
+
+    async with async_session_maker() as db:
+        result = await db.stream(query)
+        async for chat_session in result.scalars():
+            yield chat_session
+            # 已产出的会话不再需要，避免身份映射随导出规模增长
+            db.expunge(chat_session)
+
+
+async def iter_message_batches(
+    db,
+    chat_session_id: int,
+    batch_size: int = MESSAGE_BATCH_SIZE
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """按 id keyset 分页读取一个会话的消息，每次产出一批"""
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp)
+            .where(ChatMessage.session_id == chat_session_id, ChatMessage.id > last_id)
+            .order_by(ChatMessage.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            return
+        yield [
+            {"id": row.id, "role": row.role, "content": row.content, "timestamp": _isoformat(row.timestamp)}
+            for row in rows
+        ]
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
+
+
+async def csv_chunks(conditions: List) -> AsyncIterator[bytes]:
+    """逐行编码会话列表为CSV（带 BOM，兼容 Excel）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    first = True
+
+    async for chat_session in iter_sessions(conditions):
+        writer.writerow([
+            chat_session.id,
+            chat_session.user_id,
+            chat_session.companion_id,
+            chat_session.session_title or "",
+            _isoformat(chat_session.created_at),
+            _isoformat(chat_session.updated_at),
+            chat_session.total_messages or 0,
+            "活跃" if chat_session.is_active else "已删除"
+        ])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8-sig" if first else "utf-8")
+            first = False
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode("utf-8-sig" if first else "utf-8")
+
+
+async def json_chunks(conditions: List, include_messages: bool = True) -> AsyncIterator[bytes]:
+    """逐个会话、逐批消息编码JSON文档"""
+    parts: List[str] = [f'{{"export_time": {json.dumps(datetime.now().isoformat())}, "sessions": [']
+    size = len(parts[0])
+    total_sessions = 0
+
+    def take() -> bytes:
+        nonlocal size
+        data = "".join(parts).encode("utf-8")
+        parts.clear()
+        size = 0
+        return data
+
+    def append(text: str):
+        nonlocal size
+        parts.append(text)
+        size += len(text)
+
+    async with async_session_maker() as messages_db:
+        async for chat_session in iter_sessions(conditions):
+            session_data = {
+                "id": chat_session.id,
+                "user_id": chat_session.user_id,
+                "companion_id": chat_session.companion_id,
+                "session_title": chat_session.session_title,
+                "created_at": _isoformat(chat_session.created_at),
+                "updated_at": _isoformat(chat_session.updated_at),
+                "total_messages": chat_session.total_messages or 0,
+                "is_active": chat_session.is_active
+            }
+            encoded = json.dumps(session_data, ensure_ascii=False)
+            append(("," if total_sessions else "") + encoded[:-1])
+            total_sessions += 1
+
+            if include_messages:
+                append(', "messages": [')
+                first_batch = True
+                async for batch in iter_message_batches(messages_db, chat_session.id):
+                    # 整批一次编码，去掉外层方括号后拼接
+                    append(("" if first_batch else ",") + json.dumps(batch, ensure_ascii=False)[1:-1])
+                    first_batch = False
+                    if size >= EXPORT_CHUNK_BYTES:
+                        yield take()
+                append("]")
+            append("}")
+
+            if size >= EXPORT_CHUNK_BYTES:
+                yield take()
+
+    append(f'], "total_sessions": {total_sessions}}}')
+    yield take()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """边压缩边输出 gzip"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
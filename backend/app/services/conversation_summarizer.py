@@ -0,0 +1,200 @@
+"""
+滚动对话摘要 - 控制长会话的 Prompt 规模
+
+原先每轮把最近若干条原文消息直接放进 Prompt：长消息会挤爆提示词预算，
+而三轮之前的重要上下文又会直接丢失。本模块为每个聊天会话维护一份增量摘要：
+
+- 摘要和水位（已并入摘要的最后一条消息ID）保存在 ChatSession 上
+- 未摘要的旧消息累积满 K 轮时，后台把它们与旧摘要合并成新摘要
+- 最近 CONVERSATION_SUMMARY_KEEP_MESSAGES 条消息始终保留原文
+- 未摘要的消息超过 Prompt 加载的历史条数（CONVERSATION_HISTORY_MESSAGES）时也立即合并，
+  保证每条消息要么在摘要里、要么在原文历史里
+- Prompt 使用 摘要 + 按token预算截取的最近消息
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import func, select, update
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services.token_counter import count_tokens
+
+logger = logging.getLogger("conversation_summarizer")
+
+MAX_FOLD_MESSAGES = 40  # 单次并入摘要的最大消息数（积压时分多次完成）
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色标记等固定开销
+
+
+def trim_history_to_budget(history: Optional[Sequence[Dict]], max_tokens: int) -> List[Dict]:
+    """
+    从最新的消息往前取，直到用完token预算
+
+    最新一条消息超出预算时截断其内容，保证至少保留一条。
+    """
+    if not history:
+        return []
+
+    kept: List[Dict] = []
+    used = 0
+    for message in reversed(history):
+        content = message.get("content", "")
+        tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > max_tokens:
+            if not kept and max_tokens > MESSAGE_OVERHEAD_TOKENS:
+                # 按token比例截断，保留消息开头
+                keep_chars = len(content) * (max_tokens - MESSAGE_OVERHEAD_TOKENS) // max(tokens, 1)
+                kept.append({**message, "content": content[:max(keep_chars, 1)]})
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+class ConversationSummarizer:
+    """按聊天会话维护滚动摘要"""
+
+    MAX_CACHED_SESSIONS = 2048
+
+    def __init__(self):
+        self._summaries: "OrderedDict[int, str]" = OrderedDict()  # chat_session_id → 摘要（空串表示暂无）
+        self._in_flight: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _remember(self, chat_session_id: int, summary: str):
+        self._summaries[chat_session_id] = summary
+        self._summaries.move_to_end(chat_session_id)
+        while len(self._summaries) > self.MAX_CACHED_SESSIONS:
+            self._summaries.popitem(last=False)
+
+    async def get_summary(self, chat_session_id: Optional[int]) -> Optional[str]:
+        """读取会话的滚动摘要（进程内缓存，摘要更新时同步刷新）"""
+        if not chat_session_id or not settings.CONVERSATION_SUMMARY_ENABLED:
+            return None
+        if chat_session_id in self._summaries:
+            self._summaries.move_to_end(chat_session_id)
+            return self._summaries[chat_session_id] or None
+
+        try:
+            async with async_session_maker() as db:
+                result = await db.execute(
+                    select(ChatSession.rolling_summary).where(ChatSession.id == chat_session_id)
+                )
+                summary = result.scalar_one_or_none() or ""
+        except Exception as e:
+            logger.warning(f"⚠️ 读取对话摘要失败: {e}")
+            return None
+
+        self._remember(chat_session_id, summary)
+        return summary or None
+
+    def schedule(self, chat_session_id: Optional[int]):
+        """每轮对话保存后调用：在后台检查并更新摘要，不阻塞回复"""
+        if not chat_session_id or not settings.CONVERSATION_SUMMARY_ENABLED:
+            return
+        if chat_session_id in self._in_flight:
+            return
+        self._in_flight.add(chat_session_id)
+        task = asyncio.create_task(self._run_update(chat_session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_update(self, chat_session_id: int):
+        try:
+            await self.update(chat_session_id)
+        except Exception as e:
+            logger.warning(f"⚠️ 更新对话摘要失败 (会话 {chat_session_id}): {e}")
+        finally:
+            self._in_flight.discard(chat_session_id)
+
+    async def update(self, chat_session_id: int) -> bool:
+        """
+        未摘要的旧消息满 K 轮、或未摘要的消息多于 Prompt 加载的历史条数时，
+        把它们并入摘要并推进水位
+
+        Returns:
+            是否更新了摘要
+        """
+        window = max(1, settings.CONVERSATION_HISTORY_MESSAGES)
+        keep = min(max(0, settings.CONVERSATION_SUMMARY_KEEP_MESSAGES), window)
+        threshold = max(1, settings.CONVERSATION_SUMMARY_EVERY_TURNS) * 2
+
+        async with async_session_maker() as db:
+            chat_session = await db.get(ChatSession, chat_session_id)
+            if not chat_session:
+                return False
+            watermark = chat_session.summary_message_id or 0
+            previous = chat_session.rolling_summary or ""
+
+            result = await db.execute(
+                select(ChatMessage)
+                .where(ChatMessage.session_id == chat_session_id, ChatMessage.id > watermark)
+                .order_by(ChatMessage.id)
+            )
+            messages = result.scalars().all()
+            fold = messages[:len(messages) - keep] if keep else messages
+            if not fold or (len(fold) < threshold and len(messages) <= window):
+                return False
+            fold = fold[:MAX_FOLD_MESSAGES]
+
+            summary = await self._summarize(previous, fold)
+
+            # 按旧水位条件更新，并发更新时只有一个生效；不改变会话的 updated_at
+            result = await db.execute(
+                update(ChatSession)
+                .where(
+                    ChatSession.id == chat_session_id,
+                    func.coalesce(ChatSession.summary_message_id, 0) == watermark
+                )
+                .values(
+                    rolling_summary=summary,
+                    summary_message_id=fold[-1].id,
+                    updated_at=ChatSession.updated_at
+                )
+            )
+            await db.commit()
+            if result.rowcount == 0:
+                return False
+
+        self._remember(chat_session_id, summary)
+        logger.info(f"📝 对话摘要已更新 (会话 {chat_session_id}, 并入 {len(fold)} 条消息, {len(summary)} 字)")
+        return True
+
+    async def _summarize(self, previous: str, messages: Sequence[ChatMessage]) -> str:
+        """把新消息并入旧摘要，LLM不可用时退化为抽取式摘要"""
+        max_chars = settings.CONVERSATION_SUMMARY_MAX_CHARS
+        dialogue = "\n".join(
+            f"{'用户' if m.role == 'user' else '你'}: {m.content}" for m in messages
+        )
+        try:
+            from app.services.llm.factory import llm_service
+
+            prompt = f"""你在为一段持续的聊天维护对话摘要。
+已有摘要：
+{previous or '（无）'}
+
+之后新增的对话：
+{dialogue}
+
+请输出更新后的摘要：保留用户提到的重要事实、情绪变化、约定和尚未结束的话题，
+删除寒暄和重复内容，使用第三人称称呼用户，不超过{max_chars}字。请只返回摘要文本。"""
+            summary = await asyncio.wait_for(
+                llm_service.chat_completion([{"role": "user", "content": prompt}]),
+                timeout=30
+            )
+            if summary and summary.strip():
+                return summary.strip()[:max_chars]
+        except Exception as e:
+            logger.debug(f"LLM摘要失败，使用抽取式摘要: {e}")
+
+        lines = [m.content.strip().splitlines()[0][:40] for m in messages if m.role == "user" and m.content.strip()]
+        combined = "；".join(filter(None, [previous, "用户提到：" + "；".join(lines) if lines else ""]))
+        return combined[-max_chars:]
+
+
+# 全局实例
+conversation_summarizer = ConversationSummarizer()
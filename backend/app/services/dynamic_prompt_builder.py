@@ -8,17 +8,73 @@
 3. 优化token使用，确保提示词简洁高效
 4. 提供结构化、层次化的指导
 """
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 from dataclasses import dataclass
+from itertools import combinations
 import logging
+import time
 
 from app.services.emotion_expression_generator import EmotionExpression
 from app.config.affinity_levels import get_level_config
 from app.services.affinity_engine import EmotionAnalysis
-from app.core.prompts import get_system_prompt
+from app.core.prompts import get_system_prompt, get_prompt_by_version
+from app.core.config import settings
+from app.services.token_counter import count_tokens
 
 logger = logging.getLogger("dynamic_prompt")
 
+EXACT_SELECTION_MAX_SECTIONS = 12  # 可选章节不超过该数量时穷举求最优组合
+SECTION_SEPARATOR_TOKENS = 1
+STATIC_PREFIX_CACHE_SIZE = 1024
+
+# 前缀稳定布局下，人设模板中的易变占位符不填实时数值（实时数值放在后面的"当前关系状态"章节）
+STATIC_PERSONA_CONTEXT = {
+    "user_message": "[当前用户消息将在运行时插入]",
+    "romance_level": "见下方【当前关系状态】",
+    "affinity_score": "见下方【当前关系状态】",
+    "current_mood": "见下方【当前关系状态】",
+    "other_relationships": "[其他关系信息]"
+}
+
+
+def select_sections(items: Sequence[Tuple[int, int]], budget: int) -> List[int]:
+    """
+    在token预算内选择可选章节（0/1背包）
+
+    Args:
+        items: [(优先级, token数)]
+        budget: 可用token数
+
+    Returns:
+        入选章节的下标：优先级之和最大，同分时总token数最少
+    """
+    if budget <= 0 or not items:
+        return []
+
+    if len(items) > EXACT_SELECTION_MAX_SECTIONS:
+        # 章节过多时按 优先级/token 贪心
+        order = sorted(range(len(items)), key=lambda i: items[i][0] / max(items[i][1], 1), reverse=True)
+        chosen, used = [], 0
+        for i in order:
+            if used + items[i][1] <= budget:
+                chosen.append(i)
+                used += items[i][1]
+        return sorted(chosen)
+
+    best: Tuple[int, int] = (0, 0)
+    best_indices: Tuple[int, ...] = ()
+    indices = range(len(items))
+    for size in range(1, len(items) + 1):
+        for combo in combinations(indices, size):
+            tokens = sum(items[i][1] for i in combo)
+            if tokens > budget:
+                continue
+            score = (sum(items[i][0] for i in combo), -tokens)
+            if score > best:
+                best, best_indices = score, combo
+    return list(best_indices)
+
 
 @dataclass
 class PromptSection:
@@ -40,15 +96,23 @@ class DynamicPromptBuilder:
     4. 结构化输出：清晰的层次和优先级
     """
 
-    def __init__(self, max_tokens: int = 2000):
+    def __init__(self, max_tokens: int = 2000, layout: Optional[str] = None):
         """
         初始化构建器
 
         Args:
-            max_tokens: 提示词最大token数（约2000字符）
+            max_tokens: 系统提示词最大token数（由 token_counter 计数）
+            layout: 章节布局，默认取 PROMPT_LAYOUT
+                - classic: 按优先级混排（人设中填入实时状态）
+                - prefix_stable: 静态人设与关系边界在前且逐字节稳定，易变章节在后，
+                  便于模型服务商复用前缀KV缓存
         """
         self.max_tokens = max_tokens
+        self.layout = layout or settings.PROMPT_LAYOUT
         self.logger = logging.getLogger("dynamic_prompt")
+        # (伙伴, 性格原型, 关系等级, Prompt版本) → 渲染好的静态前缀
+        self._static_prefixes: "OrderedDict[Tuple, str]" = OrderedDict()
+        self.stats = {"static_hits": 0, "static_misses": 0, "builds": 0, "build_ms_total": 0.0}
 
     def build(
         self,
@@ -67,7 +131,9 @@ class DynamicPromptBuilder:
         l3_semantic_facts: Optional[Dict] = None,  # L3: 用户语义事实
         # 可选参数
         recent_emotions: Optional[List[str]] = None,  # 最近情感趋势
-        special_instructions: Optional[str] = None  # 特殊指示
+        special_instructions: Optional[str] = None,  # 特殊指示
+        companion_id: Optional[int] = None,  # 伙伴ID（静态前缀缓存键，修改伙伴时按ID失效）
+        prompt_version: str = "v1"  # 人设Prompt版本
     ) -> str:
         """
         构建完整的系统提示词
@@ -87,10 +153,63 @@ class DynamicPromptBuilder:
             l3_semantic_facts: L3语义事实
             recent_emotions: 最近情感趋势
             special_instructions: 特殊指示
+            companion_id: 伙伴ID
+            prompt_version: 人设Prompt版本
 
         Returns:
             str: 优化的系统提示词
         """
+        started = time.perf_counter()
+        if self.layout == "prefix_stable":
+            prompt = self._build_prefix_stable(
+                companion_id=companion_id,
+                companion_name=companion_name,
+                personality_archetype=personality_archetype,
+                prompt_version=prompt_version,
+                emotion_expression=emotion_expression,
+                emotion_analysis=emotion_analysis,
+                current_level=current_level,
+                affinity_score=affinity_score,
+                trust_score=trust_score,
+                tension_score=tension_score,
+                mood=mood,
+                l1_working_memory=l1_working_memory,
+                l2_episodic_memories=l2_episodic_memories,
+                l3_semantic_facts=l3_semantic_facts,
+                special_instructions=special_instructions
+            )
+        else:
+            prompt = self._build_classic(
+                companion_name, personality_archetype, emotion_expression, emotion_analysis,
+                current_level, affinity_score, trust_score, tension_score, mood,
+                l1_working_memory, l2_episodic_memories, l3_semantic_facts, special_instructions
+            )
+
+        self.stats["builds"] += 1
+        self.stats["build_ms_total"] += (time.perf_counter() - started) * 1000
+        self.logger.info(
+            f"[PromptBuilder] 提示词构建完成，长度: {len(prompt)} 字符, {count_tokens(prompt)} tokens"
+        )
+
+        return prompt
+
+    def _build_classic(
+        self,
+        companion_name: str,
+        personality_archetype: str,
+        emotion_expression: EmotionExpression,
+        emotion_analysis: EmotionAnalysis,
+        current_level: str,
+        affinity_score: int,
+        trust_score: int,
+        tension_score: int,
+        mood: str,
+        l1_working_memory: Optional[str],
+        l2_episodic_memories: Optional[List[str]],
+        l3_semantic_facts: Optional[Dict],
+        special_instructions: Optional[str]
+    ) -> str:
+        """classic 布局：所有章节按优先级混排"""
         # 准备用于填充人设提示词中占位符的上下文
         personality_context = {
             "user_message": "[当前用户消息将在运行时插入]",
@@ -141,11 +260,101 @@ class DynamicPromptBuilder:
             sections.append(self._build_special_instructions(special_instructions))
 
         # 优先级排序并组装
-        prompt = self._assemble_prompt(sections, self.max_tokens)
+        return self._assemble_prompt(sections, self.max_tokens)
 
-        self.logger.info(f"[PromptBuilder] 提示词构建完成，长度: {len(prompt)} 字符")
+    def _build_prefix_stable(
+        self,
+        companion_id: Optional[int],
+        companion_name: str,
+        personality_archetype: str,
+        prompt_version: str,
+        emotion_expression: EmotionExpression,
+        emotion_analysis: EmotionAnalysis,
+        current_level: str,
+        affinity_score: int,
+        trust_score: int,
+        tension_score: int,
+        mood: str,
+        l1_working_memory: Optional[str],
+        l2_episodic_memories: Optional[List[str]],
+        l3_semantic_facts: Optional[Dict],
+        special_instructions: Optional[str]
+    ) -> str:
+        """
+        prefix_stable 布局
 
-        return prompt
+        1. 静态前缀：人设 + 关系阶段与边界，按 (伙伴, 原型, 等级, 版本) 缓存，逐字节稳定
+        2. 易变章节：情感表现、实时状态、用户状态、记忆、特殊指示，在剩余预算内组装
+        """
+        prefix = self._static_prefix(companion_id, companion_name, personality_archetype, current_level, prompt_version)
+
+        sections = [
+            self._build_emotion_guidance(emotion_expression),
+            self._build_live_state_section(affinity_score, trust_score, tension_score, mood),
+            self._build_user_state_section(emotion_analysis),
+        ]
+        if l3_semantic_facts:
+            sections.append(self._build_semantic_facts_section(l3_semantic_facts))
+        if l2_episodic_memories:
+            sections.append(self._build_episodic_memory_section(l2_episodic_memories))
+        if l1_working_memory:
+            sections.append(self._build_working_memory_section(l1_working_memory))
+        if special_instructions:
+            sections.append(self._build_special_instructions(special_instructions))
+
+        volatile = self._assemble_prompt(sections, self.max_tokens - count_tokens(prefix) - SECTION_SEPARATOR_TOKENS)
+        return f"{prefix}\n\n{volatile}" if volatile else prefix
+
+    def _static_prefix(
+        self,
+        companion_id: Optional[int],
+        companion_name: str,
+        personality_archetype: str,
+        level: str,
+        prompt_version: str
+    ) -> str:
+        """渲染（或从缓存取出）静态前缀"""
+        key = (companion_id if companion_id is not None else companion_name, personality_archetype, level, prompt_version)
+        prefix = self._static_prefixes.get(key)
+        if prefix is not None:
+            self._static_prefixes.move_to_end(key)
+            self.stats["static_hits"] += 1
+            return prefix
+
+        self.stats["static_misses"] += 1
+        identity = PromptSection(
+            title="你的身份与人设",
+            content=[get_prompt_by_version(prompt_version, companion_name, personality_archetype, STATIC_PERSONA_CONTEXT)],
+            priority=12,
+            is_required=True
+        )
+        prefix = "\n\n".join([
+            self._format_section(identity),
+            self._format_section(self._build_level_boundary_section(level))
+        ])
+        self._static_prefixes[key] = prefix
+        while len(self._static_prefixes) > STATIC_PREFIX_CACHE_SIZE:
+            self._static_prefixes.popitem(last=False)
+        return prefix
+
+    def invalidate_static_sections(self, companion: Optional[Union[int, str]] = None):
+        """伙伴被修改/重置/删除时清除其静态前缀缓存；不传参数则全部清除"""
+        if companion is None:
+            self._static_prefixes.clear()
+            return
+        for key in [k for k in self._static_prefixes if k[0] == companion]:
+            del self._static_prefixes[key]
+
+    def get_stats(self) -> Dict:
+        """静态前缀缓存命中率与平均构建耗时"""
+        lookups = self.stats["static_hits"] + self.stats["static_misses"]
+        return {
+            **self.stats,
+            "layout": self.layout,
+            "cached_prefixes": len(self._static_prefixes),
+            "static_hit_rate": self.stats["static_hits"] / lookups if lookups else 0.0,
+            "avg_build_ms": self.stats["build_ms_total"] / self.stats["builds"] if self.stats["builds"] else 0.0
+        }
 
     def _build_identity_section(self, companion_name: str, personality_archetype: str, context: Optional[Dict] = None) -> PromptSection:
         """
@@ -194,6 +403,35 @@ class DynamicPromptBuilder:
             is_required=True
         )
 
+    def _build_level_boundary_section(self, level: str) -> PromptSection:
+        """构建关系阶段与边界章节（只取决于关系等级，属于静态前缀）"""
+        level_config = get_level_config(level)
+
+        return PromptSection(
+            title="关系阶段与边界",
+            content=[
+                f"• 关系等级: {level_config.name} - {level_config.description}",
+                f"• 亲密度: {level_config.intimacy_level}/10 | 回复正式度: {level_config.response_formality}",
+                f"• 称呼方式: {', '.join(level_config.addressing_style[:3])}",
+                f"• 语气关键词: {', '.join(level_config.tone_keywords[:4])}",
+                f"• 表情符号使用: {level_config.emoji_usage}"
+            ],
+            priority=11,
+            is_required=True
+        )
+
+    def _build_live_state_section(self, affinity: int, trust: int, tension: int, mood: str) -> PromptSection:
+        """构建实时关系状态章节（每轮变化，放在静态前缀之后）"""
+        return PromptSection(
+            title="当前关系状态",
+            content=[
+                f"• 好感度: {affinity}/1000 | 信任度: {trust}/100 | 紧张度: {tension}/100",
+                f"• 你的心情: {mood}"
+            ],
+            priority=9,
+            is_required=True
+        )
+
     def _build_emotion_guidance(self, expression: EmotionExpression) -> PromptSection:
         """构建情感表现指导"""
         content = [
@@ -236,8 +474,8 @@ class DynamicPromptBuilder:
 
     def _build_episodic_memory_section(self, memories: List[str]) -> PromptSection:
         """构建L2情景记忆章节"""
-        # 限制记忆数量，选择最相关的
-        selected_memories = memories[:5]  # 最多5条
+        # 记忆已按 相似度 + 新近度 + 重要性 重排并去冗余，直接取前几条
+        selected_memories = memories[:settings.MEMORY_PROMPT_MAX_EPISODIC]
 
         content = ["以下是你们之间的相关记忆："]
         for i, memory in enumerate(selected_memories, 1):
@@ -407,9 +645,10 @@ class DynamicPromptBuilder:
         组装提示词
 
         策略：
-        1. 优先级排序
-        2. 必需章节优先
-        3. Token预算管理
+        1. 必需章节全部保留
+        2. 可选章节在剩余token预算内按背包选择（优先级之和最大），
+           放不下大章节时仍会尝试更小的章节
+        3. 必需章节在前、入选的可选章节在后，各自按优先级排序输出
         """
         # 分离必需和可选章节
         required_sections = [s for s in sections if s.is_required]
@@ -419,29 +658,26 @@ class DynamicPromptBuilder:
         required_sections.sort(key=lambda x: x.priority, reverse=True)
         optional_sections.sort(key=lambda x: x.priority, reverse=True)
 
-        # 构建提示词
-        parts = []
-        current_length = 0
-
-        # 1. 添加所有必需章节
-        for section in required_sections:
-            section_text = self._format_section(section)
-            parts.append(section_text)
-            current_length += len(section_text)
-
-        # 2. 添加可选章节（在预算内）
-        for section in optional_sections:
-            section_text = self._format_section(section)
-            if current_length + len(section_text) <= max_tokens:
-                parts.append(section_text)
-                current_length += len(section_text)
+        # 1. 所有必需章节
+        formatted = [(section, self._format_section(section)) for section in required_sections]
+        used_tokens = sum(count_tokens(text) + SECTION_SEPARATOR_TOKENS for _, text in formatted)
+
+        # 2. 可选章节（在剩余预算内选择）
+        optional_texts = [self._format_section(section) for section in optional_sections]
+        items = [
+            (section.priority, count_tokens(text) + SECTION_SEPARATOR_TOKENS)
+            for section, text in zip(optional_sections, optional_texts)
+        ]
+        chosen = set(select_sections(items, max_tokens - used_tokens))
+        for i, section in enumerate(optional_sections):
+            if i in chosen:
+                formatted.append((section, optional_texts[i]))
             else:
                 self.logger.warning(
-                    f"[PromptBuilder] 跳过章节 '{section.title}' (预算不足)"
+                    f"[PromptBuilder] 跳过章节 '{section.title}' (预算不足, {items[i][1]} tokens)"
                 )
-                break
 
-        return "\n\n".join(parts)
+        return "\n\n".join(text for _, text in formatted)
 
     def _format_section(self, section: PromptSection) -> str:
         """格式化章节"""
@@ -451,4 +687,4 @@ class DynamicPromptBuilder:
 
 
 # 全局实例
-dynamic_prompt_builder = DynamicPromptBuilder(max_tokens=2000)
+dynamic_prompt_builder = DynamicPromptBuilder(max_tokens=settings.SYSTEM_PROMPT_MAX_TOKENS)
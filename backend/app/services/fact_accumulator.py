@@ -0,0 +1,214 @@
+"""
+分窗口的事实提取累积器 - 多轮对话合并为一次LLM提取
+
+本地规则（fact_extractor）无法覆盖的轮次不再逐轮调用LLM，而是按
+(用户, 伙伴) 累积到 Redis 列表中，满 N 轮或距首轮超过 T 分钟时，
+对整个窗口做一次事实提取并合并到 L3 用户事实。
+
+- fact_window:{user_id}:{companion_id}  待提取的对话轮次（JSON列表）
+- fact_window:pending                  有未提取窗口的分区（ZSET，分数为窗口首轮时间；
+                                       提取失败后为 下次重试时间 - 窗口时长）
+- fact_window:attempts                 窗口连续提取失败的次数（HASH）
+
+提取失败时窗口放回，按 FACT_WINDOW_RETRY_SECONDS 指数退避；退避期内新的轮次只追加，
+不触发提取。连续失败 FACT_WINDOW_MAX_ATTEMPTS 次后丢弃窗口。
+
+窗口数据只存在于 Redis 中，进程重启后由 flush_stale() 补提取。
+会话结束（disconnect / remove_session）时立即提取。
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.services.fact_extractor import fact_extractor
+
+logger = logging.getLogger("fact_accumulator")
+
+
+class FactExtractionAccumulator:
+    """按 (用户, 伙伴) 累积对话轮次，批量提取事实"""
+
+    WINDOW_PREFIX = "fact_window"
+    PENDING_KEY = "fact_window:pending"
+    ATTEMPTS_KEY = "fact_window:attempts"
+
+    def __init__(self, window_turns: Optional[int] = None, window_minutes: Optional[float] = None):
+        """
+        Args:
+            window_turns: 触发提取的轮次数，默认取 FACT_WINDOW_TURNS
+            window_minutes: 窗口最长持续时间，默认取 FACT_WINDOW_MINUTES
+        """
+        self.window_turns = max(1, window_turns or settings.FACT_WINDOW_TURNS)
+        self.window_seconds = (window_minutes or settings.FACT_WINDOW_MINUTES) * 60
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+
+    def _window_key(self, user_id: str, companion_id: int) -> str:
+        return f"{self.WINDOW_PREFIX}:{user_id}:{companion_id}"
+
+    @staticmethod
+    def _member(user_id: str, companion_id: int) -> str:
+        return f"{user_id}|{companion_id}"
+
+    async def add_turn(
+        self,
+        user_id: str,
+        companion_id: int,
+        user_message: str,
+        ai_response: str
+    ) -> Optional[Dict[str, str]]:
+        """
+        记录一轮对话
+
+        本地规则能提取的事实立即写入；仍需LLM的轮次进入窗口，
+        窗口满 N 轮或超过 T 分钟时触发一次批量提取。
+
+        Returns:
+            本次写入的事实（没有则为None）
+        """
+        from app.services.redis_memory import get_redis_memory
+
+        local = fact_extractor.extract(user_message)
+        saved = dict(local.facts)
+        if local.facts:
+            redis_mem = await get_redis_memory()
+            await redis_mem.save_multiple_facts(user_id, companion_id, local.facts)
+
+        if not local.needs_llm:
+            return saved or None
+
+        now = time.time()
+        redis = await get_redis()
+        key = self._window_key(user_id, companion_id)
+        pipe = redis.pipeline(transaction=True)
+        pipe.rpush(key, json.dumps({"user": user_message, "ai": ai_response, "ts": now}, ensure_ascii=False))
+        pipe.expire(key, int(self.window_seconds * 10))
+        pipe.zadd(self.PENDING_KEY, {self._member(user_id, companion_id): now}, nx=True)
+        pipe.zscore(self.PENDING_KEY, self._member(user_id, companion_id))
+        pipe.hget(self.ATTEMPTS_KEY, self._member(user_id, companion_id))
+        length, _, _, started_at, attempts = await pipe.execute()
+
+        # 失败后的退避期内窗口满了也不提取，到期后由超时条件触发
+        due = now - float(started_at or now) >= self.window_seconds
+        if due or (length >= self.window_turns and not attempts):
+            flushed = await self.flush(user_id, companion_id, reason="window_timeout" if due else "window_full")
+            saved.update(flushed or {})
+
+        return saved or None
+
+    async def flush(self, user_id: str, companion_id: int, reason: str = "manual") -> Optional[Dict[str, str]]:
+        """
+        对窗口内累积的对话做一次事实提取并写入 L3
+
+        取出和清空窗口在同一个事务中完成，并发 flush 只有一个会拿到数据。
+        提取失败时把对话放回窗口并推迟下次重试；连续失败达到上限时丢弃窗口。
+        """
+        from app.services.memory_integration import memory_system
+        from app.services.redis_memory import get_redis_memory
+
+        redis = await get_redis()
+        key = self._window_key(user_id, companion_id)
+        member = self._member(user_id, companion_id)
+
+        pipe = redis.pipeline(transaction=True)
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        pipe.zrem(self.PENDING_KEY, member)
+        pipe.hget(self.ATTEMPTS_KEY, member)
+        pipe.hdel(self.ATTEMPTS_KEY, member)
+        raw_turns, _, _, attempts, _ = await pipe.execute()
+        if not raw_turns:
+            return None
+
+        turns = [json.loads(raw) for raw in raw_turns]
+        text = "\n".join(f"用户: {t['user']}\nAI: {t['ai']}" for t in turns)
+        try:
+            facts = await memory_system._extract_facts(text, raise_on_error=True)
+            if facts:
+                redis_mem = await get_redis_memory()
+                await redis_mem.save_multiple_facts(user_id, companion_id, facts)
+            logger.info(
+                f"✅ 窗口事实提取 {user_id}:{companion_id} "
+                f"({len(turns)} 轮, 原因: {reason}, 提取 {len(facts) if facts else 0} 个事实)"
+            )
+            return facts
+        except Exception as e:
+            attempts = int(attempts or 0) + 1
+            if attempts >= settings.FACT_WINDOW_MAX_ATTEMPTS:
+                logger.error(
+                    f"❌ 窗口事实提取连续失败 {attempts} 次，丢弃 {len(turns)} 轮对话 "
+                    f"({user_id}:{companion_id}): {e}"
+                )
+                return None
+
+            delay = settings.FACT_WINDOW_RETRY_SECONDS * 2 ** (attempts - 1)
+            logger.warning(f"⚠️ 窗口事实提取失败（第 {attempts} 次），已放回窗口，{delay:.0f} 秒后重试: {e}")
+            pipe = redis.pipeline(transaction=True)
+            pipe.lpush(key, *reversed(raw_turns))
+            pipe.expire(key, int(self.window_seconds * 10 + delay))
+            # 分数覆盖期间新轮次写入的首轮时间：flush_stale 和 add_turn 都在重试时间之后才会提取
+            pipe.zadd(self.PENDING_KEY, {member: time.time() + delay - self.window_seconds})
+            pipe.hset(self.ATTEMPTS_KEY, member, attempts)
+            await pipe.execute()
+            return None
+
+    async def flush_stale(self) -> int:
+        """
+        提取所有已超时的窗口（启动时和后台周期调用）
+
+        Returns:
+            提取的窗口数
+        """
+        try:
+            redis = await get_redis()
+            members: List[str] = await redis.zrangebyscore(
+                self.PENDING_KEY, "-inf", time.time() - self.window_seconds
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 读取待提取窗口失败: {e}")
+            return 0
+
+        for member in members:
+            user_id, _, companion_id = member.rpartition("|")
+            await self.flush(user_id, int(companion_id), reason="stale")
+        return len(members)
+
+    async def start(self):
+        """启动后台超时窗口提取"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.task = asyncio.create_task(self._run_loop())
+        logger.info("事实提取累积器已启动")
+
+    async def stop(self):
+        """停止后台任务（未提取的窗口保留在Redis中）"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("事实提取累积器已停止")
+
+    async def _run_loop(self):
+        while self.is_running:
+            try:
+                await self.flush_stale()
+                await asyncio.sleep(max(30.0, self.window_seconds / 2))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"超时窗口提取出错: {e}")
+                await asyncio.sleep(60)
+
+
+# 全局实例
+fact_accumulator = FactExtractionAccumulator()
@@ -0,0 +1,171 @@
+"""
+本地规则事实提取器 - L3语义记忆的前置过滤
+
+大多数对话轮次并不包含新的用户事实，每轮都调用 LLM 提取既慢又贵。
+本模块用预编译的正则规则直接提取常见事实（昵称、年龄、城市、职业、
+喜好/厌恶、梦想、生日、宠物），键名与 RedisMemorySystem.get_fact_categories
+的分类规则一致；只有出现规则未覆盖的"触发短语"时才需要交给 LLM。
+
+只应作用于用户说的话（AI 回复中的"我"指的是伙伴自己）。
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+
+_VALUE = r"[一-龥A-Za-z0-9·]"
+_STOP = r"(?=[，。！？、,.!?;；~\s]|$)"
+_TRAILING_PARTICLES = "了啊呀哦啦呢吧哈嘛噢喔"
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+# 用户发言从 "用户:" 开始，到下一个 "AI:" / "用户:" 行为止（一条消息可能跨多行）
+_USER_LINE = re.compile(r"^用户\s*[:：][ \t]*(.*?)\s*(?=^(?:用户|AI)\s*[:：]|\Z)", re.MULTILINE | re.DOTALL)
+
+
+def _clean(value: str) -> str:
+    return value.strip().rstrip(_TRAILING_PARTICLES)
+
+
+def _cn_number(text: str) -> Optional[int]:
+    """解析两位以内的中文数字（十八、二十三、九）"""
+    if text.isdigit():
+        return int(text)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        value = (_CN_DIGITS.get(tens, 1) if tens else 1) * 10
+        return value + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    if len(text) == 1 and text in _CN_DIGITS:
+        return _CN_DIGITS[text]
+    return None
+
+
+def _age(match) -> Optional[Tuple[str, str]]:
+    age = _cn_number(match.group(1))
+    if age is None or not 3 <= age <= 99:
+        return None
+    return "年龄", f"{age}岁"
+
+
+def _birthday(match) -> Optional[Tuple[str, str]]:
+    month, day = int(match.group(1)), int(match.group(2))
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return "特殊日期_生日", f"{month:02d}-{day:02d}"
+
+
+def _preference(match) -> Optional[Tuple[str, str]]:
+    verb, value = match.group(1), _clean(match.group(2))
+    if not value or value in ("你", "你们", "这样", "那样", "这个", "那个"):
+        return None
+    verb = {"爱吃": "喜欢", "爱看": "喜欢", "爱喝": "喜欢", "爱玩": "喜欢", "不喜欢": "讨厌", "害怕": "讨厌"}.get(verb, verb)
+    return f"{verb}_{value}", value
+
+
+def _preference_of(match) -> Optional[Tuple[str, str]]:
+    verb, noun, value = match.group(1), match.group(2), _clean(match.group(3))
+    return (f"{verb}的{noun}", value) if value else None
+
+
+def _simple(key: str) -> Callable:
+    def build(match) -> Optional[Tuple[str, str]]:
+        value = _clean(match.group(1))
+        if not value or value[0] in "了过着的":
+            return None
+        return key, value
+    return build
+
+
+@dataclass
+class FactRule:
+    """单条提取规则：正则 + 把匹配结果转换为 (事实键, 值) 的函数"""
+    name: str
+    pattern: Pattern
+    build: Callable
+
+
+@dataclass
+class FactExtractionResult:
+    """本地提取结果"""
+    facts: Dict[str, str] = field(default_factory=dict)
+    needs_llm: bool = False
+    triggers: List[str] = field(default_factory=list)
+
+
+FACT_RULES: List[FactRule] = [
+    FactRule("nickname", re.compile(rf"(?:我叫|叫我|我的名字(?:是|叫)|我名字叫|我的昵称是)\s*({_VALUE}{{1,10}}?){_STOP}"), _simple("昵称")),
+    FactRule("age", re.compile(r"(?:我(?:今年|现在)?|今年)(?:已经)?(\d{1,2}|[一二两三四五六七八九十]{1,3})岁"), _age),
+    FactRule("birthday", re.compile(r"我的?生日(?:是|在)?\s*(\d{1,2})\s*月\s*(\d{1,2})\s*[日号]"), _birthday),
+    FactRule("city", re.compile(rf"我(?:现在)?(?:住在|生活在|定居在|搬到了?)({_VALUE}{{2,6}}?)(?:市|区|县)?{_STOP}"), _simple("所在城市")),
+    FactRule("work_city", re.compile(r"(?:我|^|[，,])(?:现在)?在([一-龥]{2,5}?)(?:市)?(?:工作|上班|上学|读书|生活)"), _simple("所在城市")),
+    FactRule("hometown", re.compile(r"我(?:是|来自)([一-龥]{2,5}?)人"), _simple("家乡")),
+    FactRule("job", re.compile(
+        r"(?:我|^|[，,])(?:是(?:一名|一个|个)?|当|在做)([一-龥]{0,6}?"
+        r"(?:程序员|工程师|设计师|老师|教师|医生|护士|律师|会计|学生|研究生|博士生|画家|作家|"
+        r"厨师|司机|记者|警察|销售|产品经理|运营|主播|模特|演员|歌手|老板|公务员))"
+    ), _simple("职业")),
+    FactRule("job_explicit", re.compile(rf"我的(?:工作|职业)是({_VALUE}{{2,10}}?){_STOP}"), _simple("职业")),
+    FactRule("preference_of", re.compile(rf"我最?(喜欢|讨厌|热爱)的([一-龥]{{1,6}})是({_VALUE}{{1,12}}?){_STOP}"), _preference_of),
+    FactRule("like", re.compile(rf"我(?:最|很|超|特别|非常|真的)?(喜欢|热爱|爱吃|爱看|爱喝|爱玩)(?!的)({_VALUE}{{1,12}}?){_STOP}"), _preference),
+    FactRule("dislike", re.compile(rf"我(?:最|很|超|特别|非常|真的)?(讨厌|不喜欢|害怕)({_VALUE}{{1,12}}?){_STOP}"), _preference),
+    FactRule("dream", re.compile(r"我的(?:梦想|愿望|理想)是([^，。！？,.!?]{2,20})"), _simple("梦想")),
+    FactRule("pet", re.compile(rf"我(?:家|养)的?(?:猫|狗|宠物|小猫|小狗)(?:叫|的名字是)({_VALUE}{{1,6}}?){_STOP}"), _simple("宠物名字")),
+]
+
+# 可能包含规则未覆盖事实的短语，出现时交给 LLM 提取
+TRIGGER_PATTERN = re.compile(
+    "|".join([
+        "我是(?!不是|说|在|真的|不)", "我叫(?![了过你])", "我的", "我家", "我住", "我今年", "我养",
+        "我喜欢(?!你)", "我讨厌(?!你)", "我爱(?!你)", "我最", "我怕", "我不吃", "过敏",
+        "我妈", "我爸", "我哥", "我姐", "我弟", "我妹", "我男朋友", "我女朋友", "我老婆", "我老公",
+        "生日", "纪念日", "毕业", "结婚", "分手", "我想成为", "我小时候", "我以前",
+        "记住", "别忘了",
+    ])
+)
+
+
+def user_text_of(text: str) -> str:
+    """从 "用户: ...\\nAI: ..." 格式的对话中取出用户说的话，不是该格式时原样返回"""
+    lines = _USER_LINE.findall(text or "")
+    return "\n".join(lines) if lines else (text or "")
+
+
+class RuleBasedFactExtractor:
+    """基于预编译正则的本地事实提取器"""
+
+    def __init__(self, rules: Optional[List[FactRule]] = None, trigger_pattern: Pattern = TRIGGER_PATTERN):
+        self.rules = rules or FACT_RULES
+        self.trigger_pattern = trigger_pattern
+
+    def extract(self, text: str) -> FactExtractionResult:
+        """
+        提取用户文本中的事实
+
+        Args:
+            text: 用户说的话（不要包含AI回复）
+
+        Returns:
+            FactExtractionResult: 规则提取的事实；needs_llm 表示仍有规则未覆盖的触发短语
+        """
+        result = FactExtractionResult()
+        if not text or not text.strip():
+            return result
+
+        covered: List[Tuple[int, int]] = []
+        for rule in self.rules:
+            for match in rule.pattern.finditer(text):
+                fact = rule.build(match)
+                if fact is None:
+                    continue
+                key, value = fact
+                result.facts.setdefault(key, value)
+                covered.append(match.span())
+
+        for trigger in self.trigger_pattern.finditer(text):
+            start, end = trigger.span()
+            if not any(s <= start and end <= e for s, e in covered):
+                result.triggers.append(trigger.group(0))
+
+        result.needs_llm = bool(result.triggers)
+        return result
+
+
+# 全局实例
+fact_extractor = RuleBasedFactExtractor()
@@ -0,0 +1,154 @@
+"""
+聊天会话最近历史缓存 - Redis 定长列表
+
+每轮对话都要读取最近若干条消息作为上下文，join_chat 还会读 20 条；原先每次都
+按时间倒序查询 chat_messages。这里为每个聊天会话维护一个定长 Redis 列表：
+
+- chat_history:{chat_session_id}  最新的消息在表头，最多 CHAT_HISTORY_CACHE_SIZE 条
+- 消息持久化成功后 LPUSHX + LTRIM 追加（列表不存在时不创建，避免残缺的历史）
+- 读取时一次 LRANGE；未命中时从数据库加载满一整个列表的消息并回填
+- 会话被删除时整体失效
+- chat_history:{chat_session_id}:version 在每次追加/失效时加一。回填前先读版本号，
+  回填时 WATCH 该键：加载数据库期间有新消息提交（其 LPUSHX 因列表不存在而落空）时放弃回填，
+  下次读取重新从数据库加载，避免回填出缺少新消息的列表
+
+Redis 不可用时所有操作静默退化，调用方回落到数据库。
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from redis.exceptions import WatchError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger("history_cache")
+
+
+class ChatHistoryCache:
+    """按聊天会话缓存最近的消息"""
+
+    KEY_PREFIX = "chat_history"
+
+    def __init__(self, size: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        """
+        Args:
+            size: 每个会话缓存的消息条数，默认取 CHAT_HISTORY_CACHE_SIZE
+            ttl_seconds: 列表过期时间，默认取 CHAT_HISTORY_CACHE_TTL_SECONDS
+        """
+        self.size = max(1, size or settings.CHAT_HISTORY_CACHE_SIZE)
+        self.ttl_seconds = ttl_seconds or settings.CHAT_HISTORY_CACHE_TTL_SECONDS
+
+    def _key(self, chat_session_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{chat_session_id}"
+
+    def _version_key(self, chat_session_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{chat_session_id}:version"
+
+    @staticmethod
+    def _encode(message: Dict) -> str:
+        timestamp = message.get('timestamp')
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        return json.dumps(
+            {'role': message['role'], 'content': message['content'], 'timestamp': timestamp},
+            ensure_ascii=False
+        )
+
+    async def get(self, chat_session_id: int, limit: int) -> Optional[List[Dict]]:
+        """
+        读取最近 limit 条消息（按时间正序）
+
+        Returns:
+            命中时返回消息列表；未命中、limit 超过缓存容量或 Redis 不可用时返回None
+        """
+        if limit > self.size:
+            return None
+        try:
+            redis = await get_redis()
+            items = await redis.lrange(self._key(chat_session_id), 0, limit - 1)
+        except Exception as e:
+            logger.debug(f"读取历史缓存失败: {e}")
+            return None
+        if not items:
+            return None
+        return [json.loads(item) for item in reversed(items)]
+
+    async def version(self, chat_session_id: int) -> Optional[str]:
+        """读取会话的写入版本号（从数据库加载历史之前调用，传给 populate）"""
+        try:
+            redis = await get_redis()
+            return await redis.get(self._version_key(chat_session_id))
+        except Exception as e:
+            logger.debug(f"读取历史缓存版本失败: {e}")
+            return None
+
+    async def populate(self, chat_session_id: int, history: Sequence[Dict], version: Optional[str]) -> bool:
+        """
+        用数据库加载的历史（按时间正序，最多 size 条）回填整个列表
+
+        Args:
+            version: 加载数据库之前 version() 的返回值；之后有追加或失效时放弃回填
+        Returns:
+            是否回填
+        """
+        if not history:
+            return False
+        key = self._key(chat_session_id)
+        version_key = self._version_key(chat_session_id)
+        try:
+            redis = await get_redis()
+            async with redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(version_key)
+                if await pipe.get(version_key) != version:
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *[self._encode(m) for m in reversed(history[-self.size:])])
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+            return True
+        except WatchError:
+            logger.debug(f"回填期间会话 {chat_session_id} 有新写入，放弃回填")
+            return False
+        except Exception as e:
+            logger.debug(f"回填历史缓存失败: {e}")
+            return False
+
+    async def append(self, chat_session_id: int, messages: Sequence[Dict]):
+        """消息持久化后追加到列表头部（列表不存在时不创建）"""
+        if not messages:
+            return
+        key = self._key(chat_session_id)
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=True)
+            # 按时间顺序逐条推入表头，最新的消息最后推入
+            pipe.lpushx(key, *[self._encode(m) for m in messages])
+            pipe.ltrim(key, 0, self.size - 1)
+            pipe.expire(key, self.ttl_seconds)
+            # 列表不存在时 LPUSHX 落空，版本号让进行中的回填失效
+            pipe.incr(self._version_key(chat_session_id))
+            pipe.expire(self._version_key(chat_session_id), self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ 追加历史缓存失败，使缓存失效: {e}")
+            await self.invalidate(chat_session_id)
+
+    async def invalidate(self, chat_session_id: int):
+        """删除会话的历史缓存（消息被删除或修改时调用）"""
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=True)
+            pipe.delete(self._key(chat_session_id))
+            pipe.incr(self._version_key(chat_session_id))
+            pipe.expire(self._version_key(chat_session_id), self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            logger.debug(f"删除历史缓存失败: {e}")
+
+
+# 全局实例
+chat_history_cache = ChatHistoryCache()
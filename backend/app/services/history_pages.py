@@ -0,0 +1,119 @@
+"""
+聊天历史分页 - 按 (timestamp, id) 的 keyset 分页读取会话消息
+
+原接口 selectinload 会话的全部消息并构造 ORM 对象，长会话一次返回数MB。这里：
+
+- 游标是 base64url 编码的 {"ts": 时间, "id": 消息ID}，before 游标向更早翻页（无限滚动）
+- 只查询响应需要的列，结果是元组，不进入 ORM 身份映射
+- 走 chat_messages(session_id, timestamp) 索引定位，每页耗时只和页大小有关，与会话长度无关
+- ETag 由会话ID、游标和本页消息范围计算，客户端带 If-None-Match 可得到 304
+"""
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Select, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.chat_session import ChatMessage
+
+# 响应中每条消息的字段（与 ChatMessageResponse 一致）
+MESSAGE_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.session_id,
+    ChatMessage.role,
+    ChatMessage.content,
+    ChatMessage.timestamp,
+)
+
+
+class InvalidHistoryCursor(ValueError):
+    """历史游标无法解析"""
+
+
+def encode_history_cursor(timestamp: datetime, message_id: int) -> str:
+    raw = json.dumps({"ts": timestamp.isoformat(), "id": message_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，返回 (时间, 消息ID)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        timestamp = datetime.fromisoformat(payload["ts"])
+        message_id = payload["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidHistoryCursor(f"无效的游标: {cursor}") from e
+    if not isinstance(message_id, int):
+        raise InvalidHistoryCursor(f"无效的游标: {cursor}")
+    return timestamp, message_id
+
+
+def recent_messages_statement(session_id: int, limit: int) -> Select:
+    """会话最近 limit 条消息（ORM 对象，时间倒序，相同时间戳按ID倒序；对话上下文加载用）"""
+    return select(ChatMessage).where(
+        ChatMessage.session_id == session_id
+    ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit)
+
+
+def history_page_statement(session_id: int, limit: int, before: Optional[str] = None) -> Select:
+    """before 游标之前最近 limit 条消息的响应列（时间倒序）"""
+    stmt = select(*MESSAGE_COLUMNS).where(ChatMessage.session_id == session_id)
+    if before:
+        timestamp, message_id = decode_history_cursor(before)
+        # 冗余的 timestamp <= 条件让索引按范围定位，只写 OR 时只能按 session_id 定位后逐行过滤
+        stmt = stmt.where(
+            ChatMessage.timestamp <= timestamp,
+            or_(ChatMessage.timestamp < timestamp, ChatMessage.id < message_id)
+        )
+    return stmt.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit)
+
+
+async def fetch_history_page(
+    db: AsyncSession,
+    session_id: int,
+    limit: int,
+    before: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    读取会话中 before 游标之前最近的一页消息
+
+    Args:
+        before: 上一页返回的 next_cursor，为空时读取最新一页
+    Returns:
+        (按时间正序的消息列表, 更早一页的游标；没有更早的消息时为 None)
+    """
+    rows = (await db.execute(history_page_statement(session_id, limit + 1, before))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+
+    messages = [dict(row._mapping) for row in rows]
+    next_cursor = encode_history_cursor(rows[0].timestamp, rows[0].id) if has_more else None
+    return messages, next_cursor
+
+
+def history_etag(session: Any, before: Optional[str], messages: List[Dict[str, Any]]) -> str:
+    """
+    本页的弱 ETag
+
+    消息只追加不修改，一页内容由游标和首尾消息ID、条数确定；会话信息随页一起返回，
+    其标题、最后更新时间和消息总数也参与计算。
+    """
+    parts = [
+        session.id,
+        session.updated_at.isoformat() if session.updated_at else "",
+        session.total_messages,
+        session.is_active,
+        session.session_title or "",
+        before or "",
+        len(messages),
+        messages[0]["id"] if messages else "",
+        messages[-1]["id"] if messages else "",
+    ]
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest}"'
@@ -0,0 +1,378 @@
+"""
+情景记忆整理任务 - L2记忆的合并、摘要与容量控制
+
+`conversation_memories` 只增不减，每个(用户, 伙伴)分区会无限增长，
+检索成本和Prompt噪声随之上升。本任务在后台周期性运行：
+
+1. 近重复合并：按向量余弦相似度聚类，保留重要性最高/最新的一条
+2. 旧记忆摘要：将久远且低重要性的记忆按时间分组，压缩为 digest 条目
+3. 容量控制：分区超过上限时按 重要性 + 新近度 淘汰
+4. 存储压缩：量化集合的墓碑比例超过阈值时重写集合文件
+
+增量执行：只处理上次运行后被写入过的分区（保存记忆时登记到Redis集合），
+每轮处理的分区数和分区间隔可配置（限速），每个分区的前后大小记录在Redis中。
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger("memory_consolidation")
+
+SECONDS_PER_DAY = 86400
+RECENCY_HALF_LIFE_DAYS = 30
+REPORT_EXPIRE_SECONDS = 30 * SECONDS_PER_DAY
+
+
+def memory_timestamp(metadata: Dict) -> float:
+    """读取记忆时间（兼容只有 created_at ISO 字符串的旧数据）"""
+    if metadata.get("created_ts") is not None:
+        return float(metadata["created_ts"])
+    created_at = metadata.get("created_at")
+    if created_at:
+        try:
+            parsed = datetime.fromisoformat(created_at)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.timestamp()
+        except ValueError:
+            pass
+    return 0.0
+
+
+def memory_importance(metadata: Dict) -> float:
+    return float(metadata.get("importance", 0.5))
+
+
+def retention_score(metadata: Dict, now: float) -> float:
+    """保留分数 = 重要性 与 新近度（半衰期30天）的加权"""
+    age_days = max(0.0, now - memory_timestamp(metadata)) / SECONDS_PER_DAY
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return 0.7 * memory_importance(metadata) + 0.3 * recency
+
+
+def plan_duplicate_merges(
+    memories: List[Dict],
+    threshold: float
+) -> Tuple[List[Tuple[Dict, List[Dict]]], List[str]]:
+    """
+    贪心聚类近重复记忆
+
+    按 (重要性, 时间) 降序依次取未归类的记忆作为代表，
+    与其相似度 >= threshold 的未归类记忆并入同一簇。
+
+    Returns:
+        (clusters, delete_ids): 包含重复项的簇 [(代表, 被合并项)] 与待删除ID
+    """
+    if len(memories) < 2:
+        return [], []
+
+    order = sorted(
+        range(len(memories)),
+        key=lambda i: (memory_importance(memories[i]["metadata"]), memory_timestamp(memories[i]["metadata"])),
+        reverse=True
+    )
+    vectors = np.asarray([memories[i]["embedding"] for i in order], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+
+    assigned = np.zeros(len(order), dtype=bool)
+    clusters, delete_ids = [], []
+    for position in range(len(order)):
+        if assigned[position]:
+            continue
+        assigned[position] = True
+        similarities = vectors @ vectors[position]
+        members = np.nonzero((similarities >= threshold) & ~assigned)[0]
+        if len(members) == 0:
+            continue
+        assigned[members] = True
+        duplicates = [memories[order[m]] for m in members]
+        clusters.append((memories[order[position]], duplicates))
+        delete_ids.extend(d["id"] for d in duplicates)
+
+    return clusters, delete_ids
+
+
+def plan_evictions(memories: List[Dict], cap: int, now: float) -> List[str]:
+    """分区超过上限时，按保留分数从低到高淘汰"""
+    overflow = len(memories) - cap
+    if overflow <= 0:
+        return []
+    ranked = sorted(memories, key=lambda m: retention_score(m["metadata"], now))
+    return [m["id"] for m in ranked[:overflow]]
+
+
+class MemoryConsolidationJob:
+    """情景记忆后台整理任务"""
+
+    TOUCHED_KEY = "memory_consolidation:touched"
+    REPORT_PREFIX = "memory_consolidation:report"
+    LAST_RUN_KEY = "memory_consolidation:last_run"
+
+    def __init__(self):
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------
+    # 增量登记
+    # ------------------------------------------------------------
+
+    async def mark_touched(self, user_id: str, companion_id: int):
+        """登记被写入过的分区，下一轮整理时处理"""
+        try:
+            redis = await get_redis()
+            await redis.sadd(self.TOUCHED_KEY, f"{user_id}|{companion_id}")
+        except Exception as e:
+            logger.debug(f"登记待整理分区失败: {e}")
+
+    # ------------------------------------------------------------
+    # 调度
+    # ------------------------------------------------------------
+
+    async def start(self):
+        """启动整理任务"""
+        if self.is_running:
+            logger.warning("记忆整理任务已在运行")
+            return
+
+        self.is_running = True
+        self.task = asyncio.create_task(self._run_loop())
+        logger.info("记忆整理任务已启动")
+
+    async def stop(self):
+        """停止整理任务"""
+        if not self.is_running:
+            return
+
+        self.is_running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("记忆整理任务已停止")
+
+    async def _run_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.sleep(settings.MEMORY_CONSOLIDATION_INTERVAL_MINUTES * 60)
+                await self.run_once()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"记忆整理任务执行出错: {e}")
+
+    async def run_once(self, max_partitions: Optional[int] = None) -> Dict:
+        """
+        执行一轮增量整理
+
+        Args:
+            max_partitions: 本轮最多处理的分区数，默认取配置
+
+        Returns:
+            本轮汇总报告
+        """
+        from app.services.chromadb_memory import get_chroma_memory
+
+        summary = {
+            "started_at": datetime.utcnow().isoformat(),
+            "partitions": 0,
+            "before": 0,
+            "after": 0,
+            "failed": 0
+        }
+
+        chroma = await get_chroma_memory()
+        if chroma is None:
+            return summary
+
+        redis = await get_redis()
+        limit = max_partitions or settings.MEMORY_CONSOLIDATION_MAX_PARTITIONS
+        partitions = await redis.spop(self.TOUCHED_KEY, limit) or []
+
+        for index, partition in enumerate(partitions):
+            user_id, _, companion_id = partition.rpartition("|")
+            try:
+                report = await self.consolidate_partition(chroma, user_id, int(companion_id))
+                summary["partitions"] += 1
+                summary["before"] += report["before"]
+                summary["after"] += report["after"]
+            except Exception as e:
+                summary["failed"] += 1
+                logger.error(f"❌ 分区整理失败 {partition}: {e}")
+                # 失败的分区留到下一轮重试
+                await redis.sadd(self.TOUCHED_KEY, partition)
+
+            if index < len(partitions) - 1:
+                await asyncio.sleep(settings.MEMORY_CONSOLIDATION_PAUSE_SECONDS)
+
+        summary["finished_at"] = datetime.utcnow().isoformat()
+        await redis.set(self.LAST_RUN_KEY, json.dumps(summary))
+        if summary["partitions"]:
+            logger.info(
+                f"✅ 记忆整理完成: {summary['partitions']} 个分区，"
+                f"{summary['before']} → {summary['after']} 条"
+            )
+        return summary
+
+    # ------------------------------------------------------------
+    # 单分区整理
+    # ------------------------------------------------------------
+
+    async def consolidate_partition(self, chroma, user_id: str, companion_id: int) -> Dict:
+        """
+        整理单个(用户, 伙伴)分区：合并近重复 → 摘要旧记忆 → 容量淘汰
+
+        Returns:
+            前后大小报告
+        """
+        started = time.perf_counter()
+        now = time.time()
+        # Chroma 客户端是同步的，读写放到线程中执行，避免阻塞事件循环
+        memories = await asyncio.to_thread(
+            chroma.get_partition_memories, user_id, companion_id, include_embeddings=True
+        )
+        report = {
+            "user_id": user_id,
+            "companion_id": companion_id,
+            "before": len(memories),
+            "merged": 0,
+            "digested": 0,
+            "digests_created": 0,
+            "evicted": 0,
+            "compacted": 0
+        }
+
+        # 1. 近重复合并
+        clusters, delete_ids = plan_duplicate_merges(memories, settings.MEMORY_DUPLICATE_SIMILARITY)
+        if clusters:
+            update_ids, update_metadatas = [], []
+            for representative, duplicates in clusters:
+                metadata = dict(representative["metadata"])
+                metadata["importance"] = max(
+                    memory_importance(m["metadata"]) for m in [representative] + duplicates
+                )
+                metadata["merged_count"] = sum(
+                    int(m["metadata"].get("merged_count", 1)) for m in [representative] + duplicates
+                )
+                representative["metadata"] = metadata
+                update_ids.append(representative["id"])
+                update_metadatas.append(metadata)
+            await asyncio.to_thread(chroma.update_memory_metadata, user_id, companion_id, update_ids, update_metadatas)
+            report["merged"] = await asyncio.to_thread(chroma.delete_memories, user_id, companion_id, delete_ids)
+
+        deleted = set(delete_ids)
+        survivors = [m for m in memories if m["id"] not in deleted]
+
+        # 2. 旧的低重要性记忆 → 摘要
+        cutoff = now - settings.MEMORY_DIGEST_AGE_DAYS * SECONDS_PER_DAY
+        stale = sorted(
+            (
+                m for m in survivors
+                if m["metadata"].get("type") != "digest"
+                and memory_timestamp(m["metadata"]) < cutoff
+                and memory_importance(m["metadata"]) <= settings.MEMORY_DIGEST_MAX_IMPORTANCE
+            ),
+            key=lambda m: memory_timestamp(m["metadata"])
+        )
+        group_size = max(2, settings.MEMORY_DIGEST_GROUP_SIZE)
+        digested_ids = set()
+        for start in range(0, len(stale), group_size):
+            group = stale[start:start + group_size]
+            if len(group) < 2:
+                break
+            digest_text = await self._summarize([m["document"] for m in group])
+            saved = await chroma.save_memory(
+                user_id=user_id,
+                companion_id=companion_id,
+                memory_text=digest_text,
+                memory_type="digest",
+                importance=max(memory_importance(m["metadata"]) for m in group),
+                created_ts=max(memory_timestamp(m["metadata"]) for m in group)
+            )
+            if not saved:
+                continue
+            group_ids = [m["id"] for m in group]
+            await asyncio.to_thread(chroma.delete_memories, user_id, companion_id, group_ids)
+            digested_ids.update(group_ids)
+            report["digests_created"] += 1
+        report["digested"] = len(digested_ids)
+
+        # 3. 容量控制
+        if digested_ids:
+            survivors = await asyncio.to_thread(chroma.get_partition_memories, user_id, companion_id)
+        evict_ids = plan_evictions(survivors, settings.MEMORY_PARTITION_CAP, now)
+        report["evicted"] = await asyncio.to_thread(chroma.delete_memories, user_id, companion_id, evict_ids)
+
+        report["after"] = len(survivors) - report["evicted"]
+
+        # 4. 删除只写墓碑（量化集合），墓碑比例过高时压缩分区所在集合回收空间
+        report["compacted"] = await asyncio.to_thread(
+            chroma.compact_collection, user_id, companion_id, settings.MEMORY_COMPACT_DEAD_RATIO
+        )
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["consolidated_at"] = datetime.utcnow().isoformat()
+
+        try:
+            redis = await get_redis()
+            await redis.setex(
+                f"{self.REPORT_PREFIX}:{user_id}:{companion_id}",
+                REPORT_EXPIRE_SECONDS,
+                json.dumps(report)
+            )
+        except Exception as e:
+            logger.debug(f"保存整理报告失败: {e}")
+
+        logger.info(
+            f"📦 分区整理 {user_id}:{companion_id} {report['before']} → {report['after']} "
+            f"(合并 {report['merged']}, 摘要 {report['digested']}, 淘汰 {report['evicted']})"
+        )
+        return report
+
+    async def get_report(self, user_id: str, companion_id: int) -> Optional[Dict]:
+        """获取分区最近一次整理报告"""
+        redis = await get_redis()
+        data = await redis.get(f"{self.REPORT_PREFIX}:{user_id}:{companion_id}")
+        return json.loads(data) if data else None
+
+    async def _summarize(self, documents: List[str]) -> str:
+        """将一组旧记忆压缩为摘要，LLM不可用时退化为抽取式摘要"""
+        try:
+            from app.services.llm.factory import llm_service
+
+            joined = "\n---\n".join(documents)
+            prompt = f"""以下是用户与AI伙伴过去的几段对话记录。
+请用一到三句话概括其中关于用户的关键信息和发生的事情，使用第三人称，不要编造。
+
+{joined}
+
+请只返回摘要文本。"""
+            summary = await asyncio.wait_for(
+                llm_service.chat_completion([{"role": "user", "content": prompt}]),
+                timeout=30
+            )
+            if summary and summary.strip():
+                return f"[往事摘要] {summary.strip()}"
+        except Exception as e:
+            logger.debug(f"LLM摘要失败，使用抽取式摘要: {e}")
+
+        lines = []
+        for document in documents:
+            first_line = document.strip().splitlines()[0] if document.strip() else ""
+            if first_line:
+                lines.append(first_line[:60])
+        return "[往事摘要] " + "；".join(lines)
+
+
+# 全局实例
+memory_consolidation_job = MemoryConsolidationJob()
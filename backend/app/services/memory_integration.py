@@ -14,10 +14,14 @@
 3. 自动事实提取从对话中学习用户信息
 """
 from typing import List, Dict, Optional, Tuple
+import json
 import logging
 from app.services.memory_manager import memory_manager  # L1工作记忆
 from app.services.chromadb_memory import get_chroma_memory, CHROMADB_AVAILABLE  # L2情景记忆
-from app.services.redis_memory import get_redis_memory  # L3语义记忆
+from app.services.redis_memory import RedisMemorySystem, get_redis_memory  # L3语义记忆
+from app.services.memory_consolidation import memory_consolidation_job  # L2后台整理
+from app.services.fact_extractor import fact_extractor, user_text_of  # L3本地事实提取
+from app.services.fact_accumulator import fact_accumulator  # L3窗口化批量提取
 
 logger = logging.getLogger("memory_integration")
 
@@ -103,6 +107,25 @@ class MemorySystemInterface:
             logger.error(f"L3查询失败: {e}")
             return None
 
+    async def warm_up(self, user_id: str, companion_id: int) -> bool:
+        """
+        预热L2分区（join_chat 时后台调用，首条消息的检索不再付冷启动开销）
+
+        Returns:
+            是否完成预热
+        """
+        try:
+            if CHROMADB_AVAILABLE:
+                chroma = await get_chroma_memory()
+                if chroma:
+                    await chroma.warm_partition(user_id, companion_id)
+                    return True
+            return False
+
+        except Exception as e:
+            logger.warning(f"L2预热失败: {e}")
+            return False
+
     async def save_memory(
         self,
         user_id: str,
@@ -142,12 +165,15 @@ class MemorySystemInterface:
                 chroma = await get_chroma_memory()
                 if chroma:
                     memory_text = f"用户: {user_message}\nAI: {ai_response}"
-                    await chroma.save_memory(
+                    saved = await chroma.save_memory(
                         user_id=user_id,
                         companion_id=companion_id,
                         memory_text=memory_text,
-                        memory_type=memory_type
+                        memory_type=memory_type,
+                        importance=await self._memory_importance(user_id, companion_id, memory_text)
                     )
+                    if saved:
+                        await memory_consolidation_job.mark_touched(user_id, companion_id)
                     logger.info("✓ L2: 情景记忆已保存")
             except Exception as e:
                 logger.warning(f"⚠ L2保存失败: {e}")
@@ -155,18 +181,15 @@ class MemorySystemInterface:
         else:
             logger.debug("L2: ChromaDB未可用")
 
-        # L3: 自动提取事实
+        # L3: 自动提取事实（规则命中立即写入，需要LLM的轮次按窗口批量提取）
         try:
-            redis_mem = await get_redis_memory()
-            extracted_facts = await self._extract_facts(
-                f"{user_message}\n{ai_response}"
+            extracted_facts = await fact_accumulator.add_turn(
+                user_id=user_id,
+                companion_id=companion_id,
+                user_message=user_message,
+                ai_response=ai_response
             )
             if extracted_facts:
-                await redis_mem.save_multiple_facts(
-                    user_id=user_id,
-                    companion_id=companion_id,
-                    facts=extracted_facts
-                )
                 logger.info(f"✓ L3: 提取 {len(extracted_facts)} 个新事实")
         except Exception as e:
             logger.warning(f"⚠ L3事实提取失败: {e}")
@@ -265,21 +288,40 @@ class MemorySystemInterface:
             logger.error(f"摘要获取失败: {e}")
             return summary
 
+    async def _memory_importance(self, user_id: str, companion_id: int, memory_text: str) -> float:
+        """按关键词和关系阶段评估记忆重要性（供整理任务淘汰/摘要使用）"""
+        try:
+            from app.services.redis_utils import redis_affinity_manager
+            state = await redis_affinity_manager.get_companion_state(user_id, companion_id)
+            return redis_affinity_manager._calculate_memory_importance(
+                memory_text, state or {"romance_level": None}
+            )
+        except Exception as e:
+            logger.debug(f"记忆重要性计算失败: {e}")
+            return 0.5
+
     async def _extract_facts(
         self,
         text: str,
-        llm_service=None
+        llm_service=None,
+        raise_on_error: bool = False
     ) -> Optional[Dict[str, str]]:
         """
-        使用LLM从文本中提取结构化事实
+        从文本中提取结构化事实（本地规则优先，必要时调用LLM）
 
         Args:
             text: 输入文本
             llm_service: LLM服务实例
+            raise_on_error: LLM调用失败或返回非JSON时抛出异常而不是只返回本地规则结果
+                （窗口提取需要据此把对话放回窗口重试）
 
         Returns:
             提取的事实字典
         """
+        local = fact_extractor.extract(user_text_of(text))
+        if not local.needs_llm:
+            return local.facts or None
+
         try:
             if not llm_service:
                 from app.services.llm.factory import llm_service as default_llm
@@ -303,8 +345,7 @@ class MemorySystemInterface:
             ])
 
             # 解析JSON
-            import json
-            facts = json.loads(response)
+            facts = {**local.facts, **json.loads(response)}
 
             if facts:
                 logger.debug(f"提取 {len(facts)} 个事实")
@@ -312,11 +353,15 @@ class MemorySystemInterface:
             return None
 
         except json.JSONDecodeError:
-            logger.debug("LLM返回非JSON格式，跳过事实提取")
-            return None
+            if raise_on_error:
+                raise
+            logger.debug("LLM返回非JSON格式，仅使用本地规则结果")
+            return local.facts or None
         except Exception as e:
+            if raise_on_error:
+                raise
             logger.warning(f"事实提取异常: {e}")
-            return None
+            return local.facts or None
 
 
 # 全局记忆系统实例
@@ -367,21 +412,20 @@ class SimpleRedisMemorySystem(MemorySystemInterface):
     生产环境建议使用专业向量数据库
     """
 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, expire_days: int = 180):
         self.redis = redis_client
+        # 键结构、旧版 JSON 字符串的迁移和 TTL 与 RedisMemorySystem 一致
+        self._store = RedisMemorySystem(expire_days=expire_days)
 
     async def get_user_facts(
         self,
         user_id: str,
         companion_id: int
     ) -> Dict[str, str]:
-        """从Redis获取用户事实"""
-        key = f"user_facts:{user_id}:{companion_id}"
+        """从Redis获取用户事实（Hash结构，与RedisMemorySystem一致）"""
+        key = self._store._make_key(user_id, companion_id)
         try:
-            facts_json = await self.redis.get(key)
-            if facts_json:
-                import json
-                return json.loads(facts_json)
+            return await self._store._run(self.redis, user_id, companion_id, lambda client: client.hgetall(key))
         except Exception as e:
             logger.error(f"获取用户事实失败: {e}")
         return {}
@@ -393,14 +437,9 @@ class SimpleRedisMemorySystem(MemorySystemInterface):
         fact_key: str,
         fact_value: str
     ):
-        """保存单个用户事实"""
-        key = f"user_facts:{user_id}:{companion_id}"
+        """保存单个用户事实（字段级写入并续期 TTL，不会覆盖并发写入的其他事实）"""
         try:
-            facts = await self.get_user_facts(user_id, companion_id)
-            facts[fact_key] = fact_value
-
-            import json
-            await self.redis.set(key, json.dumps(facts, ensure_ascii=False))
+            await self._store._write_facts(user_id, companion_id, {fact_key: fact_value}, None, redis=self.redis)
             logger.info(f"保存用户事实: {fact_key} = {fact_value}")
         except Exception as e:
             logger.error(f"保存用户事实失败: {e}")
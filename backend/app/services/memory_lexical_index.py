@@ -0,0 +1,377 @@
+"""
+情景记忆倒排索引 - 字符二元组 BM25 检索
+
+中文短消息的向量表示区分度较低，"豆豆最近怎么样"这类包含宠物名、
+城市名的消息常常检索不到相关记忆。本模块为每个(用户, 伙伴)分区维护
+一个字符二元组倒排索引，按 BM25 打分，与向量检索结果做倒数排名融合（RRF）。
+
+- 增量更新：save_memory 时追加，整理任务删除记忆时同步移除
+- 紧凑持久化：每个分区落盘 {id: 文本} 的 gzip JSON 快照加追加日志，倒排表加载时重建；
+  写入只追加日志，日志过长时压缩成新快照
+- 延迟预算：检索按查询词逐个累加得分，超出预算立即返回已有结果
+"""
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有跨进程文件锁，按单写者进程运行
+    fcntl = None
+
+logger = logging.getLogger("memory_lexical_index")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+MAX_QUERY_TERMS = 32
+COMPACT_MIN_LOG_ENTRIES = 256  # 日志记录数超过该值且超过分区记忆数的一半时压缩
+
+_CJK_RUN = re.compile(r"[㐀-鿿]+")
+_WORD = re.compile(r"[a-z0-9]+")
+_ROLE_PREFIX = re.compile(r"^(用户|AI)\s*[:：]\s*", re.MULTILINE)
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按字符二元组切分（单字保留为一元组），英文/数字按单词切分"""
+    text = _ROLE_PREFIX.sub("", text or "").lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(text))
+    return tokens
+
+
+class PartitionIndex:
+    """单个分区的 BM25 倒排索引"""
+
+    def __init__(self):
+        self.texts: Dict[str, str] = {}
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        # 持久化状态：已回放到的日志偏移、日志中的记录数、加载时的快照文件标识
+        self.log_offset = 0
+        self.log_entries = 0
+        self.snapshot_stamp: Optional[Tuple[int, int, int]] = None
+
+    def add(self, memory_id: str, text: str):
+        if memory_id in self.texts:
+            self.remove(memory_id)
+        terms = Counter(tokenize(text))
+        self.texts[memory_id] = text
+        self.lengths[memory_id] = sum(terms.values())
+        self.total_length += self.lengths[memory_id]
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[memory_id] = tf
+
+    def remove(self, memory_id: str) -> bool:
+        text = self.texts.pop(memory_id, None)
+        if text is None:
+            return False
+        self.total_length -= self.lengths.pop(memory_id, 0)
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(memory_id, None)
+                if not posting:
+                    del self.postings[term]
+        return True
+
+    def search(self, query: str, limit: int, budget_ms: float) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            limit: 返回条数
+            budget_ms: 延迟预算，超出后停止累加剩余查询词
+
+        Returns:
+            [(memory_id, score)]，按得分降序
+        """
+        n_docs = len(self.texts)
+        if n_docs == 0:
+            return []
+
+        deadline = time.perf_counter() + budget_ms / 1000
+        average_length = self.total_length / n_docs
+        # 先处理文档频率低（区分度高）的词，预算耗尽时丢弃的是最不重要的部分
+        terms = sorted(
+            (t for t in set(tokenize(query)) if t in self.postings),
+            key=lambda t: len(self.postings[t])
+        )[:MAX_QUERY_TERMS]
+
+        scores: Dict[str, float] = {}
+        for term in terms:
+            posting = self.postings[term]
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for memory_id, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[memory_id] / average_length)
+                scores[memory_id] = scores.get(memory_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            if time.perf_counter() > deadline:
+                logger.debug(f"倒排检索超出预算 {budget_ms}ms，已处理 {terms.index(term) + 1}/{len(terms)} 个词")
+                break
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class MemoryLexicalIndex:
+    """
+    分区倒排索引管理器
+
+    每个分区在磁盘上是一个快照（{key}.json.gz，{id: 文本}）加一个追加日志（{key}.log，
+    每行一条 {"op": "add"/"del", ...}）。修改只向日志追加一行；日志条数超过分区记忆数的一半
+    （且超过 COMPACT_MIN_LOG_ENTRIES）时把内存中的分区写成新快照并清空日志，
+    重写整个分区的开销摊到多次写入上。快照替换后、日志清空前崩溃时，重放日志的结果不变。
+
+    已加载的分区放在 LRU 缓存中。每次访问先对比快照文件标识并回放日志的新增部分，
+    其它进程的写入和压缩都能看到。磁盘读写都是阻塞调用，由调用方放到线程中执行
+    （asyncio.to_thread）；同一分区的访问由线程锁串行化。
+
+    多进程：有 fcntl 时每个分区的读写和压缩持有该分区的文件锁，多个 worker 进程可以
+    同时写入（要求本地文件系统）；没有 fcntl 的平台（Windows）按单写者进程运行。
+    """
+
+    def __init__(self, directory: str, max_partitions: int = 512):
+        self.directory = directory
+        self.max_partitions = max_partitions
+        self._partitions: "OrderedDict[str, PartitionIndex]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()  # 保护 LRU 缓存和锁表
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _partition_key(user_id: str, companion_id: int) -> str:
+        return hashlib.md5(f"{user_id}:{companion_id}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def _log_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.log")
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _file_lock(self, key: str):
+        """跨进程的分区文件锁（没有 fcntl 时为空操作）"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, f"{key}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _cache(self, key: str, index: PartitionIndex) -> PartitionIndex:
+        with self._guard:
+            self._partitions[key] = index
+            self._partitions.move_to_end(key)
+            while len(self._partitions) > self.max_partitions:
+                self._partitions.popitem(last=False)
+        return index
+
+    def _cached(self, key: str) -> Optional[PartitionIndex]:
+        with self._guard:
+            index = self._partitions.get(key)
+            if index is not None:
+                self._partitions.move_to_end(key)
+            return index
+
+    def _snapshot_stamp(self, key: str) -> Optional[Tuple[int, int, int]]:
+        """快照文件标识，压缩（替换快照）后改变"""
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _replay_log(self, key: str, index: PartitionIndex):
+        """回放日志中 index.log_offset 之后的完整记录"""
+        try:
+            with open(self._log_path(key), "rb") as f:
+                f.seek(index.log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # 只回放完整的行
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry["op"] == "add":
+                index.add(entry["id"], entry["text"])
+            else:
+                for memory_id in entry["ids"]:
+                    index.remove(memory_id)
+            index.log_entries += 1
+        index.log_offset += end
+
+    def _load(self, key: str) -> Optional[PartitionIndex]:
+        """返回与磁盘一致的分区索引（调用方持有分区锁和文件锁）"""
+        stamp = self._snapshot_stamp(key)
+        index = self._cached(key)
+        if index is not None and index.snapshot_stamp == stamp:
+            self._replay_log(key, index)
+            return index
+
+        if stamp is None and not os.path.exists(self._log_path(key)):
+            return None
+        index = PartitionIndex()
+        if stamp is not None:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                texts = json.load(f)
+            for memory_id, text in texts.items():
+                index.add(memory_id, text)
+        index.snapshot_stamp = stamp
+        self._replay_log(key, index)
+        return self._cache(key, index)
+
+    def _append(self, key: str, index: PartitionIndex, entries: Sequence[Dict]):
+        """向分区日志追加记录，日志过长时压缩（调用方持有分区锁和文件锁）"""
+        data = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries
+        ).encode("utf-8")
+        with open(self._log_path(key), "ab") as f:
+            f.write(data)
+        index.log_offset += len(data)
+        index.log_entries += len(entries)
+        if index.log_entries > max(COMPACT_MIN_LOG_ENTRIES, len(index.texts) // 2):
+            self._compact(key, index)
+
+    def _compact(self, key: str, index: PartitionIndex):
+        """把内存中的分区写成新快照并清空日志（调用方持有分区锁和文件锁）"""
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(index.texts, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        with open(self._log_path(key), "wb"):
+            pass
+        index.snapshot_stamp = self._snapshot_stamp(key)
+        index.log_offset = 0
+        index.log_entries = 0
+
+    def is_indexed(self, user_id: str, companion_id: int) -> bool:
+        key = self._partition_key(user_id, companion_id)
+        return (
+            self._cached(key) is not None
+            or os.path.exists(self._path(key))
+            or os.path.exists(self._log_path(key))
+        )
+
+    def warm(self, user_id: str, companion_id: int) -> bool:
+        """把分区索引加载到内存（会话预热时调用），返回分区是否已建立索引"""
+        key = self._partition_key(user_id, companion_id)
+        with self._lock_for(key), self._file_lock(key):
+            return self._load(key) is not None
+
+    def rebuild(self, user_id: str, companion_id: int, memories: Sequence[Tuple[str, str]]):
+        """用分区现有记忆 [(id, 文本)] 重建索引（旧数据回填）"""
+        key = self._partition_key(user_id, companion_id)
+        index = PartitionIndex()
+        for memory_id, text in memories:
+            index.add(memory_id, text)
+        with self._lock_for(key), self._file_lock(key):
+            self._compact(key, index)
+            self._cache(key, index)
+
+    def add(
+        self,
+        user_id: str,
+        companion_id: int,
+        memory_id: str,
+        text: str,
+        backfill: Optional[Callable[[], Sequence[Tuple[str, str]]]] = None
+    ):
+        """
+        增量添加一条记忆
+
+        Args:
+            backfill: 分区尚未建立索引时调用，返回分区已有记忆用于回填
+        """
+        key = self._partition_key(user_id, companion_id)
+        with self._lock_for(key), self._file_lock(key):
+            index = self._load(key)
+            if index is None:
+                index = self._cache(key, PartitionIndex())
+                if backfill is not None:
+                    for existing_id, existing_text in backfill():
+                        index.add(existing_id, existing_text)
+                    index.add(memory_id, text)
+                    self._compact(key, index)
+                    return
+            index.add(memory_id, text)
+            self._append(key, index, [{"op": "add", "id": memory_id, "text": text}])
+
+    def remove(self, user_id: str, companion_id: int, memory_ids: Sequence[str]):
+        """从分区索引中移除记忆"""
+        key = self._partition_key(user_id, companion_id)
+        with self._lock_for(key), self._file_lock(key):
+            index = self._load(key)
+            if index is None:
+                return
+            removed = [memory_id for memory_id in memory_ids if index.remove(memory_id)]
+            if removed:
+                self._append(key, index, [{"op": "del", "ids": removed}])
+
+    def search(
+        self,
+        user_id: str,
+        companion_id: int,
+        query: str,
+        limit: int,
+        budget_ms: Optional[float] = None
+    ) -> List[Tuple[str, str, float]]:
+        """
+        在分区内检索
+
+        延迟预算只约束打分；冷分区的加载（快照 + 日志回放）不计入预算，
+        由会话预热（warm）提前完成。
+
+        Returns:
+            [(memory_id, 文本, BM25得分)]
+        """
+        key = self._partition_key(user_id, companion_id)
+        with self._lock_for(key):
+            with self._file_lock(key):
+                index = self._load(key)
+            if index is None:
+                return []
+            budget = settings.MEMORY_LEXICAL_BUDGET_MS if budget_ms is None else budget_ms
+            return [
+                (memory_id, index.texts[memory_id], score)
+                for memory_id, score in index.search(query, limit, budget)
+            ]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], limit: int, k: int = RRF_K) -> List[str]:
+    """
+    倒数排名融合
+
+    score(d) = Σ 1 / (k + rank_i(d))，rank 从 1 开始
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)[:limit]
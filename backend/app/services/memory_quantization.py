@@ -0,0 +1,541 @@
+"""
+量化向量存储 - L2情景记忆的低内存后端
+
+ChromaDB 在内存中常驻完整的 float32 向量和 HNSW 图，用户量增长后
+`conversation_memories` 集合的内存占用会线性膨胀。本模块提供一个与
+Chroma Collection 接口兼容的量化集合：
+
+- 常驻内存的只有 int8 标量量化码（逐向量缩放），约为 float32 的 1/4
+- 全精度向量以追加文件形式落盘，检索时通过 memmap 只读取候选行
+- 查询先用量化码粗排，再对 top (n_results * rerank_factor) 候选做全精度重排
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("memory_quantization")
+
+INT8_MAX = 127
+
+
+class ScalarQuantizer:
+    """int8 对称标量量化（每个向量独立缩放）"""
+
+    @staticmethod
+    def encode(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        量化向量
+
+        Args:
+            vectors: (n, d) float32 向量矩阵
+
+        Returns:
+            (codes, scales): int8 量化码 (n, d) 和 float32 缩放系数 (n,)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / INT8_MAX
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None])
+        codes = np.clip(codes, -INT8_MAX, INT8_MAX).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    @staticmethod
+    def decode(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """反量化为 float32 近似向量"""
+        return codes.astype(np.float32) * scales[:, None]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2 归一化（余弦距离空间）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    """匹配单个字段条件（兼容 Chroma where 语法）"""
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for op, expected in condition.items():
+        if op == "$eq":
+            ok = value == expected
+        elif op == "$ne":
+            ok = value != expected
+        elif op == "$in":
+            ok = value in expected
+        elif op == "$nin":
+            ok = value not in expected
+        elif value is None:
+            ok = False
+        elif op == "$gt":
+            ok = value > expected
+        elif op == "$gte":
+            ok = value >= expected
+        elif op == "$lt":
+            ok = value < expected
+        elif op == "$lte":
+            ok = value <= expected
+        else:
+            raise ValueError(f"不支持的where操作符: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def match_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """判断元数据是否满足 Chroma 风格的 where 过滤条件"""
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, sub) for sub in condition):
+                return False
+        elif not _match_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+def _partition_of(metadata: Dict[str, Any]) -> Tuple[str, str]:
+    return str(metadata.get("user_id")), str(metadata.get("companion_id"))
+
+
+def _partition_from_where(where: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+    """从 where 条件中提取 (user_id, companion_id) 等值过滤，用于分区快速定位"""
+    if not where:
+        return None
+
+    equals: Dict[str, Any] = {}
+    clauses = where.get("$and", []) + [{k: v} for k, v in where.items() if k != "$and"]
+    for clause in clauses:
+        for key, condition in clause.items():
+            if isinstance(condition, dict):
+                if set(condition.keys()) == {"$eq"}:
+                    equals[key] = condition["$eq"]
+            elif not key.startswith("$"):
+                equals[key] = condition
+
+    if "user_id" in equals and "companion_id" in equals:
+        return str(equals["user_id"]), str(equals["companion_id"])
+    return None
+
+
+class QuantizedCollection:
+    """
+    int8 量化的向量集合（Chroma Collection 兼容子集）
+
+    支持 add / get / query / update / delete / count，where 语法与 Chroma 一致。
+    所有读写持有同一把可重入锁：检索在请求线程、整理任务在线程池中修改同一集合。
+
+    磁盘布局（directory/name/）：
+    - meta.json      向量维度
+    - codes.i8       int8 量化码（追加写）
+    - scales.f32     每个向量的缩放系数（追加写）
+    - vectors.f32    归一化后的全精度向量（追加写，查询时 memmap 读取）
+    - records.jsonl  记录日志（add / update / delete）
+
+    compact 在 {name}.compact 目录写出压缩后的文件，再把旧目录改名为 {name}.old、
+    新目录改名为 {name}；打开集合时清理两次改名之间崩溃留下的目录。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: str,
+        rerank_factor: int = 4,
+        embedding_function: Optional[Callable[[List[str]], List[Sequence[float]]]] = None
+    ):
+        """
+        初始化量化集合
+
+        Args:
+            name: 集合名称
+            directory: 量化数据根目录
+            rerank_factor: 全精度重排的候选倍数（1 表示不重排）
+            embedding_function: 文本向量化函数，未提供时延迟加载 Chroma 默认模型
+        """
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self.rerank_factor = max(1, int(rerank_factor))
+        self._embedding_function = embedding_function
+        self._lock = threading.RLock()
+
+        self._reset()
+        self._recover_compaction()
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _reset(self):
+        """清空内存中的状态"""
+        self.dim: Optional[int] = None
+        self._size = 0
+        self._codes = np.zeros((0, 0), dtype=np.int8)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._partition_rows: Dict[Tuple[str, str], List[int]] = {}
+
+        self._vectors_mm: Optional[np.memmap] = None
+        self._vectors_mm_rows = 0
+
+    # ------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------
+
+    def _file(self, filename: str) -> str:
+        return os.path.join(self.path, filename)
+
+    def _recover_compaction(self):
+        """处理 compact 中途崩溃：新目录未就位时恢复旧目录，删除残留的临时目录"""
+        compacting, old = f"{self.path}.compact", f"{self.path}.old"
+        if not os.path.exists(self.path) and os.path.exists(old):
+            os.replace(old, self.path)
+            logger.warning(f"⚠️ 量化集合 {self.name} 上次压缩未完成，已恢复压缩前的数据")
+        for leftover in (compacting, old):
+            if os.path.exists(leftover):
+                shutil.rmtree(leftover)
+
+    def _load(self):
+        """从磁盘恢复量化码和记录"""
+        meta_path = self._file("meta.json")
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+
+        codes = np.fromfile(self._file("codes.i8"), dtype=np.int8).reshape(-1, self.dim)
+        scales = np.fromfile(self._file("scales.f32"), dtype=np.float32)
+        rows = min(len(codes), len(scales))
+        self._reserve(rows)
+        self._codes[:rows] = codes[:rows]
+        self._scales[:rows] = scales[:rows]
+
+        with open(self._file("records.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["op"] == "add" and record["row"] < rows:
+                    self._register(record["row"], record["id"], record.get("document"), record.get("metadata") or {})
+                elif record["op"] == "update" and record["id"] in self._id_to_row:
+                    row = self._id_to_row[record["id"]]
+                    if "metadata" in record:
+                        self._metadatas[row] = record["metadata"]
+                    if "document" in record:
+                        self._documents[row] = record["document"]
+                elif record["op"] == "delete":
+                    self._unregister(record["id"])
+
+        self._size = rows
+        logger.info(f"✅ 量化集合已加载: {self.name} ({self.count()} 条, dim={self.dim})")
+
+    def _reserve(self, rows: int):
+        """按倍增策略扩容常驻数组，避免每次追加都整体复制"""
+        capacity = len(self._scales)
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 64)
+        codes = np.zeros((new_capacity, self.dim), dtype=np.int8)
+        scales = np.zeros(new_capacity, dtype=np.float32)
+        alive = np.zeros(new_capacity, dtype=bool)
+        if self._size:
+            codes[:self._size] = self._codes[:self._size]
+            scales[:self._size] = self._scales[:self._size]
+            alive[:self._size] = self._alive[:self._size]
+        self._codes, self._scales, self._alive = codes, scales, alive
+
+    def _register(self, row: int, memory_id: str, document: Optional[str], metadata: Dict[str, Any]):
+        while len(self._ids) <= row:
+            self._ids.append("")
+            self._documents.append(None)
+            self._metadatas.append({})
+        self._ids[row] = memory_id
+        self._documents[row] = document
+        self._metadatas[row] = metadata
+        self._alive[row] = True
+        self._id_to_row[memory_id] = row
+        self._partition_rows.setdefault(_partition_of(metadata), []).append(row)
+
+    def _unregister(self, memory_id: str) -> bool:
+        row = self._id_to_row.pop(memory_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        rows = self._partition_rows.get(_partition_of(self._metadatas[row]))
+        if rows and row in rows:
+            rows.remove(row)
+        return True
+
+    def _full_vectors(self) -> np.memmap:
+        """全精度向量的只读 memmap（仅在行数变化时重新映射）"""
+        if self._vectors_mm is None or self._vectors_mm_rows != self._size:
+            self._vectors_mm = np.memmap(
+                self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self._size, self.dim)
+            )
+            self._vectors_mm_rows = self._size
+        return self._vectors_mm
+
+    # ------------------------------------------------------------
+    # Chroma 兼容接口
+    # ------------------------------------------------------------
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._embedding_function is None:
+                from chromadb.utils import embedding_functions
+                self._embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        return np.asarray(self._embedding_function(list(texts)), dtype=np.float32)
+
+    def warm(self):
+        """加载嵌入模型（向量在打开集合时已映射，首次查询只差模型加载）"""
+        self._embed(["预热"])
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._id_to_row)
+
+    def dead_ratio(self) -> float:
+        """已删除（墓碑）行占存储行数的比例"""
+        with self._lock:
+            return (self._size - len(self._id_to_row)) / self._size if self._size else 0.0
+
+    def add(
+        self,
+        ids: List[str],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ):
+        """追加记录（量化码、全精度向量和记录日志同时落盘）"""
+        if not ids:
+            return
+        if embeddings is None:
+            if documents is None:
+                raise ValueError("documents 和 embeddings 不能同时为空")
+            embeddings = self._embed(documents)
+
+        with self._lock:
+            vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._codes = np.zeros((0, self.dim), dtype=np.int8)
+                with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不匹配: {vectors.shape[1]} != {self.dim}")
+
+            codes, scales = ScalarQuantizer.encode(vectors)
+            start = self._size
+            self._reserve(start + len(ids))
+            self._codes[start:start + len(ids)] = codes
+            self._scales[start:start + len(ids)] = scales
+
+            with open(self._file("codes.i8"), "ab") as f:
+                f.write(codes.tobytes())
+            with open(self._file("scales.f32"), "ab") as f:
+                f.write(scales.tobytes())
+            with open(self._file("vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+
+            with open(self._file("records.jsonl"), "a", encoding="utf-8") as f:
+                for offset, memory_id in enumerate(ids):
+                    if memory_id in self._id_to_row:
+                        self._unregister(memory_id)
+                    row = start + offset
+                    document = documents[offset] if documents else None
+                    metadata = metadatas[offset] if metadatas else {}
+                    self._register(row, memory_id, document, metadata)
+                    f.write(json.dumps({
+                        "op": "add", "id": memory_id, "row": row,
+                        "document": document, "metadata": metadata
+                    }, ensure_ascii=False) + "\n")
+
+            self._size = start + len(ids)
+
+    def _candidate_rows(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> List[int]:
+        if ids is not None:
+            rows = [self._id_to_row[i] for i in ids if i in self._id_to_row]
+        else:
+            partition = _partition_from_where(where)
+            if partition is not None:
+                rows = list(self._partition_rows.get(partition, []))
+            else:
+                rows = list(self._id_to_row.values())
+        rows.sort()
+        return [row for row in rows if match_where(self._metadatas[row], where)]
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: List[str] = ["metadatas", "documents"]
+    ) -> Dict[str, Any]:
+        """按ID或where条件获取记录（按写入顺序）"""
+        with self._lock:
+            rows = self._candidate_rows(ids, where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+
+            result: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+            result["documents"] = [self._documents[r] for r in rows] if "documents" in include else None
+            result["metadatas"] = [self._metadatas[r] for r in rows] if "metadatas" in include else None
+            if "embeddings" in include:
+                result["embeddings"] = self._full_vectors()[rows].tolist() if rows else []
+            else:
+                result["embeddings"] = None
+            return result
+
+    def query(
+        self,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: List[str] = ["metadatas", "documents", "distances"]
+    ) -> Dict[str, Any]:
+        """
+        向量检索：int8 粗排 + 全精度重排
+
+        距离为余弦距离 (1 - cos)，与 hnsw:space=cosine 的 Chroma 集合一致。
+        """
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts or [])
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+
+        with self._lock:
+            result: Dict[str, Any] = {key: [] for key in ("ids", "documents", "metadatas", "distances", "embeddings")}
+            rows = np.asarray(self._candidate_rows(None, where), dtype=np.int64)
+
+            for query in queries:
+                if len(rows) == 0 or self.dim is None:
+                    top_rows, distances = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+                else:
+                    # 粗排：量化码内积 * 缩放系数 ≈ 余弦相似度
+                    approx = (self._codes[rows].astype(np.float32) @ query) * self._scales[rows]
+                    n_candidates = min(len(rows), n_results * self.rerank_factor)
+                    candidates = rows[np.argpartition(-approx, n_candidates - 1)[:n_candidates]]
+
+                    # 精排：只读取候选行的全精度向量
+                    if self.rerank_factor > 1:
+                        exact = self._full_vectors()[candidates] @ query
+                    else:
+                        exact = approx[np.searchsorted(rows, candidates)]
+                    order = np.argsort(-exact)[:n_results]
+                    top_rows, distances = candidates[order], 1.0 - exact[order]
+
+                top = top_rows.tolist()
+                result["ids"].append([self._ids[r] for r in top])
+                result["documents"].append([self._documents[r] for r in top])
+                result["metadatas"].append([self._metadatas[r] for r in top])
+                result["distances"].append(distances.astype(float).tolist())
+                result["embeddings"].append(self._full_vectors()[top].tolist() if top else [])
+
+            for key in ("documents", "metadatas", "distances", "embeddings"):
+                if key not in include:
+                    result[key] = None
+            return result
+
+    def update(
+        self,
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        documents: Optional[List[str]] = None
+    ):
+        """更新记录的元数据/文档（向量不变，分区键不可修改）"""
+        with self._lock:
+            with open(self._file("records.jsonl"), "a", encoding="utf-8") as f:
+                for offset, memory_id in enumerate(ids):
+                    row = self._id_to_row.get(memory_id)
+                    if row is None:
+                        continue
+                    record: Dict[str, Any] = {"op": "update", "id": memory_id}
+                    if metadatas is not None:
+                        metadata = {**self._metadatas[row], **metadatas[offset]}
+                        if _partition_of(metadata) != _partition_of(self._metadatas[row]):
+                            raise ValueError("不支持修改记录的 user_id / companion_id")
+                        self._metadatas[row] = metadata
+                        record["metadata"] = metadata
+                    if documents is not None:
+                        self._documents[row] = documents[offset]
+                        record["document"] = documents[offset]
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """删除记录（写入墓碑，空间在 compact 时回收）"""
+        with self._lock:
+            target_ids = [self._ids[r] for r in self._candidate_rows(ids, where)]
+            if not target_ids:
+                return
+            with open(self._file("records.jsonl"), "a", encoding="utf-8") as f:
+                for memory_id in target_ids:
+                    if self._unregister(memory_id):
+                        f.write(json.dumps({"op": "delete", "id": memory_id}) + "\n")
+
+    def compact(self) -> int:
+        """
+        重写存储文件，回收已删除记录占用的空间
+
+        压缩后的文件先完整写到临时目录，再通过目录改名替换，中途失败不影响原数据。
+
+        Returns:
+            回收的记录条数
+        """
+        with self._lock:
+            dead = self._size - len(self._id_to_row)
+            if dead == 0 or self.dim is None:
+                return 0
+
+            rows = sorted(self._id_to_row.values())
+            compacting, old = f"{self.path}.compact", f"{self.path}.old"
+            if os.path.exists(compacting):
+                shutil.rmtree(compacting)
+            target = QuantizedCollection(
+                os.path.basename(compacting), os.path.dirname(self.path),
+                self.rerank_factor, self._embedding_function
+            )
+            if rows:
+                target.add(
+                    ids=[self._ids[r] for r in rows],
+                    documents=[self._documents[r] for r in rows],
+                    metadatas=[self._metadatas[r] for r in rows],
+                    embeddings=np.array(self._full_vectors()[rows])
+                )
+            else:
+                with open(target._file("meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+                for filename in ("codes.i8", "scales.f32", "vectors.f32", "records.jsonl"):
+                    open(target._file(filename), "wb").close()
+
+            self._vectors_mm = None
+            os.replace(self.path, old)
+            os.replace(compacting, self.path)
+            shutil.rmtree(old)
+
+            self._reset()
+            self._load()
+            logger.info(f"✅ 量化集合已压缩: {self.name}，回收 {dead} 条")
+            return dead
+
+    def resident_bytes(self) -> int:
+        """常驻内存的向量数据大小（量化码 + 缩放系数）"""
+        with self._lock:
+            return int(self._size * ((self.dim or 0) + 4))
@@ -0,0 +1,138 @@
+"""
+情景记忆重排 - 相似度 + 新近度 + 重要性 打分与 MMR 去冗余
+
+向量库返回的 top-k 只按余弦距离排序，会忽略记忆的时间和重要性，
+还经常返回几条内容几乎相同的记忆。检索时先多取候选，再在一次
+NumPy 计算中完成打分，最后用 MMR（最大边际相关性）挑选互相差异较大的结果。
+
+    score = w_sim * 相似度 + w_rec * 0.5^(年龄/半衰期) + w_imp * 重要性
+    MMR   = λ * score - (1 - λ) * max(与已选记忆的相似度)
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.memory_consolidation import memory_importance, memory_timestamp
+
+SECONDS_PER_DAY = 86400
+
+
+@dataclass
+class RankingWeights:
+    """重排权重配置"""
+    similarity: float = 1.0
+    recency: float = 0.3
+    importance: float = 0.3
+    half_life_days: float = 14.0
+    mmr_lambda: float = 0.7
+    min_similarity: float = 0.2
+
+    @classmethod
+    def from_settings(cls) -> "RankingWeights":
+        return cls(
+            similarity=settings.MEMORY_RANK_SIMILARITY_WEIGHT,
+            recency=settings.MEMORY_RANK_RECENCY_WEIGHT,
+            importance=settings.MEMORY_RANK_IMPORTANCE_WEIGHT,
+            half_life_days=settings.MEMORY_RECENCY_HALF_LIFE_DAYS,
+            mmr_lambda=settings.MEMORY_MMR_LAMBDA,
+            min_similarity=settings.MEMORY_MIN_SIMILARITY
+        )
+
+
+def score_candidates(
+    distances: Sequence[float],
+    metadatas: Sequence[Dict],
+    weights: RankingWeights,
+    now: Optional[float] = None
+) -> np.ndarray:
+    """
+    计算候选记忆的综合得分
+
+    Args:
+        distances: 余弦距离（1 - cos）
+        metadatas: 候选记忆元数据（importance / created_ts）
+        weights: 权重配置
+        now: 当前时间戳
+
+    Returns:
+        (n,) 综合得分；相似度低于 min_similarity 的候选为 -inf
+    """
+    now = now if now is not None else time.time()
+    similarity = 1.0 - np.asarray(distances, dtype=np.float64)
+    timestamps = np.fromiter((memory_timestamp(m or {}) for m in metadatas), dtype=np.float64, count=len(metadatas))
+    importance = np.fromiter((memory_importance(m or {}) for m in metadatas), dtype=np.float64, count=len(metadatas))
+
+    age_days = np.maximum(0.0, now - timestamps) / SECONDS_PER_DAY
+    recency = np.power(0.5, age_days / max(weights.half_life_days, 1e-6))
+
+    scores = weights.similarity * similarity + weights.recency * recency + weights.importance * importance
+    scores[similarity < weights.min_similarity] = -np.inf
+    return scores
+
+
+def mmr_select(
+    scores: np.ndarray,
+    embeddings: Optional[Sequence[Sequence[float]]],
+    limit: int,
+    mmr_lambda: float
+) -> List[int]:
+    """
+    最大边际相关性选择
+
+    Args:
+        scores: 综合得分（-inf 的候选不会被选中）
+        embeddings: 候选向量，为空时退化为按得分排序
+        limit: 选择数量
+        mmr_lambda: 相关性与多样性的权衡（1.0 = 只看得分）
+
+    Returns:
+        选中的候选下标（按选择顺序）
+    """
+    valid = np.isfinite(scores)
+    if not valid.any():
+        return []
+    if embeddings is None or len(embeddings) == 0 or mmr_lambda >= 1.0:
+        order = np.argsort(-scores)
+        return [int(i) for i in order[:min(limit, int(valid.sum()))]]
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+    pairwise = vectors @ vectors.T
+
+    # 得分归一化到 [0, 1]，与相似度惩罚处于同一量纲
+    finite = scores[valid]
+    span = finite.max() - finite.min()
+    relevance = np.where(valid, (scores - finite.min()) / span if span > 0 else 1.0, -np.inf)
+
+    selected: List[int] = []
+    redundancy = np.zeros(len(scores), dtype=np.float32)
+    available = valid.copy()
+    while available.any() and len(selected) < limit:
+        mmr = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return selected
+
+
+def rank_memories(
+    documents: Sequence[str],
+    distances: Sequence[float],
+    metadatas: Sequence[Dict],
+    embeddings: Optional[Sequence[Sequence[float]]],
+    limit: int,
+    weights: Optional[RankingWeights] = None,
+    now: Optional[float] = None
+) -> List[str]:
+    """对向量检索的候选记忆重排，返回最终的记忆文本列表"""
+    if not documents:
+        return []
+    weights = weights or RankingWeights.from_settings()
+    scores = score_candidates(distances, metadatas, weights, now)
+    return [documents[i] for i in mmr_select(scores, embeddings, limit, weights.mmr_lambda)]
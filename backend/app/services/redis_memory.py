@@ -6,24 +6,71 @@ Redis KV存储实现 - L3语义记忆系统
 """
 import logging
 import json
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from redis.exceptions import ResponseError
 from app.core.redis_client import get_redis
 
 logger = logging.getLogger("redis_memory")
 
 
+# 旧版 JSON 字符串 → Hash 的原子迁移脚本（仅当 key 仍是 string 类型时执行）
+_MIGRATE_JSON_TO_HASH = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'string' then
+    return 0
+end
+local ok, facts = pcall(cjson.decode, redis.call('GET', KEYS[1]))
+redis.call('DEL', KEYS[1])
+if not ok or type(facts) ~= 'table' then
+    return -1
+end
+local count = 0
+for field, value in pairs(facts) do
+    if type(value) == 'table' then
+        value = cjson.encode(value)
+    end
+    redis.call('HSET', KEYS[1], field, tostring(value))
+    redis.call('HSET', KEYS[2], field, ARGV[2])
+    count = count + 1
+end
+if count > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return count
+"""
+
+
+def categorize_fact_keys(keys) -> Dict[str, int]:
+    """按事实键名分类统计（特殊日期 / 偏好 / 梦想 / 基本信息）"""
+    categories = {}
+    for key in keys:
+        if "特殊日期" in key:
+            cat = "特殊日期"
+        elif any(x in key for x in ["喜欢", "讨厌", "热爱"]):
+            cat = "偏好"
+        elif "梦想" in key:
+            cat = "梦想"
+        else:
+            cat = "基本信息"
+
+        categories[cat] = categories.get(cat, 0) + 1
+
+    return categories
+
+
 class RedisMemorySystem:
     """
     基于Redis的L3语义记忆系统实现
 
     存储结构：
-    - key: user_facts:{user_id}:{companion_id}
-    - value: JSON格式的用户事实字典
+    - key: user_facts:{user_id}:{companion_id}       Hash，字段为事实键，值为事实内容
+    - key: user_facts_meta:{user_id}:{companion_id}  Hash，字段为事实键，值为 JSON {updated_at, confidence}
 
     特点：
-    - 快速键值查询
-    - 实时更新
-    - 支持TTL过期时间
+    - 字段级读写（HSET/HDEL/HGETALL），并发对话不会互相覆盖
+    - 写入与 TTL 续期在同一个 pipeline 中完成
+    - 旧版 JSON 字符串数据在首次访问时自动迁移为 Hash
     """
 
     def __init__(self, expire_days: int = 180):
@@ -35,12 +82,81 @@ class RedisMemorySystem:
         """
         self.expire_seconds = expire_days * 24 * 3600
         self.key_prefix = "user_facts"
+        self.meta_prefix = "user_facts_meta"
         logger.info(f"✅ Redis L3语义记忆已初始化 (过期时间: {expire_days}天)")
 
     def _make_key(self, user_id: str, companion_id: int) -> str:
         """生成Redis key"""
         return f"{self.key_prefix}:{user_id}:{companion_id}"
 
+    def _make_meta_key(self, user_id: str, companion_id: int) -> str:
+        """生成事实元数据的Redis key"""
+        return f"{self.meta_prefix}:{user_id}:{companion_id}"
+
+    @staticmethod
+    def _is_wrong_type(error: Exception) -> bool:
+        return isinstance(error, ResponseError) and "WRONGTYPE" in str(error)
+
+    async def _migrate_legacy(self, redis, user_id: str, companion_id: int) -> int:
+        """将旧版 JSON 字符串 key 原子迁移为 Hash"""
+        meta = json.dumps({"updated_at": datetime.utcnow().isoformat(), "confidence": None})
+        count = await redis.eval(
+            _MIGRATE_JSON_TO_HASH,
+            2,
+            self._make_key(user_id, companion_id),
+            self._make_meta_key(user_id, companion_id),
+            self.expire_seconds,
+            meta
+        )
+        if count:
+            logger.info(f"🔄 用户事实已迁移为Hash ({user_id}:{companion_id}, {count} 个字段)")
+        return count
+
+    async def _run(self, redis, user_id: str, companion_id: int, build: Callable):
+        """
+        执行读写命令；遇到旧版 string key（WRONGTYPE）时先迁移再重试一次
+
+        Args:
+            build: 接收 redis 客户端并返回 awaitable 的函数
+        """
+        try:
+            return await build(redis)
+        except ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            await self._migrate_legacy(redis, user_id, companion_id)
+            return await build(redis)
+
+    @staticmethod
+    def _encode_value(value) -> str:
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    async def _write_facts(
+        self,
+        user_id: str,
+        companion_id: int,
+        facts: Dict[str, str],
+        confidence: Optional[float],
+        redis=None
+    ):
+        """HSET 事实与元数据并续期 TTL（单个事务 pipeline；redis 为空时使用全局客户端）"""
+        redis = redis or await get_redis()
+        key = self._make_key(user_id, companion_id)
+        meta_key = self._make_meta_key(user_id, companion_id)
+        meta = json.dumps({"updated_at": datetime.utcnow().isoformat(), "confidence": confidence})
+
+        async def execute(client):
+            pipe = client.pipeline(transaction=True)
+            pipe.hset(key, mapping={k: self._encode_value(v) for k, v in facts.items()})
+            pipe.hset(meta_key, mapping={k: meta for k in facts})
+            pipe.expire(key, self.expire_seconds)
+            pipe.expire(meta_key, self.expire_seconds)
+            return await pipe.execute()
+
+        await self._run(redis, user_id, companion_id, execute)
+
     async def get_user_facts(
         self,
         user_id: str,
@@ -67,29 +183,62 @@ class RedisMemorySystem:
             redis = await get_redis()
             key = self._make_key(user_id, companion_id)
 
-            # 从Redis获取
-            facts_json = await redis.get(key)
-            if facts_json:
-                facts = json.loads(facts_json)
+            facts = await self._run(redis, user_id, companion_id, lambda client: client.hgetall(key))
+            if facts:
                 logger.info(f"✅ 获取用户事实成功 ({len(facts)} 个字段)")
                 return facts
 
             logger.debug(f"📝 用户 {user_id} 暂无事实数据")
             return {}
 
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON解析失败: {e}")
-            return {}
         except Exception as e:
             logger.error(f"❌ 获取用户事实失败: {e}")
             return {}
 
+    async def get_facts_with_meta(
+        self,
+        user_id: str,
+        companion_id: int
+    ) -> Dict[str, Dict]:
+        """
+        获取用户事实及其元数据（一次往返）
+
+        Returns:
+            {事实键: {"value": ..., "updated_at": ..., "confidence": ...}}
+        """
+        try:
+            redis = await get_redis()
+            key = self._make_key(user_id, companion_id)
+            meta_key = self._make_meta_key(user_id, companion_id)
+
+            async def execute(client):
+                pipe = client.pipeline(transaction=False)
+                pipe.hgetall(key)
+                pipe.hgetall(meta_key)
+                return await pipe.execute()
+
+            facts, metas = await self._run(redis, user_id, companion_id, execute)
+            result = {}
+            for fact_key, value in facts.items():
+                meta = json.loads(metas[fact_key]) if fact_key in metas else {}
+                result[fact_key] = {
+                    "value": value,
+                    "updated_at": meta.get("updated_at"),
+                    "confidence": meta.get("confidence")
+                }
+            return result
+
+        except Exception as e:
+            logger.error(f"❌ 获取事实元数据失败: {e}")
+            return {}
+
     async def save_user_fact(
         self,
         user_id: str,
         companion_id: int,
         fact_key: str,
-        fact_value: str
+        fact_value: str,
+        confidence: Optional[float] = None
     ) -> bool:
         """
         保存单个用户事实
@@ -99,27 +248,13 @@ class RedisMemorySystem:
             companion_id: 伙伴ID
             fact_key: 事实的键（例如"昵称"、"职业"）
             fact_value: 事实的值
+            confidence: 事实置信度（0-1，来源不明时为None）
 
         Returns:
             是否保存成功
         """
         try:
-            redis = await get_redis()
-            key = self._make_key(user_id, companion_id)
-
-            # 获取现有事实
-            facts = await self.get_user_facts(user_id, companion_id)
-
-            # 更新事实
-            facts[fact_key] = fact_value
-
-            # 保存回Redis
-            await redis.setex(
-                key,
-                self.expire_seconds,
-                json.dumps(facts, ensure_ascii=False)
-            )
-
+            await self._write_facts(user_id, companion_id, {fact_key: fact_value}, confidence)
             logger.info(f"✅ 保存事实: {fact_key} = {fact_value}")
             return True
 
@@ -131,7 +266,8 @@ class RedisMemorySystem:
         self,
         user_id: str,
         companion_id: int,
-        facts: Dict[str, str]
+        facts: Dict[str, str],
+        confidence: Optional[float] = None
     ) -> bool:
         """
         一次性保存多个用户事实
@@ -140,27 +276,16 @@ class RedisMemorySystem:
             user_id: 用户ID
             companion_id: 伙伴ID
             facts: 事实字典
+            confidence: 这批事实的置信度
 
         Returns:
             是否保存成功
         """
         try:
-            redis = await get_redis()
-            key = self._make_key(user_id, companion_id)
-
-            # 获取现有事实
-            existing_facts = await self.get_user_facts(user_id, companion_id)
-
-            # 合并新旧事实
-            existing_facts.update(facts)
-
-            # 保存回Redis
-            await redis.setex(
-                key,
-                self.expire_seconds,
-                json.dumps(existing_facts, ensure_ascii=False)
-            )
+            if not facts:
+                return True
 
+            await self._write_facts(user_id, companion_id, facts, confidence)
             logger.info(f"✅ 批量保存 {len(facts)} 个事实")
             return True
 
@@ -188,24 +313,16 @@ class RedisMemorySystem:
         try:
             redis = await get_redis()
             key = self._make_key(user_id, companion_id)
+            meta_key = self._make_meta_key(user_id, companion_id)
 
-            # 获取现有事实
-            facts = await self.get_user_facts(user_id, companion_id)
-
-            # 删除指定事实
-            if fact_key in facts:
-                del facts[fact_key]
-
-                # 保存回Redis
-                if facts:  # 如果还有事实，保存
-                    await redis.setex(
-                        key,
-                        self.expire_seconds,
-                        json.dumps(facts, ensure_ascii=False)
-                    )
-                else:  # 如果没有事实了，删除整个key
-                    await redis.delete(key)
+            async def execute(client):
+                pipe = client.pipeline(transaction=True)
+                pipe.hdel(key, fact_key)
+                pipe.hdel(meta_key, fact_key)
+                return await pipe.execute()
 
+            removed, _ = await self._run(redis, user_id, companion_id, execute)
+            if removed:
                 logger.info(f"✅ 删除事实: {fact_key}")
                 return True
 
@@ -235,7 +352,7 @@ class RedisMemorySystem:
             redis = await get_redis()
             key = self._make_key(user_id, companion_id)
 
-            result = await redis.delete(key)
+            result = await redis.delete(key, self._make_meta_key(user_id, companion_id))
             if result:
                 logger.info(f"✅ 已清空用户事实")
                 return True
@@ -253,7 +370,7 @@ class RedisMemorySystem:
         companion_id: int
     ) -> Dict[str, int]:
         """
-        获取用户事实的分类统计
+        获取用户事实的分类统计（只读取字段名，HKEYS 一次往返）
 
         Args:
             user_id: 用户ID
@@ -268,23 +385,11 @@ class RedisMemorySystem:
             }
         """
         try:
-            facts = await self.get_user_facts(user_id, companion_id)
+            redis = await get_redis()
+            key = self._make_key(user_id, companion_id)
 
-            # 简单分类规则（可根据key前缀分类）
-            categories = {}
-            for key in facts.keys():
-                if "特殊日期" in key:
-                    cat = "特殊日期"
-                elif any(x in key for x in ["喜欢", "讨厌", "热爱"]):
-                    cat = "偏好"
-                elif "梦想" in key:
-                    cat = "梦想"
-                else:
-                    cat = "基本信息"
-
-                categories[cat] = categories.get(cat, 0) + 1
-
-            return categories
+            keys = await self._run(redis, user_id, companion_id, lambda client: client.hkeys(key))
+            return categorize_fact_keys(keys)
 
         except Exception as e:
             logger.error(f"❌ 获取分类统计失败: {e}")
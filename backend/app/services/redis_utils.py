@@ -304,6 +304,25 @@ class RedisAffinityManager:
             logger.error(f"[get_companion_state] {e}")
             return None
 
+    async def get_companion_states(self, user_id: str, companion_ids: List[int]) -> Dict[int, Optional[Dict]]:
+        """
+        一次 MGET 批量读取多个伙伴的状态（列表页使用）
+
+        只读不初始化：尚未建立关系的伙伴返回 None；Redis 不可用时全部返回 None。
+        """
+        states: Dict[int, Optional[Dict]] = {int(companion_id): None for companion_id in companion_ids}
+        if not states:
+            return states
+        try:
+            redis = await get_redis()
+            keys = [f"{self.state_prefix}:{user_id}:{companion_id}" for companion_id in states]
+            for companion_id, state_data in zip(list(states), await redis.mget(keys)):
+                if state_data:
+                    states[companion_id], _ = self._ensure_state_defaults(json.loads(state_data))
+        except Exception as e:
+            logger.error(f"[get_companion_states] {e}")
+        return states
+
     async def update_affinity(self, user_id: str, companion_id: int, affinity_change: int, 
                             trust_change: int = 0, tension_change: int = 0, 
                             interaction_type: str = "chat"):
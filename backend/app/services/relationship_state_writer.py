@@ -0,0 +1,219 @@
+"""
+关系状态回写 - 合并写入 companion_relationship_states
+
+Redis 保存关系状态的热副本，数据库副本原先每条消息都 SELECT 后再 UPDATE/INSERT。
+这里按 (用户, 伙伴) 在内存中合并待写入的状态：
+
+- 等级变化时立即写回；否则累积 RELATIONSHIP_STATE_FLUSH_EVERY 次交互后写回
+- 后台任务每 RELATIONSHIP_STATE_FLUSH_SECONDS 秒写回所有未落库的状态，停止时全部写回
+- 写回使用单条 INSERT ... ON CONFLICT (user_id, companion_id) DO UPDATE（SQLite / Postgres）
+- 后台任务未启动（脚本、测试）时每次直接写回
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import JSON, cast, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.models.relationship import CompanionRelationshipState
+
+logger = logging.getLogger("relationship_state_writer")
+
+StateKey = Tuple[str, int]
+
+
+def build_upsert(dialect_name: str, row: Dict[str, Any], absolute_total: bool):
+    """
+    构建关系状态的单条 upsert 语句
+
+    Args:
+        dialect_name: sqlite | postgresql
+        row: 要写入的列；positive/negative_interactions 为待累加的增量，没有 current_mood 时不覆盖已有值
+        absolute_total: total_interactions 是绝对值（来自 Redis 快照）还是待累加的增量
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise ValueError(f"关系状态 upsert 不支持的数据库: {dialect_name}")
+
+    table = CompanionRelationshipState.__table__
+    stmt = dialect_insert(table).values(**row)
+    excluded = stmt.excluded
+
+    # special_flags 按键合并，保留其它来源写入的标记
+    if dialect_name == "postgresql":
+        flags = cast(
+            func.coalesce(cast(table.c.special_flags, JSONB), cast("{}", JSONB)).op("||")(cast(excluded.special_flags, JSONB)),
+            JSON
+        )
+    else:
+        flags = func.json_patch(func.coalesce(table.c.special_flags, "{}"), excluded.special_flags)
+
+    set_ = {
+        "affinity_score": excluded.affinity_score,
+        "trust_score": excluded.trust_score,
+        "tension_score": excluded.tension_score,
+        "romance_stage": excluded.romance_stage,
+        "total_interactions": (
+            excluded.total_interactions if absolute_total
+            else table.c.total_interactions + excluded.total_interactions
+        ),
+        "positive_interactions": table.c.positive_interactions + excluded.positive_interactions,
+        "negative_interactions": table.c.negative_interactions + excluded.negative_interactions,
+        "special_flags": flags,
+        "last_interaction_at": excluded.last_interaction_at,
+        "updated_at": func.now(),
+    }
+    # 没有新心情时保留已有行的 current_mood
+    if "current_mood" in row:
+        set_["current_mood"] = excluded.current_mood
+
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.companion_id],
+        set_=set_
+    )
+
+
+class RelationshipStateWriter:
+    """按 (用户, 伙伴) 合并关系状态写入"""
+
+    def __init__(self, flush_every: Optional[int] = None, flush_seconds: Optional[float] = None):
+        """
+        Args:
+            flush_every: 累积多少次交互后写回，默认取 RELATIONSHIP_STATE_FLUSH_EVERY
+            flush_seconds: 定期写回间隔，默认取 RELATIONSHIP_STATE_FLUSH_SECONDS
+        """
+        self.flush_every = max(1, flush_every or settings.RELATIONSHIP_STATE_FLUSH_EVERY)
+        self.flush_seconds = flush_seconds or settings.RELATIONSHIP_STATE_FLUSH_SECONDS
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+        self._dirty: Dict[StateKey, Dict[str, Any]] = {}
+
+    async def record(
+        self,
+        user_id: str,
+        companion_id: int,
+        state: Dict[str, Any],
+        *,
+        total_interactions: Optional[int],
+        affinity_change: int,
+        flags: Dict[str, Any],
+        force: bool = False
+    ):
+        """
+        记录一次交互后的关系状态
+
+        Args:
+            state: affinity_score / trust_score / tension_score / romance_stage /
+                   current_mood（可选）/ last_interaction_at 的最新值
+            total_interactions: Redis 快照中的总交互次数（没有快照时为None，写回时按交互次数累加）
+            affinity_change: 本次好感度变化，用于正/负面交互计数
+            flags: 合并进 special_flags 的标记
+            force: 立即写回（例如等级变化）
+        """
+        key = (str(user_id), int(companion_id))
+        entry = self._dirty.setdefault(key, {
+            "interactions": 0, "positive": 0, "negative": 0, "flags": {}, "total": None
+        })
+        entry.setdefault("state", {}).update(state)
+        entry["interactions"] += 1
+        entry["positive"] += 1 if affinity_change > 0 else 0
+        entry["negative"] += 1 if affinity_change < 0 else 0
+        entry["flags"].update(flags)
+        if total_interactions is not None:
+            entry["total"] = total_interactions
+
+        if force or not self.is_running or entry["interactions"] >= self.flush_every:
+            await self.flush(key)
+
+    async def flush(self, key: StateKey) -> bool:
+        """写回一个 (用户, 伙伴) 的待写入状态"""
+        entry = self._dirty.pop(key, None)
+        if entry is None:
+            return False
+
+        absolute_total = entry["total"] is not None
+        row = {
+            "user_id": key[0],
+            "companion_id": key[1],
+            **entry["state"],
+            "total_interactions": entry["total"] if absolute_total else entry["interactions"],
+            "positive_interactions": entry["positive"],
+            "negative_interactions": entry["negative"],
+            "special_flags": entry["flags"],
+        }
+        try:
+            async with async_session_maker() as session:
+                await session.execute(build_upsert(session.bind.dialect.name, row, absolute_total))
+                await session.commit()
+            return True
+        except Exception:
+            self._merge_back(key, entry)
+            raise
+
+    def _merge_back(self, key: StateKey, entry: Dict[str, Any]):
+        """写回失败时把增量并回待写入状态，等待下次写回"""
+        newer = self._dirty.get(key)
+        if newer is None:
+            self._dirty[key] = entry
+            return
+        for field in ("interactions", "positive", "negative"):
+            newer[field] += entry[field]
+        newer["flags"] = {**entry["flags"], **newer["flags"]}
+        newer["state"] = {**entry["state"], **newer.get("state", {})}
+        if newer["total"] is None:
+            newer["total"] = entry["total"]
+
+    async def flush_all(self) -> int:
+        """写回所有待写入状态，返回写回条数"""
+        flushed = 0
+        for key in list(self._dirty):
+            try:
+                if await self.flush(key):
+                    flushed += 1
+            except Exception as e:
+                logger.warning(f"⚠️ 关系状态写回失败 {key}: {e}")
+        return flushed
+
+    async def start(self):
+        """启动定期写回"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.task = asyncio.create_task(self._run_loop())
+        logger.info(f"关系状态回写已启动 (每 {self.flush_every} 次交互 / {self.flush_seconds:.0f} 秒)")
+
+    async def stop(self):
+        """停止定期写回，并写回所有未落库的状态"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        flushed = await self.flush_all()
+        logger.info(f"关系状态回写已停止 (写回 {flushed} 条)")
+
+    async def _run_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.sleep(self.flush_seconds)
+                flushed = await self.flush_all()
+                if flushed:
+                    logger.debug(f"定期写回关系状态 {flushed} 条")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"关系状态定期写回出错: {e}")
+
+
+# 全局实例
+relationship_state_writer = RelationshipStateWriter()
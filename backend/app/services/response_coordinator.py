@@ -18,7 +18,10 @@ from app.services.emotion_expression_generator import emotion_expression_generat
 from app.services.dynamic_prompt_builder import dynamic_prompt_builder
 from app.services.llm.factory import llm_service
 from app.services.memory_integration import memory_system
+from app.services.conversation_summarizer import trim_history_to_budget
+from app.services.token_counter import count_tokens
 from app.services.task_manager import task_manager
+from app.core.config import settings
 
 logger = logging.getLogger("response_coordinator")
 
@@ -83,7 +86,10 @@ class ResponseCoordinator:
         conversation_history: Optional[List[Dict]] = None,
         enable_memory: bool = True,
         special_instructions: Optional[str] = None,
-        debug_mode: bool = False
+        debug_mode: bool = False,
+        prefetched_facts: Optional[Dict] = None,  # 会话预热取到的L3事实（首条消息），传入时不再查询
+        conversation_summary: Optional[str] = None,  # 会话滚动摘要（覆盖更早的对话）
+        prompt_version: str = "v1"  # 伙伴的人设Prompt版本
 
     ) -> CoordinatedResponse:
         """
@@ -118,7 +124,7 @@ class ResponseCoordinator:
             user_facts = None
             if enable_memory:
                 memories, user_facts = await self._query_memory(
-                    user_id, companion_id, user_message
+                    user_id, companion_id, user_message, prefetched_facts
                 )
 
             # 1.2 使用AffinityEngine进行情感分析和状态计算
@@ -181,8 +187,11 @@ class ResponseCoordinator:
                 "formality": emotion_expression.verbal_style['formality']
             }
 
-            # 2.2 构建L1工作记忆（当前对话上下文）
-            l1_working_memory = self._build_working_memory(conversation_history)
+            # 2.2 构建L1工作记忆（滚动摘要 + 按token预算截取的最近消息）
+            recent_history = trim_history_to_budget(
+                conversation_history, settings.CONVERSATION_TAIL_MAX_TOKENS
+            )
+            l1_working_memory = self._build_working_memory(recent_history, conversation_summary)
 
             # 2.3 构建动态系统提示词
             system_prompt = dynamic_prompt_builder.build(
@@ -198,13 +207,32 @@ class ResponseCoordinator:
                 l1_working_memory=l1_working_memory,
                 l2_episodic_memories=memories,
                 l3_semantic_facts=user_facts,
-                special_instructions=special_instructions
+                special_instructions=special_instructions,
+                companion_id=companion_id,
+                prompt_version=prompt_version
             )
 
-            self.logger.info(f"✅ 系统提示词构建完成 (长度: {len(system_prompt)} 字符)")
+            # 历史消息与系统提示词共用总预算：系统提示词和当前消息用剩的部分才给历史
+            system_tokens = count_tokens(system_prompt)
+            user_tokens = count_tokens(user_message)
+            recent_history = trim_history_to_budget(
+                recent_history,
+                min(settings.CONVERSATION_TAIL_MAX_TOKENS,
+                    settings.PROMPT_MAX_TOKENS - system_tokens - user_tokens)
+            )
+            prompt_tokens = system_tokens + user_tokens + sum(
+                count_tokens(m["content"]) for m in recent_history
+            )
+            self.logger.info(
+                f"✅ 系统提示词构建完成 (长度: {len(system_prompt)} 字符, "
+                f"含历史约 {prompt_tokens} tokens)"
+            )
 
             debug_info["stages"]["stage2_prompt"] = {
                 "prompt_length": len(system_prompt),
+                "prompt_tokens": prompt_tokens,
+                "history_messages": len(recent_history),
+                "has_summary": bool(conversation_summary),
                 "has_memories": bool(memories),
                 "has_facts": bool(user_facts)
             }
@@ -220,11 +248,12 @@ class ResponseCoordinator:
                 {"role": "user", "content": user_message}
             ]
 
-            # 如果有对话历史，添加最近几轮（最多3轮）
-            if conversation_history:
-                recent_history = conversation_history[-6:]  # 最近3轮（6条消息）
+            # 如果有对话历史，添加预算内的最近消息（更早的内容由滚动摘要覆盖）
+            if recent_history:
                 # 在system和user之间插入历史
-                messages = [messages[0]] + recent_history + [messages[1]]
+                messages = [messages[0]] + [
+                    {"role": m["role"], "content": m["content"]} for m in recent_history
+                ] + [messages[1]]
 
             # 3.2 调用LLM
             ai_response = await llm_service.chat_completion(messages)
@@ -291,11 +320,15 @@ class ResponseCoordinator:
         self,
         user_id: str,
         companion_id: int,
-        user_message: str
+        user_message: str,
+        prefetched_facts: Optional[Dict] = None
     ) -> Tuple[Optional[List[str]], Optional[Dict]]:
         """
         从记忆系统查询相关信息
 
+        Args:
+            prefetched_facts: 预取的L3事实（空字典表示预取时没有事实），None 时查询Redis
+
         Returns:
             (memories, facts): (L2情景记忆列表, L3用户事实字典)
         """
@@ -305,14 +338,17 @@ class ResponseCoordinator:
                 user_id=user_id,
                 companion_id=companion_id,
                 query=user_message,
-                limit=5
+                limit=settings.MEMORY_PROMPT_MAX_EPISODIC
             )
 
             # 获取用户事实（L3）
-            user_facts = await memory_system.get_user_facts(
-                user_id=user_id,
-                companion_id=companion_id
-            )
+            if prefetched_facts is not None:
+                user_facts = prefetched_facts or None
+            else:
+                user_facts = await memory_system.get_user_facts(
+                    user_id=user_id,
+                    companion_id=companion_id
+                )
 
             self.logger.info(
                 f"📚 记忆查询: {len(memories) if memories else 0} 条记忆, "
@@ -493,31 +529,37 @@ class ResponseCoordinator:
 
     def _build_working_memory(
         self,
-        conversation_history: Optional[List[Dict]]
+        conversation_history: Optional[List[Dict]],
+        conversation_summary: Optional[str] = None
     ) -> Optional[str]:
         """
         构建L1工作记忆（当前对话上下文摘要）
 
         Args:
             conversation_history: 对话历史 [{"role": "user/assistant", "content": "..."}]
+            conversation_summary: 会话滚动摘要（有摘要时只返回摘要）
 
         Returns:
             str: 工作记忆摘要
         """
-        if not conversation_history or len(conversation_history) == 0:
-            return None
-
-        # 获取最近的对话（最多5轮，10条消息）
-        recent = conversation_history[-10:]
-
-        # 构建简洁的上下文摘要
-        context_lines = []
-        for msg in recent:
-            role = "用户" if msg["role"] == "user" else "你"
-            content = msg["content"][:100]  # 限制长度
-            context_lines.append(f"{role}: {content}")
-
-        return "最近对话:\n" + "\n".join(context_lines)
+        # 有摘要时最近消息已原文放在对话消息中，这里只放摘要，避免重复占用预算
+        if conversation_summary:
+            return "之前的对话摘要:\n" + conversation_summary
+
+        parts = []
+        if conversation_history:
+            # 获取最近的对话（最多5轮，10条消息）
+            recent = conversation_history[-10:]
+
+            # 构建简洁的上下文摘要
+            context_lines = []
+            for msg in recent:
+                role = "用户" if msg["role"] == "user" else "你"
+                content = msg["content"][:100]  # 限制长度
+                context_lines.append(f"{role}: {content}")
+            parts.append("最近对话:\n" + "\n".join(context_lines))
+
+        return "\n\n".join(parts) if parts else None
 
     async def _fallback_response(
         self,
@@ -0,0 +1,181 @@
+"""
+会话预热 - join_chat 时后台预取首条消息需要的数据
+
+客户端加入聊天时已经知道用户和伙伴，但首条消息仍要冷启动：查伙伴信息、
+读关系状态和用户事实、加载向量集合/嵌入模型/倒排索引、读历史消息。
+预热任务在 join_chat 后台执行这些步骤：
+
+- 伙伴信息写入进程内 TTL 缓存（之后每轮消息都复用，修改伙伴时失效）
+- 关系状态、L3 用户事实、最近一页历史随会话保存，只给首条消息使用一次
+- L2 分区（集合、倒排索引、嵌入模型）常驻内存
+
+快速断开时预热任务随会话一起取消。
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger("session_prefetch")
+
+
+class CompanionInfoCache:
+    """伙伴信息进程内缓存（伙伴信息很少变化，但每条消息都要读取）"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = settings.COMPANION_INFO_CACHE_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries: Dict[int, Tuple[float, Dict]] = {}
+
+    def get(self, companion_id: int) -> Optional[Dict]:
+        entry = self._entries.get(int(companion_id))
+        if entry is None:
+            return None
+        expires_at, info = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(int(companion_id), None)
+            return None
+        return info
+
+    def set(self, companion_id: int, info: Dict):
+        if self.ttl_seconds > 0:
+            self._entries[int(companion_id)] = (time.monotonic() + self.ttl_seconds, info)
+
+    def invalidate(self, companion_id: Optional[int] = None):
+        """伙伴被修改/重置/删除时调用；不传ID则清空全部"""
+        if companion_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(int(companion_id), None)
+
+
+@dataclass
+class PrefetchedSession:
+    """预取结果（只对会话的首条消息有效）"""
+    user_id: str
+    companion_id: int
+    chat_session_id: Optional[int]
+    companion_info: Optional[Dict] = None
+    companion_state: Optional[Dict] = None
+    user_facts: Optional[Dict[str, str]] = None
+    history: Optional[List[Dict]] = None
+    memory_warmed: bool = False
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.fetched_at <= settings.SESSION_PREFETCH_TTL_SECONDS
+
+
+class SessionPrefetcher:
+    """join_chat 后台预取，send_message 首条消息消费"""
+
+    HISTORY_LIMIT = 8  # 与首条消息加载的历史条数一致
+
+    def __init__(self):
+        self.stats = {"started": 0, "used": 0, "stale": 0, "cancelled": 0}
+
+    def start(self, session: Dict) -> Optional[asyncio.Task]:
+        """
+        为会话启动后台预取，任务保存在 session['prefetch_task']
+
+        Args:
+            session: ChatEngine.active_sessions 中的会话字典
+        """
+        if not settings.SESSION_PREFETCH_ENABLED:
+            return None
+        self.cancel(session)
+        task = asyncio.create_task(self.prefetch(
+            str(session['user_id']),
+            int(session['companion_id']),
+            session.get('chat_session_id')
+        ))
+        session['prefetch_task'] = task
+        self.stats["started"] += 1
+        return task
+
+    async def prefetch(self, user_id: str, companion_id: int, chat_session_id: Optional[int]) -> PrefetchedSession:
+        """并发预取首条消息需要的全部数据，单项失败不影响其它项"""
+        from app.services.chat_engine import chat_engine
+        from app.services.memory_integration import memory_system
+        from app.services.redis_utils import redis_affinity_manager
+
+        started = time.perf_counter()
+        result = PrefetchedSession(user_id=user_id, companion_id=companion_id, chat_session_id=chat_session_id)
+
+        async def no_history() -> None:
+            return None
+
+        companion_info, companion_state, user_facts, warmed, history = await asyncio.gather(
+            chat_engine.get_companion_info(companion_id),
+            redis_affinity_manager.get_companion_state(user_id, companion_id),
+            memory_system.get_user_facts(user_id, companion_id),
+            memory_system.warm_up(user_id, companion_id),
+            chat_engine.load_chat_history_by_session_id(chat_session_id, limit=self.HISTORY_LIMIT)
+            if chat_session_id else no_history(),
+            return_exceptions=True
+        )
+
+        for name, value in (("伙伴信息", companion_info), ("关系状态", companion_state),
+                            ("用户事实", user_facts), ("L2预热", warmed), ("历史消息", history)):
+            if isinstance(value, Exception):
+                logger.warning(f"⚠️ 会话预取{name}失败: {value}")
+
+        if not isinstance(companion_info, Exception):
+            result.companion_info = companion_info
+        if not isinstance(companion_state, Exception):
+            result.companion_state = companion_state or {}
+        if not isinstance(user_facts, Exception):
+            result.user_facts = user_facts or {}
+        result.memory_warmed = warmed is True
+        if isinstance(history, list):
+            result.history = history
+
+        result.fetched_at = time.monotonic()
+        logger.info(
+            f"🔥 会话预取完成 {user_id}:{companion_id} "
+            f"({(time.perf_counter() - started) * 1000:.1f}ms, L2预热: {result.memory_warmed})"
+        )
+        return result
+
+    async def take(self, session: Optional[Dict]) -> Optional[PrefetchedSession]:
+        """
+        取出会话的预取结果（只能取一次）
+
+        预取尚未完成时最多等待 SESSION_PREFETCH_WAIT_SECONDS——它做的就是
+        首条消息本来要做的工作，等待它比重新查询更快。
+        """
+        if not session:
+            return None
+        task: Optional[asyncio.Task] = session.pop('prefetch_task', None)
+        if task is None:
+            return None
+
+        if not task.done():
+            await asyncio.wait({task}, timeout=settings.SESSION_PREFETCH_WAIT_SECONDS)
+            if not task.done():
+                return None
+        if task.cancelled() or task.exception() is not None:
+            return None
+
+        prefetched = task.result()
+        if not prefetched.is_fresh():
+            self.stats["stale"] += 1
+            return None
+        self.stats["used"] += 1
+        return prefetched
+
+    def cancel(self, session: Optional[Dict]):
+        """取消会话未完成的预取（快速断开时调用）"""
+        if not session:
+            return
+        task: Optional[asyncio.Task] = session.pop('prefetch_task', None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.stats["cancelled"] += 1
+
+
+# 全局实例
+companion_info_cache = CompanionInfoCache()
+session_prefetcher = SessionPrefetcher()
@@ -0,0 +1,113 @@
+"""
+Token计数器 - 提示词预算管理
+
+原先用字符数估计token，对中文偏差很大。这里提供可替换的快速计数器：
+
+- ApproxTokenCounter: 查表式分词近似。先用 str.translate 把每个字符映射为
+  字符类别（字母/数字/空白/中日韩/其它），再按类别的游程计数：常见英文
+  单词整词一个token（长词每6个字母约一个），数字每3位一个token，中日韩
+  字符和标点各按权重计，空白并入相邻token。
+- 结果按文本缓存：人设、关系状态等章节每轮大量重复，命中缓存不再计数。
+
+需要精确计数时可以用 set_token_counter() 换成模型自己的分词器。
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+# 字符类别：a=字母 d=数字 s=空白 c=中日韩文字及全角符号；未登记的字符（其它符号、emoji等）保持原样，按"其它"计
+_CJK_RANGES = (
+    (0x3000, 0x303F),  # 中日韩标点
+    (0x3040, 0x30FF),  # 假名
+    (0x3400, 0x4DBF),  # 扩展A
+    (0x4E00, 0x9FFF),  # 基本汉字
+    (0xAC00, 0xD7AF),  # 韩文音节
+    (0xFF00, 0xFFEF),  # 全角字符
+)
+
+
+def _build_class_table() -> Dict[int, str]:
+    table: Dict[int, str] = {}
+    for code in range(128):
+        char = chr(code)
+        if char.isalpha():
+            table[code] = "a"
+        elif char.isdigit():
+            table[code] = "d"
+        elif char.isspace():
+            table[code] = "s"
+    for start, end in _CJK_RANGES:
+        for code in range(start, end + 1):
+            table[code] = "c"
+    return table
+
+
+_CLASS_TABLE = _build_class_table()
+_LETTER_RUNS = re.compile(r"a+")
+_DIGIT_RUNS = re.compile(r"d+")
+
+
+class TokenCounter:
+    """Token计数器接口"""
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class ApproxTokenCounter(TokenCounter):
+    """查表式分词近似（常见 BPE 分词器在中英文混合文本上的平均表现）"""
+
+    def __init__(self, cjk_weight: Optional[float] = None, other_weight: float = 1.0):
+        """
+        Args:
+            cjk_weight: 每个中日韩字符的token数，默认取 TOKEN_COUNTER_CJK_WEIGHT
+            other_weight: 每个标点/符号/emoji的token数
+        """
+        self.cjk_weight = settings.TOKEN_COUNTER_CJK_WEIGHT if cjk_weight is None else cjk_weight
+        self.other_weight = other_weight
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        classes = text.translate(_CLASS_TABLE)
+        cjk = classes.count("c")
+        spaces = classes.count("s")
+        letter_chars = letter_tokens = 0
+        for run in _LETTER_RUNS.findall(classes):
+            letter_chars += len(run)
+            letter_tokens += (len(run) + 5) // 6
+        digit_chars = digit_tokens = 0
+        for run in _DIGIT_RUNS.findall(classes):
+            digit_chars += len(run)
+            digit_tokens += (len(run) + 2) // 3
+        others = len(classes) - cjk - spaces - letter_chars - digit_chars
+        total = letter_tokens + digit_tokens + cjk * self.cjk_weight + others * self.other_weight
+        return max(1, round(total))
+
+
+_counter: TokenCounter = ApproxTokenCounter()
+
+
+@lru_cache(maxsize=4096)
+def _cached_count(text: str) -> int:
+    return _counter.count(text)
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """计算文本的token数（按文本缓存，重复的提示词章节不再重新计数）"""
+    if not text:
+        return 0
+    return _cached_count(text)
+
+
+def set_token_counter(counter: TokenCounter):
+    """替换全局计数器（例如接入模型自己的分词器），同时清空缓存"""
+    global _counter
+    _counter = counter
+    _cached_count.cache_clear()
+
+
+def get_token_counter() -> TokenCounter:
+    return _counter
@@ -4,11 +4,13 @@
 该模块提供一个统一的接口，同时利用ChromaDB的情景记忆
 和Redis的语义记忆，提供完整的长期记忆能力。
 """
+import json
 import logging
 from typing import List, Dict, Optional, Tuple
 from app.services.chromadb_memory import get_chroma_memory, CHROMADB_AVAILABLE
-from app.services.redis_memory import get_redis_memory
+from app.services.redis_memory import get_redis_memory, categorize_fact_keys
 from app.services.llm.factory import llm_service
+from app.services.fact_extractor import fact_extractor, user_text_of
 
 logger = logging.getLogger("unified_memory_system")
 
@@ -234,9 +236,7 @@ class UnifiedMemorySystem:
             if facts:
                 summary["l3_semantic"] = {
                     "total_facts": len(facts),
-                    "categories": await redis_mem.get_fact_categories(
-                        user_id, companion_id
-                    ),
+                    "categories": categorize_fact_keys(facts.keys()),
                     "facts": facts
                 }
 
@@ -265,7 +265,10 @@ class UnifiedMemorySystem:
         llm_service_instance=None
     ) -> Optional[Dict[str, str]]:
         """
-        使用LLM从文本中提取结构化事实
+        从文本中提取结构化事实
+
+        先用本地规则提取用户话语中的常见事实，只有出现规则未覆盖的
+        触发短语时才调用LLM，大部分轮次不产生LLM请求。
 
         Args:
             text: 输入文本
@@ -274,6 +277,12 @@ class UnifiedMemorySystem:
         Returns:
             提取的事实字典
         """
+        local = fact_extractor.extract(user_text_of(text))
+        if not local.needs_llm:
+            if local.facts:
+                logger.info(f"✅ 本地规则提取 {len(local.facts)} 个事实（跳过LLM）")
+            return local.facts or None
+
         try:
             # 使用全局LLM服务或传入的实例
             llm = llm_service_instance or llm_service
@@ -297,18 +306,17 @@ class UnifiedMemorySystem:
             ])
 
             # 解析JSON
-            import json
-            facts = json.loads(response)
+            facts = {**local.facts, **json.loads(response)}
 
             logger.info(f"✅ 提取 {len(facts)} 个事实")
             return facts
 
         except json.JSONDecodeError:
-            logger.debug("⚠️ LLM返回的非JSON格式，跳过事实提取")
-            return None
+            logger.debug("⚠️ LLM返回的非JSON格式，仅使用本地规则结果")
+            return local.facts or None
         except Exception as e:
             logger.warning(f"⚠️ 事实提取失败: {e}")
-            return None
+            return local.facts or None
 
     async def get_memory_context_for_prompt(
         self,
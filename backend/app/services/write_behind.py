@@ -0,0 +1,224 @@
+"""
+写入合并队列 - 追加型写入的组提交（group commit）
+
+SQLite 下每次提交都是一次 fsync，且写者互斥：每条聊天消息、情感日志、关系
+历史各开一个会话提交，高并发时都在抢写锁。这里用单个后台写者任务消费有界
+内存队列，攒够 WRITE_BEHIND_BATCH_ROWS 行或等待 WRITE_BEHIND_FLUSH_MS 毫秒后，
+把整批插入（按表 executemany）和计数累加合并成一次事务提交。
+
+- write():   入队并等待提交完成（需要持久化保证的路径，例如聊天消息）
+- enqueue(): 只入队不等待提交（日志类写入）
+- 写者未启动（脚本、测试）或已停止时，两者都退化为直接写入
+- 应用关闭时 stop() 会先提交队列中剩余的写入
+- 变更订阅表（chat_messages 等）的插入在同一事务中追加 change_log，提交后通知订阅方
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, insert, update
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.services.change_feed import change_feed, is_tracked, record_changes
+
+logger = logging.getLogger("write_behind")
+
+# (模型, 主键值, 列名, 增量)
+Increment = Tuple[Any, Any, str, int]
+
+_STOP = object()
+
+
+@dataclass
+class PendingWrite:
+    """一次待提交的写入"""
+    model: Any
+    rows: List[Dict[str, Any]]
+    increments: Sequence[Increment] = ()
+    future: Optional[asyncio.Future] = None
+
+
+class WriteBehindQueue:
+    """单写者组提交队列"""
+
+    def __init__(
+        self,
+        batch_rows: Optional[int] = None,
+        flush_ms: Optional[float] = None,
+        queue_size: Optional[int] = None
+    ):
+        """
+        Args:
+            batch_rows: 攒够该行数立即提交，默认取 WRITE_BEHIND_BATCH_ROWS
+            flush_ms: 批次最长等待时间，默认取 WRITE_BEHIND_FLUSH_MS
+            queue_size: 队列上限，默认取 WRITE_BEHIND_QUEUE_SIZE
+        """
+        self.batch_rows = max(1, batch_rows or settings.WRITE_BEHIND_BATCH_ROWS)
+        self.flush_seconds = (settings.WRITE_BEHIND_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self.queue_size = max(1, queue_size or settings.WRITE_BEHIND_QUEUE_SIZE)
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self.stats = {"batches": 0, "rows": 0, "direct_writes": 0, "failed_writes": 0}
+
+    async def start(self):
+        """启动后台写者"""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self.is_running = True
+        self.task = asyncio.create_task(self._run_loop())
+        logger.info(f"写入合并队列已启动 (每批 {self.batch_rows} 行 / {self.flush_seconds * 1000:.0f}ms)")
+
+    async def stop(self):
+        """停止后台写者，先提交队列中剩余的写入"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        await self._queue.put(_STOP)
+        if self.task:
+            await self.task
+            self.task = None
+        logger.info(f"写入合并队列已停止 (共 {self.stats['batches']} 批, {self.stats['rows']} 行)")
+
+    async def write(self, model: Any, rows: List[Dict[str, Any]], increments: Sequence[Increment] = ()):
+        """
+        写入并等待提交完成
+
+        Args:
+            model: ORM 模型类
+            rows: 要插入的行（列名 → 值）
+            increments: 同一事务内执行的计数累加 [(模型, 主键, 列名, 增量)]
+
+        Raises:
+            提交失败时抛出数据库异常
+        """
+        item = PendingWrite(model, rows, increments)
+        if not self.is_running:
+            await self._write_direct(item)
+            return
+        item.future = asyncio.get_running_loop().create_future()
+        await self._queue.put(item)
+        await item.future
+
+    async def enqueue(self, model: Any, rows: List[Dict[str, Any]], increments: Sequence[Increment] = ()):
+        """入队后立即返回（队列满时等待空位）；提交失败只记录日志"""
+        item = PendingWrite(model, rows, increments)
+        if not self.is_running:
+            await self._write_direct(item)
+            return
+        await self._queue.put(item)
+
+    async def _write_direct(self, item: PendingWrite):
+        self.stats["direct_writes"] += 1
+        await self._commit([item])
+
+    async def _run_loop(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            rows = len(first.rows)
+            deadline = time.perf_counter() + self.flush_seconds
+            while rows < self.batch_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item.rows)
+            await self._commit_batch(batch)
+
+        # 停止时仍在等待队列空位的写入
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            await self._commit_batch(leftover)
+
+    async def _commit_batch(self, batch: List[PendingWrite]):
+        try:
+            await self._commit(batch)
+        except Exception as e:
+            # 整批失败时逐条重试，只让出错的写入失败
+            logger.warning(f"⚠️ 批量提交失败，逐条重试 ({len(batch)} 项): {e}")
+            for item in batch:
+                try:
+                    await self._commit([item])
+                except Exception as item_error:
+                    self._settle(item, item_error)
+                else:
+                    self._settle(item)
+        else:
+            for item in batch:
+                self._settle(item)
+
+    def _settle(self, item: PendingWrite, error: Optional[BaseException] = None):
+        if error is not None:
+            self.stats["failed_writes"] += 1
+        if item.future is not None and not item.future.done():
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(None)
+        elif error is not None:
+            logger.warning(f"⚠️ 写入 {item.model.__tablename__} 失败: {error}")
+
+    async def _commit(self, batch: List[PendingWrite]):
+        """把一批写入合并为一次事务：每种表结构一条 executemany，计数按行合并后各一条 UPDATE"""
+        inserts: Dict[Tuple[Any, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+        increments: Dict[Tuple[Any, Any, str], int] = {}
+        for item in batch:
+            for row in item.rows:
+                inserts.setdefault((item.model, tuple(sorted(row))), []).append(row)
+            for model, pk, column, amount in item.increments:
+                key = (model, pk, column)
+                increments[key] = increments.get(key, 0) + amount
+
+        changed = False
+        async with async_session_maker() as db:
+            try:
+                for (model, _), rows in inserts.items():
+                    if is_tracked(model):
+                        # 订阅表取回带主键的整行，同一事务内追加变更日志
+                        result = await db.execute(insert(model).returning(*model.__table__.columns), rows)
+                        await record_changes(db, model, result.all())
+                        changed = True
+                    else:
+                        await db.execute(insert(model), rows)
+                for (model, pk, column), amount in increments.items():
+                    target = getattr(model, column)
+                    await db.execute(
+                        update(model)
+                        .where(model.id == pk)
+                        .values({column: func.coalesce(target, 0) + amount})
+                    )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        self.stats["batches"] += 1
+        self.stats["rows"] += sum(len(item.rows) for item in batch)
+        if changed:
+            await change_feed.notify()
+
+
+# 全局实例
+write_behind_queue = WriteBehindQueue()
@@ -0,0 +1,57 @@
+"""
+数据库增量备份
+
+用法:
+    python backup_database.py [--output ./backups] [--full] [--compression auto|gzip|zstd]
+
+每次运行在输出目录下新建一个备份目录（每张表一个 NDJSON 分段 + manifest.json）。
+默认基于输出目录中最新的备份做增量，只导出其高水位之后变化的行；--full 强制全量。
+恢复见 restore_backup.py。
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.services.backup import run_backup
+
+
+async def backup(output: str, full: bool, compression: str, batch_rows: int) -> bool:
+    try:
+        manifest = await run_backup(output, incremental=not full, compression=compression, batch_rows=batch_rows)
+    except Exception as e:
+        print(f"[ERROR] Backup failed: {e}")
+        return False
+    finally:
+        await async_engine.dispose()
+
+    kind = f"incremental (base {manifest['base']})" if manifest["base"] else "full"
+    print(f"[INFO] Backup {manifest['backup_id']}: {kind}, compression={manifest['compression']}")
+    for name, entry in manifest["tables"].items():
+        if entry["rows"]:
+            print(f"[INFO]   {name}: {entry['rows']} rows")
+    print(
+        f"[OK] Backed up {manifest['rows']} rows in {manifest['seconds']:.2f}s "
+        f"({manifest['rows_per_second']:.0f} rows/s) -> {manifest['path']}"
+    )
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental NDJSON database backup")
+    parser.add_argument("--output", default=settings.BACKUP_DIRECTORY)
+    parser.add_argument("--full", action="store_true", help="ignore previous backups and export every row")
+    parser.add_argument("--compression", choices=["auto", "gzip", "zstd"], default=settings.BACKUP_COMPRESSION)
+    parser.add_argument("--batch", type=int, default=settings.BACKUP_BATCH_ROWS)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  Database Backup")
+    print("=" * 60)
+
+    success = asyncio.run(backup(args.output, args.full, args.compression, args.batch))
+    sys.exit(0 if success else 1)
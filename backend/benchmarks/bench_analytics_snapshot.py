@@ -0,0 +1,102 @@
+"""
+分析快照聚合基准测试
+
+生成一天 --rows 条情感日志和关系历史，写成日分区后对比：
+- 逐行循环：把行当作字典逐条累加（原先报告在 Python 中循环计算的做法）
+- 列式快照：加载日分区需要的列 + NumPy 向量化聚合（含读取文件的时间）
+
+用法:
+    python benchmarks/bench_analytics_snapshot.py --rows 500000 --format npz
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.analytics_aggregation import affinity_change_distribution, affinity_score_distribution
+from app.services.analytics_snapshot import read_partition, resolve_format, to_columns, write_partition
+
+DAY = date(2025, 3, 1)
+EMOTIONS = ["joy", "sadness", "anger", "neutral", "curious", "tired"]
+
+
+def generate(rows: int, seed: int):
+    rng = random.Random(seed)
+    logs, history = [], []
+    for i in range(rows):
+        user = f"user{rng.randrange(5000)}"
+        companion = str(rng.randrange(1, 20))
+        change = rng.randint(-10, 12)
+        logs.append({"id": i, "user_id": user, "companion_id": companion, "primary_emotion": rng.choice(EMOTIONS),
+                     "emotion_intensity": rng.randrange(100), "affinity_change": change,
+                     "created_at": 1740787200000 + i})
+        history.append({"id": i, "user_id": user, "companion_id": companion, "change_type": "affinity_change",
+                        "old_value": "0", "new_value": str(rng.randrange(1000)), "delta": change,
+                        "created_at": 1740787200000 + i})
+    return logs, history
+
+
+def python_loops(logs, history):
+    """对照：逐行累加"""
+    by_emotion = defaultdict(lambda: [0, 0])
+    changes = []
+    for row in logs:
+        by_emotion[row["primary_emotion"]][0] += row["affinity_change"]
+        by_emotion[row["primary_emotion"]][1] += 1
+        changes.append(row["affinity_change"])
+    changes.sort()
+    latest = {}
+    for row in history:
+        if row["change_type"] == "affinity_change":
+            key = (row["user_id"], row["companion_id"])
+            if key not in latest or latest[key][0] < row["id"]:
+                latest[key] = (row["id"], float(row["new_value"]))
+    buckets = defaultdict(int)
+    for _, score in latest.values():
+        buckets[min(int(score // 100), 9)] += 1
+    return {emotion: total / count for emotion, (total, count) in by_emotion.items()}, changes[len(changes) // 2], buckets
+
+
+def vectorized(root):
+    logs = read_partition(root, "emotion_logs", DAY, ["affinity_change", "primary_emotion"], encoded=True)
+    history = read_partition(root, "relationship_history", DAY, ["id", "user_id", "companion_id", "change_type", "new_value"], encoded=True)
+    return affinity_change_distribution(logs), affinity_score_distribution(history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析快照聚合基准测试")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--format", choices=["auto", "parquet", "arrow", "npz"], default="auto")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    fmt = resolve_format(args.format)
+    logs, history = generate(args.rows, args.seed)
+    root = tempfile.mkdtemp(prefix="bench_analytics_")
+    started = time.perf_counter()
+    write_partition(root, "emotion_logs", DAY, to_columns("emotion_logs", logs), fmt)
+    write_partition(root, "relationship_history", DAY, to_columns("relationship_history", history), fmt)
+    print(f"写入日分区 ({fmt}, {args.rows} 行 x 2): {time.perf_counter() - started:.2f}s")
+
+    loop_ms, vector_ms = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        python_loops(logs, history)
+        loop_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        vectorized(root)
+        vector_ms.append((time.perf_counter() - started) * 1000)
+
+    print(f"  逐行循环: {min(loop_ms):8.1f}ms（数据已在内存中）")
+    print(f"  列式快照: {min(vector_ms):8.1f}ms（含读取日分区）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+增量备份 / 批量恢复吞吐基准测试
+
+在临时 SQLite 数据库中生成 --messages 条消息，依次测量：
+- 全量备份（NDJSON 分段 + 压缩）的 rows/s
+- 追加 --delta 条消息后增量备份的行数与 rows/s
+- 沿备份链恢复到新库（每批一次 executemany upsert）的 rows/s
+- --baseline 额外测量逐行 INSERT + 逐行提交恢复同样数据的 rows/s 作为对照
+
+用法:
+    python benchmarks/bench_backup_restore.py --messages 200000 --delta 5000 --baseline
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_backup_")
+DB_PATH = os.path.join(BENCH_DIR, "source.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DB_PATH}")
+os.environ.setdefault("DEBUG", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app.core.database import Base, create_database_engine, engine
+from app.models.chat_session import ChatMessage
+from app.services.backup import _read_batches, _row_converter, run_backup, run_restore
+
+
+def seed(messages: int, first_id: int = 1, sessions: int = 1000):
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany(
+        "INSERT OR IGNORE INTO chat_sessions (id, user_id, companion_id, session_title, created_at, updated_at, is_active, total_messages) "
+        "VALUES (?, ?, 1, ?, '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, 0)",
+        ((i + 1, str(i % 100), f"会话{i}") for i in range(sessions))
+    )
+    conn.executemany(
+        "INSERT INTO chat_messages (id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, '2024-01-01 00:00:00')",
+        ((n, n % sessions + 1, "user" if n % 2 else "assistant", f"第{n}条消息，今天过得怎么样？")
+         for n in range(first_id, first_id + messages))
+    )
+    conn.commit()
+    conn.close()
+
+
+async def baseline_restore(path: str, compression: str, rows: int):
+    """对照：逐行 INSERT，每行一个事务（rebuild_database.py / init_*.py 的写法）"""
+    target = create_database_engine(f"sqlite+aiosqlite:///{os.path.join(BENCH_DIR, 'baseline.db')}")
+    async with target.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    convert = _row_converter(ChatMessage.__table__)
+    started = time.perf_counter()
+    count = 0
+    for batch in _read_batches(path, compression, 1000):
+        for row in batch:
+            async with target.begin() as conn:
+                await conn.execute(insert(ChatMessage.__table__).values(**convert(row)))
+            count += 1
+            if count >= rows:
+                break
+        if count >= rows:
+            break
+    elapsed = time.perf_counter() - started
+    await target.dispose()
+    print(f"{'逐行恢复':>8}: {count:>8} 行  {elapsed:7.2f}s  {count / elapsed:>10.0f} rows/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="增量备份 / 批量恢复吞吐基准测试")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--delta", type=int, default=5000)
+    parser.add_argument("--compression", choices=["auto", "gzip", "zstd"], default="auto")
+    parser.add_argument("--baseline", action="store_true")
+    parser.add_argument("--baseline-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    seed(args.messages)
+    root = os.path.join(BENCH_DIR, "backups")
+
+    full = await run_backup(root, incremental=False, compression=args.compression)
+    print(f"{'全量备份':>8}: {full['rows']:>8} 行  {full['seconds']:7.2f}s  {full['rows_per_second']:>10.0f} rows/s  ({full['compression']})")
+
+    seed(args.delta, first_id=args.messages + 1)
+    incremental = await run_backup(root, compression=args.compression)
+    print(f"{'增量备份':>8}: {incremental['rows']:>8} 行  {incremental['seconds']:7.2f}s  {incremental['rows_per_second']:>10.0f} rows/s")
+
+    size = sum(os.path.getsize(os.path.join(d, f)) for d in (full["path"], incremental["path"]) for f in os.listdir(d))
+    print(f"备份大小: {size / 1024 / 1024:.1f}MB")
+
+    target = create_database_engine(f"sqlite+aiosqlite:///{os.path.join(BENCH_DIR, 'restored.db')}")
+    restored = await run_restore(incremental["path"], engine=target)
+    print(f"{'批量恢复':>8}: {restored['rows']:>8} 行  {restored['seconds']:7.2f}s  {restored['rows_per_second']:>10.0f} rows/s")
+    await target.dispose()
+
+    if args.baseline:
+        segment = os.path.join(full["path"], full["tables"]["chat_messages"]["file"])
+        await baseline_restore(segment, full["compression"], args.baseline_rows)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+伙伴列表查询基准测试
+
+在临时 SQLite 数据库中为一个用户生成 --companions 个伙伴、共 --sessions 个会话，
+对比伙伴列表的三种取法，每种运行 --rounds 次取平均：
+
+- 逐个伙伴 SELECT 全部会话再 len() 计数（原实现，N+1 查询）
+- 一次 LEFT JOIN + COUNT 分组聚合
+- 聚合结果命中进程内列表缓存
+
+用法:
+    python benchmarks/bench_companion_listing.py
+    python benchmarks/bench_companion_listing.py --companions 50 --sessions 20000 --rounds 50
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_companions_")
+DB_PATH = os.path.join(BENCH_DIR, "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DB_PATH}")
+os.environ.setdefault("DEBUG", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, select
+
+from app.core.database import engine, Base, async_session_maker
+from app.models.chat_session import ChatSession
+from app.models.companion import Companion
+from app.services.companion_listing import companion_list_cache, list_user_companions
+
+USER_ID = 42
+
+
+def seed(companions: int, sessions: int):
+    """用 sqlite3 直接批量写入测试数据（其它用户的数据作为干扰）"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany(
+        "INSERT INTO companions (id, user_id, name, avatar_id, personality_archetype, created_at) "
+        "VALUES (?, ?, ?, 'avatar', 'listener', '2024-01-01 00:00:00')",
+        ((i + 1, USER_ID if i < companions else USER_ID + 1 + i % 50, f"伙伴{i}") for i in range(companions * 10))
+    )
+    conn.executemany(
+        "INSERT INTO chat_sessions (user_id, companion_id, session_title, created_at, updated_at, is_active, total_messages) "
+        "VALUES (?, ?, '会话', '2024-01-01 00:00:00', '2024-01-01 00:00:00', ?, 0)",
+        ((str(USER_ID), i % companions + 1, i % 5 != 0) for i in range(sessions))
+    )
+    conn.executemany(
+        "INSERT INTO chat_sessions (user_id, companion_id, session_title, created_at, updated_at, is_active, total_messages) "
+        "VALUES (?, ?, '会话', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, 0)",
+        ((str(USER_ID + 1), companions + i % (companions * 9) + 1) for i in range(sessions * 5))
+    )
+    conn.commit()
+    conn.close()
+
+
+async def n_plus_one(db):
+    """对照：原实现"""
+    result = await db.execute(select(Companion).where(Companion.user_id == USER_ID))
+    counts = {}
+    for companion in result.scalars().all():
+        session_result = await db.execute(select(ChatSession).where(
+            and_(ChatSession.companion_id == companion.id, ChatSession.is_active == True)
+        ))
+        counts[companion.id] = len(session_result.scalars().all())
+    return counts
+
+
+async def aggregated(db):
+    companion_list_cache.invalidate()
+    return {row["id"]: row["session_count"] for row in await list_user_companions(db, USER_ID)}
+
+
+async def cached(db):
+    return {row["id"]: row["session_count"] for row in await list_user_companions(db, USER_ID)}
+
+
+async def measure(label: str, fn, rounds: int):
+    async with async_session_maker() as db:
+        counts = await fn(db)  # 预热
+        started = time.perf_counter()
+        for _ in range(rounds):
+            db.expunge_all()
+            await fn(db)
+        elapsed = (time.perf_counter() - started) / rounds
+    print(f"{label:>10}: {elapsed * 1000:8.2f}ms/次")
+    return counts
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    seed(args.companions, args.sessions)
+    print(f"数据: {args.companions} 个伙伴, 该用户 {args.sessions} 个会话（其它用户 {args.sessions * 5} 个）")
+
+    expected = await measure("N+1", n_plus_one, args.rounds)
+    assert await measure("聚合查询", aggregated, args.rounds) == expected
+    assert await measure("缓存命中", cached, args.rounds) == expected
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="伙伴列表查询基准测试")
+    parser.add_argument("--companions", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""
+流式导出内存基准测试
+
+在临时 SQLite 数据库中生成 --messages 条消息（每个会话 --per-session 条），
+完整消费 JSON / CSV 导出流，报告输出大小、耗时和 Python 内存峰值（tracemalloc）。
+--baseline 额外运行"全部读入内存再 json.dumps"的做法作为对照。
+
+用法:
+    python benchmarks/bench_export_memory.py --messages 1000000
+    python benchmarks/bench_export_memory.py --messages 200000 --baseline --gzip
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_export_")
+DB_PATH = os.path.join(BENCH_DIR, "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DB_PATH}")
+os.environ.setdefault("DEBUG", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+
+from app.core.database import engine, Base, async_session_maker
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services.conversation_export import csv_chunks, gzip_chunks, json_chunks
+
+
+def seed(messages: int, per_session: int):
+    """用 sqlite3 直接批量写入测试数据"""
+    sessions = max(1, messages // per_session)
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany(
+        "INSERT INTO chat_sessions (id, user_id, companion_id, session_title, created_at, updated_at, is_active, total_messages) "
+        "VALUES (?, ?, 1, ?, '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, ?)",
+        ((i + 1, str(i % 100), f"会话{i}", per_session) for i in range(sessions))
+    )
+    batch = []
+    for n in range(messages):
+        session_id = n // per_session % sessions + 1
+        batch.append((session_id, "user" if n % 2 == 0 else "assistant", f"第{n}条消息，今天过得怎么样？", "2024-01-01 00:00:00"))
+        if len(batch) >= 50000:
+            conn.executemany("INSERT INTO chat_messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO chat_messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+async def consume(label: str, chunks):
+    tracemalloc.start()
+    started = time.perf_counter()
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>16}: 输出 {total / 1e6:8.1f}MB  耗时 {elapsed:6.1f}s  内存峰值 {peak / 1e6:7.1f}MB")
+
+
+async def materialized():
+    """对照：全部读入内存后一次性序列化"""
+    import json
+    async with async_session_maker() as db:
+        sessions = (await db.execute(select(ChatSession))).scalars().all()
+        messages = (await db.execute(select(ChatMessage))).scalars().all()
+        by_session = {}
+        for m in messages:
+            by_session.setdefault(m.session_id, []).append(
+                {"role": m.role, "content": m.content, "timestamp": m.timestamp.isoformat()}
+            )
+        data = {"sessions": [{"id": s.id, "messages": by_session.get(s.id, [])} for s in sessions]}
+        yield json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    started = time.perf_counter()
+    seed(args.messages, args.per_session)
+    print(f"生成 {args.messages} 条消息用时 {time.perf_counter() - started:.1f}s")
+
+    await consume("json", json_chunks([]))
+    await consume("csv", csv_chunks([]))
+    if args.gzip:
+        await consume("json+gzip", gzip_chunks(json_chunks([])))
+    if args.baseline:
+        await consume("全量读入(对照)", materialized())
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式导出内存基准测试")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--per-session", type=int, default=200)
+    parser.add_argument("--baseline", action="store_true")
+    parser.add_argument("--gzip", action="store_true")
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main(parser.parse_args()))
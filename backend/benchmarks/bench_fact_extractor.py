@@ -0,0 +1,90 @@
+"""
+本地规则事实提取基准测试
+
+在带标注的用户消息样本上报告：
+- 跳过LLM的轮次比例（needs_llm=False）
+- 规则提取的精确率 / 召回率（按 事实键=值 精确匹配）
+- 单条消息的提取耗时
+
+用法:
+    python benchmarks/bench_fact_extractor.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.fact_extractor import fact_extractor
+
+# (用户消息, 期望规则提取出的事实, 是否包含规则无法覆盖、应交给LLM的事实)
+LABELED_SAMPLE = [
+    ("早上好呀", {}, False),
+    ("今天好累啊，加班到十点", {}, False),
+    ("哈哈哈你好可爱", {}, False),
+    ("晚安~", {}, False),
+    ("你在干嘛呢", {}, False),
+    ("我叫了外卖，等会儿吃", {}, False),
+    ("我在吃饭，等下聊", {}, False),
+    ("我是不是太笨了", {}, False),
+    ("我喜欢你", {}, False),
+    ("下雨了，有点冷", {}, False),
+    ("今天看了一部电影，挺感人的", {}, False),
+    ("嗯嗯好的", {}, False),
+    ("周末要不要一起去公园", {}, False),
+    ("我叫小星", {"昵称": "小星"}, False),
+    ("你可以叫我阿杰", {"昵称": "阿杰"}, False),
+    ("我今年二十三岁", {"年龄": "23岁"}, False),
+    ("我18岁了", {"年龄": "18岁"}, False),
+    ("我住在北京", {"所在城市": "北京"}, False),
+    ("我在杭州上班，是一名程序员", {"所在城市": "杭州", "职业": "程序员"}, False),
+    ("我是上海人", {"家乡": "上海"}, False),
+    ("我是一名设计师", {"职业": "设计师"}, False),
+    ("我是大学生", {"职业": "大学生"}, False),
+    ("我的工作是做外贸", {"职业": "做外贸"}, False),
+    ("我最喜欢的颜色是蓝色", {"喜欢的颜色": "蓝色"}, False),
+    ("我喜欢猫", {"喜欢_猫": "猫"}, False),
+    ("我特别爱吃火锅", {"喜欢_火锅": "火锅"}, False),
+    ("我不喜欢下雨天", {"讨厌_下雨天": "下雨天"}, False),
+    ("我讨厌香菜", {"讨厌_香菜": "香菜"}, False),
+    ("我的梦想是开一家咖啡店", {"梦想": "开一家咖啡店"}, False),
+    ("我生日是5月20号", {"特殊日期_生日": "05-20"}, False),
+    ("我家的猫叫豆豆", {"宠物名字": "豆豆"}, False),
+    ("我养的狗叫旺财，超可爱", {"宠物名字": "旺财"}, False),
+    ("我妈今天来看我了", {}, True),
+    ("我男朋友今天惹我生气了", {}, True),
+    ("我小时候在外婆家长大", {}, True),
+    ("我对花生过敏", {}, True),
+    ("下个月是我们的结婚纪念日", {}, True),
+    ("记住，我不吃辣", {}, True),
+]
+
+
+def main():
+    extracted_total = correct_total = expected_total = skipped = missed = 0
+    started = time.perf_counter()
+    for text, expected, needs_llm in LABELED_SAMPLE:
+        result = fact_extractor.extract(text)
+        if not result.needs_llm:
+            skipped += 1
+            if needs_llm:
+                missed += 1
+                print(f"  漏交LLM: {text}")
+        extracted_total += len(result.facts)
+        expected_total += len(expected)
+        correct = {k: v for k, v in result.facts.items() if expected.get(k) == v}
+        correct_total += len(correct)
+        if result.facts != expected:
+            print(f"  差异: {text} → {result.facts} (期望 {expected})")
+    elapsed_us = (time.perf_counter() - started) / len(LABELED_SAMPLE) * 1e6
+
+    print(f"样本数: {len(LABELED_SAMPLE)}")
+    print(f"跳过LLM比例: {skipped / len(LABELED_SAMPLE):.1%}")
+    print(f"规则精确率: {correct_total / max(extracted_total, 1):.1%} ({correct_total}/{extracted_total})")
+    print(f"应交LLM却被跳过: {missed}/{sum(1 for *_, flag in LABELED_SAMPLE if flag)}")
+    print(f"规则召回率: {correct_total / max(expected_total, 1):.1%} ({correct_total}/{expected_total})")
+    print(f"平均耗时: {elapsed_us:.1f} µs/条")
+
+
+if __name__ == "__main__":
+    main()
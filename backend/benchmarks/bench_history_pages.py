@@ -0,0 +1,103 @@
+"""
+聊天历史分页基准测试
+
+在临时 SQLite 数据库中生成若干个长度不同的会话（--lengths），对比：
+
+- selectinload 整个会话的消息并排序（原实现）
+- keyset 分页读取最新一页（--limit 条，只查需要的列）
+- 从会话中部向更早翻一页（before 游标）
+
+每项运行 --rounds 次取平均。分页耗时应与会话长度无关。
+
+用法:
+    python benchmarks/bench_history_pages.py
+    python benchmarks/bench_history_pages.py --lengths 1000,10000,100000 --limit 50 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_history_")
+DB_PATH = os.path.join(BENCH_DIR, "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DB_PATH}")
+os.environ.setdefault("DEBUG", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.core.database import engine, Base, async_session_maker
+from app.models.chat_session import ChatSession
+from app.services.history_pages import encode_history_cursor, fetch_history_page
+
+
+def seed(lengths):
+    """用 sqlite3 直接批量写入测试数据，会话 i 含 lengths[i] 条消息"""
+    conn = sqlite3.connect(DB_PATH)
+    for session_id, length in enumerate(lengths, start=1):
+        conn.execute(
+            "INSERT INTO chat_sessions (id, user_id, companion_id, session_title, created_at, updated_at, is_active, total_messages) "
+            "VALUES (?, '1', 1, '会话', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1, ?)",
+            (session_id, length)
+        )
+        conn.executemany(
+            "INSERT INTO chat_messages (session_id, role, content, timestamp, tokens_used) VALUES (?, ?, ?, ?, 0)",
+            (
+                (session_id, "user" if n % 2 == 0 else "assistant", f"第{n}条消息，今天过得怎么样？" * 4,
+                 f"2024-01-{1 + n // 86400 % 28:02d} {n // 3600 % 24:02d}:{n // 60 % 60:02d}:{n % 60:02d}.000000")
+                for n in range(length)
+            )
+        )
+    conn.commit()
+    conn.close()
+
+
+async def load_all(db, session_id: int):
+    """对照：原实现"""
+    result = await db.execute(
+        select(ChatSession).options(selectinload(ChatSession.messages)).where(ChatSession.id == session_id)
+    )
+    session = result.scalar_one()
+    return sorted(session.messages, key=lambda m: m.timestamp)
+
+
+async def measure(fn, rounds: int) -> float:
+    async with async_session_maker() as db:
+        await fn(db)  # 预热
+        started = time.perf_counter()
+        for _ in range(rounds):
+            db.expunge_all()
+            await fn(db)
+        return (time.perf_counter() - started) / rounds * 1000
+
+
+async def main(args):
+    lengths = [int(n) for n in args.lengths.split(",")]
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    seed(lengths)
+
+    print(f"{'会话长度':>10} {'全量加载':>10} {'最新一页':>10} {'中部翻页':>10}  (ms/次, 每页 {args.limit} 条)")
+    for session_id, length in enumerate(lengths, start=1):
+        async with async_session_maker() as db:
+            messages, _ = await fetch_history_page(db, session_id, length // 2)
+        middle = encode_history_cursor(messages[0]["timestamp"], messages[0]["id"])
+
+        full = await measure(lambda db: load_all(db, session_id), max(1, args.rounds // 5))
+        latest = await measure(lambda db: fetch_history_page(db, session_id, args.limit), args.rounds)
+        older = await measure(lambda db: fetch_history_page(db, session_id, args.limit, middle), args.rounds)
+        print(f"{length:>10} {full:>12.2f} {latest:>12.2f} {older:>12.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="聊天历史分页基准测试")
+    parser.add_argument("--lengths", default="1000,10000,100000")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
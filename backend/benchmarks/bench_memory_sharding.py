@@ -0,0 +1,110 @@
+"""
+情景记忆分片基准测试
+
+随总用户数增长（默认 1k → 10k → 100k），对比单集合 + where 过滤
+与分片集合（hash 桶）的单用户查询延迟。每个用户写入若干条随机向量，
+查询时随机选择用户并带分区过滤条件，与线上 get_recent_memories 一致。
+
+用法:
+    python benchmarks/bench_memory_sharding.py --users 1000,10000,100000 --per-user 5 --buckets 64
+
+注意：100k 用户时单集合需要构建较大的 HNSW 图，耗时和内存都较高。
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from typing import Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from chromadb.config import Settings
+
+BATCH_SIZE = 5000
+
+
+def bucket_of(user_id: str, companion_id: int, buckets: int) -> int:
+    digest = hashlib.md5(f"{user_id}:{companion_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % buckets
+
+
+def build(client, n_users: int, per_user: int, dim: int, buckets: int, rng):
+    """写入语料，返回 (单集合, 分片集合列表)"""
+    single = client.create_collection(f"single_{n_users}", metadata={"hnsw:space": "cosine"})
+    shards = [
+        client.create_collection(f"shard_{n_users}_{b}", metadata={"hnsw:space": "cosine"})
+        for b in range(buckets)
+    ]
+
+    total = n_users * per_user
+    for start in range(0, total, BATCH_SIZE):
+        rows = range(start, min(total, start + BATCH_SIZE))
+        vectors = rng.standard_normal((len(rows), dim)).astype(np.float32)
+        ids = [f"m{r}" for r in rows]
+        metadatas = [{"user_id": f"u{r // per_user}", "companion_id": "1"} for r in rows]
+        single.add(ids=ids, embeddings=vectors.tolist(), metadatas=metadatas)
+
+        by_bucket = {}
+        for index, metadata in enumerate(metadatas):
+            by_bucket.setdefault(bucket_of(metadata["user_id"], 1, buckets), []).append(index)
+        for bucket, indices in by_bucket.items():
+            shards[bucket].add(
+                ids=[ids[i] for i in indices],
+                embeddings=vectors[indices].tolist(),
+                metadatas=[metadatas[i] for i in indices]
+            )
+    return single, shards
+
+
+def measure(query_fn, n_queries: int, n_users: int, dim: int, rng) -> Tuple[float, ...]:
+    """返回 (p50, p95) 查询延迟（毫秒）"""
+    latencies = []
+    for _ in range(n_queries):
+        user_id = f"u{rng.integers(0, n_users)}"
+        vector = rng.standard_normal(dim).astype(np.float32).tolist()
+        where = {"$and": [{"user_id": user_id}, {"companion_id": "1"}]}
+        started = time.perf_counter()
+        query_fn(user_id, vector, where)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return float(np.median(latencies)), float(np.percentile(latencies, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1000,10000,100000")
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--buckets", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(5)
+    print(f"{'users':>8}{'vectors':>10}{'single p50':>12}{'single p95':>12}{'shard p50':>12}{'shard p95':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=tmp, settings=Settings(anonymized_telemetry=False))
+        for n_users in [int(u) for u in args.users.split(",")]:
+            single, shards = build(client, n_users, args.per_user, args.dim, args.buckets, rng)
+
+            single_p50, single_p95 = measure(
+                lambda u, v, w: single.query(query_embeddings=[v], n_results=args.k, where=w),
+                args.queries, n_users, args.dim, rng
+            )
+            shard_p50, shard_p95 = measure(
+                lambda u, v, w: shards[bucket_of(u, 1, args.buckets)].query(
+                    query_embeddings=[v], n_results=args.k, where=w
+                ),
+                args.queries, n_users, args.dim, rng
+            )
+            print(f"{n_users:>8}{n_users * args.per_user:>10}{single_p50:>12.2f}{single_p95:>12.2f}"
+                  f"{shard_p50:>12.2f}{shard_p95:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+提示词前缀稳定性基准测试
+
+模拟多个伙伴的连续对话（好感度、心情、情感每轮变化），分别用 classic 和
+prefix_stable 两种布局构建系统提示词，报告：
+- 平均构建耗时
+- 与同一伙伴上一轮提示词的公共前缀占比（服务商前缀KV缓存可复用的部分）
+- 公共前缀达到 --min-prefix-tokens（服务商缓存的最小前缀长度）的调用比例
+- 静态前缀缓存命中率
+
+用法:
+    python benchmarks/bench_prompt_prefix.py --turns 200 --min-prefix-tokens 256
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.affinity_engine import EmotionAnalysis
+from app.services.dynamic_prompt_builder import DynamicPromptBuilder
+from app.services.emotion_expression_generator import emotion_expression_generator
+from app.services.token_counter import count_tokens
+
+COMPANIONS = [(1, "林梓汐", "linzixi"), (2, "Zoe", "zoe"), (3, "小雪", "listener")]
+EMOTIONS = [("positive", ["joy"], "sharing"), ("negative", ["sadness"], "complaint"), ("neutral", [], "question")]
+MOODS = ["neutral", "happy", "tired", "curious"]
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def run(layout: str, turns: int, min_prefix_tokens: int, seed: int):
+    rng = random.Random(seed)
+    builder = DynamicPromptBuilder(max_tokens=2000, layout=layout)
+    last_prompt = {}
+    build_ms, shared_ratio, cacheable = [], [], 0
+    affinity = {cid: 300 for cid, _, _ in COMPANIONS}
+
+    for turn in range(turns):
+        companion_id, name, archetype = rng.choice(COMPANIONS)
+        affinity[companion_id] += rng.randint(-3, 8)
+        primary, detected, intent = rng.choice(EMOTIONS)
+        analysis = EmotionAnalysis(
+            primary_emotion=primary, emotion_intensity=rng.random(), detected_emotions=detected,
+            user_intent=intent, is_appropriate=True, violation_reason="", suggested_affinity_change=0,
+            suggested_trust_change=0, suggested_tension_change=0, key_points=[], is_memorable=False
+        )
+        mood = rng.choice(MOODS)
+        expression = emotion_expression_generator.generate(
+            emotion_analysis=analysis, current_level="friend", affinity_score=affinity[companion_id],
+            trust_score=40, tension_score=5, mood=mood
+        )
+
+        started = time.perf_counter()
+        prompt = builder.build(
+            companion_name=name, personality_archetype=archetype, emotion_expression=expression,
+            emotion_analysis=analysis, current_level="friend", affinity_score=affinity[companion_id],
+            trust_score=40, tension_score=5, mood=mood,
+            l1_working_memory=f"最近对话:\n用户: 第{turn}轮的消息",
+            l3_semantic_facts={"昵称": "小星", "所在城市": "杭州"},
+            companion_id=companion_id
+        )
+        build_ms.append((time.perf_counter() - started) * 1000)
+
+        previous = last_prompt.get(companion_id)
+        if previous is not None:
+            shared = prompt[:common_prefix_length(previous, prompt)]
+            shared_ratio.append(count_tokens(shared) / max(count_tokens(prompt), 1))
+            if count_tokens(shared) >= min_prefix_tokens:
+                cacheable += 1
+        last_prompt[companion_id] = prompt
+
+    stats = builder.get_stats()
+    print(
+        f"{layout:>13}: 构建 p50 {statistics.median(build_ms):.3f}ms  "
+        f"公共前缀占比 {statistics.mean(shared_ratio):6.1%}  "
+        f"可命中前缀缓存 {cacheable / max(len(shared_ratio), 1):6.1%}  "
+        f"静态前缀缓存命中率 {stats['static_hit_rate']:.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示词前缀稳定性基准测试")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--min-prefix-tokens", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    for layout in ("classic", "prefix_stable"):
+        run(layout, args.turns, args.min_prefix_tokens, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+提示词模板渲染基准测试
+
+对比两种模板填充方式的单次渲染耗时：
+- before: 每次调用对整段提示词 re.finditer，逐个占位符遍历点分路径后 str.replace
+- after:  模板预编译为字面量/占位符片段（按文本缓存），渲染时一次 join
+
+同时报告 get_prompt_by_version 在人设模板缓存命中时的单次耗时。
+
+用法:
+    python benchmarks/bench_prompt_render.py --iterations 20000
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.prompts import _v1_persona_prompts, compile_template, get_prompt_by_version
+
+CONTEXT = {
+    "affinity_score": 420,
+    "current_mood": "开心",
+    "romance_level": "friend",
+    "user_message": "今天终于把项目上线了，想跟你分享一下",
+    "user": {"name": "小星", "profile": {"city": "杭州"}},
+}
+
+
+def legacy_fill(prompt, context):
+    """改造前的实现：每次正则扫描 + 逐个 replace"""
+    if not context:
+        return prompt
+    for placeholder in re.finditer(r"\{\{([^}]+)\}\}", prompt):
+        full_match = placeholder.group(0)
+        key_path = placeholder.group(1).strip()
+        try:
+            value = context
+            for key in key_path.split('.'):
+                value = value[key] if isinstance(value, dict) else getattr(value, key)
+            prompt = prompt.replace(full_match, str(value))
+        except (AttributeError, KeyError, TypeError):
+            continue
+    return prompt
+
+
+def per_call_us(func, iterations: int, repeats: int = 5) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - started) / iterations * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示词模板渲染基准测试")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    template = _v1_persona_prompts()["linzixi"] + "\n用户资料: {{user.name}} / {{user.profile.city}} / {{user.missing}}"
+    assert legacy_fill(template, CONTEXT) == compile_template(template).render(CONTEXT)
+
+    print(f"模板长度: {len(template)} 字, 占位符: {len(compile_template(template).placeholders)} 个")
+    before = per_call_us(lambda: legacy_fill(template, CONTEXT), args.iterations)
+    after = per_call_us(lambda: compile_template(template).render(CONTEXT), args.iterations)
+    print(f"before: {before:8.2f} µs/次")
+    print(f"after:  {after:8.2f} µs/次  ({before / after:.1f}x)")
+
+    by_version = per_call_us(lambda: get_prompt_by_version("v1", "林梓汐", "linzixi", CONTEXT), args.iterations)
+    print(f"get_prompt_by_version(v1, 缓存命中): {by_version:8.2f} µs/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+滚动对话摘要基准测试 - 长会话的 Prompt 规模与耗时
+
+在临时 SQLite 数据库中模拟一段长会话（用户消息较长），逐轮对比：
+- before: 原做法，最近6条原文消息 + 最近10条消息(每条截断100字)的工作记忆
+- after:  滚动摘要 + 按 CONVERSATION_TAIL_MAX_TOKENS 截取的最近消息
+
+报告每轮历史部分的估算token数、摘要更新次数与耗时。摘要使用 LLM_PROVIDER
+配置的模型（默认 mock），LLM 不可用时使用抽取式摘要。
+
+用法:
+    python benchmarks/bench_rolling_summary.py --turns 40 --message-chars 120
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_summary_")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{BENCH_DIR}/bench.db")
+os.environ.setdefault("DEBUG", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import async_session_maker, engine, Base
+from app.models.chat_session import ChatSession, ChatMessage
+from app.models.companion import Companion
+from app.core.config import settings
+from app.services.conversation_summarizer import ConversationSummarizer, trim_history_to_budget
+from app.services.token_counter import count_tokens
+from app.services.response_coordinator import response_coordinator
+
+TOPICS = ["工作上的项目延期了", "周末想去杭州爬山", "家里的猫最近不爱吃饭", "在准备考研的复习计划", "和朋友闹了点小别扭"]
+
+
+def user_message(turn: int, chars: int) -> str:
+    base = f"第{turn}轮：我想跟你说说{TOPICS[turn % len(TOPICS)]}，"
+    return (base + "事情是这样的，" * chars)[:chars]
+
+
+def history_tokens(messages, working_memory) -> int:
+    return sum(count_tokens(m["content"]) for m in messages) + count_tokens(working_memory or "")
+
+
+async def main(turns: int, message_chars: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_session_maker() as db:
+        companion = Companion(name="小雪", user_id=1, avatar_id="a", personality_archetype="listener")
+        db.add(companion)
+        await db.flush()
+        chat_session = ChatSession(user_id="1", companion_id=companion.id, session_title="bench")
+        db.add(chat_session)
+        await db.commit()
+        session_id = chat_session.id
+
+    summarizer = ConversationSummarizer()
+    before, after, update_ms = [], [], []
+    history = []
+    for turn in range(turns):
+        async with async_session_maker() as db:
+            for role, content in (("user", user_message(turn, message_chars)), ("assistant", f"嗯嗯，我记住了第{turn}轮你说的事。")):
+                db.add(ChatMessage(session_id=session_id, role=role, content=content))
+                history.append({"role": role, "content": content})
+            await db.commit()
+
+        started = time.perf_counter()
+        if await summarizer.update(session_id):
+            update_ms.append((time.perf_counter() - started) * 1000)
+
+        recent = history[-8:]
+        old_tail = recent[-6:]
+        before.append(history_tokens(old_tail, response_coordinator._build_working_memory(recent)))
+
+        summary = await summarizer.get_summary(session_id)
+        new_tail = trim_history_to_budget(recent, settings.CONVERSATION_TAIL_MAX_TOKENS)
+        after.append(history_tokens(new_tail, response_coordinator._build_working_memory(new_tail, summary)))
+
+    print(f"会话轮数: {turns}, 用户消息长度: {message_chars} 字, 尾部预算: {settings.CONVERSATION_TAIL_MAX_TOKENS} tokens")
+    print(f"before: 历史部分 p50 {statistics.median(before):6.0f} tokens  max {max(before):6.0f}")
+    print(f"after:  历史部分 p50 {statistics.median(after):6.0f} tokens  max {max(after):6.0f}")
+    if update_ms:
+        print(f"摘要更新: {len(update_ms)} 次, 平均 {statistics.mean(update_ms):.1f}ms (后台执行，不计入回复延迟)")
+    print(f"最终摘要: {(await summarizer.get_summary(session_id)) or '（无）'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="滚动对话摘要基准测试")
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--message-chars", type=int, default=120)
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.message_chars))
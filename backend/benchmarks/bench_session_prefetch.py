@@ -0,0 +1,121 @@
+"""
+会话预热基准测试 - 首条消息延迟（有/无 join_chat 预取）
+
+测量首条消息在调用LLM之前的准备耗时：伙伴信息、最近历史、关系状态、
+L2 情景记忆检索、L3 用户事实——与 process_message_by_db_session 一致。
+LLM 本身的耗时与预热无关，不计入。
+
+每种模式在独立子进程中运行，保证嵌入模型、向量集合、倒排索引和
+进程内缓存都从冷状态开始：
+- cold:     直接处理首条消息
+- prefetch: 先启动预取，等待 --think-ms（模拟用户输入首条消息的时间）后处理首条消息
+
+需要可用的数据库、Redis 和 ChromaDB（使用 .env 中的配置）。
+
+用法:
+    python benchmarks/bench_session_prefetch.py --user-id 1 --companion-id 1 --runs 5 --think-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST_MESSAGE = "还记得我上次跟你说的那件事吗"
+
+
+async def first_message_context(chat_engine, session, prefetched, message: str):
+    """首条消息在调用LLM前的准备步骤"""
+    from app.services.memory_integration import memory_system
+    from app.services.redis_utils import redis_affinity_manager
+    from app.core.config import settings
+
+    user_id, companion_id = str(session['user_id']), session['companion_id']
+    chat_session_id = session['chat_session_id']
+
+    companion_info = (prefetched and prefetched.companion_info) or await chat_engine.get_companion_info(companion_id)
+    history = chat_engine._prefetched_history(prefetched, chat_session_id)
+    if history is None:
+        history = await chat_engine.load_chat_history_by_session_id(chat_session_id, limit=8)
+    if prefetched and prefetched.companion_state is not None:
+        state = prefetched.companion_state
+    else:
+        state = await redis_affinity_manager.get_companion_state(user_id, companion_id) or {}
+    memories = await memory_system.get_recent_memories(
+        user_id, companion_id, message, limit=settings.MEMORY_PROMPT_MAX_EPISODIC
+    )
+    if prefetched and prefetched.user_facts is not None:
+        facts = prefetched.user_facts
+    else:
+        facts = await memory_system.get_user_facts(user_id, companion_id)
+    return companion_info, history, state, memories, facts
+
+
+async def run_once(mode: str, user_id: str, companion_id: int, chat_session_id: int, think_ms: float) -> dict:
+    from app.services.chat_engine import chat_engine
+    from app.services.session_prefetch import session_prefetcher
+
+    session = {'user_id': user_id, 'companion_id': companion_id, 'chat_session_id': chat_session_id}
+    prefetched = None
+    if mode == "prefetch":
+        session_prefetcher.start(session)
+        await asyncio.sleep(think_ms / 1000)
+
+    started = time.perf_counter()
+    if mode == "prefetch":
+        prefetched = await session_prefetcher.take(session)
+    await first_message_context(chat_engine, session, prefetched, FIRST_MESSAGE)
+    first_ms = (time.perf_counter() - started) * 1000
+
+    # 同一进程内的第二条消息作为"全热"参照
+    started = time.perf_counter()
+    await first_message_context(chat_engine, session, None, FIRST_MESSAGE)
+    second_ms = (time.perf_counter() - started) * 1000
+    return {"first_ms": first_ms, "second_ms": second_ms, "prefetch_used": prefetched is not None}
+
+
+def spawn(mode: str, args) -> dict:
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__), "--child", mode,
+        "--user-id", args.user_id, "--companion-id", str(args.companion_id),
+        "--chat-session-id", str(args.chat_session_id), "--think-ms", str(args.think_ms)
+    ], text=True, stderr=subprocess.DEVNULL)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话预热首条消息延迟基准测试")
+    parser.add_argument("--user-id", default="1")
+    parser.add_argument("--companion-id", type=int, default=1)
+    parser.add_argument("--chat-session-id", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=1500.0)
+    parser.add_argument("--child", choices=["cold", "prefetch"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = asyncio.run(run_once(args.child, args.user_id, args.companion_id, args.chat_session_id, args.think_ms))
+        print(json.dumps(result))
+        return
+
+    print(f"用户 {args.user_id} / 伙伴 {args.companion_id} / 会话 {args.chat_session_id}, "
+          f"{args.runs} 次, 思考时间 {args.think_ms:.0f}ms")
+    for mode in ("cold", "prefetch"):
+        results = [spawn(mode, args) for _ in range(args.runs)]
+        first = [r["first_ms"] for r in results]
+        second = [r["second_ms"] for r in results]
+        used = sum(1 for r in results if r["prefetch_used"])
+        print(
+            f"{mode:>8}: 首条消息 p50 {statistics.median(first):8.1f}ms  max {max(first):8.1f}ms  "
+            f"| 第二条 p50 {statistics.median(second):6.1f}ms"
+            + (f"  | 预取命中 {used}/{len(results)}" if mode == "prefetch" else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
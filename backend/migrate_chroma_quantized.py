@@ -0,0 +1,94 @@
+"""
+将现有 chroma_db 中的情景记忆迁移为 int8 量化存储
+
+用法:
+    python migrate_chroma_quantized.py [--persist ./chroma_db] [--batch 1000]
+
+迁移完成后设置 MEMORY_EMBEDDING_QUANTIZATION=int8 即可切换。
+原 Chroma 集合保持不变，可随时切回 none。
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chromadb
+from chromadb.config import Settings
+
+from app.core.config import settings
+from app.services.memory_quantization import QuantizedCollection
+
+COLLECTION_NAME = "conversation_memories"
+
+
+def migrate(persist_directory: str, batch_size: int) -> bool:
+    if not os.path.exists(persist_directory):
+        print(f"[ERROR] Chroma directory not found: {persist_directory}")
+        return False
+
+    client = chromadb.PersistentClient(
+        path=persist_directory,
+        settings=Settings(anonymized_telemetry=False, allow_reset=True)
+    )
+    try:
+        source = client.get_collection(COLLECTION_NAME)
+    except Exception as e:
+        print(f"[ERROR] Collection {COLLECTION_NAME} not found: {e}")
+        return False
+
+    total = source.count()
+    print(f"[INFO] Source records: {total}")
+
+    quantized_root = os.path.join(persist_directory, "quantized")
+    target_path = os.path.join(quantized_root, COLLECTION_NAME)
+    if os.path.exists(target_path):
+        print(f"[INFO] Removing previous quantized data: {target_path}")
+        shutil.rmtree(target_path)
+
+    target = QuantizedCollection(
+        name=COLLECTION_NAME,
+        directory=quantized_root,
+        rerank_factor=settings.MEMORY_RERANK_FACTOR
+    )
+
+    started = time.perf_counter()
+    offset = 0
+    while offset < total:
+        batch = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        if not batch["ids"]:
+            break
+        target.add(
+            ids=batch["ids"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"],
+            embeddings=batch["embeddings"]
+        )
+        offset += len(batch["ids"])
+        print(f"[INFO] Migrated {offset}/{total}")
+
+    elapsed = time.perf_counter() - started
+    print(f"[OK] Migrated {target.count()} records in {elapsed:.1f}s")
+    print(f"[INFO] Resident vector data: {target.resident_bytes() / 1024 / 1024:.1f} MB "
+          f"(float32 would be {target.count() * (target.dim or 0) * 4 / 1024 / 1024:.1f} MB)")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate Chroma memories to int8 quantized storage")
+    parser.add_argument("--persist", default=settings.CHROMA_PERSIST_DIRECTORY)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  Chroma Migration: int8 quantized memory embeddings")
+    print("=" * 60)
+
+    success = migrate(args.persist, args.batch)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,102 @@
+"""
+将单集合 conversation_memories 中的情景记忆迁移到分片集合
+
+用法:
+    python migrate_chroma_shards.py --sharding hash --buckets 64 [--delete-source]
+
+迁移后设置 MEMORY_SHARDING / MEMORY_SHARD_BUCKETS 与迁移参数一致。
+源集合默认保留，确认无误后可加 --delete-source 重新运行以清理。
+向量直接复制，不重新计算 embedding。
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.services.chromadb_memory import BASE_COLLECTION_NAME, ChromaMemorySystem
+
+
+def migrate(persist_directory: str, sharding: str, buckets: int, batch_size: int, delete_source: bool) -> bool:
+    if sharding == "none":
+        print("[ERROR] Target sharding must be hash or companion")
+        return False
+    if not os.path.exists(persist_directory):
+        print(f"[ERROR] Chroma directory not found: {persist_directory}")
+        return False
+
+    chroma = ChromaMemorySystem(
+        persist_directory=persist_directory,
+        sharding=sharding,
+        shard_buckets=buckets
+    )
+    source = chroma.collection
+    total = source.count()
+    print(f"[INFO] Source records: {total} ({BASE_COLLECTION_NAME}, storage={chroma.quantization})")
+
+    started = time.perf_counter()
+    shard_counts = defaultdict(int)
+    offset = 0
+    while offset < total:
+        batch = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        if not batch["ids"]:
+            break
+
+        routed = defaultdict(lambda: {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+        for index, memory_id in enumerate(batch["ids"]):
+            metadata = batch["metadatas"][index] or {}
+            name = chroma.shard_name(metadata.get("user_id"), metadata.get("companion_id"))
+            routed[name]["ids"].append(memory_id)
+            routed[name]["documents"].append(batch["documents"][index])
+            routed[name]["metadatas"].append(metadata)
+            routed[name]["embeddings"].append(batch["embeddings"][index])
+
+        for name, records in routed.items():
+            collection = chroma._get_collection(name)
+            # 原生集合用 upsert 保证可重复运行；量化集合的 add 本身会覆盖同ID记录
+            write = getattr(collection, "upsert", collection.add)
+            write(**records)
+            shard_counts[name] += len(records["ids"])
+
+        offset += len(batch["ids"])
+        print(f"[INFO] Migrated {offset}/{total}")
+
+    elapsed = time.perf_counter() - started
+    print(f"[OK] Migrated {sum(shard_counts.values())} records into {len(shard_counts)} shards in {elapsed:.1f}s")
+    if shard_counts:
+        sizes = sorted(shard_counts.values())
+        print(f"[INFO] Shard size min/median/max: {sizes[0]}/{sizes[len(sizes) // 2]}/{sizes[-1]}")
+
+    if delete_source and total:
+        if chroma.quantization == "int8":
+            source.delete(ids=source.get(include=[])["ids"])
+            source.compact()
+        else:
+            chroma.client.delete_collection(BASE_COLLECTION_NAME)
+        print(f"[OK] Source collection {BASE_COLLECTION_NAME} cleared")
+
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate Chroma memories into sharded collections")
+    parser.add_argument("--persist", default=settings.CHROMA_PERSIST_DIRECTORY)
+    parser.add_argument("--sharding", choices=["hash", "companion"], default="hash")
+    parser.add_argument("--buckets", type=int, default=settings.MEMORY_SHARD_BUCKETS)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--delete-source", action="store_true")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"  Chroma Migration: shard memories ({args.sharding})")
+    print("=" * 60)
+
+    success = migrate(args.persist, args.sharding, args.buckets, args.batch, args.delete_source)
+    sys.exit(0 if success else 1)
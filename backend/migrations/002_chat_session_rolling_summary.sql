@@ -0,0 +1,11 @@
+-- ============================================================
+-- 数据库迁移脚本: 滚动对话摘要
+-- 描述: chat_sessions 增加滚动摘要和摘要水位列
+--       （init_db 启动时也会自动补齐，本脚本用于手动迁移）
+-- ============================================================
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS rolling_summary TEXT;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_message_id INTEGER DEFAULT 0;
+
+COMMENT ON COLUMN chat_sessions.rolling_summary IS '滚动对话摘要（覆盖到 summary_message_id 为止的消息）';
+COMMENT ON COLUMN chat_sessions.summary_message_id IS '摘要水位：已并入摘要的最后一条消息ID';
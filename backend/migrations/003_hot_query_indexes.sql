@@ -0,0 +1,25 @@
+-- ============================================================
+-- 数据库迁移脚本: 热点查询复合索引
+-- 描述: 为历史消息、事件冷却、离线日志、会话统计、关系状态的热点查询补充复合索引
+--       （init_db 启动时也会自动补建，本脚本用于手动迁移）
+-- ============================================================
+
+-- 按会话读取最近的历史消息
+CREATE INDEX IF NOT EXISTS ix_chat_messages_session_timestamp
+    ON chat_messages (session_id, timestamp);
+
+-- 伙伴的活跃会话统计
+CREATE INDEX IF NOT EXISTS ix_chat_sessions_companion_active
+    ON chat_sessions (companion_id, is_active);
+
+-- 事件冷却检查：按用户/伙伴/事件取最近一次触发
+CREATE INDEX IF NOT EXISTS ix_user_event_history_cooldown
+    ON user_event_history (user_id, companion_id, event_id, triggered_at);
+
+-- 聊天时查找伙伴未分享的重要日志
+CREATE INDEX IF NOT EXISTS ix_offline_life_logs_companion_unshared
+    ON offline_life_logs (companion_id, is_shared_with_user, importance_score);
+
+-- 按用户和伙伴读取关系状态
+CREATE INDEX IF NOT EXISTS ix_relationship_states_user_companion
+    ON companion_relationship_states (user_id, companion_id);
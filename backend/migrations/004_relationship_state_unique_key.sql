@@ -0,0 +1,20 @@
+-- ============================================================
+-- 数据库迁移脚本: 关系状态唯一键
+-- 描述: companion_relationship_states.companion_id 改为整数，
+--       (user_id, companion_id) 建唯一索引，供 INSERT ... ON CONFLICT 写入
+--       （SQLite 由 init_db 启动时清理重复行并补建唯一索引，本脚本用于 Postgres 手动迁移）
+-- ============================================================
+
+ALTER TABLE companion_relationship_states
+    ALTER COLUMN companion_id TYPE INTEGER USING companion_id::integer;
+
+-- 清理重复行，保留每组最新的一行
+DELETE FROM companion_relationship_states
+WHERE id NOT IN (
+    SELECT MAX(id) FROM companion_relationship_states GROUP BY user_id, companion_id
+);
+
+DROP INDEX IF EXISTS ix_relationship_states_user_companion;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_relationship_states_user_companion
+    ON companion_relationship_states (user_id, companion_id);
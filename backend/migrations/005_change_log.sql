@@ -0,0 +1,23 @@
+-- ============================================================
+-- 数据库迁移脚本: 变更日志表
+-- 描述: 聊天消息、情感日志、关系历史写入时同一事务追加的变更日志，
+--       供 /api/changes 按游标增量订阅（init_db 启动时也会自动创建）
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS change_log (
+    id BIGSERIAL PRIMARY KEY,                    -- 单调递增，作为游标位置
+    source_table VARCHAR(50) NOT NULL,           -- 来源表
+    row_id INTEGER NOT NULL,                     -- 来源表中的主键
+    payload JSONB NOT NULL,                      -- 写入时的整行数据
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()  -- 写入时间
+);
+
+-- 按来源表过滤的订阅
+CREATE INDEX IF NOT EXISTS ix_change_log_table_id
+    ON change_log (source_table, id);
+
+COMMENT ON TABLE change_log IS '变更日志表 - 追加写入的表在同一事务中记录整行数据，供增量订阅';
+COMMENT ON COLUMN change_log.id IS '游标位置（单调递增）';
+COMMENT ON COLUMN change_log.source_table IS '来源表名';
+COMMENT ON COLUMN change_log.row_id IS '来源表中的主键';
+COMMENT ON COLUMN change_log.payload IS '写入时的整行数据';
@@ -0,0 +1,62 @@
+"""
+从增量备份恢复数据库
+
+用法:
+    python restore_backup.py ./backups/<备份ID> [--database-url sqlite+aiosqlite:///./restored.db]
+
+给出的是增量备份时，会沿 manifest 的 base 链先恢复全量备份，再按顺序重放各个增量。
+每批行一次 executemany 的 upsert；Postgres（asyncpg）上空表的全量分段用 COPY 导入。
+目标库应为空库（默认使用 DATABASE_URL），表结构不存在时自动创建。
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.database import create_database_engine
+from app.services.backup import backup_chain, run_restore
+
+
+async def restore(backup_dir: str, database_url: str, batch_rows: int) -> bool:
+    try:
+        chain = backup_chain(backup_dir)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Invalid backup: {e}")
+        return False
+    print(f"[INFO] Restore chain: {' -> '.join(os.path.basename(path) for path in chain)}")
+
+    engine = create_database_engine(database_url)
+    try:
+        result = await run_restore(backup_dir, engine=engine, batch_rows=batch_rows)
+    except Exception as e:
+        print(f"[ERROR] Restore failed: {e}")
+        return False
+    finally:
+        await engine.dispose()
+
+    for name, rows in result["tables"].items():
+        if rows:
+            print(f"[INFO]   {name}: {rows} rows")
+    print(
+        f"[OK] Restored {result['rows']} rows in {result['seconds']:.2f}s "
+        f"({result['rows_per_second']:.0f} rows/s)"
+    )
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restore the database from an NDJSON backup chain")
+    parser.add_argument("backup_dir")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--batch", type=int, default=settings.BACKUP_BATCH_ROWS)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  Database Restore")
+    print("=" * 60)
+
+    success = asyncio.run(restore(args.backup_dir, args.database_url, args.batch))
+    sys.exit(0 if success else 1)
@@ -0,0 +1,79 @@
+import os
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.database import Base, create_database_engine
+from app.models.relationship import EmotionLog, RelationshipHistory
+from app.services.analytics_aggregation import (
+    affinity_change_distribution, affinity_score_distribution, compare_prompt_versions
+)
+from app.services.analytics_snapshot import (
+    FORMAT_SUFFIX, export_day, partition_dir, read_range, to_columns, write_partition
+)
+
+DAY = date(2025, 3, 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["npz", "parquet", "arrow"])
+async def test_day_partition_export_and_vectorized_aggregation(tmp_path, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow.parquet")
+    elif fmt == "arrow":
+        pytest.importorskip("pyarrow")
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'analytics.db'}")
+    root = str(tmp_path / "snapshots")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(EmotionLog.__table__.insert(), [
+                {"user_id": "u1", "companion_id": "1", "primary_emotion": emotion, "emotion_intensity": 50,
+                 "affinity_change": change, "created_at": datetime(2025, 3, 1, hour)}
+                for hour, (emotion, change) in enumerate([("joy", 8), ("joy", 4), ("sadness", -6)])
+            ] + [
+                # 前一天的行不进入该日分区
+                {"user_id": "u1", "companion_id": "1", "primary_emotion": "joy", "emotion_intensity": 50,
+                 "affinity_change": 100, "created_at": datetime(2025, 2, 28, 23)}
+            ])
+            await conn.execute(RelationshipHistory.__table__.insert(), [
+                {"user_id": "u1", "companion_id": "1", "change_type": "affinity_change", "old_value": "300",
+                 "new_value": "308", "delta": 8, "created_at": datetime(2025, 3, 1, 1)},
+                {"user_id": "u1", "companion_id": "1", "change_type": "affinity_change", "old_value": "308",
+                 "new_value": "302", "delta": -6, "created_at": datetime(2025, 3, 1, 2)},
+                {"user_id": "u2", "companion_id": "1", "change_type": "affinity_change", "old_value": "600",
+                 "new_value": "650", "delta": 50, "created_at": datetime(2025, 3, 1, 3)},
+                {"user_id": "u2", "companion_id": "1", "change_type": "level_change", "old_value": "friend",
+                 "new_value": "close_friend", "delta": None, "created_at": datetime(2025, 3, 1, 3)},
+            ])
+
+        written = await export_day(DAY, root=root, fmt=fmt, engine=engine)
+        assert written == {"emotion_logs": 3, "relationship_history": 4, "chat_messages": 0}
+        assert os.listdir(partition_dir(root, "emotion_logs", DAY)) == ["part" + FORMAT_SUFFIX[fmt]]
+
+        logs = read_range(root, "emotion_logs", DAY, DAY, ["affinity_change", "primary_emotion"])
+        distribution = affinity_change_distribution(logs)
+        assert distribution["count"] == 3
+        assert distribution["by_emotion"]["joy"] == {"count": 2, "mean_affinity_change": 6.0}
+
+        history = read_range(root, "relationship_history", DAY - timedelta(days=1), DAY, encoded=True)
+        scores = affinity_score_distribution(history)
+        assert scores["relationships"] == 2
+        assert scores["mean"] == pytest.approx((302 + 650) / 2)
+
+        write_partition(root, "daily_counters", DAY, to_columns("daily_counters", [
+            {"prompt_version": "v1", "usage": 40, "total_score": 10, "feedback_count": 20},
+            {"prompt_version": "v2", "usage": 30, "total_score": 15, "feedback_count": 20},
+        ]), fmt)
+        counters = read_range(root, "daily_counters", date(2025, 2, 27), DAY)
+        result = compare_prompt_versions(counters, "v1", "v2")
+        assert result["winner"] == {"by_quality": "v2", "by_usage": "v1"}
+        assert result["comparison"]["v2"]["stats"]["quality"]["2025-03-01"] == {"avg_score": 0.75, "feedback_count": 20}
+    finally:
+        await engine.dispose()
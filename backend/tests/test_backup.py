@@ -0,0 +1,64 @@
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, select, update
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.database import Base, create_database_engine
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services.backup import backup_chain, read_manifest, run_backup, run_restore
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_and_restore_chain(tmp_path):
+    source = create_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'source.db'}")
+    target = create_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'target.db'}")
+    root = str(tmp_path / "backups")
+    try:
+        async with source.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(ChatSession.__table__.insert(), [
+                {"id": 1, "user_id": "u1", "companion_id": 1, "session_title": "旧标题", "total_messages": 2}
+            ])
+            await conn.execute(ChatMessage.__table__.insert(), [
+                {"session_id": 1, "role": "user", "content": f"消息{i}"} for i in range(2)
+            ])
+
+        full = await run_backup(root, compression="gzip", engine=source)
+        assert full["base"] is None
+        assert full["tables"]["chat_messages"]["rows"] == 2
+
+        async with source.begin() as conn:
+            await conn.execute(ChatMessage.__table__.insert(), [{"session_id": 1, "role": "assistant", "content": "新消息"}])
+            await conn.execute(
+                update(ChatSession.__table__).where(ChatSession.id == 1)
+                .values(session_title="新标题", total_messages=3)
+            )
+
+        incremental = await run_backup(root, compression="gzip", engine=source)
+        assert incremental["base"] == full["backup_id"]
+        assert incremental["tables"]["chat_messages"]["rows"] == 1
+        assert incremental["tables"]["chat_sessions"]["rows"] == 1
+        assert incremental["tables"]["users"]["rows"] == 0
+        segment = Path(incremental["path"]) / incremental["tables"]["chat_messages"]["file"]
+        with gzip.open(segment, "rt", encoding="utf-8") as f:
+            assert [json.loads(line)["content"] for line in f] == ["新消息"]
+
+        assert [Path(p).name for p in backup_chain(incremental["path"])] == [full["backup_id"], incremental["backup_id"]]
+        assert read_manifest(incremental["path"])["tables"]["chat_messages"]["mark"]["value"] == 3
+
+        result = await run_restore(incremental["path"], engine=target)
+        assert result["tables"]["chat_messages"] == 3
+        async with target.connect() as conn:
+            assert (await conn.execute(select(func.count()).select_from(ChatMessage.__table__))).scalar() == 3
+            session_row = (await conn.execute(select(ChatSession.__table__))).one()
+            assert session_row.session_title == "新标题" and session_row.total_messages == 3
+    finally:
+        await source.dispose()
+        await target.dispose()
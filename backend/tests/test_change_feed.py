@@ -0,0 +1,59 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete, func, select
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.api.changes import list_changes
+from app.core.database import async_session_maker, init_db
+from app.models.change_log import ChangeLog
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services.change_feed import decode_cursor, encode_cursor
+from app.services.write_behind import WriteBehindQueue
+
+
+@pytest.mark.asyncio
+async def test_change_feed_pages_and_long_polls_new_rows():
+    await init_db()
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id="test-change-feed", companion_id=1, session_title="变更订阅")
+        db.add(chat_session)
+        await db.commit()
+        chat_session_id = chat_session.id
+        start_id = (await db.execute(select(func.coalesce(func.max(ChangeLog.id), 0)))).scalar()
+
+    queue = WriteBehindQueue()
+    cursor = encode_cursor(start_id, None)
+    try:
+        await queue.write(ChatMessage, [
+            {"session_id": chat_session_id, "role": "user", "content": f"消息{i}"} for i in range(3)
+        ])
+
+        page = await list_changes(cursor=cursor, limit=2, tables="chat_messages", wait=0)
+        assert [c["data"]["content"] for c in page["changes"]] == ["消息0", "消息1"]
+        assert page["has_more"] is True
+        assert page["changes"][0]["row_id"] == page["changes"][0]["data"]["id"]
+
+        page = await list_changes(cursor=page["next_cursor"], limit=2, tables="chat_messages", wait=0)
+        assert [c["data"]["content"] for c in page["changes"]] == ["消息2"]
+        assert page["has_more"] is False
+
+        # 没有新变更时长轮询等待，提交后立即返回
+        waiter = asyncio.create_task(list_changes(cursor=page["next_cursor"], limit=10, tables="chat_messages", wait=5))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await queue.write(ChatMessage, [{"session_id": chat_session_id, "role": "assistant", "content": "新回复"}])
+        page = await asyncio.wait_for(waiter, 1)
+        assert [c["data"]["content"] for c in page["changes"]] == ["新回复"]
+        assert decode_cursor(page["next_cursor"]) > start_id
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ChangeLog).where(ChangeLog.id > start_id))
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == chat_session_id))
+            await db.commit()
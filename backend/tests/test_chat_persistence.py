@@ -0,0 +1,104 @@
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete, select
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.database import async_session_maker, init_db
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services import chat_engine as chat_engine_module
+from app.services.chat_engine import chat_engine
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_keep_message_count():
+    await init_db()
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id="test-turn-persistence", companion_id=1, session_title="turns")
+        db.add(chat_session)
+        await db.commit()
+        chat_session_id = chat_session.id
+
+    try:
+        results = await asyncio.gather(*[
+            chat_engine.save_turn_to_db(chat_session_id, [
+                {"role": "user", "content": f"问题{turn}"},
+                {"role": "assistant", "content": f"回答{turn}"},
+            ])
+            for turn in range(10)
+        ])
+        assert all(results)
+
+        async with async_session_maker() as db:
+            saved = await db.get(ChatSession, chat_session_id)
+            assert saved.total_messages == 20
+
+        history = await chat_engine.load_chat_history_by_session_id(chat_session_id, limit=2)
+        assert [m["role"] for m in history] == ["user", "assistant"]
+        assert history[0]["content"].replace("问题", "") == history[1]["content"].replace("回答", "")
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == chat_session_id))
+            await db.commit()
+
+
+
+async def _async_value(value=None):
+    return value
+
+
+@pytest.fixture
+def offline_turn(monkeypatch):
+    """process_message_by_db_session 依赖的 Redis / LLM 服务替换为固定结果"""
+    monkeypatch.setattr(chat_engine_module.content_filter, "is_content_safe", lambda message: _async_value((True, None)))
+    monkeypatch.setattr(chat_engine_module.redis_stats_manager, "increment_counter", lambda *args, **kwargs: _async_value())
+    monkeypatch.setattr(chat_engine_module.hot_conversation_cache, "get_cached_response", lambda *args: _async_value())
+    monkeypatch.setattr(chat_engine_module.redis_affinity_manager, "get_companion_state", lambda *args: _async_value({}))
+    monkeypatch.setattr(chat_engine_module.conversation_summarizer, "get_summary", lambda *args: _async_value())
+    monkeypatch.setattr(chat_engine_module.analytics_service, "track_prompt_usage", lambda *args: _async_value())
+    monkeypatch.setattr(chat_engine, "load_chat_history_by_session_id", lambda *args, **kwargs: _async_value([]))
+    monkeypatch.setattr(chat_engine, "get_companion_info", lambda companion_id: _async_value(
+        {"name": "小雪", "personality_archetype": "listener"} if companion_id == 1 else None
+    ))
+    monkeypatch.setattr(chat_engine_module.response_coordinator, "coordinate_response", lambda **kwargs: _async_value(
+        SimpleNamespace(ai_response="很长的回复" * 100, completed_tasks=None)
+    ))
+
+
+@pytest.mark.asyncio
+async def test_user_message_is_saved_on_early_return_and_disconnect(offline_turn):
+    await init_db()
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id="test-turn-finally", companion_id=1, session_title="turns")
+        db.add(chat_session)
+        await db.commit()
+        chat_session_id = chat_session.id
+
+    try:
+        # 找不到伙伴时提前返回
+        replies = [chunk async for chunk in chat_engine.process_message_by_db_session(chat_session_id, 1, 99, "你还在吗")]
+        assert replies == ["抱歉，找不到对应的AI伙伴信息。"]
+
+        # 流式回复中途客户端断开
+        stream = chat_engine.process_message_by_db_session(chat_session_id, 1, 1, "讲个故事")
+        assert await stream.__anext__()
+        await stream.aclose()
+
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(ChatMessage.role, ChatMessage.content)
+                .where(ChatMessage.session_id == chat_session_id).order_by(ChatMessage.id)
+            )
+            assert result.all() == [("user", "你还在吗"), ("user", "讲个故事")]
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == chat_session_id))
+            await db.commit()
@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.api.chat_sessions import create_chat_session, delete_chat_session
+from app.api.schemas_chat import ChatSessionCreate
+from app.services import chat_engine as chat_engine_module
+from app.core.database import async_session_maker, init_db
+from app.models.chat_session import ChatSession
+from app.models.companion import Companion
+from app.services.companion_listing import companion_list_cache, list_user_companions
+
+USER_ID = 987654
+
+
+@pytest.mark.asyncio
+async def test_companion_list_counts_sessions_and_invalidates_cache(monkeypatch):
+    async def no_redis(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(chat_engine_module.redis_session_manager, "create_session", no_redis)
+    monkeypatch.setattr(chat_engine_module.redis_stats_manager, "increment_counter", no_redis)
+    await init_db()
+    async with async_session_maker() as db:
+        companions = [
+            Companion(user_id=USER_ID, name=f"列表伙伴{i}", avatar_id="a", personality_archetype="listener")
+            for i in range(3)
+        ]
+        db.add_all(companions)
+        await db.flush()
+        busy, idle, archived = [c.id for c in companions]
+        db.add_all(
+            [ChatSession(user_id=str(USER_ID), companion_id=busy, session_title="会话") for _ in range(4)]
+            + [ChatSession(user_id=str(USER_ID), companion_id=archived, session_title="旧会话", is_active=False)]
+        )
+        await db.commit()
+
+    companion_list_cache.invalidate()
+    try:
+        async with async_session_maker() as db:
+            rows = await list_user_companions(db, USER_ID)
+            counts = {row["id"]: row["session_count"] for row in rows}
+            assert counts == {busy: 4, idle: 0, archived: 0}
+
+            # 命中缓存：返回同一份结果
+            assert await list_user_companions(db, USER_ID) is rows
+
+            # 创建会话使包含该伙伴的列表失效
+            session = await create_chat_session(ChatSessionCreate(user_id=str(USER_ID), companion_id=idle), db)
+            counts = {row["id"]: row["session_count"] for row in await list_user_companions(db, USER_ID)}
+            assert counts[idle] == 1
+
+            await delete_chat_session(session.id, user_id=str(USER_ID), db=db)
+            counts = {row["id"]: row["session_count"] for row in await list_user_companions(db, USER_ID)}
+            assert counts[idle] == 0
+
+            # join_chat 创建会话同样使列表失效
+            await chat_engine_module.chat_engine.create_session("test-companion-listing", idle, str(USER_ID))
+            chat_engine_module.chat_engine.active_sessions.pop("test-companion-listing", None)
+            counts = {row["id"]: row["session_count"] for row in await list_user_companions(db, USER_ID)}
+            assert counts[idle] == 1
+    finally:
+        companion_list_cache.invalidate()
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatSession).where(ChatSession.companion_id.in_([busy, idle, archived])))
+            await db.execute(delete(Companion).where(Companion.user_id == USER_ID))
+            await db.commit()
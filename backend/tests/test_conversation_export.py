@@ -0,0 +1,55 @@
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.database import async_session_maker, init_db
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services.conversation_export import (
+    gzip_chunks, iter_message_batches, json_chunks, session_conditions
+)
+
+
+async def collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+@pytest.mark.asyncio
+async def test_streamed_json_export_is_complete_and_gzip_roundtrips():
+    user_id = "test-export-user"
+    await init_db()
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id=user_id, companion_id=1, session_title="导出")
+        db.add(chat_session)
+        await db.flush()
+        db.add_all([
+            ChatMessage(session_id=chat_session.id, role="user" if i % 2 == 0 else "assistant", content=f"消息{i}")
+            for i in range(5)
+        ])
+        await db.commit()
+        chat_session_id = chat_session.id
+
+    try:
+        async with async_session_maker() as db:
+            batches = [batch async for batch in iter_message_batches(db, chat_session_id, batch_size=2)]
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+
+        conditions = session_conditions(user_id=user_id)
+        document = json.loads(await collect(json_chunks(conditions)))
+        assert document["total_sessions"] == 1
+        assert [m["content"] for m in document["sessions"][0]["messages"]] == [f"消息{i}" for i in range(5)]
+
+        compressed = await collect(gzip_chunks(json_chunks(conditions, include_messages=False)))
+        assert json.loads(gzip.decompress(compressed))["sessions"][0]["id"] == chat_session_id
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == chat_session_id))
+            await db.commit()
@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, delete, func, inspect, select, text
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.config import settings
+from app.core.database import _upgrade_schema, async_session_maker, init_db
+from app.models.chat_session import ChatSession, ChatMessage
+from app.services.conversation_summarizer import ConversationSummarizer, trim_history_to_budget
+from app.services.llm import factory as llm_factory
+from app.services.token_counter import count_tokens
+
+
+def test_tail_keeps_newest_messages_within_budget():
+    history = [
+        {"role": "user", "content": "很长的一段话" * 50},
+        {"role": "assistant", "content": "好的"},
+        {"role": "user", "content": "今天去爬山了"},
+    ]
+
+    tail = trim_history_to_budget(history, max_tokens=30)
+    assert [m["content"] for m in tail] == ["好的", "今天去爬山了"]
+
+    only_long = trim_history_to_budget(history[:1], max_tokens=30)
+    assert len(only_long) == 1 and count_tokens(only_long[0]["content"]) <= 30
+
+
+def test_upgrade_schema_adds_summary_columns_to_existing_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE chat_sessions (id INTEGER PRIMARY KEY, user_id VARCHAR(50))"))
+        _upgrade_schema(conn)
+        _upgrade_schema(conn)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("chat_sessions")}
+    assert {"rolling_summary", "summary_message_id"} <= columns
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("keep", [2, 6])
+async def test_unsummarized_messages_never_exceed_history_window(monkeypatch, keep):
+    async def no_llm(messages):
+        raise RuntimeError("测试中不使用LLM")
+
+    monkeypatch.setattr(llm_factory.llm_service, "chat_completion", no_llm)
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_KEEP_MESSAGES", keep)
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_EVERY_TURNS", 4)
+    monkeypatch.setattr(settings, "CONVERSATION_HISTORY_MESSAGES", 8)
+
+    await init_db()
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id="test-summary-window", companion_id=1, session_title="摘要")
+        db.add(chat_session)
+        await db.commit()
+        chat_session_id = chat_session.id
+
+    summarizer = ConversationSummarizer()
+    try:
+        for turn in range(15):
+            async with async_session_maker() as db:
+                db.add_all([
+                    ChatMessage(session_id=chat_session_id, role="user", content=f"第{turn}轮的问题"),
+                    ChatMessage(session_id=chat_session_id, role="assistant", content=f"第{turn}轮的回答"),
+                ])
+                await db.commit()
+            await summarizer.update(chat_session_id)
+
+            # Prompt 只加载最近 8 条原文，其余消息必须都已并入摘要
+            async with async_session_maker() as db:
+                watermark = (await db.get(ChatSession, chat_session_id)).summary_message_id or 0
+                unsummarized = (await db.execute(
+                    select(func.count(ChatMessage.id))
+                    .where(ChatMessage.session_id == chat_session_id, ChatMessage.id > watermark)
+                )).scalar()
+            assert unsummarized <= 8
+        assert "第0轮的问题" in await summarizer.get_summary(chat_session_id)
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == chat_session_id))
+            await db.commit()
@@ -0,0 +1,204 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.config import settings
+from app.services import fact_accumulator as fact_accumulator_module
+from app.services import redis_memory as redis_memory_module
+from app.services.fact_accumulator import FactExtractionAccumulator
+from app.services.llm import factory as llm_factory
+
+
+class WindowStore:
+    """只实现事实窗口用到的列表 / 有序集合命令"""
+
+    def __init__(self):
+        self.lists = {}
+        self.zsets = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    async def zrangebyscore(self, key, low, high):
+        return [member for member, score in self.zsets.get(key, {}).items() if score <= high]
+
+
+class Pipeline:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    async def execute(self):
+        lists, zsets, hashes = self.store.lists, self.store.zsets, self.store.hashes
+        results = []
+        for name, args, kwargs in self.ops:
+            key = args[0]
+            if name == "rpush":
+                lists.setdefault(key, []).extend(args[1:])
+                results.append(len(lists[key]))
+            elif name == "lpush":
+                for value in args[1:]:
+                    lists.setdefault(key, []).insert(0, value)
+                results.append(len(lists[key]))
+            elif name == "lrange":
+                results.append(list(lists.get(key, [])))
+            elif name == "delete":
+                results.append(int(lists.pop(key, None) is not None))
+            elif name == "zadd":
+                zset = zsets.setdefault(key, {})
+                for member, score in args[1].items():
+                    if not (kwargs.get("nx") and member in zset):
+                        zset[member] = score
+                results.append(1)
+            elif name == "zrem":
+                results.append(int(zsets.get(key, {}).pop(args[1], None) is not None))
+            elif name == "zscore":
+                results.append(zsets.get(key, {}).get(args[1]))
+            elif name == "hget":
+                results.append(hashes.get(key, {}).get(args[1]))
+            elif name == "hset":
+                hashes.setdefault(key, {})[args[1]] = str(args[2])
+                results.append(1)
+            elif name == "hdel":
+                results.append(int(hashes.get(key, {}).pop(args[1], None) is not None))
+            else:
+                results.append(True)
+        return results
+
+
+class FactStore:
+    def __init__(self):
+        self.saved = []
+
+    async def save_multiple_facts(self, user_id, companion_id, facts):
+        self.saved.append(facts)
+        return True
+
+
+@pytest.mark.asyncio
+async def test_window_is_requeued_when_llm_fails(monkeypatch):
+    store, facts = WindowStore(), FactStore()
+
+    async def fake_get_redis():
+        return store
+
+    async def fake_get_redis_memory():
+        return facts
+
+    llm_calls = []
+
+    async def failing_completion(messages):
+        llm_calls.append(messages)
+        raise RuntimeError("LLM不可用")
+
+    monkeypatch.setattr(fact_accumulator_module, "get_redis", fake_get_redis)
+    monkeypatch.setattr(redis_memory_module, "get_redis_memory", fake_get_redis_memory)
+    monkeypatch.setattr(llm_factory.llm_service, "chat_completion", failing_completion)
+
+    accumulator = FactExtractionAccumulator(window_turns=2)
+    key = accumulator._window_key("u1", 3)
+
+    await accumulator.add_turn("u1", 3, "我对花生过敏", "记住了")
+    assert await accumulator.add_turn("u1", 3, "我养了一只叫豆豆的猫", "好可爱") is None
+
+    # 提取失败：两轮对话按原顺序放回窗口，分区仍待提取
+    assert len(llm_calls) == 1
+    assert ["花生" in raw for raw in store.lists[key]] == [True, False]
+    assert accumulator._member("u1", 3) in store.zsets[accumulator.PENDING_KEY]
+
+    async def working_completion(messages):
+        llm_calls.append(messages)
+        return '{"过敏": "花生", "宠物": "猫豆豆"}'
+
+    monkeypatch.setattr(llm_factory.llm_service, "chat_completion", working_completion)
+    assert await accumulator.flush("u1", 3, reason="retry") == {"过敏": "花生", "宠物": "猫豆豆"}
+    assert "豆豆" in llm_calls[-1][0]["content"] and "花生" in llm_calls[-1][0]["content"]
+    assert facts.saved == [{"过敏": "花生", "宠物": "猫豆豆"}]
+    assert key not in store.lists
+
+
+@pytest.mark.asyncio
+async def test_malformed_llm_reply_requeues_window(monkeypatch):
+    store, facts = WindowStore(), FactStore()
+
+    async def fake_get_redis():
+        return store
+
+    async def fake_get_redis_memory():
+        return facts
+
+    async def prose_completion(messages):
+        return "好的，我记住了你喜欢抹茶"
+
+    monkeypatch.setattr(fact_accumulator_module, "get_redis", fake_get_redis)
+    monkeypatch.setattr(redis_memory_module, "get_redis_memory", fake_get_redis_memory)
+    monkeypatch.setattr(llm_factory.llm_service, "chat_completion", prose_completion)
+
+    accumulator = FactExtractionAccumulator(window_turns=2)
+    await accumulator.add_turn("u1", 3, "我对花生过敏", "记住了")
+    assert await accumulator.add_turn("u1", 3, "我养了一只叫豆豆的猫", "好可爱") is None
+
+    # 非JSON回复不会清空窗口
+    assert len(store.lists[accumulator._window_key("u1", 3)]) == 2
+    assert facts.saved == []
+
+
+@pytest.mark.asyncio
+async def test_failed_window_backs_off_and_is_dropped_after_max_attempts(monkeypatch):
+    store, facts = WindowStore(), FactStore()
+    clock = [time.time()]
+
+    async def fake_get_redis():
+        return store
+
+    async def fake_get_redis_memory():
+        return facts
+
+    llm_calls = []
+
+    async def failing_completion(messages):
+        llm_calls.append(messages)
+        raise RuntimeError("LLM不可用")
+
+    monkeypatch.setattr(fact_accumulator_module, "get_redis", fake_get_redis)
+    monkeypatch.setattr(redis_memory_module, "get_redis_memory", fake_get_redis_memory)
+    monkeypatch.setattr(llm_factory.llm_service, "chat_completion", failing_completion)
+    monkeypatch.setattr(fact_accumulator_module.time, "time", lambda: clock[0])
+    monkeypatch.setattr(settings, "FACT_WINDOW_RETRY_SECONDS", 60.0)
+    monkeypatch.setattr(settings, "FACT_WINDOW_MAX_ATTEMPTS", 3)
+
+    accumulator = FactExtractionAccumulator(window_turns=2)
+    key, member = accumulator._window_key("u1", 3), accumulator._member("u1", 3)
+    await accumulator.add_turn("u1", 3, "我对花生过敏", "记住了")
+    await accumulator.add_turn("u1", 3, "我养了一只叫豆豆的猫", "好可爱")
+    assert len(llm_calls) == 1
+
+    # 退避期内：新轮次只追加，后台任务也不重试
+    await accumulator.add_turn("u1", 3, "我最近在学吉他", "加油")
+    assert await accumulator.flush_stale() == 0
+    assert len(llm_calls) == 1 and len(store.lists[key]) == 3
+
+    # 第一次退避 60 秒后重试，再失败时退避翻倍
+    clock[0] += 61
+    assert await accumulator.flush_stale() == 1
+    assert len(llm_calls) == 2
+    clock[0] += 61
+    assert await accumulator.flush_stale() == 0
+    clock[0] += 60
+
+    # 达到最大次数：丢弃窗口，不再重试
+    assert await accumulator.flush_stale() == 1
+    assert len(llm_calls) == 3
+    assert key not in store.lists
+    assert member not in store.zsets[accumulator.PENDING_KEY]
+    assert member not in store.hashes.get(accumulator.ATTEMPTS_KEY, {})
@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.fact_extractor import fact_extractor, user_text_of
+
+
+def test_common_facts_are_extracted_without_llm():
+    result = fact_extractor.extract("我叫小星，今年二十三岁，在杭州上班，是一名程序员")
+
+    assert result.facts == {"昵称": "小星", "年龄": "23岁", "所在城市": "杭州", "职业": "程序员"}
+    assert result.needs_llm is False
+
+
+def test_small_talk_skips_llm_and_uncovered_facts_trigger_it():
+    assert fact_extractor.extract("我在吃饭，等下聊").needs_llm is False
+    assert fact_extractor.extract("我对花生过敏").needs_llm is True
+
+
+def test_only_user_lines_are_considered():
+    text = "用户: 今天好累\nAI: 我叫小雪，我喜欢画画"
+
+    assert user_text_of(text) == "今天好累"
+    assert fact_extractor.extract(user_text_of(text)).facts == {}
+
+
+def test_multiline_user_messages_are_kept_whole():
+    text = "用户: 在吗\n我叫小星，我在杭州上班\nAI: 你好\n用户: 我对花生过敏\nAI: 记住了"
+
+    assert user_text_of(text) == "在吗\n我叫小星，我在杭州上班\n我对花生过敏"
+    result = fact_extractor.extract(user_text_of(text))
+    assert result.facts == {"昵称": "小星", "所在城市": "杭州"}
+    assert result.needs_llm is True
@@ -0,0 +1,121 @@
+import sys
+from pathlib import Path
+
+import pytest
+from redis.exceptions import WatchError
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services import history_cache as history_cache_module
+from app.services.history_cache import ChatHistoryCache
+
+
+class ListStore:
+    """只实现历史缓存用到的列表 / 计数器命令和 WATCH 事务"""
+
+    def __init__(self):
+        self.lists = {}
+        self.values = {}
+        self.writes = 0  # 每次写入加一，WATCH 时记录
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    async def lrange(self, key, start, end):
+        return self.lists.get(key, [])[start:end + 1]
+
+    async def get(self, key):
+        return self.values.get(key)
+
+
+class Pipeline:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+        self.watched_at = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args: self.ops.append((name, args))
+
+    async def watch(self, key):
+        self.watched_at = self.store.writes
+
+    async def get(self, key):
+        return self.store.values.get(key)
+
+    def multi(self):
+        pass
+
+    async def execute(self):
+        store, lists = self.store, self.store.lists
+        if self.watched_at is not None and store.writes != self.watched_at:
+            raise WatchError("watched key changed")
+        store.writes += 1
+        for name, args in self.ops:
+            key, values = args[0], args[1:]
+            if name == "delete":
+                lists.pop(key, None)
+            elif name == "rpush":
+                lists.setdefault(key, []).extend(values)
+            elif name == "lpushx" and key in lists:
+                for value in values:
+                    lists[key].insert(0, value)
+            elif name == "ltrim":
+                lists[key] = lists.get(key, [])[values[0]:values[1] + 1]
+            elif name == "incr":
+                store.values[key] = str(int(store.values.get(key) or 0) + 1)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    store = ListStore()
+
+    async def fake_get_redis():
+        return store
+
+    monkeypatch.setattr(history_cache_module, "get_redis", fake_get_redis)
+    return ChatHistoryCache(size=4)
+
+
+@pytest.mark.asyncio
+async def test_history_cache_appends_only_to_populated_lists(cache):
+    await cache.append(1, [{"role": "user", "content": "没有缓存时不写入"}])
+    assert await cache.get(1, 4) is None
+
+    version = await cache.version(1)
+    assert await cache.populate(1, [{"role": "user", "content": f"消息{i}"} for i in range(3)], version)
+    await cache.append(1, [{"role": "user", "content": "消息3"}, {"role": "assistant", "content": "消息4"}])
+
+    history = await cache.get(1, 4)
+    assert [m["content"] for m in history] == ["消息1", "消息2", "消息3", "消息4"]
+    assert [m["content"] for m in await cache.get(1, 2)] == ["消息3", "消息4"]
+    assert await cache.get(1, 5) is None
+
+    await cache.invalidate(1)
+    assert await cache.get(1, 2) is None
+
+
+@pytest.mark.asyncio
+async def test_history_cache_skips_backfill_after_concurrent_append(cache):
+    # 读取未命中：先取版本号，再加载数据库
+    version = await cache.version(1)
+    loaded = [{"role": "user", "content": f"消息{i}"} for i in range(3)]
+
+    # 加载期间另一轮对话提交，LPUSHX 因列表不存在而落空
+    await cache.append(1, [{"role": "assistant", "content": "新回复"}])
+
+    # 用旧的数据库结果回填会丢掉新回复，放弃回填，下次读取重新加载
+    assert not await cache.populate(1, loaded, version)
+    assert await cache.get(1, 2) is None
+
+    version = await cache.version(1)
+    assert await cache.populate(1, loaded + [{"role": "assistant", "content": "新回复"}], version)
+    assert [m["content"] for m in await cache.get(1, 2)] == ["消息2", "新回复"]
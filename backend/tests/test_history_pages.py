@@ -0,0 +1,74 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from fastapi import Response
+from sqlalchemy import delete
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.api.chat_sessions import get_chat_history
+from app.core.database import async_session_maker, init_db
+from app.models.chat_session import ChatSession, ChatMessage
+
+USER_ID = "987655"
+
+
+@pytest.mark.asyncio
+async def test_history_pages_backwards_with_ties_and_etag():
+    await init_db()
+    base = datetime(2024, 1, 1, 12)
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id=USER_ID, companion_id=1, session_title="分页", total_messages=7)
+        db.add(chat_session)
+        await db.flush()
+        # 每两条消息同一时间戳，分页边界落在相同时间戳中间
+        db.add_all([
+            ChatMessage(session_id=chat_session.id, role="user", content=f"消息{i}", timestamp=base + timedelta(seconds=i // 2))
+            for i in range(7)
+        ])
+        await db.commit()
+        session_id = chat_session.id
+
+    try:
+        async with async_session_maker() as db:
+            contents = []
+            before = None
+            while True:
+                page = await get_chat_history(
+                    session_id, Response(), user_id=USER_ID, limit=3, before=before, if_none_match=None, db=db
+                )
+                contents = [m.content for m in page.messages] + contents
+                if not page.has_more:
+                    assert page.next_cursor is None
+                    break
+                before = page.next_cursor
+            assert contents == [f"消息{i}" for i in range(7)]
+
+            # 最新一页：命中 ETag 返回 304
+            response = Response()
+            page = await get_chat_history(
+                session_id, response, user_id=USER_ID, limit=3, before=None, if_none_match=None, db=db
+            )
+            assert [m.content for m in page.messages] == ["消息4", "消息5", "消息6"]
+            etag = response.headers["ETag"]
+            cached = await get_chat_history(
+                session_id, Response(), user_id=USER_ID, limit=3, before=None, if_none_match=etag, db=db
+            )
+            assert cached.status_code == 304
+
+            # 新消息到达后 ETag 变化
+            db.add(ChatMessage(session_id=session_id, role="assistant", content="新回复", timestamp=base + timedelta(minutes=1)))
+            await db.commit()
+            page = await get_chat_history(
+                session_id, Response(), user_id=USER_ID, limit=3, before=None, if_none_match=etag, db=db
+            )
+            assert page.messages[-1].content == "新回复"
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == session_id))
+            await db.commit()
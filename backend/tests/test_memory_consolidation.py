@@ -0,0 +1,133 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.config import settings
+from app.services import memory_consolidation as consolidation_module
+from app.services.llm import factory as llm_factory
+from app.services.memory_consolidation import MemoryConsolidationJob, plan_duplicate_merges, plan_evictions
+
+
+def _memory(memory_id, embedding, importance=0.5, age_days=0.0):
+    return {
+        "id": memory_id,
+        "document": memory_id,
+        "embedding": embedding,
+        "metadata": {"importance": importance, "created_ts": time.time() - age_days * 86400},
+    }
+
+
+def test_duplicates_merge_into_most_important_memory():
+    memories = [
+        _memory("a", [1.0, 0.0, 0.0], importance=0.5),
+        _memory("b", [0.99, 0.05, 0.0], importance=0.9),
+        _memory("c", [0.0, 1.0, 0.0]),
+    ]
+
+    clusters, delete_ids = plan_duplicate_merges(memories, threshold=0.95)
+
+    assert delete_ids == ["a"]
+    assert clusters[0][0]["id"] == "b"
+
+
+def test_evictions_drop_old_low_importance_first():
+    memories = [
+        _memory("old-low", [1.0], importance=0.1, age_days=120),
+        _memory("old-high", [1.0], importance=0.9, age_days=120),
+        _memory("new-low", [1.0], importance=0.1, age_days=0),
+    ]
+
+    assert plan_evictions(memories, cap=2, now=time.time()) == ["old-low"]
+    assert plan_evictions(memories, cap=3, now=time.time()) == []
+
+
+class PartitionStore:
+    """只实现整理任务用到的 Chroma 分区接口"""
+
+    def __init__(self, memories):
+        self.memories = {m["id"]: m for m in memories}
+        self.saved = 0
+        self.compactions = []
+
+    def get_partition_memories(self, user_id, companion_id, include_embeddings=False):
+        return [dict(m) for m in self.memories.values()]
+
+    def update_memory_metadata(self, user_id, companion_id, ids, metadatas):
+        for memory_id, metadata in zip(ids, metadatas):
+            self.memories[memory_id]["metadata"] = metadata
+
+    def delete_memories(self, user_id, companion_id, ids):
+        for memory_id in ids:
+            self.memories.pop(memory_id, None)
+        return len(ids)
+
+    def compact_collection(self, user_id, companion_id, min_dead_ratio):
+        self.compactions.append(min_dead_ratio)
+        return 0
+
+    async def save_memory(self, user_id, companion_id, memory_text, memory_type="conversation",
+                          importance=0.5, created_ts=None):
+        self.saved += 1
+        memory_id = f"digest_{self.saved}"
+        self.memories[memory_id] = _memory(memory_id, [0.0] * 5 + [1.0], importance=importance)
+        self.memories[memory_id].update(document=memory_text)
+        self.memories[memory_id]["metadata"].update(type=memory_type, created_ts=created_ts)
+        return True
+
+
+@pytest.mark.asyncio
+async def test_consolidate_partition_merges_and_digests_base_importance_memories(monkeypatch):
+    async def no_redis():
+        raise ConnectionError("测试中不使用Redis")
+
+    async def no_llm(messages):
+        raise RuntimeError("测试中不使用LLM")
+
+    monkeypatch.setattr(consolidation_module, "get_redis", no_redis)
+    monkeypatch.setattr(llm_factory.llm_service, "chat_completion", no_llm)
+    monkeypatch.setattr(settings, "MEMORY_DIGEST_GROUP_SIZE", 10)
+    monkeypatch.setattr(settings, "MEMORY_PARTITION_CAP", 300)
+
+    # 旧记忆取 _calculate_memory_importance 的基础值 0.5，应被摘要；带关键词加成的 0.7 保留
+    axes = np.eye(6).tolist()
+    old = [_memory(f"old{i}", axes[i], importance=0.5, age_days=60 + i) for i in range(3)]
+    important = _memory("important", axes[3], importance=0.7, age_days=60)
+    recent = _memory("recent", axes[4], age_days=1)
+    duplicate = _memory("recent_dup", [0.0, 0.0, 0.0, 0.0, 1.0, 0.05], age_days=2)
+    store = PartitionStore(old + [important, recent, duplicate])
+
+    report = await MemoryConsolidationJob().consolidate_partition(store, "u1", 3)
+
+    assert report["before"] == 6
+    assert report["merged"] == 1
+    assert report["digested"] == 3 and report["digests_created"] == 1
+    assert report["after"] == 3
+    assert set(store.memories) == {"important", "recent", "digest_1"}
+    assert store.memories["digest_1"]["document"].startswith("[往事摘要]")
+    assert store.memories["recent"]["metadata"]["merged_count"] == 2
+    assert store.compactions == [settings.MEMORY_COMPACT_DEAD_RATIO]
+
+
+@pytest.mark.asyncio
+async def test_save_memory_embeds_and_writes_off_the_event_loop(tmp_path):
+    from app.services.chromadb_memory import ChromaMemorySystem
+
+    chroma = ChromaMemorySystem(persist_directory=str(tmp_path), quantization="int8")
+    embed_threads = []
+
+    def embed(texts):
+        embed_threads.append(threading.current_thread())
+        return [[1.0, 0.0, 0.0]] * len(texts)
+
+    chroma.collection._embedding_function = embed
+    assert await chroma.save_memory("u1", 3, "[往事摘要] 一起看了海", memory_type="digest")
+    assert embed_threads and threading.main_thread() not in embed_threads
+    assert chroma.get_partition_memories("u1", 3)[0]["metadata"]["type"] == "digest"
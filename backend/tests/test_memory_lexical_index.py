@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services import memory_lexical_index as lexical_module
+from app.services.memory_lexical_index import MemoryLexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_uses_cjk_bigrams_and_words():
+    assert tokenize("用户: 豆豆很乖 Corgi") == ["豆豆", "豆很", "很乖", "corgi"]
+
+
+def test_search_finds_entity_and_survives_reload(tmp_path):
+    index = MemoryLexicalIndex(str(tmp_path))
+    index.add("u1", 1, "m1", "用户: 我家的猫叫豆豆\nAI: 好可爱的名字")
+    index.add("u1", 1, "m2", "用户: 今天去杭州出差\nAI: 路上注意安全")
+    index.add("u2", 1, "m3", "用户: 豆豆是我的狗\nAI: 好的")
+
+    hits = index.search("u1", 1, "豆豆最近怎么样", limit=5, budget_ms=50)
+    assert [memory_id for memory_id, _, _ in hits] == ["m1"]
+
+    index.remove("u1", 1, ["m1"])
+    reloaded = MemoryLexicalIndex(str(tmp_path))
+    assert reloaded.search("u1", 1, "豆豆", limit=5, budget_ms=50) == []
+    assert reloaded.search("u1", 1, "杭州", limit=5, budget_ms=50)[0][0] == "m2"
+
+
+def test_writes_append_to_log_and_compact(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_module, "COMPACT_MIN_LOG_ENTRIES", 4)
+    index = MemoryLexicalIndex(str(tmp_path))
+    key = index._partition_key("u1", 1)
+    snapshot, log = tmp_path / f"{key}.json.gz", tmp_path / f"{key}.log"
+
+    # 前几次写入只追加日志，不重写快照
+    for i in range(4):
+        index.add("u1", 1, f"m{i}", f"第{i}条记忆")
+    assert not snapshot.exists()
+    assert len(log.read_text(encoding="utf-8").splitlines()) == 4
+
+    # 日志超过阈值后压缩成快照，日志清空
+    index.add("u1", 1, "m4", "豆豆的生日")
+    assert snapshot.exists() and log.read_bytes() == b""
+
+    index.remove("u1", 1, ["m0"])
+    reloaded = MemoryLexicalIndex(str(tmp_path))
+    assert reloaded.search("u1", 1, "豆豆", limit=5, budget_ms=50)[0][0] == "m4"
+    assert {hit[0] for hit in reloaded.search("u1", 1, "第0条记忆", limit=5, budget_ms=50)} == {"m1", "m2", "m3"}
+
+
+def test_cached_partition_sees_other_process_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_module, "COMPACT_MIN_LOG_ENTRIES", 2)
+    worker_a = MemoryLexicalIndex(str(tmp_path))
+    worker_b = MemoryLexicalIndex(str(tmp_path))
+    worker_a.add("u1", 1, "m1", "我家的猫叫豆豆")
+    assert worker_b.warm("u1", 1)
+
+    # A 追加的记录：B 的缓存回放日志新增部分
+    worker_a.add("u1", 1, "m2", "下周去杭州出差")
+    assert worker_b.search("u1", 1, "杭州", limit=5, budget_ms=50)[0][0] == "m2"
+
+    # B 写入触发压缩（快照替换、日志清空）：A 的缓存按快照标识重新加载，不丢记录
+    worker_b.add("u1", 1, "m3", "喜欢喝抹茶拿铁")
+    worker_a.add("u1", 1, "m4", "豆豆生病了")
+    assert {hit[0] for hit in worker_a.search("u1", 1, "豆豆杭州抹茶", limit=5, budget_ms=50)} == {"m1", "m2", "m3", "m4"}
+    assert {hit[0] for hit in worker_b.search("u1", 1, "豆豆杭州抹茶", limit=5, budget_ms=50)} == {"m1", "m2", "m3", "m4"}
+
+
+def test_reciprocal_rank_fusion_promotes_items_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], limit=2)
+    assert fused == ["c", "a"]
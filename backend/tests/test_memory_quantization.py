@@ -0,0 +1,82 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.memory_quantization import QuantizedCollection, ScalarQuantizer
+
+
+def _vectors(n, dim=32, seed=3):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def test_scalar_quantizer_roundtrip_error_is_small():
+    vectors = _vectors(50)
+    codes, scales = ScalarQuantizer.encode(vectors)
+    restored = ScalarQuantizer.decode(codes, scales)
+
+    assert codes.dtype == np.int8
+    assert np.abs(restored - vectors).max() <= scales.max() / 2 + 1e-6
+
+
+def test_quantized_collection_query_filter_and_reload(tmp_path):
+    vectors = _vectors(200)
+    ids = [f"m{i}" for i in range(200)]
+    metadatas = [{"user_id": f"u{i % 2}", "companion_id": "1"} for i in range(200)]
+
+    collection = QuantizedCollection("memories", str(tmp_path), rerank_factor=4)
+    collection.add(ids=ids, documents=ids, metadatas=metadatas, embeddings=vectors)
+
+    where = {"$and": [{"user_id": "u0"}, {"companion_id": "1"}]}
+    result = collection.query(query_embeddings=[vectors[10]], n_results=3, where=where)
+    assert result["ids"][0][0] == "m10"
+    assert result["distances"][0][0] < 1e-5
+    assert all(metadatas[int(i[1:])]["user_id"] == "u0" for i in result["ids"][0])
+
+    collection.delete(ids=["m10"])
+    reloaded = QuantizedCollection("memories", str(tmp_path))
+    assert reloaded.count() == 199
+    result = reloaded.query(query_embeddings=[vectors[10]], n_results=3, where=where)
+    assert "m10" not in result["ids"][0]
+
+    assert reloaded.compact() == 1
+    assert reloaded.count() == 199
+    assert reloaded.get(ids=["m12"])["documents"] == ["m12"]
+
+
+def test_compact_failure_and_interrupted_swap_keep_original_data(tmp_path, monkeypatch):
+    vectors = _vectors(4)
+    collection = QuantizedCollection("memories", str(tmp_path))
+    collection.add(ids=["a", "b", "c", "d"], documents=["a", "b", "c", "d"], embeddings=vectors)
+    collection.delete(ids=["a", "b", "c"])
+    assert collection.dead_ratio() == 0.75
+
+    # 写临时目录时失败：原目录不受影响
+    def failing_add(self, **kwargs):
+        raise OSError("磁盘已满")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(QuantizedCollection, "add", failing_add)
+        with pytest.raises(OSError):
+            collection.compact()
+    assert QuantizedCollection("memories", str(tmp_path)).get(ids=["d"])["documents"] == ["d"]
+
+    # 两次改名之间崩溃：重新打开时恢复旧目录并清理临时目录
+    path = tmp_path / "memories"
+    os.replace(path, tmp_path / "memories.old")
+    (tmp_path / "memories.compact").mkdir()
+    reopened = QuantizedCollection("memories", str(tmp_path))
+    assert reopened.count() == 1
+    assert not (tmp_path / "memories.compact").exists() and not (tmp_path / "memories.old").exists()
+
+    assert reopened.compact() == 3
+    assert reopened.dead_ratio() == 0.0
+    assert reopened.query(query_embeddings=[vectors[3]], n_results=1)["ids"] == [["d"]]
+    assert QuantizedCollection("memories", str(tmp_path)).count() == 1
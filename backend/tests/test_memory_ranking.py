@@ -0,0 +1,36 @@
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.memory_ranking import RankingWeights, rank_memories
+
+
+def test_recency_and_importance_break_similarity_ties():
+    now = time.time()
+    weights = RankingWeights(mmr_lambda=1.0)
+    documents = ["old", "new", "important"]
+    metadatas = [
+        {"created_ts": now - 90 * 86400, "importance": 0.5},
+        {"created_ts": now, "importance": 0.5},
+        {"created_ts": now - 90 * 86400, "importance": 1.0},
+    ]
+
+    ranked = rank_memories(documents, [0.3, 0.3, 0.3], metadatas, None, limit=3, weights=weights, now=now)
+
+    assert ranked[-1] == "old"
+
+
+def test_mmr_skips_near_duplicates_and_irrelevant_candidates():
+    now = time.time()
+    weights = RankingWeights(mmr_lambda=0.5, min_similarity=0.2)
+    documents = ["cat", "cat again", "city", "unrelated"]
+    metadatas = [{"created_ts": now, "importance": 0.5}] * 4
+    embeddings = [[1.0, 0.0], [1.0, 0.01], [0.0, 1.0], [0.7, 0.7]]
+
+    ranked = rank_memories(documents, [0.1, 0.12, 0.3, 0.95], metadatas, embeddings, limit=2, weights=weights, now=now)
+
+    assert ranked == ["cat", "city"]
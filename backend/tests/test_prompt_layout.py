@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.affinity_engine import EmotionAnalysis
+from app.services.dynamic_prompt_builder import DynamicPromptBuilder
+from app.services.emotion_expression_generator import emotion_expression_generator
+
+
+def _build(builder, affinity, mood, primary):
+    analysis = EmotionAnalysis(
+        primary_emotion=primary, emotion_intensity=0.6, detected_emotions=[], user_intent="sharing",
+        is_appropriate=True, violation_reason="", suggested_affinity_change=0, suggested_trust_change=0,
+        suggested_tension_change=0, key_points=[], is_memorable=False
+    )
+    expression = emotion_expression_generator.generate(
+        emotion_analysis=analysis, current_level="friend", affinity_score=affinity,
+        trust_score=40, tension_score=5, mood=mood
+    )
+    return builder.build(
+        companion_name="Zoe", personality_archetype="zoe", emotion_expression=expression,
+        emotion_analysis=analysis, current_level="friend", affinity_score=affinity,
+        trust_score=40, tension_score=5, mood=mood, companion_id=2
+    )
+
+
+def test_static_prefix_is_byte_identical_across_turns():
+    builder = DynamicPromptBuilder(max_tokens=2000, layout="prefix_stable")
+    first = _build(builder, 300, "happy", "positive")
+    second = _build(builder, 312, "tired", "negative")
+
+    prefix = builder._static_prefix(2, "Zoe", "zoe", "friend", "v1")
+    assert first.startswith(prefix) and second.startswith(prefix)
+    assert "312" not in prefix and "{{" not in prefix
+    assert builder.get_stats()["static_hits"] >= 1
+
+    builder.invalidate_static_sections(2)
+    assert builder.get_stats()["cached_prefixes"] == 0
@@ -0,0 +1,31 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.prompts import _fill_prompt_template, compile_template, get_system_prompt
+
+
+class Profile:
+    city = "杭州"
+
+
+def test_compiled_template_fills_nested_keys_and_keeps_missing_placeholders():
+    template = "你好{{ user.name }}，来自{{user.profile.city}}，心情{{mood}}，{{user.age}}"
+    context = {"user": {"name": "小星", "profile": Profile()}, "mood": "开心"}
+
+    rendered = compile_template(template).render(context)
+    assert rendered == "你好小星，来自杭州，心情开心，{{user.age}}"
+    assert _fill_prompt_template(template, context) == rendered
+    assert compile_template(template) is compile_template(template)
+    assert _fill_prompt_template(template, None) == template
+
+
+def test_v1_persona_placeholders_are_filled_from_context():
+    context = {"affinity_score": 420, "current_mood": "开心", "romance_level": "friend", "user_message": "在吗"}
+
+    prompt = get_system_prompt("林梓汐", "linzixi", context)
+    assert "{{" not in prompt and "{affinity_score}" not in prompt
+    assert "420" in prompt
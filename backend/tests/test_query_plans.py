@@ -0,0 +1,101 @@
+import re
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Boolean, DateTime, Integer, and_, create_engine, func, insert, select, text
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models.chat_session import ChatSession, ChatMessage
+from app.models.companion import Companion
+from app.models.event import Event, UserEventHistory, OfflineLifeLog
+from app.models.relationship import CompanionRelationshipState
+from app.models.user import User
+from app.services.history_pages import encode_history_cursor, history_page_statement, recent_messages_statement
+
+SEED_ROWS = 300
+
+# 与服务代码中的热点查询保持一致
+HOT_QUERIES = {
+    "chat_history": recent_messages_statement(7, settings.CHAT_HISTORY_CACHE_SIZE),
+    "chat_history_page": history_page_statement(7, 51, encode_history_cursor(datetime(2024, 1, 1, 3), 180)),
+    "active_sessions": select(ChatSession).where(
+        and_(ChatSession.companion_id == 3, ChatSession.is_active == True)
+    ),
+    "event_cooldown": select(UserEventHistory).where(
+        and_(
+            UserEventHistory.user_id == "5",
+            UserEventHistory.companion_id == "3",
+            UserEventHistory.event_id == "event_7"
+        )
+    ).order_by(UserEventHistory.triggered_at.desc()),
+    "unshared_offline_logs": select(OfflineLifeLog).where(
+        OfflineLifeLog.companion_id == 3,
+        OfflineLifeLog.importance_score > 80,
+        OfflineLifeLog.is_shared_with_user == False
+    ).order_by(OfflineLifeLog.importance_score.desc()),
+    "companion_list": select(Companion.id, func.count(ChatSession.id)).outerjoin(
+        ChatSession, and_(ChatSession.companion_id == Companion.id, ChatSession.is_active == True)
+    ).where(Companion.user_id == 3).group_by(Companion.id),
+    "relationship_state": select(CompanionRelationshipState).where(
+        CompanionRelationshipState.user_id == "5",
+        CompanionRelationshipState.companion_id == 3
+    ),
+}
+
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?! USING (?:COVERING )?INDEX)")
+
+
+def seed_value(column, row: int):
+    if isinstance(column.type, Boolean):
+        return row % 2 == 0
+    if isinstance(column.type, Integer):
+        return row % 10 if column.foreign_keys else row % 100
+    if isinstance(column.type, DateTime):
+        return datetime(2024, 1, 1) + timedelta(minutes=row)
+    if column.name in ("user_id", "companion_id"):
+        return str(row % 10)
+    if column.name == "event_id":
+        return f"event_{row % 20}"
+    return f"{column.name}_{row}"
+
+
+@pytest.fixture(scope="module")
+def seeded_engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(engine)
+    tables = [model.__table__ for model in (
+        User, Companion, Event, ChatSession, ChatMessage, UserEventHistory, OfflineLifeLog, CompanionRelationshipState
+    )]
+    with engine.begin() as conn:
+        for table in tables:
+            rows = []
+            for row in range(SEED_ROWS):
+                values = {column.name: seed_value(column, row) for column in table.columns if not column.primary_key}
+                rows.append(values)
+            if table.name in ("users", "companions", "events"):
+                rows = rows[:20]
+            for index in table.indexes:
+                if index.unique:
+                    unique_rows = {tuple(row[column.name] for column in index.columns): row for row in rows}
+                    rows = list(unique_rows.values())
+            conn.execute(insert(table), rows)
+        conn.execute(text("ANALYZE"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(seeded_engine, name):
+    statement = HOT_QUERIES[name].compile(seeded_engine, compile_kwargs={"literal_binds": True})
+    with seeded_engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}")]
+
+    scans = [detail for detail in plan if FULL_SCAN.match(detail)]
+    assert not scans, f"{name} 全表扫描: {plan}"
@@ -0,0 +1,116 @@
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, delete, inspect, select, text
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.database import async_session_maker, init_db, _upgrade_schema
+from app.models.relationship import CompanionRelationshipState
+from app.services.relationship_state_writer import RelationshipStateWriter
+
+
+async def load_state(user_id: str):
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(CompanionRelationshipState).where(CompanionRelationshipState.user_id == user_id)
+        )
+        return result.scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_writer_coalesces_interactions_into_single_upserted_row():
+    user_id = "test-relationship-writer"
+    await init_db()
+    writer = RelationshipStateWriter(flush_every=3, flush_seconds=3600)
+    await writer.start()
+
+    async def interact(affinity: int, change: int, force: bool = False):
+        await writer.record(
+            user_id, 42,
+            {
+                "affinity_score": affinity, "trust_score": 20, "tension_score": 0,
+                "romance_stage": "friend", "current_mood": "happy",
+                "last_interaction_at": datetime.now(timezone.utc),
+            },
+            total_interactions=None, affinity_change=change,
+            flags={"last_affinity_change": change}, force=force
+        )
+
+    try:
+        await interact(101, 1)
+        await interact(102, 1)
+        assert await load_state(user_id) == []
+
+        await interact(100, -2)
+        await interact(110, 10, force=True)
+        await interact(111, 1)
+        await writer.stop()
+
+        states = await load_state(user_id)
+        assert len(states) == 1
+        state = states[0]
+        assert state.affinity_score == 111
+        assert state.total_interactions == 5
+        assert (state.positive_interactions, state.negative_interactions) == (4, 1)
+        assert state.special_flags["last_affinity_change"] == 1
+    finally:
+        await writer.stop()
+        async with async_session_maker() as session:
+            await session.execute(delete(CompanionRelationshipState).where(CompanionRelationshipState.user_id == user_id))
+            await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_writer_keeps_stored_mood_when_snapshot_has_none():
+    user_id = "test-relationship-mood"
+    await init_db()
+    writer = RelationshipStateWriter(flush_every=1, flush_seconds=3600)
+
+    async def interact(**mood):
+        await writer.record(
+            user_id, 42,
+            {
+                "affinity_score": 60, "trust_score": 20, "tension_score": 0,
+                "romance_stage": "friend", "last_interaction_at": datetime.now(timezone.utc), **mood,
+            },
+            total_interactions=None, affinity_change=1, flags={}
+        )
+
+    try:
+        await interact()
+        assert (await load_state(user_id))[0].current_mood == "neutral"
+
+        await interact(current_mood="happy")
+        await interact()
+        states = await load_state(user_id)
+        assert [state.current_mood for state in states] == ["happy"]
+        assert states[0].total_interactions == 3
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(CompanionRelationshipState).where(CompanionRelationshipState.user_id == user_id))
+            await session.commit()
+
+
+def test_upgrade_schema_dedupes_before_creating_unique_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE companion_relationship_states "
+            "(id INTEGER PRIMARY KEY, user_id VARCHAR(255), companion_id VARCHAR(255), affinity_score INTEGER)"
+        ))
+        conn.execute(text(
+            "INSERT INTO companion_relationship_states (user_id, companion_id, affinity_score) "
+            "VALUES ('1', '3', 10), ('1', '3', 20), ('2', '3', 30)"
+        ))
+        _upgrade_schema(conn)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT user_id, affinity_score FROM companion_relationship_states ORDER BY user_id")).all()
+    assert [tuple(row) for row in rows] == [("1", 20), ("2", 30)]
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("companion_relationship_states")}
+    assert indexes["uq_relationship_states_user_companion"]["unique"]
@@ -0,0 +1,44 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.session_prefetch import CompanionInfoCache, PrefetchedSession, SessionPrefetcher
+
+
+def test_companion_info_cache_expires_and_invalidates():
+    cache = CompanionInfoCache(ttl_seconds=60)
+    cache.set(1, {"name": "小雪"})
+    assert cache.get(1) == {"name": "小雪"}
+
+    cache.invalidate(1)
+    assert cache.get(1) is None
+
+    expired = CompanionInfoCache(ttl_seconds=-1)
+    expired._entries[1] = (0.0, {"name": "小雪"})
+    assert expired.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_prefetch_is_taken_once_and_cancelled_on_disconnect():
+    prefetcher = SessionPrefetcher()
+
+    async def done():
+        return PrefetchedSession(user_id="1", companion_id=2, chat_session_id=3, companion_state={})
+
+    session = {"prefetch_task": asyncio.create_task(done())}
+    prefetched = await prefetcher.take(session)
+    assert prefetched.companion_id == 2
+    assert await prefetcher.take(session) is None
+
+    slow = asyncio.create_task(asyncio.sleep(10))
+    session = {"prefetch_task": slow}
+    prefetcher.cancel(session)
+    with pytest.raises(asyncio.CancelledError):
+        await slow
+    assert "prefetch_task" not in session
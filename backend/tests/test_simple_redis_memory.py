@@ -0,0 +1,67 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from redis.exceptions import ResponseError
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.memory_integration import SimpleRedisMemorySystem
+
+
+class FactStore:
+    """旧版 key 是 JSON 字符串；eval 模拟迁移脚本把它转成 Hash"""
+
+    def __init__(self):
+        self.strings = {}
+        self.hashes = {}
+        self.ttls = {}
+
+    async def hgetall(self, key):
+        if key in self.strings:
+            raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return dict(self.hashes.get(key, {}))
+
+    async def eval(self, script, numkeys, key, meta_key, expire_seconds, meta):
+        facts = json.loads(self.strings.pop(key))
+        self.hashes[key] = facts
+        self.hashes[meta_key] = {field: meta for field in facts}
+        self.ttls[key] = self.ttls[meta_key] = expire_seconds
+        return len(facts)
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+
+class Pipeline:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    async def execute(self):
+        for name, args, kwargs in self.ops:
+            if name == "hset":
+                self.store.hashes.setdefault(args[0], {}).update(kwargs["mapping"])
+            elif name == "expire":
+                self.store.ttls[args[0]] = args[1]
+        return [True] * len(self.ops)
+
+
+@pytest.mark.asyncio
+async def test_simple_redis_memory_migrates_legacy_keys_and_sets_ttl():
+    store = FactStore()
+    store.strings["user_facts:u1:1"] = json.dumps({"昵称": "小星"}, ensure_ascii=False)
+    memory = SimpleRedisMemorySystem(store, expire_days=30)
+
+    assert await memory.get_user_facts("u1", 1) == {"昵称": "小星"}
+
+    await memory.save_user_fact("u1", 1, "宠物", "猫豆豆")
+    assert store.hashes["user_facts:u1:1"] == {"昵称": "小星", "宠物": "猫豆豆"}
+    assert "宠物" in store.hashes["user_facts_meta:u1:1"]
+    assert store.ttls["user_facts:u1:1"] == store.ttls["user_facts_meta:u1:1"] == 30 * 24 * 3600
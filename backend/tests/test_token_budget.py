@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.dynamic_prompt_builder import DynamicPromptBuilder, PromptSection, select_sections
+from app.services.token_counter import ApproxTokenCounter
+
+
+def test_counter_handles_chinese_and_english():
+    counter = ApproxTokenCounter(cjk_weight=1.0)
+
+    assert counter.count("我叫小星") == 4
+    assert counter.count("hello world") == 2
+    assert counter.count("12345") == 2
+
+
+def test_selection_tries_smaller_sections_when_large_one_does_not_fit():
+    # (优先级, token数)：预算放不下第一个大章节，但能放下后面两个小章节
+    assert select_sections([(8, 500), (7, 40), (6, 30)], budget=100) == [1, 2]
+    assert select_sections([(8, 60), (7, 50), (6, 50)], budget=100) == [1, 2]
+
+
+def test_assemble_prompt_keeps_required_sections_first():
+    builder = DynamicPromptBuilder(max_tokens=80)
+    sections = [
+        PromptSection(title="记忆", content=["很长的记忆" * 40], priority=7, is_required=False),
+        PromptSection(title="身份", content=["你是小雪"], priority=12, is_required=True),
+        PromptSection(title="资料", content=["用户喜欢猫"], priority=6, is_required=False),
+    ]
+
+    prompt = builder._assemble_prompt(sections, builder.max_tokens)
+    assert prompt == "# 身份\n你是小雪\n\n# 资料\n用户喜欢猫"
@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete, select
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.core.database import async_session_maker, init_db
+from app.models.chat_session import ChatSession, ChatMessage
+from app.models.relationship import RelationshipHistory
+from app.services.write_behind import WriteBehindQueue
+
+
+@pytest.mark.asyncio
+async def test_group_commit_batches_writes_and_flushes_on_stop():
+    user_id = "test-write-behind"
+    await init_db()
+    async with async_session_maker() as db:
+        chat_session = ChatSession(user_id=user_id, companion_id=1, session_title="write-behind")
+        db.add(chat_session)
+        await db.commit()
+        chat_session_id = chat_session.id
+
+    queue = WriteBehindQueue(batch_rows=100, flush_ms=50)
+    await queue.start()
+    try:
+        for turn in range(3):
+            await queue.enqueue(RelationshipHistory, [{
+                "user_id": user_id, "companion_id": "1", "change_type": "affinity_change",
+                "old_value": str(turn), "new_value": str(turn + 1), "delta": 1,
+                "trigger_reason": "test", "trigger_context": {}
+            }])
+        await queue.write(
+            ChatMessage,
+            [{"session_id": chat_session_id, "role": "user", "content": "你好"}],
+            increments=[(ChatSession, chat_session_id, "total_messages", 1)]
+        )
+        assert queue.stats["batches"] == 1
+
+        await queue.enqueue(ChatMessage, [{"session_id": chat_session_id, "role": "assistant", "content": "在的"}])
+        await queue.stop()
+
+        async with async_session_maker() as db:
+            saved = await db.get(ChatSession, chat_session_id)
+            assert saved.total_messages == 1
+            messages = (await db.execute(
+                select(ChatMessage.content).where(ChatMessage.session_id == chat_session_id).order_by(ChatMessage.id)
+            )).scalars().all()
+            assert messages == ["你好", "在的"]
+            history = (await db.execute(
+                select(RelationshipHistory).where(RelationshipHistory.user_id == user_id)
+            )).scalars().all()
+            assert len(history) == 3
+    finally:
+        await queue.stop()
+        async with async_session_maker() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session_id))
+            await db.execute(delete(ChatSession).where(ChatSession.id == chat_session_id))
+            await db.execute(delete(RelationshipHistory).where(RelationshipHistory.user_id == user_id))
+            await db.commit()